@@ -95,7 +95,7 @@ def find_shortest_path(graph: Graph, start: Vertex, end: Vertex) -> Tuple[List[V
                 
             # 计算从起点到邻居的新距离
             edge = graph.get_edge_between(current, neighbor)
-            if not edge:
+            if not edge or edge.closed:
                 continue
                 
             tentative_g_score = g_score[current] + edge.length
@@ -160,7 +160,7 @@ def find_fastest_path(graph: Graph, start: Vertex, end: Vertex, use_traffic: boo
                 
             # 计算从起点到邻居的新成本
             edge = graph.get_edge_between(current, neighbor)
-            if not edge:
+            if not edge or edge.closed:
                 continue
                 
             # 根据use_traffic参数决定使用哪种成本计算方式
@@ -0,0 +1,335 @@
+"""
+基于个体车辆的离散事件交通模拟
+每辆车沿寻路得到的路径依次通过道路，通过一条道路的时间为 c·L·f(n/v)，
+车辆驶出道路的时间作为事件放入按时间排序的优先队列（事件日历），按时间顺序处理
+"""
+import heapq
+import time
+from typing import Callable, List, Optional
+import numpy as np
+from ..models.graph import Graph
+from .traffic_simulate import congestion_factor
+
+
+class VehicleTable:
+    """
+    结构数组（struct-of-arrays）形式的车辆表，车辆ID即数组下标
+
+    所有车辆的路径首尾相接保存在同一个数组routes中，
+    每辆车通过route_start和route_length定位自己的路径
+
+    属性:
+        count: 车辆数量
+        route_start: 路径在routes中的起始位置
+        route_length: 路径包含的道路数量
+        route_pos: 当前所在道路在路径中的位置，-1表示尚未出发
+        edge: 当前所在道路的下标，-1表示不在路网中
+        depart_time: 出发时间
+        enter_time: 驶入当前道路的时间
+        exit_time: 预计驶出当前道路的时间
+        arrive_time: 到达终点的时间，未到达为NaN
+        routes: 所有车辆的路径（道路下标）
+    """
+
+    _FIELDS = (
+        ('route_start', np.int64, 0),
+        ('route_length', np.int32, 0),
+        ('route_pos', np.int32, -1),
+        ('edge', np.int32, -1),
+        ('depart_time', np.float64, 0.0),
+        ('enter_time', np.float64, np.nan),
+        ('exit_time', np.float64, np.nan),
+        ('arrive_time', np.float64, np.nan),
+    )
+
+    def __init__(self, initial_capacity=1024):
+        """
+        初始化车辆表
+
+        参数:
+            initial_capacity: 初始容量，超出后按两倍扩容
+        """
+        self.count = 0
+        self._capacity = max(initial_capacity, 1)
+        for name, dtype, fill in self._FIELDS:
+            setattr(self, name, np.full(self._capacity, fill, dtype=dtype))
+        self.routes = np.empty(self._capacity * 8, dtype=np.int32)
+        self._routes_size = 0
+
+    def _grow(self, min_capacity):
+        """扩容车辆字段数组"""
+        capacity = self._capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        for name, dtype, fill in self._FIELDS:
+            array = np.full(capacity, fill, dtype=dtype)
+            array[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, array)
+        self._capacity = capacity
+
+    def _grow_routes(self, min_size):
+        """扩容路径数组"""
+        size = len(self.routes)
+        while size < min_size:
+            size *= 2
+        routes = np.empty(size, dtype=np.int32)
+        routes[:self._routes_size] = self.routes[:self._routes_size]
+        self.routes = routes
+
+    def add(self, route, depart_time):
+        """
+        添加一辆车
+
+        参数:
+            route: 道路下标序列
+            depart_time: 出发时间
+
+        返回:
+            车辆ID
+        """
+        vehicle_id = self.count
+        if vehicle_id >= self._capacity:
+            self._grow(vehicle_id + 1)
+        route = np.asarray(route, dtype=np.int32)
+        start = self._routes_size
+        if start + len(route) > len(self.routes):
+            self._grow_routes(start + len(route))
+        self.routes[start:start + len(route)] = route
+        self._routes_size += len(route)
+
+        self.route_start[vehicle_id] = start
+        self.route_length[vehicle_id] = len(route)
+        self.depart_time[vehicle_id] = depart_time
+        self.count += 1
+        return vehicle_id
+
+    def __len__(self):
+        """返回车辆数量"""
+        return self.count
+
+
+class AgentSimulation:
+    """
+    基于离散事件的个体车辆模拟
+
+    每辆车在事件日历中最多只有一个待处理事件：出发或驶出当前道路。
+    车辆驶入道路时根据道路上的车辆数（包括自己）计算通过时间 c·L·f(n/v)
+
+    属性:
+        graph: 图实例
+        time_factor: 行驶时间系数 c
+        edge_ids: 道路ID列表，下标即道路下标
+        occupancy: 每条道路上的车辆数
+        vehicles: 车辆表
+        now: 当前模拟时间
+    """
+
+    def __init__(self, graph: Graph, time_factor: float = 1.0):
+        """
+        初始化模拟
+
+        参数:
+            graph: 图实例
+            time_factor: 行驶时间系数 c
+        """
+        self.graph = graph
+        self.time_factor = time_factor
+        self.edge_ids = list(graph.edges.keys())
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+        edges = list(graph.edges.values())
+        self.length = [edge.length for edge in edges]
+        self.capacity = [edge.capacity for edge in edges]
+        self.occupancy = np.zeros(len(edges), dtype=np.int64)
+        self.vehicles = VehicleTable()
+        self.now = 0.0
+        self.active_count = 0
+        self.finished_count = 0
+        self.events_processed = 0
+        self._calendar = []  # (事件时间, 车辆ID)
+
+    def add_vehicle(self, route, depart_time: Optional[float] = None) -> int:
+        """
+        添加一辆沿指定路径行驶的车辆
+
+        参数:
+            route: 边对象或边ID的序列，相邻道路需首尾相连
+            depart_time: 出发时间，默认为当前模拟时间
+
+        返回:
+            车辆ID
+        """
+        route_indices = [self.edge_index[getattr(edge, 'id', edge)] for edge in route]
+        depart_time = self.now if depart_time is None else max(depart_time, self.now)
+        vehicle_id = self.vehicles.add(route_indices, depart_time)
+        self.active_count += 1
+        heapq.heappush(self._calendar, (depart_time, vehicle_id))
+        return vehicle_id
+
+    def add_vehicle_between(self, start, end, depart_time: Optional[float] = None,
+                            router: Optional[Callable] = None) -> Optional[int]:
+        """
+        使用寻路算法规划路径并添加车辆
+
+        参数:
+            start: 起点顶点
+            end: 终点顶点
+            depart_time: 出发时间
+            router: 寻路函数 (graph, start, end) -> (顶点路径, 边路径, 代价)，默认为find_fastest_path
+
+        返回:
+            车辆ID，找不到路径时返回None
+        """
+        if router is None:
+            from .a_star import find_fastest_path
+            router = find_fastest_path
+        _, edges, _ = router(self.graph, start, end)
+        if not edges:
+            return None
+        return self.add_vehicle(edges, depart_time)
+
+    def _enter_edge(self, vehicle_id, edge, now):
+        """车辆驶入道路，计算通过时间并安排驶出事件"""
+        vehicles = self.vehicles
+        occupancy = self.occupancy[edge] + 1
+        self.occupancy[edge] = occupancy
+        travel_time = self.time_factor * self.length[edge] * congestion_factor(occupancy, self.capacity[edge])
+        exit_time = now + travel_time
+        vehicles.edge[vehicle_id] = edge
+        vehicles.enter_time[vehicle_id] = now
+        vehicles.exit_time[vehicle_id] = exit_time
+        heapq.heappush(self._calendar, (exit_time, vehicle_id))
+
+    def advance(self, until: float) -> int:
+        """
+        按时间顺序处理截至指定时间的所有事件
+
+        参数:
+            until: 目标模拟时间
+
+        返回:
+            处理的事件数量
+        """
+        calendar = self._calendar
+        vehicles = self.vehicles
+        route_pos = vehicles.route_pos
+        route_start = vehicles.route_start
+        route_length = vehicles.route_length
+        routes = vehicles.routes
+        processed = 0
+
+        while calendar and calendar[0][0] <= until:
+            now, vehicle_id = heapq.heappop(calendar)
+            position = int(route_pos[vehicle_id])
+            if position >= 0:
+                # 驶出当前道路
+                self.occupancy[vehicles.edge[vehicle_id]] -= 1
+            position += 1
+            route_pos[vehicle_id] = position
+            if position >= route_length[vehicle_id]:
+                # 到达终点
+                vehicles.edge[vehicle_id] = -1
+                vehicles.arrive_time[vehicle_id] = now
+                self.active_count -= 1
+                self.finished_count += 1
+            else:
+                self._enter_edge(vehicle_id, int(routes[route_start[vehicle_id] + position]), now)
+            processed += 1
+
+        self.now = max(self.now, until)
+        self.events_processed += processed
+        return processed
+
+    def run_realtime(self, duration: float, speed: float = 1.0, tick: float = 0.1,
+                     on_tick: Optional[Callable] = None) -> dict:
+        """
+        按墙钟时间推进模拟（模拟时间 = 墙钟时间 × speed）
+
+        参数:
+            duration: 运行的墙钟时间（秒）
+            speed: 模拟时间与墙钟时间的倍率
+            tick: 每次推进的墙钟时间间隔（秒）
+            on_tick: 每次推进后调用的回调函数，参数为模拟实例
+
+        返回:
+            运行统计 {events, max_lag, ...}，max_lag为处理事件落后于墙钟的最大时间（秒）
+        """
+        start_wall = time.perf_counter()
+        start_sim = self.now
+        events = 0
+        max_lag = 0.0
+        next_tick = start_wall
+        while True:
+            elapsed = time.perf_counter() - start_wall
+            if elapsed >= duration:
+                break
+            events += self.advance(start_sim + elapsed * speed)
+            if on_tick is not None:
+                on_tick(self)
+            next_tick += tick
+            lag = time.perf_counter() - next_tick
+            if lag > 0:
+                max_lag = max(max_lag, lag)
+            else:
+                time.sleep(-lag)
+        return {
+            "events": events,
+            "max_lag": max_lag,
+            "sim_time": self.now - start_sim,
+            "active_vehicles": self.active_count,
+            "finished_vehicles": self.finished_count,
+        }
+
+    def sync_to_graph(self):
+        """将每条道路上的车辆数写回图中"""
+        for edge_id, count in zip(self.edge_ids, self.occupancy.tolist()):
+            self.graph.edges[edge_id].current_vehicles = count
+
+    def get_vehicle_progress(self, now: Optional[float] = None):
+        """
+        获取所有在路网中的车辆及其在当前道路上的行驶进度
+
+        参数:
+            now: 查询时间，默认为当前模拟时间
+
+        返回:
+            (车辆ID数组, 道路下标数组, 进度数组[0, 1])
+        """
+        now = self.now if now is None else now
+        vehicles = self.vehicles
+        count = vehicles.count
+        active = np.nonzero(vehicles.edge[:count] >= 0)[0]
+        enter = vehicles.enter_time[active]
+        span = vehicles.exit_time[active] - enter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            progress = np.clip(np.where(span > 0, (now - enter) / span, 1.0), 0.0, 1.0)
+        return active, vehicles.edge[active], progress
+
+
+def build_route_pool(graph: Graph, n_routes: int, rng: Optional[np.random.Generator] = None,
+                     router: Optional[Callable] = None) -> List[list]:
+    """
+    随机选择起终点并规划若干条路径，用于批量生成车辆
+
+    参数:
+        graph: 图实例
+        n_routes: 路径数量
+        rng: 随机数生成器
+        router: 寻路函数，默认为find_fastest_path
+
+    返回:
+        边路径列表
+    """
+    if router is None:
+        from .a_star import find_fastest_path
+        router = find_fastest_path
+    rng = rng if rng is not None else np.random.default_rng()
+    vertices = list(graph.vertices.values())
+    routes = []
+    attempts = 0
+    while len(routes) < n_routes and attempts < n_routes * 4 and len(vertices) > 1:
+        attempts += 1
+        start, end = rng.choice(len(vertices), size=2, replace=False)
+        _, edges, _ = router(graph, vertices[start], vertices[end])
+        if edges:
+            routes.append(edges)
+    return routes
@@ -0,0 +1,342 @@
+"""
+拥堵成本模型
+道路行驶时间 = c × L × f(n/v)，其中L为道路长度，n为车辆数（至少按1计），v为容量。
+不同的模型提供不同的f，均对整个道路数组向量化计算；寻路、交通分配和模拟共用同一个当前模型，
+通过set_congestion_model切换。含指数的模型可选用查表近似代替np.exp
+"""
+import math
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+# 可用的拥堵成本模型名称
+CONGESTION_MODEL_TYPES = ('default', 'spec', 'bpr', 'piecewise')
+# 默认模型在阈值之后的第二段分界点
+DEFAULT_SECOND_BREAK = 0.7
+# 分段线性模型的默认表 (n/v, f)，近似默认模型
+DEFAULT_PIECEWISE_TABLE = ((0.0, 1.0), (0.5, 1.0), (0.7, 2.0), (0.9, 3.7), (1.0, 3.9), (1.5, 5.7), (2.0, 8.6))
+
+
+class ExpTable:
+    """
+    指数函数的查表近似
+
+    在 [0, max_x] 上按等间距保存e^x，查表后线性插值，相对误差约为 step²/8；
+    超出范围的值仍使用np.exp计算
+
+    属性:
+        max_x: 查表范围的上限
+        resolution: 每单位x的表项数量
+    """
+
+    def __init__(self, max_x: float = 4.0, resolution: int = 1024):
+        """
+        初始化指数表
+
+        参数:
+            max_x: 查表范围的上限
+            resolution: 每单位x的表项数量
+        """
+        if max_x <= 0 or resolution <= 0:
+            raise ValueError(f"无效的指数表参数: max_x={max_x}, resolution={resolution}")
+        self.max_x = float(max_x)
+        self.resolution = int(resolution)
+        n = int(math.ceil(self.max_x * self.resolution))
+        self._table = np.exp(np.arange(n + 2) / self.resolution)
+        # 相邻表项之差，插值时只需一次乘法和一次加法
+        self._slope = np.diff(self._table)
+
+    def __call__(self, x) -> np.ndarray:
+        """
+        计算e^x的近似值
+
+        参数:
+            x: 数组
+
+        返回:
+            近似值数组
+        """
+        x = np.asarray(x, dtype=np.float64)
+        position = x * self.resolution
+        index = np.clip(position, 0, len(self._slope) - 1).astype(np.intp)
+        position -= index
+        result = self._slope[index]
+        result *= position
+        result += self._table[index]
+        outside = (x < 0) | (x > self.max_x)
+        if outside.any():
+            result[outside] = np.exp(x[outside])
+        return result
+
+    def to_dict(self) -> dict:
+        """返回参数字典"""
+        return {"max_x": self.max_x, "resolution": self.resolution}
+
+
+class CongestionModel(ABC):
+    """
+    拥堵成本模型接口，子类需要实现factor
+
+    属性:
+        scale: 常数c，行驶时间 = scale × 长度 × f(n/v)
+    """
+
+    name = None
+
+    def __init__(self, scale: float = 1.0):
+        """
+        初始化
+
+        参数:
+            scale: 常数c
+        """
+        self.scale = float(scale)
+
+    @abstractmethod
+    def factor(self, ratio: np.ndarray) -> np.ndarray:
+        """
+        向量化计算拥堵系数 f(n/v)
+
+        参数:
+            ratio: 车辆数与容量之比的数组
+
+        返回:
+            拥堵系数数组
+        """
+
+    def scalar_factor(self, ratio: float) -> float:
+        """
+        计算单个拥堵系数（逐条道路调用时使用，避免创建数组的开销）
+
+        参数:
+            ratio: 车辆数与容量之比
+
+        返回:
+            拥堵系数
+        """
+        return float(self.factor(np.array([ratio]))[0])
+
+    def travel_time(self, length, capacity, vehicles) -> np.ndarray:
+        """
+        计算行驶时间 c × L × f(max(n, 1) / v)，容量为0（封闭）的道路行驶时间为无穷大
+
+        参数:
+            length: 道路长度数组
+            capacity: 道路容量数组
+            vehicles: 车辆数数组
+
+        返回:
+            行驶时间数组
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.maximum(vehicles, 1) / capacity
+            times = length * self.factor(ratio)
+        if self.scale != 1.0:
+            times *= self.scale
+        # 分段线性等模型在超出范围时取端点的值，封闭道路需要单独设为无穷大
+        times[np.asarray(capacity) <= 0] = np.inf
+        return times
+
+    def params(self) -> dict:
+        """返回模型参数（不含scale）"""
+        return {}
+
+    def to_dict(self) -> dict:
+        """
+        返回模型的描述
+
+        返回:
+            {"type": 模型名称, "scale": c, "params": {...}}
+        """
+        return {"type": self.name, "scale": self.scale, "params": self.params()}
+
+
+class _ExpModel(CongestionModel):
+    """含指数的分段模型的公共部分：阈值和可选的指数表"""
+
+    def __init__(self, threshold: Optional[float] = None, scale: float = 1.0, exp_table: Optional[ExpTable] = None):
+        """
+        初始化
+
+        参数:
+            threshold: 拥堵阈值，为None时使用init_traffic_simulation设置的traffic_simulate.threshold
+            scale: 常数c
+            exp_table: 可选的指数表，为None时使用np.exp
+        """
+        super().__init__(scale)
+        self.threshold = threshold
+        self.exp_table = exp_table
+
+    def current_threshold(self) -> float:
+        """当前使用的拥堵阈值"""
+        if self.threshold is not None:
+            return self.threshold
+        from . import traffic_simulate
+        return traffic_simulate.threshold
+
+    def _exp(self, x):
+        return self.exp_table(x) if self.exp_table is not None else np.exp(x)
+
+    def params(self) -> dict:
+        return {"threshold": self.current_threshold(),
+                "exp_table": self.exp_table.to_dict() if self.exp_table is not None else None}
+
+
+class DefaultCongestionModel(_ExpModel):
+    """
+    原有的拥堵函数: f(x) = 1 (x ≤ 阈值)，e^x (x ≤ 0.7)，1.2 + e^x (x > 0.7)
+    """
+
+    name = 'default'
+
+    def factor(self, ratio):
+        # 原地修改，避免np.where嵌套产生的临时数组；加0.0不改变结果，与逐条计算完全一致
+        result = self._exp(ratio)
+        result += (ratio > DEFAULT_SECOND_BREAK) * 1.2
+        result[ratio <= self.current_threshold()] = 1.0
+        return result
+
+    def scalar_factor(self, ratio):
+        if ratio <= self.current_threshold():
+            return 1
+        elif ratio <= DEFAULT_SECOND_BREAK:
+            return math.exp(ratio)
+        return 1.2 + math.exp(ratio)
+
+
+class SpecCongestionModel(_ExpModel):
+    """
+    任务说明中的拥堵函数: f(x) = 1 (x ≤ 阈值)，1 + e^x (x > 阈值)
+    """
+
+    name = 'spec'
+
+    def factor(self, ratio):
+        result = self._exp(ratio)
+        result += 1.0
+        result[ratio <= self.current_threshold()] = 1.0
+        return result
+
+    def scalar_factor(self, ratio):
+        return 1 if ratio <= self.current_threshold() else 1 + math.exp(ratio)
+
+
+class BPRCongestionModel(CongestionModel):
+    """
+    美国公路局（BPR）函数: f(x) = 1 + alpha × x^beta，连续且单调，适合交通分配
+    """
+
+    name = 'bpr'
+
+    def __init__(self, alpha: float = 0.15, beta: float = 4.0, scale: float = 1.0):
+        """
+        初始化
+
+        参数:
+            alpha: 系数
+            beta: 指数
+            scale: 常数c
+        """
+        super().__init__(scale)
+        self.alpha = float(alpha)
+        self.beta = float(beta)
+
+    def factor(self, ratio):
+        if self.beta == 4.0:
+            # 整数幂用两次平方计算，比np.power快
+            squared = ratio * ratio
+            return 1.0 + self.alpha * (squared * squared)
+        return 1.0 + self.alpha * np.power(ratio, self.beta)
+
+    def scalar_factor(self, ratio):
+        return 1.0 + self.alpha * ratio ** self.beta
+
+    def params(self) -> dict:
+        return {"alpha": self.alpha, "beta": self.beta}
+
+
+class PiecewiseLinearCongestionModel(CongestionModel):
+    """
+    分段线性表: 在给定的 (n/v, f) 点之间线性插值，超出范围时取端点的值
+    """
+
+    name = 'piecewise'
+
+    def __init__(self, table: Sequence[Tuple[float, float]] = DEFAULT_PIECEWISE_TABLE, scale: float = 1.0):
+        """
+        初始化
+
+        参数:
+            table: (n/v, f) 点的序列，n/v需要严格递增
+            scale: 常数c
+        """
+        super().__init__(scale)
+        points = np.asarray(table, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 1:
+            raise ValueError("分段线性表必须是 (n/v, f) 点的序列")
+        if np.any(np.diff(points[:, 0]) <= 0):
+            raise ValueError("分段线性表的n/v必须严格递增")
+        self.ratios = points[:, 0]
+        self.factors = points[:, 1]
+
+    def factor(self, ratio):
+        return np.interp(ratio, self.ratios, self.factors)
+
+    def scalar_factor(self, ratio):
+        return float(np.interp(ratio, self.ratios, self.factors))
+
+    def params(self) -> dict:
+        return {"table": [[r, f] for r, f in zip(self.ratios.tolist(), self.factors.tolist())]}
+
+
+def create_congestion_model(model_type: str = 'default', scale: float = 1.0, exp_table=None,
+                            **params) -> CongestionModel:
+    """
+    按名称创建拥堵成本模型
+
+    参数:
+        model_type: 模型名称 ('default', 'spec', 'bpr', 'piecewise')
+        scale: 常数c
+        exp_table: 含指数的模型使用的指数表：ExpTable实例、参数字典或True（使用默认参数）
+        params: 模型参数（default/spec: threshold；bpr: alpha、beta；piecewise: table）
+
+    返回:
+        CongestionModel实例
+    """
+    if model_type in ('default', 'spec'):
+        if exp_table is True:
+            exp_table = ExpTable()
+        elif isinstance(exp_table, dict):
+            exp_table = ExpTable(**exp_table)
+        model_class = DefaultCongestionModel if model_type == 'default' else SpecCongestionModel
+        return model_class(scale=scale, exp_table=exp_table or None, **params)
+    if model_type == 'bpr':
+        return BPRCongestionModel(scale=scale, **params)
+    if model_type == 'piecewise':
+        return PiecewiseLinearCongestionModel(scale=scale, **params)
+    raise ValueError(f"未知的拥堵成本模型: {model_type}，可选: {', '.join(CONGESTION_MODEL_TYPES)}")
+
+
+# 当前使用的模型，寻路、交通分配和模拟共用
+_current_model: CongestionModel = DefaultCongestionModel()
+
+
+def get_congestion_model() -> CongestionModel:
+    """返回当前使用的拥堵成本模型"""
+    return _current_model
+
+
+def set_congestion_model(model: Optional[CongestionModel]) -> CongestionModel:
+    """
+    设置当前使用的拥堵成本模型
+
+    参数:
+        model: CongestionModel实例，为None时恢复默认模型
+
+    返回:
+        之前使用的模型
+    """
+    global _current_model
+    previous = _current_model
+    _current_model = model if model is not None else DefaultCongestionModel()
+    return previous
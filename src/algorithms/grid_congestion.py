@@ -0,0 +1,346 @@
+"""
+网格拥堵统计
+每条道路计入其起点所在的网格。道路到网格的分配只在创建时计算一次，
+之后每一步只需对车辆数数组做一次np.bincount；
+能整除最细网格的较粗网格直接由最细网格合并得到，多种分辨率几乎不增加开销。
+CongestionPyramid在此基础上维护 2^z × 2^z 的多级网格，每一级由下一级的2×2网格相加得到
+"""
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .traffic_engine import TrafficState
+
+
+def graph_extent(state: TrafficState) -> Tuple[float, float, float, float]:
+    """
+    计算交通状态中所有顶点的范围
+
+    参数:
+        state: 交通状态（需要顶点坐标）
+
+    返回:
+        (west, south, east, north)
+    """
+    if state.vertex_xy is None or len(state.vertex_xy) == 0:
+        raise ValueError("交通状态没有顶点坐标，无法计算网格拥堵")
+    x_min, y_min = state.vertex_xy.min(axis=0)
+    x_max, y_max = state.vertex_xy.max(axis=0)
+    return float(x_min), float(y_min), float(x_max), float(y_max)
+
+
+class GridCongestion:
+    """
+    增量网格拥堵统计
+
+    网格按行（y方向，从south开始）和列（x方向，从west开始）编号，
+    网格下标为 row × grid_size + col。起点不在统计范围内的道路不计入任何网格
+
+    属性:
+        state: 交通状态
+        bounds: 统计范围 (west, south, east, north)
+        grid_sizes: 支持的网格行/列数，从大到小排列
+        capacity: {网格行/列数: 每个网格的总容量 (grid_size, grid_size)}
+        edge_count: {网格行/列数: 每个网格的道路数量 (grid_size, grid_size)}
+    """
+
+    def __init__(self, state: TrafficState, bounds: Optional[Tuple[float, float, float, float]] = None,
+                 grid_sizes: Iterable[int] = (10,)):
+        """
+        预先计算道路到网格的分配
+
+        参数:
+            state: 交通状态（需要顶点坐标）
+            bounds: 统计范围 (west, south, east, north)，为None时使用所有顶点的范围
+            grid_sizes: 需要统计的网格行/列数
+        """
+        self.state = state
+        self.bounds = tuple(float(value) for value in bounds) if bounds is not None else graph_extent(state)
+        west, south, east, north = self.bounds
+        if east <= west or north <= south:
+            raise ValueError(f"无效的网格范围: {self.bounds}")
+        self.grid_sizes = sorted({int(size) for size in grid_sizes}, reverse=True)
+        if not self.grid_sizes or self.grid_sizes[-1] <= 0:
+            raise ValueError(f"无效的网格大小: {list(grid_sizes)}")
+
+        if state.vertex_xy is None:
+            raise ValueError("交通状态没有顶点坐标，无法计算网格拥堵")
+        xy = state.vertex_xy[state.source]
+        x, y = xy[:, 0], xy[:, 1]
+        self._inside = (x >= west) & (x <= east) & (y >= south) & (y <= north)
+        # 相对位置 [0, 1]，落在east/north边界上的道路计入最后一行/列
+        self._u = (x - west) / (east - west)
+        self._v = (y - south) / (north - south)
+
+        # 需要单独bincount的网格大小；其余大小由能整除它的更细网格合并得到
+        self._cells: Dict[int, np.ndarray] = {}
+        self._derived_from: Dict[int, int] = {}
+        for size in self.grid_sizes:
+            base = next((fine for fine in self._cells if fine % size == 0), None)
+            if base is None:
+                self._cells[size] = self._assign(size)
+            else:
+                self._derived_from[size] = base
+
+        ones = np.ones(len(state))
+        self.capacity = self._aggregate_all(state.capacity)
+        self.edge_count = {size: counts.astype(np.int64) for size, counts in self._aggregate_all(ones).items()}
+
+    def _assign(self, grid_size: int) -> np.ndarray:
+        """计算每条道路所在的网格下标，范围外的道路分配到额外的第 grid_size² 个格子"""
+        col = np.minimum((self._u * grid_size).astype(np.int64), grid_size - 1)
+        row = np.minimum((self._v * grid_size).astype(np.int64), grid_size - 1)
+        cells = row * grid_size + col
+        cells[~self._inside] = grid_size * grid_size
+        return cells
+
+    def _aggregate_all(self, values, indices=None) -> Dict[int, np.ndarray]:
+        """
+        按所有网格大小汇总每条道路的数值，返回 {网格大小: (grid_size, grid_size) 数组}
+        给定indices时values只对应这些道路
+        """
+        result = {}
+        for size, cells in self._cells.items():
+            n_cells = size * size
+            if indices is not None:
+                cells = cells[indices]
+            result[size] = np.bincount(cells, weights=values, minlength=n_cells + 1)[:n_cells].reshape(size, size)
+        for size, base in self._derived_from.items():
+            factor = base // size
+            result[size] = result[base].reshape(size, factor, size, factor).sum(axis=(1, 3))
+        return result
+
+    def aggregate(self, vehicles=None) -> Dict[int, np.ndarray]:
+        """
+        统计每个网格的车辆数
+
+        参数:
+            vehicles: 按道路顺序排列的车辆数数组，默认为state.vehicles
+
+        返回:
+            {网格行/列数: 每个网格的车辆数 (grid_size, grid_size)}
+        """
+        return self._aggregate_all(self.state.vehicles if vehicles is None else vehicles)
+
+    def aggregate_changes(self, indices, delta) -> Dict[int, np.ndarray]:
+        """
+        只统计部分道路的车辆数变化量，加到上一次的统计结果上即得到新的结果
+
+        参数:
+            indices: 车辆数发生变化的道路下标
+            delta: 对应的车辆数变化量
+
+        返回:
+            {网格行/列数: 每个网格的车辆数变化量 (grid_size, grid_size)}
+        """
+        return self._aggregate_all(delta, np.asarray(indices, dtype=np.int64))
+
+    def apply_capacity_changes(self, indices, delta):
+        """
+        部分道路的容量发生变化后，只把变化量加到其所在网格的总容量上
+
+        参数:
+            indices: 容量发生变化的道路下标
+            delta: 对应的容量变化量
+        """
+        changes = self._aggregate_all(delta, np.asarray(indices, dtype=np.int64))
+        for size, change in changes.items():
+            self.capacity[size] = self.capacity[size] + change
+
+    def to_dict(self, grid_size: int, vehicles_per_cell: np.ndarray) -> dict:
+        """
+        将一种网格大小的统计结果转换为接口返回的格式
+
+        参数:
+            grid_size: 网格行/列数
+            vehicles_per_cell: aggregate返回的该网格大小的车辆数
+
+        返回:
+            {"grid_size", "bounds", "cells": [{row, col, bounds, total_capacity, current_vehicles, edge_count}, ...]}
+        """
+        return grid_to_dict(self.bounds, grid_size, self.capacity[grid_size], vehicles_per_cell,
+                            self.edge_count[grid_size])
+
+
+def grid_to_dict(bounds, grid_size: int, capacity: np.ndarray, vehicles: np.ndarray, edge_count: np.ndarray,
+                 rows: Optional[Tuple[int, int]] = None, cols: Optional[Tuple[int, int]] = None,
+                 skip_empty: bool = False) -> dict:
+    """
+    将网格统计数组转换为接口返回的格式
+
+    参数:
+        bounds: 整个网格的范围 (west, south, east, north)
+        grid_size: 网格行/列数
+        capacity: 每个网格的总容量 (grid_size, grid_size)
+        vehicles: 每个网格的车辆数 (grid_size, grid_size)
+        edge_count: 每个网格的道路数量 (grid_size, grid_size)
+        rows: 只输出 [起始行, 结束行) 范围内的网格，为None时输出所有行
+        cols: 只输出 [起始列, 结束列) 范围内的网格，为None时输出所有列
+        skip_empty: 是否跳过没有道路的网格
+
+    返回:
+        {"grid_size", "bounds", "cells": [{row, col, bounds, total_capacity, current_vehicles, edge_count}, ...]}
+    """
+    west, south, east, north = bounds
+    cell_width = (east - west) / grid_size
+    cell_height = (north - south) / grid_size
+    row_start, row_end = rows if rows is not None else (0, grid_size)
+    col_start, col_end = cols if cols is not None else (0, grid_size)
+    block = (slice(row_start, row_end), slice(col_start, col_end))
+    capacity = capacity[block].tolist()
+    vehicles = vehicles[block].astype(np.int64).tolist()
+    edge_count = edge_count[block].tolist()
+    cells = []
+    for i, row in enumerate(range(row_start, row_end)):
+        cell_south = south + row * cell_height
+        for j, col in enumerate(range(col_start, col_end)):
+            if skip_empty and not edge_count[i][j]:
+                continue
+            cell_west = west + col * cell_width
+            cells.append({
+                "row": row,
+                "col": col,
+                "bounds": {"west": cell_west, "south": cell_south,
+                           "east": cell_west + cell_width, "north": cell_south + cell_height},
+                "total_capacity": capacity[i][j],
+                "current_vehicles": vehicles[i][j],
+                "edge_count": edge_count[i][j]
+            })
+    return {
+        "grid_size": grid_size,
+        "bounds": {"west": west, "south": south, "east": east, "north": north},
+        "cells": cells
+    }
+
+
+class CongestionPyramid:
+    """
+    多分辨率拥堵金字塔
+
+    第z级为 2^z × 2^z 的网格（第0级为整个范围），只有最细的一级需要对道路做bincount，
+    其余各级由下一级每2×2个网格相加得到，全部级别的开销只比最细一级略多（约多1/3的网格）
+
+    属性:
+        state: 交通状态
+        bounds: 统计范围 (west, south, east, north)
+        max_level: 最细一级的级别
+        capacity: 每一级每个网格的总容量，按级别排列的数组列表
+        edge_count: 每一级每个网格的道路数量
+        vehicles: 最近一次update时每一级每个网格的车辆数
+    """
+
+    def __init__(self, state: TrafficState, bounds: Optional[Tuple[float, float, float, float]] = None,
+                 max_level: int = 7):
+        """
+        预先计算最细一级的道路到网格分配以及各级的容量和道路数量
+
+        参数:
+            state: 交通状态（需要顶点坐标）
+            bounds: 统计范围 (west, south, east, north)，为None时使用所有顶点的范围
+            max_level: 最细一级的级别，最细一级为 2^max_level × 2^max_level 的网格
+        """
+        if max_level < 0:
+            raise ValueError(f"无效的金字塔级别: {max_level}")
+        self.state = state
+        self.max_level = int(max_level)
+        self._finest_size = 2 ** self.max_level
+        self._grid = GridCongestion(state, bounds, (self._finest_size,))
+        self.bounds = self._grid.bounds
+        self.capacity = self._build_levels(self._grid.capacity[self._finest_size])
+        self.edge_count = self._build_levels(self._grid.edge_count[self._finest_size])
+        self.vehicles: List[np.ndarray] = []
+        self.update()
+
+    @staticmethod
+    def _build_levels(finest: np.ndarray) -> List[np.ndarray]:
+        """由最细一级逐级合并2×2网格，返回从第0级到最细一级的数组列表"""
+        levels = [finest]
+        while len(levels[-1]) > 1:
+            # 先合并相邻两行再合并相邻两列，比reshape后sum快，小数组时尤其明显
+            rows = levels[-1][0::2] + levels[-1][1::2]
+            levels.append(rows[:, 0::2] + rows[:, 1::2])
+        levels.reverse()
+        return levels
+
+    def update(self, vehicles=None):
+        """
+        用当前车辆数更新所有级别
+
+        参数:
+            vehicles: 按道路顺序排列的车辆数数组，默认为state.vehicles
+        """
+        finest = self._grid.aggregate(vehicles)[self._finest_size]
+        # 整体替换列表，读取方不会看到只更新了一部分的级别
+        self.vehicles = self._build_levels(finest)
+
+    def apply_changes(self, indices, delta):
+        """
+        只用发生变化的道路更新所有级别（车辆数为整数时结果与update完全相同）
+
+        参数:
+            indices: 车辆数发生变化的道路下标
+            delta: 对应的车辆数变化量
+        """
+        finest = self.vehicles[-1] + self._grid.aggregate_changes(indices, delta)[self._finest_size]
+        self.vehicles = self._build_levels(finest)
+
+    def apply_capacity_changes(self, indices, delta):
+        """
+        部分道路的容量发生变化后，只用这些道路更新所有级别的网格总容量
+
+        参数:
+            indices: 容量发生变化的道路下标
+            delta: 对应的容量变化量
+        """
+        self._grid.apply_capacity_changes(indices, delta)
+        self.capacity = self._build_levels(self._grid.capacity[self._finest_size])
+
+    def level_for_viewport(self, viewport, pixel_width: float, cell_pixels: float = 48) -> int:
+        """
+        根据视口选择合适的级别，使网格在屏幕上的宽度不超过cell_pixels
+
+        参数:
+            viewport: 视口范围 (west, south, east, north)
+            pixel_width: 视口在屏幕上的宽度（像素）
+            cell_pixels: 期望的网格宽度（像素）
+
+        返回:
+            级别，范围为 [0, max_level]
+        """
+        west, _, east, _ = self.bounds
+        viewport_width = viewport[2] - viewport[0]
+        if viewport_width <= 0 or pixel_width <= 0 or cell_pixels <= 0:
+            return 0
+        cells_across = (east - west) / viewport_width * pixel_width / cell_pixels
+        if cells_across <= 1:
+            return 0
+        return min(self.max_level, math.ceil(math.log2(cells_across)))
+
+    def _cell_range(self, low: float, high: float, origin: float, extent: float, size: int) -> Tuple[int, int]:
+        """计算与 [low, high] 相交的网格行/列范围 [起始, 结束)"""
+        start = int(math.floor((low - origin) / extent * size))
+        end = int(math.floor((high - origin) / extent * size)) + 1
+        return max(start, 0), min(max(end, 0), size)
+
+    def level_dict(self, level: int, viewport=None) -> dict:
+        """
+        将一级网格转换为接口返回的格式，只包含与视口相交且有道路的网格
+
+        参数:
+            level: 级别
+            viewport: 视口范围 (west, south, east, north)，为None时包含整个范围
+
+        返回:
+            {"level", "grid_size", "bounds", "cells": [...]}，格式同GridCongestion.to_dict
+        """
+        if not 0 <= level <= self.max_level:
+            raise ValueError(f"金字塔级别必须在0到{self.max_level}之间")
+        size = 2 ** level
+        rows = cols = None
+        if viewport is not None:
+            west, south, east, north = self.bounds
+            cols = self._cell_range(viewport[0], viewport[2], west, east - west, size)
+            rows = self._cell_range(viewport[1], viewport[3], south, north - south, size)
+        data = grid_to_dict(self.bounds, size, self.capacity[level], self.vehicles[level], self.edge_count[level],
+                            rows, cols, skip_empty=True)
+        data["level"] = level
+        return data
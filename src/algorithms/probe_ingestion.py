@@ -0,0 +1,375 @@
+"""
+探测车（GPS定位点）数据接入
+把观测到的车辆位置批量匹配到道路，按滑动时间窗口汇总，估计每条道路的车辆数和平均速度并写入交通状态，
+之后寻路、增量推送和拥堵统计都使用观测值。
+
+匹配使用数组形式的网格道路索引：每条道路登记到其外包矩形（向外扩展最大匹配距离）覆盖的所有网格，
+一批定位点只需查找所在网格的候选道路，计算点到线段的距离并取最近的一条，全部为向量化运算。
+时间窗口由若干时间桶组成的环形缓冲区实现，时间前进时只需清空过期的桶
+"""
+import math
+from typing import Optional, Tuple
+import numpy as np
+from .traffic_engine import TrafficState
+
+# 默认的滑动窗口长度（秒）和时间桶数量
+DEFAULT_WINDOW = 60.0
+DEFAULT_BUCKETS = 12
+# 默认每辆探测车上报定位点的间隔（秒）
+DEFAULT_PING_INTERVAL = 5.0
+
+
+class EdgeGridMatcher:
+    """
+    基于均匀网格的道路匹配
+
+    网格中登记的是扩展了max_distance的外包矩形，因此与定位点距离不超过max_distance的道路
+    一定登记在定位点所在的网格中，查询时不需要检查相邻网格
+
+    属性:
+        max_distance: 最大匹配距离，超过该距离的定位点不匹配任何道路
+        cell_size: 网格边长
+        origin: 网格左下角坐标
+        shape: 网格的 (列数, 行数)
+    """
+
+    def __init__(self, state: TrafficState, max_distance: Optional[float] = None,
+                 cell_size: Optional[float] = None):
+        """
+        按道路的顶点坐标构建网格索引
+
+        参数:
+            state: 交通状态，需要包含顶点坐标
+            max_distance: 最大匹配距离，为None时取道路长度中位数的一半
+            cell_size: 网格边长，为None时与最大匹配距离相同
+        """
+        if state.vertex_xy is None:
+            raise ValueError("交通状态没有顶点坐标，无法匹配定位点")
+        if max_distance is None:
+            max_distance = float(np.median(state.length)) / 2 if len(state) else 1.0
+        if cell_size is None:
+            cell_size = max_distance
+        if max_distance <= 0 or cell_size <= 0:
+            raise ValueError(f"无效的匹配参数: max_distance={max_distance}, cell_size={cell_size}")
+        self.max_distance = float(max_distance)
+        self.cell_size = float(cell_size)
+
+        xy = state.vertex_xy
+        self._x1, self._y1 = xy[state.source, 0], xy[state.source, 1]
+        self._x2, self._y2 = xy[state.target, 0], xy[state.target, 1]
+        self._dx = self._x2 - self._x1
+        self._dy = self._y2 - self._y1
+        length_sq = self._dx * self._dx + self._dy * self._dy
+        # 长度为0的线段投影比例恒为0（即到起点的距离）
+        self._inverse_length_sq = np.divide(1.0, length_sq, out=np.zeros(len(state)), where=length_sq > 0)
+
+        pad = self.max_distance
+        x_min = np.minimum(self._x1, self._x2) - pad
+        y_min = np.minimum(self._y1, self._y2) - pad
+        x_max = np.maximum(self._x1, self._x2) + pad
+        y_max = np.maximum(self._y1, self._y2) + pad
+        self.origin = (float(x_min.min()), float(y_min.min())) if len(state) else (0.0, 0.0)
+        columns = int(math.floor((float(x_max.max()) - self.origin[0]) / self.cell_size)) + 1 if len(state) else 1
+        rows = int(math.floor((float(y_max.max()) - self.origin[1]) / self.cell_size)) + 1 if len(state) else 1
+        self.shape = (columns, rows)
+
+        # 每条道路覆盖的网格范围，展开为 (网格, 道路) 对后按网格排序，得到CSR形式的网格 -> 道路列表
+        cx0 = ((x_min - self.origin[0]) // self.cell_size).astype(np.int64)
+        cy0 = ((y_min - self.origin[1]) // self.cell_size).astype(np.int64)
+        cx1 = ((x_max - self.origin[0]) // self.cell_size).astype(np.int64)
+        cy1 = ((y_max - self.origin[1]) // self.cell_size).astype(np.int64)
+        widths = cx1 - cx0 + 1
+        counts = widths * (cy1 - cy0 + 1)
+        edges = np.repeat(np.arange(len(state)), counts)
+        offsets = np.arange(len(edges)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = cx0[edges] + offsets % widths[edges]
+        cell_y = cy0[edges] + offsets // widths[edges]
+        cells = cell_y * columns + cell_x
+        order = np.argsort(cells, kind='stable')
+        self._cell_edges = edges[order]
+        self._cell_start = np.zeros(columns * rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=columns * rows), out=self._cell_start[1:])
+
+    def match(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        把一批定位点匹配到最近的道路
+
+        参数:
+            x: 横坐标数组
+            y: 纵坐标数组
+
+        返回:
+            (道路下标数组, 距离数组)，没有匹配到道路的定位点下标为-1，距离为inf
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        n = len(x)
+        matched = np.full(n, -1, dtype=np.int64)
+        distance = np.full(n, np.inf)
+        columns, rows = self.shape
+        cx = np.floor((x - self.origin[0]) / self.cell_size)
+        cy = np.floor((y - self.origin[1]) / self.cell_size)
+        inside = np.flatnonzero((cx >= 0) & (cx < columns) & (cy >= 0) & (cy < rows))
+        if len(inside) == 0:
+            return matched, distance
+        cells = cy[inside].astype(np.int64) * columns + cx[inside].astype(np.int64)
+        begin = self._cell_start[cells]
+        counts = self._cell_start[cells + 1] - begin
+        has_candidates = counts > 0
+        inside, begin, counts = inside[has_candidates], begin[has_candidates], counts[has_candidates]
+        if len(inside) == 0:
+            return matched, distance
+
+        # 展开每个定位点的候选道路，同一定位点的候选在数组中连续
+        group_start = np.cumsum(counts) - counts
+        point = np.repeat(inside, counts)
+        candidate = self._cell_edges[np.arange(len(point)) - np.repeat(group_start - begin, counts)]
+
+        # 点到线段的距离平方：投影比例截断到 [0, 1]
+        px = x[point] - self._x1[candidate]
+        py = y[point] - self._y1[candidate]
+        dx, dy = self._dx[candidate], self._dy[candidate]
+        ratio = (px * dx + py * dy) * self._inverse_length_sq[candidate]
+        np.clip(ratio, 0.0, 1.0, out=ratio)
+        px -= ratio * dx
+        py -= ratio * dy
+        distance_sq = px * px + py * py
+
+        # 每个定位点取距离最小的候选（距离相同时取第一个）
+        nearest = np.minimum.reduceat(distance_sq, group_start)
+        is_nearest = distance_sq == np.repeat(nearest, counts)
+        first = np.flatnonzero(is_nearest)
+        first = first[np.concatenate(([True], point[first[1:]] != point[first[:-1]]))]
+        close = nearest <= self.max_distance * self.max_distance
+        matched[inside[close]] = candidate[first[close]]
+        distance[inside[close]] = np.sqrt(nearest[close])
+        return matched, distance
+
+
+class ProbeIngestor:
+    """
+    探测车数据接入：匹配定位点并按滑动时间窗口汇总
+
+    窗口分为n_buckets个时间桶，桶k保存时间 [k × 桶宽, (k+1) × 桶宽) 内匹配到每条道路的定位点数量和速度之和，
+    按 k mod n_buckets 存放在环形缓冲区中。窗口内的总量随桶的加入和过期增量维护。
+    车辆数估计: 一辆车在窗口内停留在某条道路上时上报 window / ping_interval 个定位点，
+    再除以探测车占全部车辆的比例（penetration）
+
+    属性:
+        state: 交通状态
+        matcher: 道路匹配器
+        window: 窗口长度（秒）
+        ping_interval: 每辆探测车上报定位点的间隔（秒）
+        penetration: 探测车占全部车辆的比例
+        min_pings: 窗口内定位点数量不少于该值的道路才视为有观测
+        pings: 窗口内每条道路的定位点数量
+        speed_sum: 窗口内每条道路有速度的定位点的速度之和
+        speed_pings: 窗口内每条道路有速度的定位点数量
+        latest_time: 已接收的最新时间
+    """
+
+    def __init__(self, state: TrafficState, window: float = DEFAULT_WINDOW, n_buckets: int = DEFAULT_BUCKETS,
+                 ping_interval: float = DEFAULT_PING_INTERVAL, penetration: float = 1.0, min_pings: int = 1,
+                 max_distance: Optional[float] = None, cell_size: Optional[float] = None):
+        """
+        初始化
+
+        参数:
+            state: 交通状态
+            window: 窗口长度（秒）
+            n_buckets: 时间桶数量
+            ping_interval: 每辆探测车上报定位点的间隔（秒）
+            penetration: 探测车占全部车辆的比例 (0, 1]
+            min_pings: 视为有观测的最少定位点数量
+            max_distance: 最大匹配距离，见EdgeGridMatcher
+            cell_size: 网格边长，见EdgeGridMatcher
+        """
+        if window <= 0 or n_buckets <= 0 or ping_interval <= 0 or not 0 < penetration <= 1 or min_pings < 1:
+            raise ValueError(f"无效的探测车数据参数: window={window}, n_buckets={n_buckets}, "
+                             f"ping_interval={ping_interval}, penetration={penetration}, min_pings={min_pings}")
+        self.state = state
+        self.matcher = EdgeGridMatcher(state, max_distance, cell_size)
+        self.window = float(window)
+        self.n_buckets = int(n_buckets)
+        self.bucket_width = self.window / self.n_buckets
+        self.ping_interval = float(ping_interval)
+        self.penetration = float(penetration)
+        self.min_pings = int(min_pings)
+        n_edges = len(state)
+        self._bucket_pings = np.zeros((self.n_buckets, n_edges), dtype=np.int64)
+        self._bucket_speed_sum = np.zeros((self.n_buckets, n_edges))
+        self._bucket_speed_pings = np.zeros((self.n_buckets, n_edges), dtype=np.int64)
+        self.pings = np.zeros(n_edges, dtype=np.int64)
+        self.speed_sum = np.zeros(n_edges)
+        self.speed_pings = np.zeros(n_edges, dtype=np.int64)
+        self._latest_bucket = None
+        self.latest_time = None
+
+    def _advance(self, bucket: int):
+        """窗口前进到bucket：清空从窗口中移出的桶，并从窗口总量中减去"""
+        if self._latest_bucket is not None and bucket <= self._latest_bucket:
+            return
+        if self._latest_bucket is None or bucket - self._latest_bucket >= self.n_buckets:
+            expired = range(self.n_buckets)
+        else:
+            expired = [k % self.n_buckets for k in range(self._latest_bucket + 1, bucket + 1)]
+        for slot in expired:
+            self.pings -= self._bucket_pings[slot]
+            self.speed_sum -= self._bucket_speed_sum[slot]
+            self.speed_pings -= self._bucket_speed_pings[slot]
+            self._bucket_pings[slot] = 0
+            self._bucket_speed_sum[slot] = 0.0
+            self._bucket_speed_pings[slot] = 0
+        self._latest_bucket = bucket
+
+    def ingest(self, t, x, y, speed=None) -> dict:
+        """
+        接入一批定位点（时间可以无序，早于当前窗口的定位点被丢弃）
+
+        参数:
+            t: 时间数组（秒）
+            x: 横坐标数组
+            y: 纵坐标数组
+            speed: 可选的速度数组，NaN表示该定位点没有速度
+
+        返回:
+            {pings: 定位点数量, matched: 匹配到道路的数量, expired: 早于窗口被丢弃的数量}
+        """
+        t = np.asarray(t, dtype=np.float64)
+        n = len(t)
+        if len(x) != n or len(y) != n or (speed is not None and len(speed) != n):
+            raise ValueError("定位点的时间、坐标和速度数组长度必须相同")
+        if n == 0:
+            return {"pings": 0, "matched": 0, "expired": 0}
+        edges, _ = self.matcher.match(x, y)
+        buckets = np.floor(t / self.bucket_width).astype(np.int64)
+        self._advance(int(buckets.max()))
+        self.latest_time = float(t.max()) if self.latest_time is None else max(self.latest_time, float(t.max()))
+
+        fresh = buckets > self._latest_bucket - self.n_buckets
+        keep = (edges >= 0) & fresh
+        edges, buckets = edges[keep], buckets[keep]
+        if speed is not None:
+            speed = np.asarray(speed, dtype=np.float64)[keep]
+        n_edges = len(self.state)
+        # 一批定位点通常只落在一两个桶中，逐桶用bincount汇总
+        for bucket in np.unique(buckets).tolist():
+            slot = bucket % self.n_buckets
+            selected = buckets == bucket
+            bucket_edges = edges[selected]
+            counts = np.bincount(bucket_edges, minlength=n_edges)
+            self._bucket_pings[slot] += counts
+            self.pings += counts
+            if speed is not None:
+                bucket_speed = speed[selected]
+                valid = ~np.isnan(bucket_speed)
+                speed_sum = np.bincount(bucket_edges[valid], weights=bucket_speed[valid], minlength=n_edges)
+                speed_counts = np.bincount(bucket_edges[valid], minlength=n_edges)
+                self._bucket_speed_sum[slot] += speed_sum
+                self.speed_sum += speed_sum
+                self._bucket_speed_pings[slot] += speed_counts
+                self.speed_pings += speed_counts
+        return {"pings": n, "matched": int(keep.sum()), "expired": int(np.count_nonzero(~fresh))}
+
+    def observed(self) -> np.ndarray:
+        """窗口内有观测的道路下标"""
+        return np.flatnonzero(self.pings >= self.min_pings)
+
+    def estimated_vehicles(self, indices=None) -> np.ndarray:
+        """
+        由窗口内的定位点数量估计车辆数
+
+        参数:
+            indices: 道路下标数组，为None时返回所有道路
+
+        返回:
+            车辆数数组
+        """
+        pings = self.pings if indices is None else self.pings[indices]
+        return pings * (self.ping_interval / (self.window * self.penetration))
+
+    def mean_speed(self, indices=None) -> np.ndarray:
+        """
+        窗口内的平均速度
+
+        参数:
+            indices: 道路下标数组，为None时返回所有道路
+
+        返回:
+            速度数组，没有速度观测的道路为NaN
+        """
+        speed_sum = self.speed_sum if indices is None else self.speed_sum[indices]
+        speed_pings = self.speed_pings if indices is None else self.speed_pings[indices]
+        return np.divide(speed_sum, speed_pings, out=np.full(len(speed_sum), np.nan), where=speed_pings > 0)
+
+    def apply_to_state(self, state: Optional[TrafficState] = None) -> np.ndarray:
+        """
+        把有观测的道路的估计车辆数写入交通状态（不超过各道路的车辆数上限），没有观测的道路保持不变
+
+        参数:
+            state: 交通状态，默认为构建时使用的状态
+
+        返回:
+            车辆数发生变化的道路下标
+        """
+        state = state if state is not None else self.state
+        indices = self.observed()
+        vehicles = np.minimum(self.estimated_vehicles(indices), state.upper[indices])
+        changed = indices[vehicles != state.vehicles[indices]]
+        state.vehicles[indices] = vehicles
+        return changed
+
+    def summary(self) -> dict:
+        """
+        窗口的统计信息
+
+        返回:
+            {window_pings, observed_edges, mean_speed, latest_time}
+        """
+        speed_pings = int(self.speed_pings.sum())
+        return {
+            "window_pings": int(self.pings.sum()),
+            "observed_edges": int(np.count_nonzero(self.pings >= self.min_pings)),
+            "mean_speed": float(self.speed_sum.sum()) / speed_pings if speed_pings else None,
+            "latest_time": self.latest_time
+        }
+
+
+def read_probe_file(path: str) -> dict:
+    """
+    读取探测车数据文件（CSV，每行为 时间,x,y[,速度]，可以有一行表头）
+
+    参数:
+        path: 文件路径
+
+    返回:
+        {"t": 时间数组, "x": 横坐标数组, "y": 纵坐标数组, "speed": 速度数组或None}，按时间排序
+    """
+    with open(path, encoding='utf-8') as f:
+        first = f.readline()
+    skip = 0 if first.split(',')[0].strip().lstrip('-').replace('.', '', 1).isdigit() else 1
+    data = np.loadtxt(path, delimiter=',', skiprows=skip, ndmin=2)
+    if data.shape[1] < 3:
+        raise ValueError(f"探测车数据文件至少需要3列（时间,x,y）: {path}")
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    return {"t": data[:, 0], "x": data[:, 1], "y": data[:, 2], "speed": data[:, 3] if data.shape[1] > 3 else None}
+
+
+def iter_probe_batches(pings: dict, batch_seconds: float):
+    """
+    按时间把定位点切分为批次，用于回放文件
+
+    参数:
+        pings: read_probe_file返回的字典（按时间排序）
+        batch_seconds: 每批覆盖的时间长度（秒）
+
+    返回:
+        生成器，依次产生与pings格式相同的字典
+    """
+    t = pings["t"]
+    if len(t) == 0:
+        return
+    batch = np.floor((t - t[0]) / batch_seconds).astype(np.int64)
+    bounds = np.flatnonzero(np.diff(batch)) + 1
+    for lo, hi in zip(np.concatenate(([0], bounds)).tolist(), np.concatenate((bounds, [len(t)])).tolist()):
+        yield {key: None if value is None else value[lo:hi] for key, value in pings.items()}
@@ -0,0 +1,417 @@
+"""
+独立进程中的交通流模拟
+模拟进程每一步把车辆数写入共享内存，使用顺序锁（seqlock）保证读取方得到一致的快照：
+写入前后各把版本号加1，版本号为奇数表示正在写入；读取方复制数据前后版本号相同且为偶数时数据一致，
+否则重试。读取方不需要任何锁，也不会阻塞模拟进程，Web服务进程中的请求处理不再与模拟争用GIL
+"""
+import multiprocessing as mp
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+import numpy as np
+from .traffic_engine import TrafficState, update_traffic_flow_vectorized
+from .traffic_active import ActiveSetTrafficEngine
+from .traffic_ctm import CellTransmissionEngine
+
+# 共享内存头部: int64[4] = 版本号、步数、写入时间（纳秒）、道路数量
+_HEADER_FIELDS = 4
+_HEADER_BYTES = _HEADER_FIELDS * 8
+# 读取方在放弃之前的最大重试次数
+MAX_READ_RETRIES = 1000
+# 模拟进程可以使用的引擎
+PROCESS_ENGINES = ('vectorized', 'active', 'ctm')
+
+
+class SharedTrafficBuffer:
+    """
+    使用顺序锁保护的共享内存车辆数数组（单写多读）
+
+    写入方调用write，读取方调用read。numpy的赋值是普通的内存写入，
+    在x86-64等写入和读取分别按程序顺序可见的平台上，版本号检查足以保证一致性
+
+    属性:
+        name: 共享内存名称，其他进程用attach连接
+        n_edges: 道路数量
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, n_edges: int, owner: bool):
+        """
+        使用已有的共享内存构建缓冲区，请使用create或attach
+
+        参数:
+            shm: 共享内存
+            n_edges: 道路数量
+            owner: 是否由本对象负责删除共享内存
+        """
+        self._shm = shm
+        self._owner = owner
+        self.name = shm.name
+        self.n_edges = n_edges
+        self._header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self._data = np.ndarray((n_edges,), dtype=np.float64, buffer=shm.buf, offset=_HEADER_BYTES)
+
+    @classmethod
+    def create(cls, n_edges: int) -> 'SharedTrafficBuffer':
+        """
+        创建新的共享内存缓冲区
+
+        参数:
+            n_edges: 道路数量
+
+        返回:
+            SharedTrafficBuffer实例
+        """
+        shm = shared_memory.SharedMemory(create=True, size=_HEADER_BYTES + max(n_edges, 1) * 8)
+        buffer = cls(shm, n_edges, owner=True)
+        buffer._header[:] = 0
+        buffer._header[3] = n_edges
+        return buffer
+
+    @classmethod
+    def attach(cls, name: str, n_edges: int) -> 'SharedTrafficBuffer':
+        """
+        连接到已有的共享内存缓冲区
+
+        参数:
+            name: 共享内存名称
+            n_edges: 道路数量
+
+        返回:
+            SharedTrafficBuffer实例
+        """
+        return cls(shared_memory.SharedMemory(name=name), n_edges, owner=False)
+
+    @property
+    def version(self) -> int:
+        """当前版本号，每次写入完成后增加2"""
+        return int(self._header[0])
+
+    def write(self, vehicles, tick: int):
+        """
+        写入一步的车辆数（只能有一个写入方）
+
+        参数:
+            vehicles: 按道路顺序排列的车辆数数组
+            tick: 步数
+        """
+        header = self._header
+        header[0] += 1  # 奇数：正在写入
+        self._data[:] = vehicles
+        header[1] = tick
+        header[2] = time.time_ns()
+        header[0] += 1  # 偶数：写入完成
+
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, int, int, float]:
+        """
+        读取一致的快照，不加锁；写入进行中时重试
+
+        参数:
+            out: 可选的输出数组，长度为道路数量
+
+        返回:
+            (车辆数数组, 步数, 版本号, 写入时间)
+        """
+        header = self._header
+        out = np.empty(self.n_edges) if out is None else out
+        for _ in range(MAX_READ_RETRIES):
+            before = int(header[0])
+            if before & 1:
+                time.sleep(0)
+                continue
+            out[:] = self._data
+            tick = int(header[1])
+            written_at = int(header[2]) / 1e9
+            if int(header[0]) == before:
+                return out, tick, before, written_at
+        raise RuntimeError("读取共享交通状态失败：写入方持续占用")
+
+    def close(self):
+        """释放共享内存（创建方同时删除共享内存）"""
+        self._header = self._data = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # 调用方仍持有指向共享内存的视图，内存在视图释放后回收
+            pass
+        if self._owner:
+            self._shm.unlink()
+            self._owner = False
+
+
+def _rng_from_state(rng_state) -> np.random.Generator:
+    """由bit_generator.state字典重建随机数生成器"""
+    if rng_state is None:
+        return np.random.default_rng()
+    bit_generator = getattr(np.random, rng_state["bit_generator"])()
+    bit_generator.state = rng_state
+    return np.random.Generator(bit_generator)
+
+
+def _simulation_worker(conn, shm_name, state: TrafficState, rng_state, tick: int, interval: float,
+                       active_probability: Optional[float] = None, engine_name: str = 'vectorized'):
+    """
+    模拟进程主循环，engine_name为 vectorized / active（使用active_probability）/ ctm
+
+    没有命令时按interval推进模拟并写入共享内存；命令通过管道接收，每个命令都会回复:
+        ('resume',) / ('pause',): 开始/暂停推进
+        ('interval', 秒): 修改每步间隔
+        ('get_state',): 回复 (车辆数, 随机数生成器状态, 步数)
+        ('set_state', 车辆数或None, 随机数生成器状态或None, 步数或None): 替换模拟状态并立即写入共享内存
+        ('set_capacity', 道路下标, 容量): 修改部分道路的容量，引擎只更新这些道路相关的数组，并立即写入共享内存
+        ('stop',): 结束进程
+    """
+    buffer = SharedTrafficBuffer.attach(shm_name, len(state))
+    rng = _rng_from_state(rng_state)
+    engine = None
+    if engine_name == 'active':
+        engine = ActiveSetTrafficEngine(state, active_probability)
+    elif engine_name == 'ctm':
+        engine = CellTransmissionEngine(state)
+    running = False
+    next_tick = time.monotonic()
+    try:
+        while True:
+            timeout = max(0.0, next_tick - time.monotonic()) if running else None
+            if conn.poll(timeout):
+                command = conn.recv()
+                name = command[0]
+                if name == 'stop':
+                    conn.send(True)
+                    break
+                if name == 'resume':
+                    if not running:
+                        running = True
+                        next_tick = time.monotonic()
+                    conn.send(True)
+                elif name == 'pause':
+                    running = False
+                    conn.send(True)
+                elif name == 'interval':
+                    interval = float(command[1])
+                    conn.send(True)
+                elif name == 'get_state':
+                    conn.send((state.vehicles.copy(), rng.bit_generator.state, tick))
+                elif name == 'set_state':
+                    _, vehicles, new_rng_state, new_tick = command
+                    if vehicles is not None:
+                        state.vehicles[:] = vehicles
+                    if new_rng_state is not None:
+                        rng = _rng_from_state(new_rng_state)
+                    if new_tick is not None:
+                        tick = int(new_tick)
+                    if engine is not None:
+                        engine.reset()
+                    buffer.write(state.vehicles, tick)
+                    conn.send(True)
+                elif name == 'set_capacity':
+                    _, indices, capacity = command
+                    state.set_capacity(indices, capacity)
+                    if engine is not None:
+                        engine.update_edges(indices)
+                    buffer.write(state.vehicles, tick)
+                    conn.send(True)
+                else:
+                    conn.send(ValueError(f"未知的模拟命令: {name}"))
+                continue
+            if not running:
+                continue
+            if engine is not None:
+                engine.step(rng)
+            else:
+                update_traffic_flow_vectorized(state, rng)
+            tick += 1
+            buffer.write(state.vehicles, tick)
+            # 落后超过一步时不再补步，从当前时间重新计时
+            next_tick = max(next_tick + interval, time.monotonic())
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        buffer.close()
+        conn.close()
+
+
+class TrafficSimulationProcess:
+    """
+    在独立进程中运行交通流模拟
+
+    子进程持有交通状态和随机数生成器，按固定间隔推进模拟，每一步写入共享内存；
+    主进程通过snapshot无锁读取最新的车辆数，通过get_state / set_state读取或替换完整状态（用于检查点）
+
+    用法:
+        process = TrafficSimulationProcess(state, interval=2.0).start()
+        process.resume()
+        vehicles, tick, version, written_at = process.snapshot()
+        process.close()
+
+    属性:
+        state: 创建时的交通状态（子进程使用其副本）
+        interval: 每步间隔（秒）
+        active_probability: 使用活动集引擎时每条道路每一步发生随机增减的概率
+        engine: 子进程使用的引擎 vectorized / active / ctm
+    """
+
+    def __init__(self, state: TrafficState, interval: float = 2.0, rng: Optional[np.random.Generator] = None,
+                 tick: int = 0, active_probability: Optional[float] = None, engine: Optional[str] = None):
+        """
+        初始化
+
+        参数:
+            state: 交通状态
+            interval: 每步间隔（秒）
+            rng: 随机数生成器，其状态会复制到子进程
+            tick: 起始步数
+            active_probability: 活动集引擎中每条道路每一步发生随机增减的概率
+            engine: 引擎名称，为None时active_probability不为None则使用活动集引擎，否则使用向量化引擎
+        """
+        if engine is None:
+            engine = 'active' if active_probability is not None else 'vectorized'
+        if engine not in PROCESS_ENGINES:
+            raise ValueError(f"未知的模拟引擎: {engine}，可选: {', '.join(PROCESS_ENGINES)}")
+        if engine == 'active' and active_probability is None:
+            raise ValueError("活动集引擎需要指定active_probability")
+        self.state = state
+        self.interval = interval
+        self.active_probability = active_probability
+        self.engine = engine
+        self._rng_state = rng.bit_generator.state if rng is not None else None
+        self._tick = tick
+        self._buffer = None
+        self._process = None
+        self._conn = None
+        self._running = False
+        self._conn_lock = threading.Lock()  # 多个线程共用同一条管道，命令和回复必须成对
+
+    def start(self) -> 'TrafficSimulationProcess':
+        """创建共享内存并启动子进程（启动后处于暂停状态）"""
+        if self._process is not None:
+            return self
+        self._buffer = SharedTrafficBuffer.create(len(self.state))
+        self._buffer.write(self.state.vehicles, self._tick)
+        parent_conn, child_conn = mp.Pipe()
+        self._process = mp.Process(
+            target=_simulation_worker,
+            args=(child_conn, self._buffer.name, self.state, self._rng_state, self._tick, self.interval,
+                  self.active_probability, self.engine),
+            daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        return self
+
+    def _command(self, *command):
+        """发送命令并等待回复"""
+        if self._process is None:
+            self.start()
+        with self._conn_lock:
+            self._conn.send(command)
+            reply = self._conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    @property
+    def running(self) -> bool:
+        """模拟是否正在推进"""
+        return self._running and self.is_alive()
+
+    def is_alive(self) -> bool:
+        """子进程是否存活"""
+        return self._process is not None and self._process.is_alive()
+
+    def resume(self):
+        """开始推进模拟"""
+        self._command('resume')
+        self._running = True
+
+    def pause(self):
+        """暂停推进模拟"""
+        if self._process is not None:
+            self._command('pause')
+        self._running = False
+
+    def set_interval(self, interval: float):
+        """
+        修改每步间隔
+
+        参数:
+            interval: 每步间隔（秒）
+        """
+        self.interval = interval
+        if self._process is not None:
+            self._command('interval', interval)
+
+    @property
+    def version(self) -> int:
+        """共享内存的版本号，每写入一步增加2"""
+        return self._buffer.version if self._buffer is not None else 0
+
+    def snapshot(self, out: Optional[np.ndarray] = None):
+        """
+        无锁读取最新一步的车辆数
+
+        参数:
+            out: 可选的输出数组
+
+        返回:
+            (车辆数数组, 步数, 版本号, 写入时间)
+        """
+        if self._buffer is None:
+            self.start()
+        return self._buffer.read(out)
+
+    def get_state(self):
+        """
+        读取子进程的完整状态
+
+        返回:
+            (车辆数数组, 随机数生成器, 步数)
+        """
+        vehicles, rng_state, tick = self._command('get_state')
+        return vehicles, _rng_from_state(rng_state), tick
+
+    def set_state(self, vehicles=None, rng: Optional[np.random.Generator] = None, tick: Optional[int] = None):
+        """
+        替换子进程的状态（例如恢复检查点或写入交通分配结果），新的车辆数立即写入共享内存
+
+        参数:
+            vehicles: 车辆数数组，为None时保持不变
+            rng: 随机数生成器，为None时保持不变
+            tick: 步数，为None时保持不变
+        """
+        rng_state = rng.bit_generator.state if rng is not None else None
+        vehicles = None if vehicles is None else np.asarray(vehicles, dtype=np.float64)
+        self._command('set_state', vehicles, rng_state, tick)
+
+    def set_capacity(self, indices, capacity):
+        """
+        修改子进程中部分道路的容量（道路封闭或通行能力下降），截断后的车辆数立即写入共享内存
+
+        参数:
+            indices: 道路下标数组
+            capacity: 新的容量数组
+        """
+        self._command('set_capacity', np.asarray(indices, dtype=np.int64), np.asarray(capacity, dtype=np.float64))
+
+    def close(self):
+        """停止子进程并释放共享内存"""
+        if self._process is not None:
+            try:
+                self._command('stop')
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._conn.close()
+            self._process = self._conn = None
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._running = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
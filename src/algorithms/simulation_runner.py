@@ -0,0 +1,293 @@
+"""
+无界面的交通流模拟运行器
+与WebSocket推送解耦，按指定步数尽可能快地（或按指定频率）推进交通流模拟，
+统计每秒步数、每秒道路更新数以及各阶段耗时，用于容量规划和性能回归测试
+
+命令行用法:
+    python -m src.algorithms.simulation_runner --vertices 20000 --ticks 100
+    python -m src.algorithms.simulation_runner --map data/map_data.json --ticks 50 --rate 10 --json
+    python -m src.algorithms.simulation_runner --engine active --active-probability 0.001 --ticks 500
+    python -m src.algorithms.simulation_runner --engine ctm --cell-length 10 --ticks 100
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict, Optional
+import numpy as np
+from ..models.graph import Graph
+from .traffic_engine import TrafficState, random_vehicle_changes, distribute_vehicles_vectorized
+from .traffic_active import ActiveSetTrafficEngine, DEFAULT_PERTURB_PROBABILITY
+from .traffic_ctm import CellTransmissionEngine
+from .traffic_simulate import update_traffic_flow
+
+# 可选的模拟引擎
+ENGINES = ('vectorized', 'active', 'ctm', 'partitioned', 'python')
+
+
+class SimulationRunner:
+    """
+    交通流模拟运行器
+
+    引擎:
+        vectorized: 向量化引擎，阶段为 random_changes、distribute
+        active: 活动集引擎（每条道路以active_probability的概率发生随机增减），阶段为 step，
+                写回图中和记录历史时只处理变化的道路
+        ctm: 元胞传输模型（道路按cell_length划分单元），阶段为 step
+        partitioned: 分区并行引擎，阶段为 step
+        python: 逐条道路的原始实现（同步更新），阶段为 update
+    sync_to_graph为True时每一步之后把车辆数写回图中，并计入sync_to_graph阶段；
+    提供history时每一步之后记录车辆数，并计入record_history阶段
+
+    属性:
+        graph: 图实例
+        engine: 引擎名称
+        state: 交通状态（python引擎为None）
+        tick: 已执行的步数
+    """
+
+    def __init__(self, graph: Graph, engine: str = 'vectorized', n_partitions: Optional[int] = None,
+                 sync_to_graph: bool = False, seed: Optional[int] = None, history=None,
+                 active_probability: float = DEFAULT_PERTURB_PROBABILITY, cell_length: Optional[float] = None):
+        """
+        初始化运行器
+
+        参数:
+            graph: 图实例
+            engine: 模拟引擎，见ENGINES
+            n_partitions: partitioned引擎的分区数量，默认为CPU核心数
+            sync_to_graph: 是否每一步都把车辆数写回图中
+            seed: 随机数种子
+            history: 可选的TrafficHistory，用于记录每一步的车辆数
+            active_probability: active引擎中每条道路每一步发生随机增减的概率
+            cell_length: ctm引擎的单元长度，为None时取道路长度中位数的一半
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"未知的模拟引擎: {engine}，可选: {', '.join(ENGINES)}")
+        self.graph = graph
+        self.engine = engine
+        self.sync_to_graph = sync_to_graph
+        self.rng = np.random.default_rng(seed)
+        self.state = None if engine == 'python' else TrafficState.from_graph(graph)
+        self.history = history
+        self.tick = 0
+        self._executor = None
+        self._active_engine = None
+        self._active_counts = []
+        if engine == 'active':
+            self._active_engine = ActiveSetTrafficEngine(self.state, active_probability)
+        self._ctm_engine = CellTransmissionEngine(self.state, cell_length) if engine == 'ctm' else None
+        if engine == 'partitioned':
+            from .traffic_partition import PartitionedTrafficExecutor
+            self._executor = PartitionedTrafficExecutor(self.state, n_partitions)
+        self._phase_times: Dict[str, list] = {}
+
+    def _timed(self, phase, function, *args):
+        """执行一个阶段并记录耗时"""
+        start = time.perf_counter()
+        function(*args)
+        self._phase_times.setdefault(phase, []).append(time.perf_counter() - start)
+
+    def _sync_partitioned(self):
+        """将分区引擎的车辆数写回交通状态和图"""
+        self.state.vehicles[:] = self._executor.vehicles
+        self.state.sync_to_graph(self.graph)
+
+    def step(self):
+        """执行一步模拟"""
+        if self.engine == 'vectorized':
+            self._timed('random_changes', random_vehicle_changes, self.state, self.rng)
+            self._timed('distribute', distribute_vehicles_vectorized, self.state)
+            if self.sync_to_graph:
+                self._timed('sync_to_graph', self.state.sync_to_graph, self.graph)
+        elif self.engine == 'active':
+            self._timed('step', self._active_engine.step, self.rng)
+            self._active_counts.append(self._active_engine.active)
+            if self.sync_to_graph:
+                self._timed('sync_to_graph', self.state.sync_to_graph, self.graph, self._active_engine.changed)
+        elif self.engine == 'ctm':
+            self._timed('step', self._ctm_engine.step, self.rng)
+            if self.sync_to_graph:
+                self._timed('sync_to_graph', self.state.sync_to_graph, self.graph, self._ctm_engine.changed)
+        elif self.engine == 'partitioned':
+            self._timed('step', self._executor.step, self.rng)
+            if self.sync_to_graph:
+                self._timed('sync_to_graph', self._sync_partitioned)
+        else:
+            self._timed('update', update_traffic_flow, self.graph, True, self.rng)
+        if self.history is not None:
+            self._timed('record_history', self.history.record, self._current_vehicles())
+        self.tick += 1
+
+    def _current_vehicles(self):
+        """当前车辆数数组"""
+        if self.engine == 'partitioned':
+            return self._executor.vehicles
+        if self.engine in ('vectorized', 'active', 'ctm'):
+            return self.state.vehicles
+        return np.fromiter((edge.current_vehicles for edge in self.graph.edges.values()),
+                           dtype=np.float64, count=len(self.graph.edges))
+
+    def run(self, ticks: int, rate: Optional[float] = None,
+            on_tick: Optional[Callable[['SimulationRunner'], None]] = None) -> dict:
+        """
+        连续执行若干步模拟
+
+        参数:
+            ticks: 步数
+            rate: 每秒步数，为None或0时尽可能快地运行
+            on_tick: 每一步之后调用的回调函数（例如推送数据），参数为运行器，其耗时不计入阶段统计
+
+        返回:
+            运行统计，见report
+        """
+        if self._executor is not None:
+            # 工作进程的启动时间不计入统计
+            self._executor.start()
+        self._phase_times = {}
+        self._active_counts = []
+        tick_times = []
+        interval = 1.0 / rate if rate else 0.0
+        max_lag = 0.0
+        start = time.perf_counter()
+        next_tick = start
+        for _ in range(ticks):
+            tick_start = time.perf_counter()
+            self.step()
+            tick_times.append(time.perf_counter() - tick_start)
+            if on_tick is not None:
+                on_tick(self)
+            if interval:
+                next_tick += interval
+                lag = time.perf_counter() - next_tick
+                if lag > 0:
+                    max_lag = max(max_lag, lag)
+                else:
+                    time.sleep(-lag)
+        elapsed = time.perf_counter() - start
+        return self.report(ticks, elapsed, tick_times, max_lag)
+
+    def report(self, ticks, elapsed, tick_times, max_lag) -> dict:
+        """
+        汇总运行统计
+
+        返回:
+            {engine, edges, ticks, elapsed, ticks_per_sec, edge_updates_per_sec,
+             tick_p50, tick_p95, tick_max, max_lag, phases: {阶段: {total, mean, max}}}，时间单位为秒；
+            active引擎另有active_edges（每步平均重新计算的道路数量），道路更新数按重新计算的道路计；
+            ctm引擎另有cells（单元数量）
+        """
+        n_edges = len(self.graph.edges)
+        tick_times = np.asarray(tick_times) if tick_times else np.zeros(1)
+        updates = sum(self._active_counts) if self.engine == 'active' else ticks * n_edges
+        stats = {
+            "engine": self.engine,
+            "edges": n_edges,
+            "ticks": ticks,
+            "elapsed": elapsed,
+            "ticks_per_sec": ticks / elapsed if elapsed > 0 else float('inf'),
+            "edge_updates_per_sec": updates / elapsed if elapsed > 0 else float('inf'),
+            "tick_p50": float(np.percentile(tick_times, 50)),
+            "tick_p95": float(np.percentile(tick_times, 95)),
+            "tick_max": float(tick_times.max()),
+            "max_lag": max_lag,
+            "phases": {phase: {"total": float(np.sum(times)), "mean": float(np.mean(times)),
+                               "max": float(np.max(times))}
+                       for phase, times in self._phase_times.items()},
+        }
+        if self.engine == 'active':
+            stats["active_edges"] = updates / ticks if ticks else 0.0
+        if self.engine == 'ctm':
+            stats["cells"] = self._ctm_engine.n_cells
+        return stats
+
+    def close(self):
+        """释放分区引擎的工作进程，并把最终车辆数写回图中"""
+        if self._executor is not None:
+            self._executor.close()
+            self._executor = None
+        if self.state is not None:
+            self.state.sync_to_graph(self.graph)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def format_report(stats: dict) -> str:
+    """
+    将运行统计格式化为可读文本
+
+    参数:
+        stats: SimulationRunner.run返回的统计
+
+    返回:
+        多行文本
+    """
+    lines = [
+        f"引擎: {stats['engine']}，道路数: {stats['edges']}",
+        f"步数: {stats['ticks']}，用时 {stats['elapsed']:.4f} 秒",
+        f"吞吐量: {stats['ticks_per_sec']:.2f} 步/秒，{stats['edge_updates_per_sec']:.0f} 道路更新/秒",
+        f"每步耗时: p50 {stats['tick_p50'] * 1000:.2f} 毫秒，p95 {stats['tick_p95'] * 1000:.2f} 毫秒，"
+        f"最大 {stats['tick_max'] * 1000:.2f} 毫秒",
+    ]
+    if 'active_edges' in stats:
+        lines.append(f"每步平均活动道路: {stats['active_edges']:.0f} 条")
+    if 'cells' in stats:
+        lines.append(f"元胞传输单元: {stats['cells']} 个")
+    if stats['max_lag'] > 0:
+        lines.append(f"最大落后: {stats['max_lag'] * 1000:.2f} 毫秒")
+    for phase, timing in stats['phases'].items():
+        lines.append(f"  {phase}: 总计 {timing['total']:.4f} 秒，平均 {timing['mean'] * 1000:.2f} 毫秒，"
+                     f"最大 {timing['max'] * 1000:.2f} 毫秒")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="无界面运行交通流模拟并统计吞吐量")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--map', help="地图JSON文件（export_graph_to_json导出的格式）")
+    source.add_argument('--vertices', type=int, default=10000, help="随机生成地图的顶点数量（默认10000）")
+    parser.add_argument('--ticks', type=int, default=100, help="模拟步数（默认100）")
+    parser.add_argument('--rate', type=float, default=0, help="每秒步数，0表示尽可能快（默认0）")
+    parser.add_argument('--engine', choices=ENGINES, default='vectorized', help="模拟引擎（默认vectorized）")
+    parser.add_argument('--partitions', type=int, default=None, help="partitioned引擎的分区数量")
+    parser.add_argument('--active-probability', type=float, default=DEFAULT_PERTURB_PROBABILITY,
+                        help=f"active引擎中每条道路每一步发生随机增减的概率（默认{DEFAULT_PERTURB_PROBABILITY}）")
+    parser.add_argument('--cell-length', type=float, default=None,
+                        help="ctm引擎的单元长度（默认为道路长度中位数的一半）")
+    parser.add_argument('--sync', action='store_true', help="每一步都把车辆数写回图中")
+    parser.add_argument('--seed', type=int, default=None, help="随机数种子")
+    parser.add_argument('--history', type=int, default=0, help="同时记录最近若干步的交通历史（默认0，不记录）")
+    parser.add_argument('--json', action='store_true', help="以JSON格式输出统计结果")
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    if args.map:
+        from ..exporters.json_exporter import load_graph_from_json
+        graph = load_graph_from_json(args.map)
+    else:
+        from ..generators.random_map import generate_random_points, generate_connected_map
+        graph = generate_connected_map(generate_random_points(n=args.vertices, x_max=2000, y_max=2000))
+    load_time = time.time() - start_time
+
+    history = None
+    if args.history > 0:
+        from .traffic_history import TrafficHistory
+        history = TrafficHistory(len(graph.edges), args.history)
+
+    with SimulationRunner(graph, args.engine, args.partitions, args.sync, args.seed, history,
+                          args.active_probability, args.cell_length) as runner:
+        stats = runner.run(args.ticks, args.rate)
+
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(f"地图: {len(graph.vertices)} 个顶点，{len(graph.edges)} 条边（加载用时 {load_time:.2f} 秒）")
+        print(format_report(stats))
+
+
+if __name__ == "__main__":
+    main()
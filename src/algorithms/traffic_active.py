@@ -0,0 +1,295 @@
+"""
+活动集（稀疏）交通流更新
+向量化引擎每一步都处理所有道路，但大多数道路的车辆数在一步之后并不变化。
+分配一步中道路j的新车辆数只取决于与j相距两跳以内的道路在分配前的车辆数，
+因此只需重新计算这些道路发生了变化的道路；其余道路的结果与上一步相同。
+随机增减也只作用于按概率抽取的一部分道路，每一步的开销与活动道路数量成正比，而与路网规模无关。
+每一步之后导出发生变化的道路下标，供行驶时间、网格统计和增量推送只更新变化的部分
+"""
+from typing import Optional
+import numpy as np
+from scipy import sparse
+from .traffic_engine import TrafficState, MAX_DISTRIBUTE, collect_inflow, congestion_travel_time
+
+# 默认每条道路每一步发生随机增减的概率
+DEFAULT_PERTURB_PROBABILITY = 0.05
+# 一跳范围内的道路超过该比例时，两跳范围已覆盖路网的相当一部分，改为对所有道路做一次向量化计算
+DENSE_FRACTION = 0.04
+
+
+def row_positions(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    返回CSR矩阵中给定各行的非零元素位置（按行依次排列）
+
+    参数:
+        indptr: CSR矩阵的indptr
+        rows: 行下标数组
+
+    返回:
+        非零元素位置数组
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    # 每行的位置从starts开始连续排列：全局序号减去该行之前的元素数再加上starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total)
+
+
+class EdgeSetBuilder:
+    """
+    无重复的道路下标集合合并
+
+    用长度为道路数量的标记数组去重，开销只与输入的下标数量成正比，不需要排序
+    """
+
+    def __init__(self, n_edges: int):
+        """
+        初始化
+
+        参数:
+            n_edges: 道路数量
+        """
+        self._stamp = np.zeros(n_edges, dtype=np.int64)
+
+    def union(self, *parts) -> np.ndarray:
+        """
+        合并若干道路下标数组
+
+        参数:
+            parts: 道路下标数组
+
+        返回:
+            无重复的道路下标数组（顺序不固定）
+        """
+        edges = np.concatenate(parts)
+        order = np.arange(len(edges))
+        # 重复的下标只有最后一次写入的序号保留下来
+        self._stamp[edges] = order
+        return edges[self._stamp[edges] == order]
+
+    def with_neighbors(self, adjacency, edges: np.ndarray) -> np.ndarray:
+        """
+        返回给定道路及其相邻道路的下标
+
+        参数:
+            adjacency: 道路相邻矩阵 (CSR)
+            edges: 道路下标数组
+
+        返回:
+            无重复的道路下标数组（顺序不固定）
+        """
+        return self.union(edges, adjacency.indices[row_positions(adjacency.indptr, edges)])
+
+
+def row_submatrix(adjacency, rows: np.ndarray):
+    """
+    取出CSR矩阵的若干行（列不变），按行求和的顺序与原矩阵相同
+
+    参数:
+        adjacency: CSR矩阵
+        rows: 行下标数组
+
+    返回:
+        (子矩阵, 每个非零元素所在的子矩阵行)
+    """
+    positions = row_positions(adjacency.indptr, rows)
+    counts = adjacency.indptr[rows + 1] - adjacency.indptr[rows]
+    indptr = np.concatenate(([0], np.cumsum(counts)))
+    matrix = sparse.csr_matrix((adjacency.data[positions], adjacency.indices[positions], indptr),
+                               shape=(len(rows), adjacency.shape[1]))
+    return matrix, np.repeat(np.arange(len(rows)), counts)
+
+
+def draw_sparse_vehicle_changes(state: TrafficState, probability: float,
+                                rng: Optional[np.random.Generator] = None):
+    """
+    按概率抽取一部分道路并生成随机车辆变化量
+
+    每条道路以probability的概率被抽中，变化量的分布与draw_vehicle_changes相同；
+    probability为1时与向量化引擎的随机增减等价
+
+    参数:
+        state: 交通状态
+        probability: 每条道路被抽中的概率
+        rng: 随机数生成器，为None时使用默认生成器
+
+    返回:
+        (道路下标数组（升序）, 车辆变化量数组)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    n = len(state)
+    count = int(rng.binomial(n, probability)) if n else 0
+    edges = np.sort(rng.choice(n, size=count, replace=False, shuffle=False)) if count else \
+        np.empty(0, dtype=np.int64)
+    change = rng.integers(-2, 3, size=count).astype(np.float64)
+    return edges, np.where(state.is_mall[edges], np.trunc(change * 1.5), change)
+
+
+class ActiveSetTrafficEngine:
+    """
+    活动集交通流引擎
+
+    每一步:
+        1. 随机增减：只有被抽中的道路（以及上一步被抽中或车辆数变化的道路）需要重新计算分配前的车辆数
+        2. 分配前车辆数变化的道路D：更新其流出量和权重
+        3. D及其相邻道路：重新计算相邻道路权重之和与每单位权重分出的车辆数
+        4. 再向外一跳的道路：重新计算流入量得到新的车辆数
+    与向量化引擎使用相同的公式和求和顺序，对同样的随机增减得到完全相同的结果。
+    state.vehicles原地更新，没有变化的道路不会被写入
+
+    属性:
+        state: 交通状态
+        perturb_probability: 每条道路每一步发生随机增减的概率
+        changed: 最近一步车辆数发生变化的道路下标（顺序不固定）
+        active: 最近一步重新计算的道路数量
+        travel_time: 每条道路的行驶时间，只在车辆数变化的道路上更新
+    """
+
+    def __init__(self, state: TrafficState, perturb_probability: float = DEFAULT_PERTURB_PROBABILITY):
+        """
+        初始化引擎
+
+        参数:
+            state: 交通状态
+            perturb_probability: 每条道路每一步发生随机增减的概率
+        """
+        if not 0 <= perturb_probability <= 1:
+            raise ValueError(f"无效的随机增减概率: {perturb_probability}")
+        self.state = state
+        self.perturb_probability = perturb_probability
+        n = len(state)
+        self._input = np.empty(n)       # 上一步分配前（随机增减之后）的车辆数
+        self._outflow = np.zeros(n)
+        self._remaining = np.zeros(n)
+        self._weights = np.zeros(n)
+        self._per_weight = np.zeros(n)
+        self._change = np.zeros(n)      # 本步被抽中道路的变化量，其余为0
+        self.travel_time = np.empty(n)
+        self.changed = np.empty(0, dtype=np.int64)
+        self.active = 0
+        self._sets = EdgeSetBuilder(n)
+        self.reset()
+
+    def reset(self):
+        """
+        外部修改了state.vehicles之后（例如恢复检查点）调用，下一步重新计算所有道路
+        """
+        n = len(self.state)
+        # NaN与任何值都不相等，下一步所有道路都视为分配前车辆数发生了变化
+        self._input.fill(np.nan)
+        self._pending = np.arange(n)
+        self._perturbed = np.empty(0, dtype=np.int64)
+        self.travel_time[:] = congestion_travel_time(self.state.length, self.state.capacity, self.state.vehicles)
+
+    def update_edges(self, indices):
+        """
+        部分道路的容量被修改之后调用：只更新这些道路的行驶时间，下一步把它们视为分配前车辆数发生了变化，
+        其权重以及两跳以内道路的分配随之重新计算
+
+        参数:
+            indices: 容量发生变化的道路下标数组
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        state = self.state
+        self._input[indices] = np.nan
+        self._pending = self._sets.union(self._pending, indices)
+        self.travel_time[indices] = congestion_travel_time(
+            state.length[indices], state.capacity[indices], state.vehicles[indices])
+
+    def step(self, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        执行一步交通流更新
+
+        参数:
+            rng: 随机数生成器
+
+        返回:
+            车辆数发生变化的道路下标
+        """
+        state = self.state
+        vehicles = state.vehicles
+        perturbed, change = draw_sparse_vehicle_changes(state, self.perturb_probability, rng)
+
+        # 1. 分配前的车辆数：没有被抽中、上一步也没有被抽中且车辆数没有变化的道路与上一步相同
+        candidates = self._sets.union(perturbed, self._pending, self._perturbed)
+        self._perturbed = perturbed
+        self._change[perturbed] = change
+        new_input = vehicles[candidates] + self._change[candidates]
+        self._change[perturbed] = 0.0
+        np.clip(new_input, 0, state.upper[candidates], out=new_input)
+        differs = new_input != self._input[candidates]
+        dirty = candidates[differs]
+        self._input[dirty] = new_input[differs]
+
+        if len(dirty) == 0:
+            self._pending = self.changed = np.empty(0, dtype=np.int64)
+            self.active = 0
+            return self.changed
+
+        # 2. 流出量、剩余车辆数和权重
+        inputs = self._input[dirty]
+        outflow = np.where(inputs > 0, np.minimum(inputs, MAX_DISTRIBUTE), 0.0)
+        self._outflow[dirty] = outflow
+        self._remaining[dirty] = inputs - outflow
+        self._weights[dirty] = state.capacity[dirty] / np.maximum(inputs - outflow, 1)
+
+        adjacency = state.adjacency
+        # 3. 相邻道路权重之和变化的道路（按行切片的矩阵乘法与整体相乘的求和顺序相同）
+        if len(dirty) > DENSE_FRACTION * len(state):
+            return self._dense_step()
+        weight_rows = self._sets.with_neighbors(adjacency, dirty)
+        if len(weight_rows) > DENSE_FRACTION * len(state):
+            return self._dense_step()
+        sub_adjacency, _ = row_submatrix(adjacency, weight_rows)
+        total_weight = sub_adjacency @ self._weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._per_weight[weight_rows] = np.where(total_weight > 0,
+                                                     self._outflow[weight_rows] / total_weight, 0.0)
+
+        # 4. 流入量变化的道路
+        rows = self._sets.with_neighbors(adjacency, weight_rows)
+        sub_adjacency, sub_rows = row_submatrix(adjacency, rows)
+        nnz = sub_adjacency.nnz
+        inflow = collect_inflow(sub_adjacency, sub_rows, self._per_weight, self._weights[rows],
+                                np.empty(nnz), np.empty(nnz), state._unit_adjacency)
+        new_vehicles = self._remaining[rows] + inflow
+
+        moved = new_vehicles != vehicles[rows]
+        self.changed = rows[moved]
+        vehicles[self.changed] = new_vehicles[moved]
+        self.travel_time[self.changed] = congestion_travel_time(
+            state.length[self.changed], state.capacity[self.changed], vehicles[self.changed])
+        self._pending = self.changed
+        self.active = len(rows)
+        return self.changed
+
+    def _dense_step(self) -> np.ndarray:
+        """活动道路过多时对所有道路计算分配（公式与distribute_vehicles_vectorized相同）"""
+        state = self.state
+        vehicles = state.vehicles
+        inputs = self._input
+        np.copyto(self._outflow, np.where(inputs > 0, np.minimum(inputs, MAX_DISTRIBUTE), 0.0))
+        np.subtract(inputs, self._outflow, out=self._remaining)
+        np.divide(state.capacity, np.maximum(self._remaining, 1), out=self._weights)
+
+        adjacency = state.adjacency
+        if adjacency.nnz == 0:
+            new_vehicles = self._remaining.copy()
+        else:
+            total_weight = adjacency @ self._weights
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.copyto(self._per_weight, np.where(total_weight > 0, self._outflow / total_weight, 0.0))
+            new_vehicles = self._remaining + collect_inflow(adjacency, state.adjacency_rows, self._per_weight,
+                                                            self._weights, state._share, state._row_weights,
+                                                            state._unit_adjacency)
+
+        self.changed = np.flatnonzero(new_vehicles != vehicles)
+        vehicles[self.changed] = new_vehicles[self.changed]
+        self.travel_time[self.changed] = congestion_travel_time(
+            state.length[self.changed], state.capacity[self.changed], vehicles[self.changed])
+        self._pending = self.changed
+        self.active = len(state)
+        return self.changed
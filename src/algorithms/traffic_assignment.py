@@ -0,0 +1,327 @@
+"""
+用户均衡交通分配
+使用Frank-Wolfe算法将起讫点出行需求分配到路网上：每次迭代按当前道路流量计算拥堵后的行驶时间
+（默认与寻路共用当前的拥堵成本模型），按最短路径做一次全有全无分配，再沿分配方向做线搜索。
+最短路径树用scipy的Dijkstra按起点批量计算，可以把起点分给多个工作进程并行计算
+"""
+import multiprocessing as mp
+import os
+import time
+from typing import Optional, Tuple
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from .traffic_engine import TrafficState, congestion_travel_time
+from .congestion_models import CongestionModel
+from .traffic_demand import ODDemand
+
+# 道路成本的下限，避免长度为0的道路在稀疏矩阵中被当作不存在
+MIN_COST = 1e-9
+# 一批Dijkstra结果（距离和前驱矩阵）最多包含的元素数
+MAX_BATCH_ELEMENTS = 1 << 23
+
+
+class ShortestPathLoader:
+    """
+    全有全无分配：按给定的道路成本计算最短路径树，把每对起讫点的出行量全部加到其最短路径的道路上
+
+    道路视为双向通行；两个顶点之间有多条道路时只使用成本最低的一条
+    """
+
+    def __init__(self, source, target, n_vertices: int, batch_size: int = 64):
+        """
+        初始化
+
+        参数:
+            source: 道路起点顶点下标数组
+            target: 道路终点顶点下标数组
+            n_vertices: 顶点数量
+            batch_size: 每次调用Dijkstra计算的起点数量
+        """
+        source = np.asarray(source, dtype=np.int64)
+        target = np.asarray(target, dtype=np.int64)
+        self.n_vertices = n_vertices
+        self.n_edges = len(source)
+        self._low = np.minimum(source, target)
+        self._high = np.maximum(source, target)
+        self._pair_key = self._low * n_vertices + self._high
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_ELEMENTS // max(n_vertices, 1)))
+
+    def _network(self, costs):
+        """构建成本矩阵，返回 (稀疏矩阵, 选中道路下标, 选中道路的顶点对键，升序)；成本为无穷大（封闭）的道路不加入"""
+        order = np.lexsort((costs, self._pair_key))
+        keys = self._pair_key[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        first &= np.isfinite(costs[order])
+        chosen = order[first]
+        matrix = sparse.csr_matrix((np.maximum(costs[chosen], MIN_COST), (self._low[chosen], self._high[chosen])),
+                                   shape=(self.n_vertices, self.n_vertices))
+        return matrix, chosen, keys[first]
+
+    def load(self, costs, origins, destinations, trips) -> Tuple[np.ndarray, float]:
+        """
+        按最短路径加载出行量
+
+        参数:
+            costs: 道路成本数组
+            origins: 起点顶点下标数组
+            destinations: 终点顶点下标数组
+            trips: 出行量数组
+
+        返回:
+            (道路流量数组, 无法到达终点的出行量)
+        """
+        flows = np.zeros(self.n_edges)
+        if len(origins) == 0:
+            return flows, 0.0
+        matrix, chosen, chosen_keys = self._network(np.asarray(costs, dtype=np.float64))
+        n = self.n_vertices
+        order = np.argsort(origins, kind='stable')
+        origins, destinations, trips = origins[order], destinations[order], trips[order]
+        unique_origins, starts = np.unique(origins, return_index=True)
+        bounds = np.append(starts, len(origins))
+        unassigned = 0.0
+
+        for batch_start in range(0, len(unique_origins), self.batch_size):
+            batch = unique_origins[batch_start:batch_start + self.batch_size]
+            _, predecessors = csgraph.dijkstra(matrix, directed=False, indices=batch, return_predecessors=True)
+            lo, hi = bounds[batch_start], bounds[batch_start + len(batch)]
+            row = np.repeat(np.arange(len(batch)), np.diff(bounds[batch_start:batch_start + len(batch) + 1]))
+            current, amount = destinations[lo:hi], trips[lo:hi]
+
+            # 终点不可达时其前驱为负数；起点与终点相同的出行不占用道路
+            parent = predecessors[row, current]
+            unreachable = (parent < 0) & (current != batch[row])
+            unassigned += float(amount[unreachable].sum())
+
+            # 所有终点同时沿前驱向起点回溯，记录经过的每个顶点（即最短路径树中进入该顶点的道路）
+            node_parts, amount_parts = [], []
+            while len(current):
+                valid = parent >= 0
+                row, current, parent, amount = row[valid], current[valid], parent[valid], amount[valid]
+                if not len(current):
+                    break
+                node_parts.append(row * n + current)
+                amount_parts.append(amount)
+                current = parent
+                parent = predecessors[row, current]
+            if not node_parts:
+                continue
+            # 先按 (起点, 顶点) 汇总，每条树边只需查找一次对应的道路
+            node_flows = np.bincount(np.concatenate(node_parts), weights=np.concatenate(amount_parts))
+            used = np.nonzero(node_flows)[0]
+            child = used % n
+            parent = predecessors[used // n, child]
+            keys = np.minimum(parent, child) * n + np.maximum(parent, child)
+            edges = chosen[np.searchsorted(chosen_keys, keys)]
+            flows += np.bincount(edges, weights=node_flows[used], minlength=self.n_edges)
+        return flows, unassigned
+
+
+# 工作进程中的全有全无分配器，由_init_worker创建
+_worker_loader = None
+
+
+def _init_worker(source, target, n_vertices, batch_size):
+    """工作进程初始化：路网结构只传输一次"""
+    global _worker_loader
+    _worker_loader = ShortestPathLoader(source, target, n_vertices, batch_size)
+
+
+def _load_chunk(args):
+    """工作进程：加载一组起点的出行量"""
+    costs, origins, destinations, trips = args
+    return _worker_loader.load(costs, origins, destinations, trips)
+
+
+class TrafficAssignment:
+    """
+    Frank-Wolfe用户均衡交通分配
+
+    每次迭代:
+        1. 按当前流量计算每条道路的行驶时间
+        2. 全有全无分配得到辅助流量y（最短路径树可由多个工作进程并行计算）
+        3. 二分搜索步长α，使 Σ(y - x)·t(x + α(y - x)) = 0（行驶时间随流量单调不减）
+        4. x ← x + α(y - x)
+    相对间隙 (Σx·t - Σy·t) / Σx·t 小于容差时停止
+
+    属性:
+        state: 交通状态（提供道路长度、容量和顶点下标）
+        demand: 起讫点出行需求
+        flows: 当前的均衡流量
+        n_workers: 计算最短路径的工作进程数量，1表示在当前进程中计算
+        cost_model: 拥堵成本模型，为None时使用当前模型
+    """
+
+    def __init__(self, state: TrafficState, demand: ODDemand, n_workers: Optional[int] = None,
+                 batch_size: int = 64, cost_model: Optional[CongestionModel] = None):
+        """
+        初始化交通分配
+
+        参数:
+            state: 交通状态
+            demand: 起讫点出行需求，顶点下标与state一致
+            n_workers: 工作进程数量，默认为CPU核心数
+            batch_size: 每次调用Dijkstra计算的起点数量
+            cost_model: 拥堵成本模型，为None时使用当前模型（get_congestion_model）
+        """
+        self.state = state
+        self.cost_model = cost_model
+        self.demand = demand
+        self.n_vertices = demand.n_vertices
+        if state.vertex_xy is not None:
+            self.n_vertices = max(self.n_vertices, len(state.vertex_xy))
+        self.n_workers = max(1, n_workers if n_workers is not None else (os.cpu_count() or 1))
+        self.flows = np.zeros(len(state))
+        self.unassigned = 0.0
+        self._loader = ShortestPathLoader(state.source, state.target, self.n_vertices, batch_size)
+        self._pool = None
+        self._chunks = self._split_demand()
+        if self.n_workers > 1 and len(self._chunks) > 1:
+            self._pool = mp.Pool(self.n_workers, initializer=_init_worker,
+                                 initargs=(state.source, state.target, self.n_vertices, batch_size))
+
+    def _split_demand(self):
+        """按起点把出行需求分成若干组，每组的起点互不重复，分给工作进程"""
+        demand = self.demand
+        if len(demand) == 0:
+            return []
+        order = np.argsort(demand.origins, kind='stable')
+        origins = demand.origins[order]
+        unique_origins, starts = np.unique(origins, return_index=True)
+        n_chunks = min(len(unique_origins), self.n_workers * 4 if self.n_workers > 1 else 1)
+        cuts = [starts[part[0]] for part in np.array_split(np.arange(len(unique_origins)), n_chunks)]
+        cuts.append(len(origins))
+        return [order[cuts[i]:cuts[i + 1]] for i in range(n_chunks)]
+
+    def travel_time(self, flows) -> np.ndarray:
+        """
+        按拥堵函数计算给定流量下的道路行驶时间
+
+        参数:
+            flows: 道路流量数组
+
+        返回:
+            行驶时间数组
+        """
+        return congestion_travel_time(self.state.length, self.state.capacity, flows, self.cost_model)
+
+    def all_or_nothing(self, costs) -> np.ndarray:
+        """
+        全有全无分配
+
+        参数:
+            costs: 道路成本数组
+
+        返回:
+            道路流量数组
+        """
+        demand = self.demand
+        tasks = [(costs, demand.origins[chunk], demand.destinations[chunk], demand.trips[chunk])
+                 for chunk in self._chunks]
+        if self._pool is not None:
+            results = self._pool.map(_load_chunk, tasks)
+        else:
+            results = [self._loader.load(*task) for task in tasks]
+        flows = np.zeros(len(self.state))
+        self.unassigned = 0.0
+        for chunk_flows, unassigned in results:
+            flows += chunk_flows
+            self.unassigned += unassigned
+        return flows
+
+    @staticmethod
+    def _cost_sum(weights, costs) -> float:
+        """Σ weights·costs，跳过成本为无穷大（封闭，流量为0）的道路"""
+        finite = np.isfinite(costs)
+        return float(weights[finite] @ costs[finite])
+
+    def _line_search(self, flows, target, iterations: int = 24) -> float:
+        """二分搜索使目标函数沿方向 target - flows 的方向导数为0的步长"""
+        direction = target - flows
+
+        def slope(alpha):
+            return self._cost_sum(direction, self.travel_time(flows + alpha * direction))
+
+        if slope(1.0) <= 0:
+            return 1.0
+        low, high = 0.0, 1.0
+        for _ in range(iterations):
+            middle = (low + high) / 2
+            if slope(middle) > 0:
+                high = middle
+            else:
+                low = middle
+        return (low + high) / 2
+
+    def solve(self, max_iterations: int = 20, gap_tolerance: float = 1e-3, verbose: bool = False) -> dict:
+        """
+        迭代求解用户均衡
+
+        参数:
+            max_iterations: 最大迭代次数
+            gap_tolerance: 相对间隙容差
+            verbose: 是否打印每次迭代的信息
+
+        返回:
+            {iterations, relative_gap, gaps, elapsed, shortest_path_time, total_travel_time, unassigned}
+        """
+        start_time = time.perf_counter()
+        shortest_path_time = 0.0
+
+        step_start = time.perf_counter()
+        flows = self.all_or_nothing(self.travel_time(np.zeros(len(self.state))))
+        shortest_path_time += time.perf_counter() - step_start
+
+        gaps = []
+        iterations = 0
+        for iterations in range(1, max_iterations + 1):
+            costs = self.travel_time(flows)
+            step_start = time.perf_counter()
+            target = self.all_or_nothing(costs)
+            shortest_path_time += time.perf_counter() - step_start
+
+            current_cost = self._cost_sum(flows, costs)
+            gap = (current_cost - self._cost_sum(target, costs)) / current_cost if current_cost > 0 else 0.0
+            gaps.append(gap)
+            if verbose:
+                print(f"迭代 {iterations}: 相对间隙 {gap:.6f}，总行驶时间 {current_cost:.1f}")
+            if gap < gap_tolerance:
+                break
+            alpha = self._line_search(flows, target)
+            flows = flows + alpha * (target - flows)
+
+        self.flows = flows
+        return {
+            "iterations": iterations,
+            "relative_gap": gaps[-1] if gaps else 0.0,
+            "gaps": gaps,
+            "elapsed": time.perf_counter() - start_time,
+            "shortest_path_time": shortest_path_time,
+            "total_travel_time": self._cost_sum(flows, self.travel_time(flows)),
+            "unassigned": self.unassigned,
+        }
+
+    def apply_to_state(self, state: Optional[TrafficState] = None):
+        """
+        将均衡流量写入交通状态的车辆数（不超过各道路的车辆数上限）
+
+        参数:
+            state: 交通状态，默认为构建时使用的状态
+        """
+        state = state if state is not None else self.state
+        state.vehicles[:] = np.minimum(self.flows, state.upper)
+
+    def close(self):
+        """关闭工作进程"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
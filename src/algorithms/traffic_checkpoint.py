@@ -0,0 +1,185 @@
+"""
+交通模拟检查点
+将模拟状态（车辆数、随机数生成器状态、步数、历史记录）保存为未压缩的NumPy二进制文件，
+并可从文件恢复。保存分为两步：在模拟线程中快速复制状态（内存拷贝），
+然后在后台线程写入文件，写入期间模拟可以继续运行
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+import numpy as np
+from .traffic_engine import TrafficState
+
+# 检查点文件格式版本
+CHECKPOINT_VERSION = 1
+
+
+def capture_checkpoint(state: TrafficState, rng: Optional[np.random.Generator] = None, tick: int = 0,
+                       history=None) -> dict:
+    """
+    复制需要保存的模拟状态
+
+    参数:
+        state: 交通状态
+        rng: 模拟使用的随机数生成器
+        tick: 当前步数
+        history: 可选的TrafficHistory
+
+    返回:
+        数组字典，可传给write_checkpoint
+    """
+    snapshot = {
+        "version": np.array(CHECKPOINT_VERSION),
+        "tick": np.array(tick, dtype=np.int64),
+        "saved_at": np.array(time.time()),
+        "edge_ids": np.asarray(state.edge_ids),
+        "vehicles": state.vehicles.copy(),
+    }
+    if rng is not None:
+        snapshot["rng_state"] = np.array(json.dumps(rng.bit_generator.state))
+    if history is not None:
+        for name, array in history.snapshot().items():
+            snapshot["history_" + name] = array
+    return snapshot
+
+
+def write_checkpoint(path: str, snapshot: dict):
+    """
+    将状态写入检查点文件（先写入临时文件再替换，避免中途失败留下不完整的文件）
+
+    参数:
+        path: 检查点文件路径
+        snapshot: capture_checkpoint返回的数组字典
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        np.savez(f, **snapshot)
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    读取检查点文件
+
+    参数:
+        path: 检查点文件路径
+
+    返回:
+        数组字典
+    """
+    with np.load(path, allow_pickle=False) as data:
+        snapshot = {name: data[name] for name in data.files}
+    version = int(snapshot.get("version", -1))
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"不支持的检查点版本: {version}")
+    return snapshot
+
+
+def restore_checkpoint(snapshot: dict, state: TrafficState, history=None):
+    """
+    将检查点恢复到交通状态和历史记录
+
+    检查点不包含道路容量和交通事件，恢复时保留当前的容量，车辆数不超过当前的上限
+    （例如保存后封闭的道路恢复后没有车辆）
+
+    参数:
+        snapshot: load_checkpoint返回的数组字典
+        state: 要恢复的交通状态，道路必须与保存时一致
+        history: 可选的TrafficHistory，检查点包含历史记录时一并恢复
+
+    返回:
+        (随机数生成器, 步数)，检查点没有保存随机数状态时返回新的随机数生成器
+    """
+    edge_ids = snapshot["edge_ids"]
+    if len(edge_ids) != len(state) or edge_ids.tolist() != list(state.edge_ids):
+        raise ValueError("检查点与当前路网的道路不一致")
+    np.minimum(snapshot["vehicles"], state.upper, out=state.vehicles)
+
+    if "rng_state" in snapshot:
+        rng_state = json.loads(str(snapshot["rng_state"]))
+        bit_generator = getattr(np.random, rng_state["bit_generator"])()
+        bit_generator.state = rng_state
+        rng = np.random.Generator(bit_generator)
+    else:
+        rng = np.random.default_rng()
+
+    if history is not None and "history_buffer" in snapshot:
+        history.restore({name[len("history_"):]: array for name, array in snapshot.items()
+                         if name.startswith("history_")})
+    return rng, int(snapshot["tick"])
+
+
+class CheckpointWriter:
+    """
+    后台检查点写入器
+
+    submit只登记待写入的状态并立即返回；后台线程负责写入文件。
+    上一次写入尚未完成时，新的状态会替换尚未开始写入的状态，只写入最新的一份
+
+    属性:
+        path: 检查点文件路径
+        last_saved: 最近一次写入完成的时间
+        last_duration: 最近一次写入的耗时（秒）
+        last_error: 最近一次写入失败的异常
+    """
+
+    def __init__(self, path: str):
+        """
+        初始化写入器
+
+        参数:
+            path: 检查点文件路径
+        """
+        self.path = path
+        self.last_saved = None
+        self.last_duration = None
+        self.last_error = None
+        self._pending = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, snapshot: dict):
+        """
+        登记一份待写入的状态
+
+        参数:
+            snapshot: capture_checkpoint返回的数组字典
+        """
+        with self._lock:
+            self._pending = snapshot
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """后台线程：写入待写入的状态，直到没有新的状态"""
+        while True:
+            with self._lock:
+                snapshot, self._pending = self._pending, None
+                if snapshot is None:
+                    self._thread = None
+                    return
+            start_time = time.time()
+            try:
+                write_checkpoint(self.path, snapshot)
+                self.last_saved = time.time()
+                self.last_duration = self.last_saved - start_time
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                print(f"写入交通检查点失败: {e}")
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        等待后台写入完成
+
+        参数:
+            timeout: 最长等待时间（秒）
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
@@ -0,0 +1,289 @@
+"""
+元胞传输模型（Cell Transmission Model，CTM）
+每条道路按两个行驶方向拆成两条有向路段，每条路段按长度划分为若干单元（元胞），
+自由流时车辆每一步前进一个单元，因此单元越多的道路通过时间越长。每一步:
+    发送量 S = min(n, Q)，接收量 R = min(Q, w × (N - n))
+    路段内部相邻单元之间的流量为 min(S_上游, R_下游)，下游拥堵时车辆排队并向上游蔓延（溢出）
+    路口: 驶入路口的车辆一部分结束行程，其余按转向比例分配到驶出路段；
+          驶出路段的需求超过其接收量时按比例削减（合流），
+          驶入路段按其最受限的转向同比例削减（分流的先进先出），受阻的车辆留在路段末端单元
+    结束行程的车辆作为新的出行从各路段的首个单元重新进入（按剩余空间成比例），路网中的车辆总数保持不变
+所有计算都是对单元数组或路段数组的向量化运算，路口的转向由路口汇总量得到，每一步的开销与单元数量成线性关系
+"""
+from typing import Optional
+import numpy as np
+from .traffic_engine import TrafficState, draw_vehicle_changes
+
+# 默认每一步自由流行驶的距离（单元长度），为None时取道路长度的中位数的一半
+DEFAULT_CELL_LENGTH = None
+# 拥堵波速与自由流速度之比 w，决定最大流量 Q = N × w / (1 + w)
+DEFAULT_WAVE_RATIO = 0.5
+# 驶入路口的车辆中结束行程的比例
+DEFAULT_EXIT_FRACTION = 0.1
+
+
+class CellTransmissionEngine:
+    """
+    元胞传输模型交通流引擎
+
+    路段下标: 0..E-1 为 source→target 方向，E..2E-1 为 target→source 方向（E为道路数量）。
+    道路的车辆数上限（state.upper）平均分给两个方向的各个单元，作为单元的阻塞车辆数N。
+    转向比例与驶出路段的容量成正比，不允许掉头，除非路口没有其他驶出路段。
+    每一步之后把各道路所有单元的车辆数之和写入state.vehicles，其余模块（推送、网格统计、检查点）无需改动
+
+    属性:
+        state: 交通状态
+        cell_length: 单元长度（每一步自由流行驶的距离）
+        wave_ratio: 拥堵波速与自由流速度之比
+        exit_fraction: 驶入路口的车辆中结束行程（随后从其他路段重新进入）的比例
+        perturb: 是否每一步对道路进行随机增减（作用于两个方向的首个单元，各一半）
+        cells: 单元车辆数数组
+        changed: 最近一步车辆数发生变化的道路下标
+    """
+
+    def __init__(self, state: TrafficState, cell_length: Optional[float] = DEFAULT_CELL_LENGTH,
+                 wave_ratio: float = DEFAULT_WAVE_RATIO, exit_fraction: float = DEFAULT_EXIT_FRACTION,
+                 perturb: bool = True):
+        """
+        初始化引擎并按道路长度划分单元
+
+        参数:
+            state: 交通状态
+            cell_length: 单元长度，为None时取道路长度中位数的一半
+            wave_ratio: 拥堵波速与自由流速度之比 (0, 1]
+            exit_fraction: 驶入路口的车辆中结束行程的比例 [0, 1]
+            perturb: 是否每一步进行随机增减
+        """
+        if not 0 < wave_ratio <= 1 or not 0 <= exit_fraction <= 1:
+            raise ValueError(f"无效的元胞传输模型参数: wave_ratio={wave_ratio}, exit_fraction={exit_fraction}")
+        n_edges = len(state)
+        if cell_length is None:
+            cell_length = float(np.median(state.length)) / 2 if n_edges else 1.0
+        if cell_length <= 0:
+            raise ValueError(f"无效的单元长度: {cell_length}")
+        self.state = state
+        self.cell_length = float(cell_length)
+        self.wave_ratio = float(wave_ratio)
+        self.exit_fraction = float(exit_fraction)
+        self.perturb = perturb
+
+        # 路段：两个方向，单元数按长度四舍五入，至少为1
+        link_edge = np.concatenate((np.arange(n_edges), np.arange(n_edges)))
+        link_from = np.concatenate((state.source, state.target))
+        link_to = np.concatenate((state.target, state.source))
+        cell_counts = np.maximum(np.rint(state.length / self.cell_length), 1).astype(np.int64)
+        link_cells = np.concatenate((cell_counts, cell_counts))
+        self.link_edge = link_edge
+        self.first_cell = np.concatenate(([0], np.cumsum(link_cells)[:-1])).astype(np.int64)
+        self.last_cell = self.first_cell + link_cells - 1
+        n_cells = int(link_cells.sum())
+        self.cell_edge = np.repeat(link_edge, link_cells)
+
+        # 每个单元的阻塞车辆数和最大流量
+        self.jam = np.repeat(np.concatenate((state.upper, state.upper)) / (2 * link_cells), link_cells)
+        self.max_flow = self.jam * (self.wave_ratio / (1 + self.wave_ratio))
+        # 路段内部的单元边界（下游单元为上游单元下标+1）
+        internal = np.ones(n_cells, dtype=bool)
+        internal[self.last_cell] = False
+        self.internal_cells = np.flatnonzero(internal)
+
+        self._build_junctions(link_from, link_to, n_edges)
+        self.cells = np.zeros(n_cells)
+        self.changed = np.empty(0, dtype=np.int64)
+        self.reset()
+
+    def _build_junctions(self, link_from, link_to, n_edges):
+        """
+        预先计算路口分配用到的数组
+
+        驶入路段a到驶出路段b（同一路口，b不是a的反向路段）的转向比例为 c_b / (C - c_反向(a))，
+        其中c为路段所在道路的容量，C为路口所有驶出路段的容量之和；断头路允许掉头，比例为 c_b / C。
+        因此每个驶出路段的需求可以由路口汇总量减去反向路段的贡献得到，不需要逐个转向计算
+        """
+        n_links = len(link_from)
+        n_vertices = int(max(link_from.max(), link_to.max())) + 1 if n_links else 0
+        self.n_vertices = n_vertices
+        self.link_from = link_from
+        self.link_to = link_to
+        self.reverse = np.concatenate((np.arange(n_edges, n_links), np.arange(n_edges)))
+        self.link_capacity = self.state.capacity[self.link_edge]
+
+        out_count = np.bincount(link_from, minlength=n_vertices)
+        self._node_capacity = np.bincount(link_from, weights=self.link_capacity, minlength=n_vertices)
+        # 驶入路段是否到达断头路（路口只有其反向路段一个驶出路段）
+        self._dead_end = out_count[link_to] == 1
+        # 按到达路口排列的驶入路段（CSR），修改容量后只需重新计算相关路口的驶入路段
+        self._incoming = np.argsort(link_to, kind='stable')
+        self._incoming_start = np.concatenate(([0], np.cumsum(np.bincount(link_to, minlength=n_vertices))))
+        self._inverse_denominator = np.zeros(n_links)
+        self._continue = np.zeros(n_links)
+        self._update_junction_terms(np.arange(n_links))
+        # 驶出路段b需要扣除反向路段驶入的部分（断头路除外）
+        self._exclude_reverse = (~self._dead_end[self.reverse]).astype(np.float64)
+
+    def _update_junction_terms(self, links: np.ndarray):
+        """重新计算给定驶入路段的转向比例分母倒数和继续行驶的比例"""
+        denominator = self._node_capacity[self.link_to[links]] - \
+            np.where(self._dead_end[links], 0.0, self.link_capacity[self.reverse[links]])
+        self._inverse_denominator[links] = np.divide(1.0, denominator, out=np.zeros(len(links)),
+                                                     where=denominator > 0)
+        # 路口没有可以驶入的路段（其余驶出道路的容量均为0）时，车辆不会驶出该路段
+        self._continue[links] = (1 - self.exit_fraction) * (denominator > 0)
+
+    def update_edges(self, indices):
+        """
+        部分道路的容量被修改之后调用（state.capacity和state.upper已更新）：
+        只更新这些道路的单元阻塞车辆数和最大流量，以及其端点路口的转向比例，超过新阻塞车辆数的单元被截断
+
+        参数:
+            indices: 容量发生变化的道路下标数组
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        if len(indices) == 0:
+            return
+        state = self.state
+        links = np.concatenate((indices, indices + len(state)))
+        capacity = state.capacity[self.link_edge[links]]
+        np.add.at(self._node_capacity, self.link_from[links], capacity - self.link_capacity[links])
+        self.link_capacity[links] = capacity
+
+        link_cells = self.last_cell[links] - self.first_cell[links] + 1
+        cells = np.repeat(self.first_cell[links] - np.cumsum(link_cells) + link_cells, link_cells) + \
+            np.arange(int(link_cells.sum()))
+        self.jam[cells] = np.repeat(state.upper[self.link_edge[links]] / (2 * link_cells), link_cells)
+        self.max_flow[cells] = self.jam[cells] * (self.wave_ratio / (1 + self.wave_ratio))
+        self.cells[cells] = np.minimum(self.cells[cells], self.jam[cells])
+
+        # 路口汇总容量变化的路口，其所有驶入路段的分母都需要重新计算
+        nodes = np.unique(self.link_from[links])
+        starts = self._incoming_start[nodes]
+        counts = self._incoming_start[nodes + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()))
+        self._update_junction_terms(self._incoming[positions])
+        link_vehicles = np.add.reduceat(self.cells[cells], np.cumsum(link_cells) - link_cells)
+        state.vehicles[indices] = link_vehicles[:len(indices)] + link_vehicles[len(indices):]
+
+    def _outgoing(self, incoming: np.ndarray) -> np.ndarray:
+        """
+        把驶入路段按转向比例分配给驶出路段
+
+        参数:
+            incoming: 每条驶入路段驶入路口的车辆数（已乘以转向比例的分母倒数）
+
+        返回:
+            每条驶出路段分到的车辆数
+        """
+        node_total = np.bincount(self.link_to, weights=incoming, minlength=self.n_vertices)
+        outgoing = node_total[self.link_from] - incoming[self.reverse] * self._exclude_reverse
+        np.maximum(outgoing, 0.0, out=outgoing)
+        outgoing *= self.link_capacity
+        return outgoing
+
+    def _fifo_limit(self, accepted: np.ndarray, constrained: np.ndarray) -> np.ndarray:
+        """
+        每条驶入路段可以驶出的比例: 其所有可用驶出路段接受比例的最小值（先进先出）
+
+        对每个路口求接受比例的最小值和次小值，驶入路段的反向路段恰好是最小值所在路段时取次小值
+
+        参数:
+            accepted: 接受比例数组（只使用constrained中的路段，其余视为1）
+            constrained: 接受比例小于1的驶出路段下标
+
+        返回:
+            每条驶入路段的比例数组
+        """
+        nodes = self.link_from[constrained]
+        values = accepted[constrained]
+        smallest = np.ones(self.n_vertices)
+        np.minimum.at(smallest, nodes, values)
+        owner = np.full(self.n_vertices, -1, dtype=np.int64)
+        is_smallest = values == smallest[nodes]
+        owner[nodes[is_smallest]] = constrained[is_smallest]
+        others = constrained != owner[nodes]
+        second = np.ones(self.n_vertices)
+        np.minimum.at(second, nodes[others], values[others])
+        to = self.link_to
+        return np.where((owner[to] == self.reverse) & ~self._dead_end, second[to], smallest[to])
+
+    @property
+    def n_cells(self) -> int:
+        """单元数量"""
+        return len(self.cells)
+
+    def reset(self):
+        """
+        按state.vehicles重新设置单元车辆数（外部修改了车辆数之后调用）：每条道路的车辆平均分到两个方向的所有单元
+        """
+        link_cells = self.last_cell - self.first_cell + 1
+        per_cell = np.concatenate((self.state.vehicles, self.state.vehicles)) / (2 * link_cells)
+        np.minimum(np.repeat(per_cell, link_cells), self.jam, out=self.cells)
+        self.state.vehicles[:] = self.edge_vehicles()
+
+    def edge_vehicles(self) -> np.ndarray:
+        """各道路两个方向所有单元的车辆数之和"""
+        return np.bincount(self.cell_edge, weights=self.cells, minlength=len(self.state))
+
+    def step(self, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        执行一步元胞传输
+
+        参数:
+            rng: 随机数生成器
+
+        返回:
+            车辆数发生变化的道路下标
+        """
+        state = self.state
+        cells = self.cells
+        if len(cells) == 0:
+            return self.changed
+        if self.perturb:
+            # 随机增减作用于两个方向的首个单元，各一半
+            half = draw_vehicle_changes(state, rng) / 2
+            first = self.first_cell
+            n_edges = len(state)
+            cells[first[:n_edges]] += half
+            cells[first[n_edges:]] += half
+            np.clip(cells, 0, self.jam, out=cells)
+
+        sending = np.minimum(cells, self.max_flow)
+        receiving = np.minimum(self.max_flow, self.wave_ratio * (self.jam - cells))
+
+        # 路段内部
+        upstream = self.internal_cells
+        inner_flow = np.minimum(sending[upstream], receiving[upstream + 1])
+
+        # 路口: 需求按转向比例分配，驶出路段按比例削减，驶入路段按最受限的转向削减
+        arriving = sending[self.last_cell]
+        weighted = arriving * self._continue * self._inverse_denominator
+        demand = self._outgoing(weighted)
+        supply = receiving[self.first_cell]
+        constrained = np.flatnonzero(demand > supply)
+        if len(constrained):
+            accepted = np.ones(len(arriving))
+            accepted[constrained] = supply[constrained] / demand[constrained]
+            limit = self._fifo_limit(accepted, constrained)
+            entering = self._outgoing(weighted * limit)
+        else:
+            limit = 1.0
+            entering = demand
+        finished = arriving * self.exit_fraction
+        leaving = finished + arriving * self._continue * limit
+
+        cells[upstream] -= inner_flow
+        cells[upstream + 1] += inner_flow
+        cells[self.last_cell] -= leaving
+        cells[self.first_cell] += entering
+
+        # 结束行程的车辆按首个单元的剩余空间成比例重新进入
+        trips = finished.sum()
+        if trips > 0:
+            space = np.maximum(self.jam[self.first_cell] - cells[self.first_cell], 0.0)
+            total_space = space.sum()
+            if total_space > 0:
+                cells[self.first_cell] += space * min(trips / total_space, 1.0)
+
+        vehicles = self.edge_vehicles()
+        self.changed = np.flatnonzero(vehicles != state.vehicles)
+        state.vehicles[:] = vehicles
+        return self.changed
@@ -0,0 +1,175 @@
+"""
+出行需求模型
+将地图划分为若干交通小区，按顶点属性（停车场、商场、加油站）计算各顶点的出行产生量和吸引量，
+用重力模型生成起讫点（OD）出行量：起点为小区的代表顶点，终点为具体顶点
+"""
+from typing import Optional
+import numpy as np
+from ..models.graph import Graph
+
+# 出行产生权重：普通顶点为1，停车场产生更多出行
+PARKING_PRODUCTION = 4.0
+# 出行吸引权重：普通顶点为1，商场和停车场吸引更多出行
+MALL_ATTRACTION = 10.0
+PARKING_ATTRACTION = 3.0
+GAS_STATION_ATTRACTION = 1.5
+
+
+class ODDemand:
+    """
+    起讫点出行需求
+
+    起点和终点为顶点下标（graph.vertices的迭代顺序，与TrafficState一致），
+    同一对起讫点只出现一次
+
+    属性:
+        origins: 起点顶点下标数组
+        destinations: 终点顶点下标数组
+        trips: 每对起讫点的出行量
+        n_vertices: 顶点数量
+    """
+
+    def __init__(self, origins, destinations, trips, n_vertices: int):
+        """
+        初始化出行需求
+
+        参数:
+            origins: 起点顶点下标数组
+            destinations: 终点顶点下标数组
+            trips: 出行量数组
+            n_vertices: 顶点数量
+        """
+        self.origins = np.asarray(origins, dtype=np.int64)
+        self.destinations = np.asarray(destinations, dtype=np.int64)
+        self.trips = np.asarray(trips, dtype=np.float64)
+        self.n_vertices = n_vertices
+
+    def __len__(self):
+        """返回起讫点对的数量"""
+        return len(self.origins)
+
+    @property
+    def total_trips(self) -> float:
+        """总出行量"""
+        return float(self.trips.sum())
+
+    def scaled(self, factor: float) -> 'ODDemand':
+        """
+        返回出行量按比例缩放后的需求
+
+        参数:
+            factor: 缩放比例
+
+        返回:
+            新的ODDemand
+        """
+        return ODDemand(self.origins, self.destinations, self.trips * factor, self.n_vertices)
+
+
+def vertex_weights(graph: Graph):
+    """
+    按顶点属性计算出行产生权重和吸引权重
+
+    参数:
+        graph: 图实例
+
+    返回:
+        (产生权重数组, 吸引权重数组)，顺序与graph.vertices一致
+    """
+    vertices = list(graph.vertices.values())
+    n = len(vertices)
+    is_parking = np.fromiter((v.is_parking_lot for v in vertices), dtype=bool, count=n)
+    is_mall = np.fromiter((v.is_shopping_mall for v in vertices), dtype=bool, count=n)
+    is_gas = np.fromiter((v.is_gas_station for v in vertices), dtype=bool, count=n)
+    production = np.where(is_parking, PARKING_PRODUCTION, 1.0)
+    attraction = np.ones(n)
+    attraction[is_gas] = GAS_STATION_ATTRACTION
+    attraction[is_parking] = PARKING_ATTRACTION
+    attraction[is_mall] = MALL_ATTRACTION
+    return production, attraction
+
+
+def zone_centroids(vertex_xy: np.ndarray, production: np.ndarray, zone_grid: int):
+    """
+    将顶点按规则网格划分为交通小区，并为每个小区选择代表顶点
+
+    代表顶点为距离小区内产生权重加权中心最近的顶点
+
+    参数:
+        vertex_xy: 顶点坐标 (V, 2)
+        production: 顶点产生权重
+        zone_grid: 每个方向的小区数量
+
+    返回:
+        (每个顶点所属的小区下标, 非空小区的代表顶点下标数组, 非空小区的下标数组)
+    """
+    low = vertex_xy.min(axis=0)
+    span = np.maximum(vertex_xy.max(axis=0) - low, 1e-9)
+    cell = np.minimum(((vertex_xy - low) / span * zone_grid).astype(np.int64), zone_grid - 1)
+    zone = cell[:, 1] * zone_grid + cell[:, 0]
+
+    order = np.argsort(zone, kind='stable')
+    zones, starts = np.unique(zone[order], return_index=True)
+    centroids = np.empty(len(zones), dtype=np.int64)
+    for i, members in enumerate(np.split(order, starts[1:])):
+        weights = production[members]
+        center = (vertex_xy[members] * weights[:, None]).sum(axis=0) / weights.sum()
+        nearest = np.argmin(((vertex_xy[members] - center) ** 2).sum(axis=1))
+        centroids[i] = members[nearest]
+    return zone, centroids, zones
+
+
+def generate_od_demand(graph: Graph, n_trips: int = 50000, zone_grid: int = 16,
+                       distance_decay: Optional[float] = None,
+                       rng: Optional[np.random.Generator] = None) -> ODDemand:
+    """
+    用重力模型生成起讫点出行需求
+
+    起点小区按小区的产生权重之和抽样，出行从小区的代表顶点出发；
+    终点顶点按 吸引权重 × exp(-距离 / distance_decay) 抽样，因此商场和停车场附近的道路更拥堵。
+    相同的起讫点合并为一对
+
+    参数:
+        graph: 图实例
+        n_trips: 出行总量（抽样次数）
+        zone_grid: 每个方向的小区数量，起点数量最多为 zone_grid²
+        distance_decay: 距离衰减尺度，默认为地图宽度的1/4
+        rng: 随机数生成器
+
+    返回:
+        ODDemand实例
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    vertices = list(graph.vertices.values())
+    n_vertices = len(vertices)
+    if n_vertices < 2 or n_trips <= 0:
+        return ODDemand([], [], [], n_vertices)
+    vertex_xy = np.fromiter((c for v in vertices for c in (v.x, v.y)),
+                            dtype=np.float64, count=2 * n_vertices).reshape(-1, 2)
+    production, attraction = vertex_weights(graph)
+    zone, centroids, zones = zone_centroids(vertex_xy, production, zone_grid)
+    if distance_decay is None:
+        distance_decay = max(float(np.ptp(vertex_xy[:, 0])), 1.0) / 4
+
+    # 各小区的出行数按产生权重之和多项分布抽样
+    zone_production = np.bincount(zone, weights=production)[zones]
+    zone_trips = rng.multinomial(n_trips, zone_production / zone_production.sum())
+
+    origins = []
+    destinations = []
+    for centroid, count in zip(centroids.tolist(), zone_trips.tolist()):
+        if count == 0:
+            continue
+        distance = np.sqrt(((vertex_xy - vertex_xy[centroid]) ** 2).sum(axis=1))
+        weights = attraction * np.exp(-distance / distance_decay)
+        weights[centroid] = 0.0
+        sampled = rng.choice(n_vertices, size=count, p=weights / weights.sum())
+        origins.append(np.full(count, centroid, dtype=np.int64))
+        destinations.append(sampled)
+    if not origins:
+        return ODDemand([], [], [], n_vertices)
+
+    # 合并相同的起讫点
+    keys = np.concatenate(origins) * n_vertices + np.concatenate(destinations)
+    keys, trips = np.unique(keys, return_counts=True)
+    return ODDemand(keys // n_vertices, keys % n_vertices, trips, n_vertices)
@@ -0,0 +1,362 @@
+"""
+向量化交通流模拟引擎
+将道路状态保存为NumPy数组，道路之间的相邻关系保存为稀疏矩阵，
+一次模拟更新只需少量向量化运算，适用于大规模路网
+"""
+from typing import Dict, Optional
+import numpy as np
+from scipy import sparse
+from ..models.graph import Graph
+from .congestion_models import CongestionModel, get_congestion_model
+
+# 交通流量等级的分界值，与get_edge_traffic_level一致
+LEVEL_THRESHOLDS = np.array([0.5, 0.7, 0.8, 0.9])
+# 各等级对应的颜色，与get_traffic_color一致
+LEVEL_COLORS = ["#00FF00", "#90EE90", "#FFFF00", "#FFA500", "#FF0000"]
+# 每条道路每次最多分配到相邻道路的车辆数
+MAX_DISTRIBUTE = 5
+
+
+class TrafficState:
+    """
+    交通状态的数组表示
+
+    所有数组的下标与edge_ids一一对应（即graph.edges的迭代顺序）
+
+    属性:
+        edge_ids: 道路ID列表
+        source: 起点顶点下标
+        target: 终点顶点下标
+        length: 道路长度
+        capacity: 道路容量
+        vehicles: 当前车辆数
+        is_mall: 是否连接商场
+        upper: 车辆数上限
+        vertex_xy: 顶点坐标 (V, 2)，可能为None
+        vertex_is_mall: 各顶点是否为商场 (V,)，可能为None
+        adjacency: 道路相邻矩阵 (CSR)，adjacency[i, j] 为道路i与道路j共享的顶点数
+    """
+
+    def __init__(self, edge_ids, source, target, length, capacity, vehicles, is_mall, vertex_xy=None,
+                 vertex_is_mall=None):
+        """
+        从数组构建交通状态
+
+        参数:
+            edge_ids: 道路ID列表
+            source: 起点顶点下标数组
+            target: 终点顶点下标数组
+            length: 道路长度数组
+            capacity: 道路容量数组
+            vehicles: 当前车辆数数组
+            is_mall: 是否连接商场的布尔数组
+            vertex_xy: 可选的顶点坐标数组 (V, 2)，用于按空间划分道路
+            vertex_is_mall: 可选的顶点是否为商场的布尔数组，用于确定商场附近的道路
+        """
+        self.edge_ids = list(edge_ids)
+        self.edge_index = {edge_id: i for i, edge_id in enumerate(self.edge_ids)}
+        self.source = np.asarray(source, dtype=np.int64)
+        self.target = np.asarray(target, dtype=np.int64)
+        self.length = np.asarray(length, dtype=np.float64)
+        self.capacity = np.asarray(capacity, dtype=np.float64)
+        self.vehicles = np.asarray(vehicles, dtype=np.float64).copy()
+        self.is_mall = np.asarray(is_mall, dtype=bool)
+        # 车辆数上限：普通道路为容量的1.05倍，连接商场的道路为容量
+        self.upper = np.where(self.is_mall, self.capacity, self.capacity * 1.05)
+        self.vertex_xy = None if vertex_xy is None else np.asarray(vertex_xy, dtype=np.float64)
+        self.vertex_is_mall = None if vertex_is_mall is None else np.asarray(vertex_is_mall, dtype=bool)
+        # 双缓冲：每一步从vehicles读取，写入_back后交换
+        self._back = np.empty_like(self.vehicles)
+        self.adjacency = build_edge_adjacency(self.source, self.target)
+        # 每个非零元素所在的行，用于按行广播
+        self.adjacency_rows = np.repeat(np.arange(len(self.edge_ids)), np.diff(self.adjacency.indptr))
+        # 分配车辆时复用的缓冲区，避免每次更新重新申请大数组
+        self._share = np.empty(self.adjacency.nnz)
+        self._row_weights = np.empty(self.adjacency.nnz)
+        # 没有平行道路时相邻矩阵元素全为1，分配时可省去一次乘法
+        self._unit_adjacency = bool(np.all(self.adjacency.data == 1))
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'TrafficState':
+        """
+        从图构建交通状态
+
+        参数:
+            graph: 图实例
+
+        返回:
+            TrafficState实例
+        """
+        vertex_index = {vertex_id: i for i, vertex_id in enumerate(graph.vertices)}
+        edges = list(graph.edges.values())
+        n = len(edges)
+        vertex_xy = np.fromiter((c for v in graph.vertices.values() for c in (v.x, v.y)),
+                                dtype=np.float64, count=2 * len(vertex_index)).reshape(-1, 2)
+        return cls(
+            list(graph.edges.keys()),
+            np.fromiter((vertex_index[e.vertex1.id] for e in edges), dtype=np.int64, count=n),
+            np.fromiter((vertex_index[e.vertex2.id] for e in edges), dtype=np.int64, count=n),
+            np.fromiter((e.length for e in edges), dtype=np.float64, count=n),
+            np.fromiter((e.capacity for e in edges), dtype=np.float64, count=n),
+            np.fromiter((e.current_vehicles for e in edges), dtype=np.float64, count=n),
+            np.fromiter((e.is_mall_connection for e in edges), dtype=bool, count=n),
+            vertex_xy,
+            np.fromiter((v.is_shopping_mall for v in graph.vertices.values()), dtype=bool, count=len(vertex_index)),
+        )
+
+    def __len__(self):
+        """返回道路数量"""
+        return len(self.edge_ids)
+
+    def sync_to_graph(self, graph: Graph, indices=None):
+        """
+        将车辆数写回图中的道路对象
+
+        参数:
+            graph: 构建状态时使用的图
+            indices: 只写回这些道路（例如活动集引擎导出的变化道路），为None时写回所有道路
+        """
+        if indices is None:
+            for edge_id, vehicles in zip(self.edge_ids, self.vehicles.tolist()):
+                graph.edges[edge_id].current_vehicles = vehicles
+            return
+        edge_ids = self.edge_ids
+        for i, vehicles in zip(indices.tolist(), self.vehicles[indices].tolist()):
+            graph.edges[edge_ids[i]].current_vehicles = vehicles
+
+    def set_capacity(self, indices, capacity) -> np.ndarray:
+        """
+        修改部分道路的容量（例如道路封闭或事故导致通行能力下降），同时更新车辆数上限，
+        超过新上限的车辆数截断到上限
+
+        参数:
+            indices: 道路下标数组
+            capacity: 新的容量数组，0表示道路封闭
+
+        返回:
+            车辆数被截断的道路下标
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        capacity = np.asarray(capacity, dtype=np.float64)
+        self.capacity[indices] = capacity
+        self.upper[indices] = np.where(self.is_mall[indices], capacity, capacity * 1.05)
+        over = self.vehicles[indices] > self.upper[indices]
+        clipped = indices[over]
+        self.vehicles[clipped] = self.upper[clipped]
+        return clipped
+
+    def sync_from_graph(self, graph: Graph):
+        """
+        从图中的道路对象读取车辆数（例如外部修改了道路状态之后）
+
+        参数:
+            graph: 构建状态时使用的图
+        """
+        self.vehicles[:] = np.fromiter((graph.edges[edge_id].current_vehicles for edge_id in self.edge_ids),
+                                       dtype=np.float64, count=len(self.edge_ids))
+
+
+def build_edge_adjacency(source, target) -> sparse.csr_matrix:
+    """
+    构建道路相邻矩阵：两条道路共享顶点即为相邻，对角线为0
+
+    通过顶点-道路关联矩阵B计算 B^T B 得到
+
+    参数:
+        source: 起点顶点下标数组
+        target: 终点顶点下标数组
+
+    返回:
+        CSR格式的相邻矩阵，元素为共享的顶点数
+    """
+    n_edges = len(source)
+    if n_edges == 0:
+        return sparse.csr_matrix((0, 0), dtype=np.float64)
+    n_vertices = int(max(source.max(), target.max())) + 1
+    rows = np.concatenate((source, target))
+    cols = np.concatenate((np.arange(n_edges), np.arange(n_edges)))
+    incidence = sparse.csr_matrix((np.ones(2 * n_edges), (rows, cols)), shape=(n_vertices, n_edges))
+    adjacency = (incidence.T @ incidence).tocsr()
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    adjacency.sort_indices()
+    return adjacency
+
+
+def draw_vehicle_changes(state: TrafficState, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    一次批量生成所有道路的随机车辆变化量
+
+    普通道路变化-2到2辆，连接商场的道路变化量乘以1.5（向零取整），与update_traffic_flow一致
+
+    参数:
+        state: 交通状态
+        rng: 随机数生成器，为None时使用默认生成器
+
+    返回:
+        车辆变化量数组
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    change = rng.integers(-2, 3, size=len(state)).astype(np.float64)
+    return np.where(state.is_mall, np.trunc(change * 1.5), change)
+
+
+def random_vehicle_changes(state: TrafficState, rng: Optional[np.random.Generator] = None):
+    """
+    随机增减每条道路的车辆数
+
+    普通道路不超过容量的1.05倍，连接商场的道路不超过容量
+
+    参数:
+        state: 交通状态
+        rng: 随机数生成器，为None时使用默认生成器
+    """
+    change = draw_vehicle_changes(state, rng)
+    np.clip(state.vehicles + change, 0, state.upper, out=state.vehicles)
+
+
+def distribute_vehicles_vectorized(state: TrafficState):
+    """
+    将车辆分配到相邻的道路（同步更新）
+
+    每条道路取出最多MAX_DISTRIBUTE辆车，按相邻道路的权重 capacity / max(vehicles, 1)
+    向下取整分配给相邻道路。所有道路都从当前缓冲区读取同一时刻的状态，
+    结果写入另一个缓冲区后交换，因此结果与道路顺序无关且可复现
+
+    参数:
+        state: 交通状态
+    """
+    vehicles = state.vehicles
+    outflow = np.where(vehicles > 0, np.minimum(vehicles, MAX_DISTRIBUTE), 0.0)
+    remaining = vehicles - outflow
+    back = state._back
+
+    adjacency = state.adjacency
+    if adjacency.nnz == 0:
+        back[:] = remaining
+    else:
+        weights = state.capacity / np.maximum(remaining, 1)
+        # 每条道路的相邻道路权重之和，以及每单位权重分到的车辆数
+        total_weight = adjacency @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_weight = np.where(total_weight > 0, outflow / total_weight, 0.0)
+        back[:] = remaining + collect_inflow(adjacency, state.adjacency_rows, per_weight, weights,
+                                             state._share, state._row_weights, state._unit_adjacency)
+
+    state.vehicles, state._back = back, vehicles
+
+
+def collect_inflow(adjacency, adjacency_rows, per_weight, row_weights_source, share, row_weights, unit_adjacency):
+    """
+    计算每行道路从相邻道路流入的车辆数
+
+    相邻矩阵对称，道路j的流入量为第j行上 floor(per_weight[i] * weights[j]) 之和，
+    按行求和可直接用CSR矩阵乘法完成，避免散射写入
+
+    参数:
+        adjacency: 相邻矩阵（可以只包含部分行，列下标与per_weight对应）
+        adjacency_rows: 每个非零元素所在的行
+        per_weight: 各列道路每单位权重分出的车辆数
+        row_weights_source: 各行道路的权重
+        share: 长度为非零元素数量的缓冲区
+        row_weights: 长度为非零元素数量的缓冲区
+        unit_adjacency: 相邻矩阵元素是否全为1
+
+    返回:
+        每行道路的流入车辆数
+    """
+    np.take(per_weight, adjacency.indices, out=share, mode='clip')
+    np.take(row_weights_source, adjacency_rows, out=row_weights, mode='clip')
+    share *= row_weights
+    np.floor(share, out=share)
+    if not unit_adjacency:
+        share *= adjacency.data
+    return sparse.csr_matrix((share, adjacency.indices, adjacency.indptr), shape=adjacency.shape) \
+        @ np.ones(adjacency.shape[1])
+
+
+def update_traffic_flow_vectorized(state: TrafficState, rng: Optional[np.random.Generator] = None):
+    """
+    向量化地执行一次交通流更新（随机增减 + 向相邻道路分配）
+
+    参数:
+        state: 交通状态
+        rng: 随机数生成器
+    """
+    random_vehicle_changes(state, rng)
+    distribute_vehicles_vectorized(state)
+
+
+def calculate_travel_time_vectorized(state: TrafficState, model: Optional[CongestionModel] = None) -> np.ndarray:
+    """
+    计算所有道路的行驶时间，拥堵函数与calculate_travel_time一致
+
+    参数:
+        state: 交通状态
+        model: 拥堵成本模型，默认为当前模型
+
+    返回:
+        行驶时间数组
+    """
+    return congestion_travel_time(state.length, state.capacity, state.vehicles, model)
+
+
+def congestion_travel_time(length, capacity, vehicles, model: Optional[CongestionModel] = None) -> np.ndarray:
+    """
+    按拥堵成本模型计算行驶时间：c × 长度 × f(车辆数/容量)，与congestion_factor使用同一个模型
+
+    参数:
+        length: 道路长度数组
+        capacity: 道路容量数组
+        vehicles: 车辆数数组
+        model: 拥堵成本模型，默认为当前模型（get_congestion_model）
+
+    返回:
+        行驶时间数组
+    """
+    return (model if model is not None else get_congestion_model()).travel_time(length, capacity, vehicles)
+
+
+def traffic_levels(vehicles, capacity) -> np.ndarray:
+    """
+    按车辆数与容量之比计算交通流量等级 (0-4)，容量为0（封闭）的道路为0级
+
+    参数:
+        vehicles: 车辆数数组，可以是 (帧数, 道路数) 的二维数组
+        capacity: 道路容量数组
+
+    返回:
+        等级数组，形状与vehicles和capacity广播后的形状相同
+    """
+    vehicles = np.asarray(vehicles, dtype=np.float64)
+    capacity = np.asarray(capacity, dtype=np.float64)
+    ratio = np.zeros(np.broadcast_shapes(vehicles.shape, capacity.shape))
+    np.divide(vehicles, capacity, out=ratio, where=capacity > 0)
+    return np.searchsorted(LEVEL_THRESHOLDS, ratio, side='right')
+
+
+def get_traffic_level_vectorized(state: TrafficState) -> np.ndarray:
+    """
+    获取所有道路的交通流量等级 (0-4)，容量为0（封闭）的道路为0级
+
+    参数:
+        state: 交通状态
+
+    返回:
+        等级数组
+    """
+    return traffic_levels(state.vehicles, state.capacity)
+
+
+def get_traffic_color_vectorized(state: TrafficState) -> Dict[str, str]:
+    """
+    获取所有道路的交通颜色
+
+    参数:
+        state: 交通状态
+
+    返回:
+        每条道路的颜色字典 {edge_id: color}
+    """
+    levels = get_traffic_level_vectorized(state).tolist()
+    return {edge_id: LEVEL_COLORS[level] for edge_id, level in zip(state.edge_ids, levels)}
@@ -0,0 +1,445 @@
+"""
+蒙特卡洛集合模拟
+对若干情景（封闭道路、扩容、商场需求增加等）各运行多个使用不同随机数种子的独立模拟副本，
+副本分给进程池中的工作进程并行执行。路网结构在创建进程池时传给工作进程一次
+（Linux上通过fork按写时复制共享，不会复制）。每个副本边运行边把道路拥堵度 (车辆数/容量)
+累加到固定分箱的直方图中，主进程收到一个副本的结果就合并到所属情景并丢弃，
+内存占用与步数和副本数量无关，只与情景数 × 道路数 × 分箱数成正比
+"""
+import copy
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from .traffic_engine import TrafficState, random_vehicle_changes, distribute_vehicles_vectorized
+
+# 拥堵度直方图的默认分箱宽度和上限，超过上限的值计入最后一个分箱
+DEFAULT_BIN_WIDTH = 0.05
+DEFAULT_MAX_RATIO = 2.0
+
+
+class Scenario:
+    """
+    集合模拟的一个情景
+
+    属性:
+        name: 情景名称
+        closed_edges: 封闭的道路ID，封闭道路的容量和车辆数为0，相邻道路不会向其分配车辆
+        capacity_scale: 所有道路的容量倍数
+        capacity_factors: 道路ID -> 容量倍数（在capacity_scale的基础上再相乘）
+        mall_demand: 需求道路每一步平均额外驶入的车辆数（泊松分布）
+        demand_edges: 额外驶入车辆的道路ID，为None时为所有与商场顶点相连的道路
+    """
+
+    def __init__(self, name: str, closed_edges: Iterable = (), capacity_scale: float = 1.0,
+                 capacity_factors: Optional[Dict] = None, mall_demand: float = 0.0,
+                 demand_edges: Optional[Iterable] = None):
+        """
+        初始化情景
+
+        参数:
+            name: 情景名称
+            closed_edges: 封闭的道路ID
+            capacity_scale: 所有道路的容量倍数
+            capacity_factors: 道路ID -> 容量倍数
+            mall_demand: 需求道路每一步平均额外驶入的车辆数
+            demand_edges: 额外驶入车辆的道路ID，为None时为所有与商场顶点相连的道路
+        """
+        if capacity_scale <= 0 or mall_demand < 0:
+            raise ValueError(f"无效的情景参数: capacity_scale={capacity_scale}, mall_demand={mall_demand}")
+        self.name = name
+        self.closed_edges = list(closed_edges)
+        self.capacity_scale = float(capacity_scale)
+        self.capacity_factors = dict(capacity_factors or {})
+        self.mall_demand = float(mall_demand)
+        self.demand_edges = None if demand_edges is None else list(demand_edges)
+
+    def resolve(self, state: TrafficState):
+        """
+        把道路ID转换为交通状态中的下标
+
+        参数:
+            state: 交通状态
+
+        返回:
+            (封闭道路下标数组, 容量倍数数组或None, 需求道路下标数组或None, mall_demand)
+
+        异常:
+            ValueError: 道路不存在、容量倍数不是正数，或mall_demand大于0时没有需求道路
+        """
+        try:
+            closed = np.array([state.edge_index[edge_id] for edge_id in self.closed_edges], dtype=np.int64)
+            demand = None
+            if self.mall_demand > 0:
+                demand = mall_edges(state) if self.demand_edges is None else \
+                    np.array([state.edge_index[edge_id] for edge_id in self.demand_edges], dtype=np.int64)
+            factors = None
+            if self.capacity_scale != 1.0 or self.capacity_factors:
+                factors = np.full(len(state), self.capacity_scale)
+                for edge_id, factor in self.capacity_factors.items():
+                    factors[state.edge_index[edge_id]] *= factor
+        except KeyError as e:
+            raise ValueError(f"情景 {self.name} 中的道路不存在: {e.args[0]}") from None
+        if factors is not None and np.any(factors <= 0):
+            raise ValueError(f"情景 {self.name} 中的容量倍数必须为正数")
+        if demand is not None and len(demand) == 0:
+            raise ValueError(f"情景 {self.name} 没有可以增加商场需求的道路，请通过demand_edges指定")
+        return closed, factors, demand, self.mall_demand
+
+    def to_dict(self) -> dict:
+        """返回情景的描述"""
+        return {"name": self.name, "closed_edges": self.closed_edges, "capacity_scale": self.capacity_scale,
+                "capacity_factors": self.capacity_factors, "mall_demand": self.mall_demand,
+                "demand_edges": self.demand_edges}
+
+
+def mall_edges(state: TrafficState) -> np.ndarray:
+    """
+    与商场顶点相连的道路下标，没有顶点信息时使用道路自身的is_mall标记
+
+    参数:
+        state: 交通状态
+
+    返回:
+        道路下标数组
+    """
+    if state.vertex_is_mall is None:
+        return np.flatnonzero(state.is_mall)
+    return np.flatnonzero(state.vertex_is_mall[state.source] | state.vertex_is_mall[state.target] | state.is_mall)
+
+
+def scenario_state(base: TrafficState, closed: np.ndarray, factors: Optional[np.ndarray]) -> TrafficState:
+    """
+    按情景修改容量后的交通状态，道路结构（相邻矩阵等）与base共用
+
+    参数:
+        base: 基准交通状态
+        closed: 封闭道路下标数组
+        factors: 容量倍数数组，为None时容量不变
+
+    返回:
+        新的TrafficState，车辆数为base的副本（不超过新的上限）
+    """
+    state = copy.copy(base)
+    capacity = base.capacity * factors if factors is not None else base.capacity.copy()
+    capacity[closed] = 0.0
+    state.capacity = capacity
+    state.upper = np.where(base.is_mall, capacity, capacity * 1.05)
+    state.vehicles = np.minimum(base.vehicles, state.upper)
+    state._back = np.empty_like(state.vehicles)
+    state._share = np.empty(base.adjacency.nnz)
+    state._row_weights = np.empty(base.adjacency.nnz)
+    return state
+
+
+class CongestionAccumulator:
+    """
+    逐步累加每条道路的拥堵度统计，不保存历史
+
+    均值和标准差由和与平方和得到；分位数由每条道路的固定分箱直方图估计（分箱内线性插值），
+    误差不超过一个分箱宽度。多个累加器可以合并
+
+    属性:
+        n_edges: 道路数量
+        bin_width: 分箱宽度
+        n_bins: 分箱数量（最后一个分箱包含所有不小于上限的值）
+        samples: 已累加的步数
+    """
+
+    def __init__(self, n_edges: int, bin_width: float = DEFAULT_BIN_WIDTH, max_ratio: float = DEFAULT_MAX_RATIO):
+        """
+        初始化累加器
+
+        参数:
+            n_edges: 道路数量
+            bin_width: 分箱宽度
+            max_ratio: 直方图上限
+        """
+        if bin_width <= 0 or max_ratio <= 0:
+            raise ValueError(f"无效的直方图参数: bin_width={bin_width}, max_ratio={max_ratio}")
+        self.n_edges = n_edges
+        self.bin_width = float(bin_width)
+        self.n_bins = int(np.ceil(max_ratio / bin_width)) + 1
+        self.samples = 0
+        self.counts = np.zeros((n_edges, self.n_bins), dtype=np.uint32)
+        self.total = np.zeros(n_edges)
+        self.total_squares = np.zeros(n_edges)
+        self.maximum = np.zeros(n_edges)
+        self._row_offsets = np.arange(n_edges, dtype=np.intp) * self.n_bins
+
+    def add(self, ratio: np.ndarray):
+        """
+        累加一步的拥堵度
+
+        参数:
+            ratio: 每条道路的拥堵度数组（非负）
+        """
+        bins = np.minimum(ratio * (1.0 / self.bin_width), self.n_bins - 1).astype(np.intp)
+        bins += self._row_offsets
+        # 每条道路恰好增加一个分箱，下标不重复，可以直接按下标加1
+        self.counts.reshape(-1)[bins] += 1
+        self.total += ratio
+        self.total_squares += ratio * ratio
+        np.maximum(self.maximum, ratio, out=self.maximum)
+        self.samples += 1
+
+    def merge(self, other: 'CongestionAccumulator'):
+        """
+        合并另一个累加器（分箱参数必须相同）
+
+        参数:
+            other: 累加器
+        """
+        if other.n_edges != self.n_edges or other.n_bins != self.n_bins or other.bin_width != self.bin_width:
+            raise ValueError("累加器的道路数量或分箱参数不同，无法合并")
+        self.counts += other.counts
+        self.total += other.total
+        self.total_squares += other.total_squares
+        np.maximum(self.maximum, other.maximum, out=self.maximum)
+        self.samples += other.samples
+
+    def mean(self) -> np.ndarray:
+        """每条道路的平均拥堵度"""
+        return self.total / max(self.samples, 1)
+
+    def std(self) -> np.ndarray:
+        """每条道路拥堵度的标准差"""
+        mean = self.mean()
+        return np.sqrt(np.maximum(self.total_squares / max(self.samples, 1) - mean * mean, 0.0))
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        估计每条道路拥堵度的分位数
+
+        参数:
+            q: 分位数 (0-1)
+
+        返回:
+            分位数数组
+        """
+        if self.samples == 0:
+            return np.zeros(self.n_edges)
+        cumulative = np.cumsum(self.counts, axis=1, dtype=np.int64)
+        target = q * self.samples
+        bins = np.argmax(cumulative >= target, axis=1)
+        rows = np.arange(self.n_edges)
+        before = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        inside = self.counts[rows, bins]
+        fraction = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0.0)
+        return np.minimum((bins + np.clip(fraction, 0.0, 1.0)) * self.bin_width, self.maximum)
+
+
+# 工作进程中的基准交通状态和直方图参数，由_init_worker设置
+_worker_state = None
+_worker_histogram = None
+
+
+def _init_worker(state, bin_width, max_ratio):
+    """工作进程初始化：路网结构只传输一次"""
+    global _worker_state, _worker_histogram
+    _worker_state = state
+    _worker_histogram = (bin_width, max_ratio)
+
+
+def run_replica(base: TrafficState, closed, factors, demand, mall_demand: float, seed, ticks: int, warmup: int = 0,
+                bin_width: float = DEFAULT_BIN_WIDTH, max_ratio: float = DEFAULT_MAX_RATIO) -> CongestionAccumulator:
+    """
+    运行一个模拟副本并累加拥堵度统计
+
+    每一步: 随机增减 → 需求道路额外驶入车辆 → 向相邻道路分配，与向量化引擎相同
+
+    参数:
+        base: 基准交通状态（不会被修改）
+        closed: 封闭道路下标数组
+        factors: 容量倍数数组或None
+        demand: 额外驶入车辆的道路下标数组或None
+        mall_demand: 需求道路每一步平均额外驶入的车辆数
+        seed: 随机数种子（整数或SeedSequence）
+        ticks: 统计的步数
+        warmup: 开始统计之前执行的步数
+        bin_width: 直方图分箱宽度
+        max_ratio: 直方图上限
+
+    返回:
+        CongestionAccumulator
+    """
+    state = scenario_state(base, closed, factors)
+    rng = np.random.default_rng(seed)
+    open_edges = state.capacity > 0
+    ratio = np.zeros(len(state))
+    accumulator = CongestionAccumulator(len(state), bin_width, max_ratio)
+    for tick in range(warmup + ticks):
+        random_vehicle_changes(state, rng)
+        if demand is not None and len(demand) and mall_demand > 0:
+            arrivals = rng.poisson(mall_demand, size=len(demand))
+            state.vehicles[demand] = np.minimum(state.vehicles[demand] + arrivals, state.upper[demand])
+        distribute_vehicles_vectorized(state)
+        if tick >= warmup:
+            # 封闭道路的容量为0，拥堵度按0计
+            np.divide(state.vehicles, state.capacity, out=ratio, where=open_edges)
+            accumulator.add(ratio)
+    return accumulator
+
+
+def _run_task(args):
+    """工作进程：运行一个副本，返回 (情景下标, 累加器)"""
+    scenario_index, closed, factors, demand, mall_demand, seed, ticks, warmup = args
+    bin_width, max_ratio = _worker_histogram
+    return scenario_index, run_replica(_worker_state, closed, factors, demand, mall_demand, seed, ticks, warmup,
+                                       bin_width, max_ratio)
+
+
+class EnsembleResult:
+    """
+    一个情景所有副本合并后的统计
+
+    属性:
+        scenario: 情景
+        stats: 合并后的CongestionAccumulator
+        replica_means: 每个副本的全网平均拥堵度，用于估计副本之间的差异
+    """
+
+    def __init__(self, scenario: Scenario, stats: CongestionAccumulator):
+        self.scenario = scenario
+        self.stats = stats
+        self.replica_means = []
+
+    @property
+    def replicas(self) -> int:
+        """已合并的副本数量"""
+        return len(self.replica_means)
+
+    def summary(self, edge_ids: Optional[Sequence] = None, quantile: float = 0.9, top: int = 10) -> dict:
+        """
+        汇总情景的结果
+
+        参数:
+            edge_ids: 道路ID列表（与交通状态顺序一致），提供时列出分位数最高的道路
+            quantile: 分位数
+            top: 列出的道路数量
+
+        返回:
+            {scenario, replicas, samples, mean_congestion, replica_std, mean_quantile, congested_edges, top_edges}
+        """
+        mean = self.stats.mean()
+        upper = self.stats.quantile(quantile)
+        replica_means = np.asarray(self.replica_means)
+        result = {
+            "scenario": self.scenario.to_dict(),
+            "replicas": self.replicas,
+            "samples": self.stats.samples,
+            "mean_congestion": float(mean.mean()) if len(mean) else 0.0,
+            "replica_std": float(replica_means.std(ddof=1)) if len(replica_means) > 1 else 0.0,
+            "mean_quantile": float(upper.mean()) if len(upper) else 0.0,
+            # 分位数超过1（车辆数超过容量）的道路数量
+            "congested_edges": int(np.count_nonzero(upper > 1.0)),
+        }
+        if edge_ids is not None:
+            order = np.argsort(-upper, kind='stable')[:top]
+            result["top_edges"] = [{"id": edge_ids[i], "mean": float(mean[i]), "quantile": float(upper[i])}
+                                   for i in order.tolist()]
+        return result
+
+
+class TrafficEnsemble:
+    """
+    并行运行多个情景的蒙特卡洛模拟副本
+
+    每个情景运行replicas个副本；第r个副本在所有情景中使用相同的随机数种子（公共随机数），
+    情景之间的差异因此主要来自情景本身而不是随机波动
+
+    用法:
+        with TrafficEnsemble(state, [Scenario('基准'), Scenario('扩容', capacity_scale=2)]) as ensemble:
+            results = ensemble.run(replicas=8, ticks=200)
+
+    属性:
+        state: 基准交通状态
+        scenarios: 情景列表
+        n_workers: 工作进程数量，1表示在当前进程中运行
+    """
+
+    def __init__(self, state: TrafficState, scenarios: Sequence[Scenario], n_workers: Optional[int] = None,
+                 bin_width: float = DEFAULT_BIN_WIDTH, max_ratio: float = DEFAULT_MAX_RATIO, vehicles=None):
+        """
+        初始化集合模拟
+
+        参数:
+            state: 基准交通状态，副本从其当前车辆数开始
+            scenarios: 情景列表
+            n_workers: 工作进程数量，默认为CPU核心数
+            bin_width: 拥堵度直方图的分箱宽度
+            max_ratio: 拥堵度直方图的上限
+            vehicles: 副本的初始车辆数，默认为state的当前车辆数（不会修改state）
+        """
+        if not scenarios:
+            raise ValueError("至少需要一个情景")
+        if vehicles is not None:
+            state = copy.copy(state)
+            state.vehicles = np.asarray(vehicles, dtype=np.float64)
+        self.state = state
+        self.scenarios = list(scenarios)
+        self._resolved = [scenario.resolve(state) for scenario in self.scenarios]
+        self.n_workers = max(1, n_workers if n_workers is not None else (os.cpu_count() or 1))
+        self.bin_width = bin_width
+        self.max_ratio = max_ratio
+        self._pool = None
+
+    def _tasks(self, replicas: int, ticks: int, warmup: int, seed):
+        seeds = np.random.SeedSequence(seed).spawn(replicas)
+        for replica_seed in seeds:
+            for index, resolved in enumerate(self._resolved):
+                yield (index, *resolved, replica_seed, ticks, warmup)
+
+    def run(self, replicas: int = 8, ticks: int = 200, warmup: int = 0, seed=None,
+            verbose: bool = False) -> List[EnsembleResult]:
+        """
+        运行所有情景的副本
+
+        参数:
+            replicas: 每个情景的副本数量
+            ticks: 每个副本统计的步数
+            warmup: 每个副本开始统计之前执行的步数
+            seed: 随机数种子
+            verbose: 是否打印每个副本完成的信息
+
+        返回:
+            与scenarios顺序一致的EnsembleResult列表
+        """
+        if replicas <= 0 or ticks <= 0 or warmup < 0:
+            raise ValueError(f"无效的集合模拟参数: replicas={replicas}, ticks={ticks}, warmup={warmup}")
+        results = [EnsembleResult(scenario, CongestionAccumulator(len(self.state), self.bin_width, self.max_ratio))
+                   for scenario in self.scenarios]
+        tasks = self._tasks(replicas, ticks, warmup, seed)
+        n_tasks = replicas * len(self.scenarios)
+        if self.n_workers > 1 and n_tasks > 1:
+            if self._pool is None:
+                self._pool = mp.Pool(min(self.n_workers, n_tasks), initializer=_init_worker,
+                                     initargs=(self.state, self.bin_width, self.max_ratio))
+            finished = self._pool.imap_unordered(_run_task, tasks)
+        else:
+            finished = ((task[0], run_replica(self.state, *task[1:], self.bin_width, self.max_ratio))
+                        for task in tasks)
+
+        start_time = time.perf_counter()
+        for done, (index, accumulator) in enumerate(finished, 1):
+            # 每个副本的结果合并后即丢弃
+            results[index].stats.merge(accumulator)
+            results[index].replica_means.append(float(accumulator.mean().mean()) if len(self.state) else 0.0)
+            if verbose:
+                print(f"副本 {done}/{n_tasks} 完成（情景 {self.scenarios[index].name}），"
+                      f"已用时 {time.perf_counter() - start_time:.2f} 秒")
+        return results
+
+    def close(self):
+        """关闭工作进程"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
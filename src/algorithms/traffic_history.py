@@ -0,0 +1,190 @@
+"""
+道路交通历史记录
+使用一个预先分配的二维环形缓冲区（步数 × 道路数）保存最近若干步的车辆数，
+内存占用固定为 ticks × 道路数 × 元素大小，记录一步只需写入一行
+"""
+import time
+from typing import Optional
+import numpy as np
+
+
+class TrafficHistory:
+    """
+    道路车辆数的环形缓冲区
+
+    每一行对应一次记录（一步模拟），列的顺序与TrafficState的道路顺序一致。
+    缓冲区写满后覆盖最早的记录
+
+    属性:
+        n_edges: 道路数量
+        capacity: 最多保存的记录数
+        buffer: 车辆数缓冲区 (capacity, n_edges)
+        timestamps: 每一行的记录时间
+        ticks: 每一行对应的步数序号
+        count: 当前保存的记录数
+    """
+
+    def __init__(self, n_edges: int, capacity: int = 300, dtype=np.uint16):
+        """
+        初始化历史记录
+
+        参数:
+            n_edges: 道路数量
+            capacity: 最多保存的记录数
+            dtype: 车辆数的存储类型，整数类型超出范围的值会被截断
+        """
+        self.n_edges = n_edges
+        self.capacity = max(int(capacity), 1)
+        self.dtype = np.dtype(dtype)
+        self.buffer = np.zeros((self.capacity, n_edges), dtype=self.dtype)
+        self.timestamps = np.full(self.capacity, np.nan)
+        self.ticks = np.full(self.capacity, -1, dtype=np.int64)
+        self.count = 0
+        self.total_recorded = 0
+        self._head = 0  # 下一次写入的行
+        self._max_value = np.iinfo(self.dtype).max if self.dtype.kind in 'iu' else None
+        self._scratch = np.empty(n_edges) if self._max_value is not None else None
+
+    @staticmethod
+    def memory_required(n_edges: int, capacity: int, dtype=np.uint16) -> int:
+        """
+        计算指定配置需要的缓冲区内存
+
+        参数:
+            n_edges: 道路数量
+            capacity: 记录数
+            dtype: 存储类型
+
+        返回:
+            字节数（包括时间、步数序号和记录时使用的临时数组）
+        """
+        dtype = np.dtype(dtype)
+        scratch = n_edges * 8 if dtype.kind in 'iu' else 0
+        return n_edges * capacity * dtype.itemsize + capacity * 16 + scratch
+
+    @property
+    def nbytes(self) -> int:
+        """缓冲区占用的内存字节数"""
+        scratch = self._scratch.nbytes if self._scratch is not None else 0
+        return self.buffer.nbytes + self.timestamps.nbytes + self.ticks.nbytes + scratch
+
+    def record(self, vehicles, timestamp: Optional[float] = None, tick: Optional[int] = None):
+        """
+        记录一步的车辆数
+
+        参数:
+            vehicles: 按道路顺序排列的车辆数数组
+            timestamp: 记录时间，默认为当前时间
+            tick: 步数序号，默认为已记录的总次数
+        """
+        row = self.buffer[self._head]
+        if self._max_value is None:
+            row[:] = vehicles
+        else:
+            # 四舍五入并截断到存储类型的范围
+            scratch = self._scratch
+            np.rint(vehicles, out=scratch)
+            np.clip(scratch, 0, self._max_value, out=scratch)
+            row[:] = scratch
+        self.timestamps[self._head] = time.time() if timestamp is None else timestamp
+        self.ticks[self._head] = self.total_recorded if tick is None else tick
+        self._head = (self._head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total_recorded += 1
+
+    def _slots(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> np.ndarray:
+        """按时间顺序返回落在时间范围内的行下标"""
+        if self.count < self.capacity:
+            slots = np.arange(self.count)
+        else:
+            slots = (np.arange(self.capacity) + self._head) % self.capacity
+        times = self.timestamps[slots]
+        lo = 0 if start_time is None else np.searchsorted(times, start_time, side='left')
+        hi = len(slots) if end_time is None else np.searchsorted(times, end_time, side='right')
+        return slots[lo:hi]
+
+    def time_range(self):
+        """
+        获取已保存记录的时间范围
+
+        返回:
+            (最早时间, 最晚时间)，没有记录时返回None
+        """
+        slots = self._slots()
+        if len(slots) == 0:
+            return None
+        return float(self.timestamps[slots[0]]), float(self.timestamps[slots[-1]])
+
+    def query_edge(self, edge_index: int, start_time: Optional[float] = None, end_time: Optional[float] = None):
+        """
+        查询一条道路在时间范围内的车辆数
+
+        参数:
+            edge_index: 道路下标
+            start_time: 起始时间，为None时不限制
+            end_time: 结束时间，为None时不限制
+
+        返回:
+            (时间数组, 车辆数数组)
+        """
+        slots = self._slots(start_time, end_time)
+        return self.timestamps[slots], self.buffer[slots, edge_index]
+
+    def query_edges(self, edge_indices, start_time: Optional[float] = None, end_time: Optional[float] = None):
+        """
+        查询多条道路在时间范围内的车辆数
+
+        参数:
+            edge_indices: 道路下标数组
+            start_time: 起始时间，为None时不限制
+            end_time: 结束时间，为None时不限制
+
+        返回:
+            (时间数组, 车辆数矩阵 (记录数, 道路数))
+        """
+        slots = self._slots(start_time, end_time)
+        edge_indices = np.asarray(edge_indices, dtype=np.int64)
+        return self.timestamps[slots], self.buffer[np.ix_(slots, edge_indices)]
+
+    def snapshot(self) -> dict:
+        """
+        复制历史记录的全部内容，用于保存检查点
+
+        返回:
+            {"buffer", "timestamps", "ticks", "meta"} 数组字典，meta为 [下一次写入的行, 记录数, 总记录次数]
+        """
+        return {
+            "buffer": self.buffer.copy(),
+            "timestamps": self.timestamps.copy(),
+            "ticks": self.ticks.copy(),
+            "meta": np.array([self._head, self.count, self.total_recorded], dtype=np.int64),
+        }
+
+    def restore(self, snapshot: dict):
+        """
+        从snapshot的结果恢复历史记录
+
+        保存时的记录数上限与当前不同时，按时间顺序重新写入，只保留最近的记录
+
+        参数:
+            snapshot: snapshot返回的数组字典
+        """
+        buffer = snapshot["buffer"]
+        head, count, total_recorded = (int(value) for value in snapshot["meta"])
+        if buffer.shape[1] != self.n_edges:
+            raise ValueError(f"历史记录的道路数量不一致: {buffer.shape[1]} != {self.n_edges}")
+        if buffer.shape == self.buffer.shape:
+            self.buffer[:] = buffer
+            self.timestamps[:] = snapshot["timestamps"]
+            self.ticks[:] = snapshot["ticks"]
+            self._head, self.count = head, count
+        else:
+            saved_capacity = buffer.shape[0]
+            if count < saved_capacity:
+                slots = np.arange(count)
+            else:
+                slots = (np.arange(saved_capacity) + head) % saved_capacity
+            self._head = self.count = 0
+            for slot in slots[-self.capacity:].tolist():
+                self.record(buffer[slot], snapshot["timestamps"][slot], int(snapshot["ticks"][slot]))
+        self.total_recorded = total_recorded
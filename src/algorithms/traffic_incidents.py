@@ -0,0 +1,141 @@
+"""
+道路封闭与交通事件
+事件把一组道路标记为封闭或降低其通行能力（容量乘以系数）。同一条道路上有多个事件时取最小的系数，
+事件解除后恢复为其余事件的最小系数或原始容量。每次添加或解除事件只返回受影响道路的新容量，
+由调用方只更新这些道路相关的派生数据（行驶时间、模拟引擎的数组、网格统计、订阅的路线等），不需要整体重建
+"""
+import itertools
+import threading
+import time
+from typing import Optional
+import numpy as np
+from .traffic_engine import TrafficState
+
+# 事件类型: 封闭（容量系数为0）、通行能力下降
+INCIDENT_TYPES = ('closure', 'capacity')
+
+
+class IncidentManager:
+    """
+    交通事件管理
+
+    属性:
+        state: 交通状态
+        base_capacity: 没有事件时各道路的容量
+        factor: 各道路当前的容量系数（1表示没有事件，0表示封闭）
+    """
+
+    def __init__(self, state: TrafficState):
+        """
+        初始化，以交通状态当前的容量作为原始容量
+
+        参数:
+            state: 交通状态
+        """
+        self.state = state
+        self.base_capacity = state.capacity.copy()
+        self.factor = np.ones(len(state))
+        self._incidents = {}  # 事件ID -> {id, type, edges（道路下标数组）, capacity_factor, description, created}
+        self._edge_incidents = {}  # 道路下标 -> {事件ID: 容量系数}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """返回当前的事件数量"""
+        return len(self._incidents)
+
+    @property
+    def closed(self) -> np.ndarray:
+        """道路封闭标记数组"""
+        return self.factor == 0
+
+    def add(self, edges, incident_type: str = 'closure', capacity_factor: Optional[float] = None,
+            description: str = '') -> tuple:
+        """
+        添加事件
+
+        参数:
+            edges: 道路下标数组
+            incident_type: 'closure' 封闭，或 'capacity' 通行能力下降
+            capacity_factor: 通行能力下降时的容量系数 (0, 1)，封闭时忽略
+            description: 事件描述
+
+        返回:
+            (事件字典, 容量发生变化的道路下标数组, 这些道路的新容量数组)
+        """
+        if incident_type not in INCIDENT_TYPES:
+            raise ValueError(f"未知的事件类型: {incident_type}，可选: {', '.join(INCIDENT_TYPES)}")
+        if incident_type == 'closure':
+            capacity_factor = 0.0
+        elif capacity_factor is None or not 0 < capacity_factor < 1:
+            raise ValueError(f"通行能力下降的容量系数必须在0和1之间: {capacity_factor}")
+        edges = np.unique(np.asarray(edges, dtype=np.int64))
+        if len(edges) == 0:
+            raise ValueError("事件至少需要包含一条道路")
+        if edges[0] < 0 or edges[-1] >= len(self.state):
+            raise ValueError("道路下标超出范围")
+        with self._lock:
+            incident_id = next(self._ids)
+            incident = {"id": incident_id, "type": incident_type, "edges": edges,
+                        "capacity_factor": float(capacity_factor), "description": description,
+                        "created": time.time()}
+            self._incidents[incident_id] = incident
+            for edge in edges.tolist():
+                self._edge_incidents.setdefault(edge, {})[incident_id] = float(capacity_factor)
+            changed, capacity = self._refresh(edges)
+        return incident, changed, capacity
+
+    def remove(self, incident_id: int) -> tuple:
+        """
+        解除事件
+
+        参数:
+            incident_id: 事件ID
+
+        返回:
+            (事件字典, 容量发生变化的道路下标数组, 这些道路的新容量数组)
+
+        异常:
+            KeyError: 事件不存在
+        """
+        with self._lock:
+            incident = self._incidents.pop(incident_id)
+            for edge in incident["edges"].tolist():
+                factors = self._edge_incidents[edge]
+                del factors[incident_id]
+                if not factors:
+                    del self._edge_incidents[edge]
+            changed, capacity = self._refresh(incident["edges"])
+        return incident, changed, capacity
+
+    def _refresh(self, edges):
+        """重新计算给定道路的容量系数，返回系数发生变化的道路及其新容量（调用方需持有锁）"""
+        edge_incidents = self._edge_incidents
+        factor = np.fromiter((min(edge_incidents[edge].values()) if edge in edge_incidents else 1.0
+                              for edge in edges.tolist()), dtype=np.float64, count=len(edges))
+        differs = factor != self.factor[edges]
+        changed = edges[differs]
+        self.factor[changed] = factor[differs]
+        return changed, self.base_capacity[changed] * self.factor[changed]
+
+    def get(self, incident_id: int) -> Optional[dict]:
+        """按ID获取事件，不存在时返回None"""
+        return self._incidents.get(incident_id)
+
+    def incidents(self) -> list:
+        """返回所有事件（按添加顺序）"""
+        with self._lock:
+            return list(self._incidents.values())
+
+    def to_dict(self, incident: dict) -> dict:
+        """
+        把事件转换为可以序列化为JSON的字典
+
+        参数:
+            incident: 事件字典
+
+        返回:
+            {id, type, edges（道路ID列表）, capacity_factor, description, created}
+        """
+        edge_ids = self.state.edge_ids
+        return dict(incident, edges=[edge_ids[i] for i in incident["edges"].tolist()])
@@ -0,0 +1,240 @@
+"""
+分区并行交通流模拟
+按空间将道路划分给多个工作进程，车辆数保存在共享内存的双缓冲中，
+每一步各进程只需读取分区边界上相邻道路的数据，结果与单进程的向量化引擎完全一致
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List, Optional
+import numpy as np
+from scipy import sparse
+from .traffic_engine import TrafficState, MAX_DISTRIBUTE, draw_vehicle_changes, collect_inflow
+
+
+def partition_edges(state: TrafficState, n_partitions: int) -> List[np.ndarray]:
+    """
+    按道路中点坐标递归二分（每次沿跨度较大的坐标轴切分），将道路划分为空间上连续的若干分区
+
+    没有顶点坐标时按道路下标均分
+
+    参数:
+        state: 交通状态
+        n_partitions: 分区数量
+
+    返回:
+        每个分区的道路下标数组（升序）列表
+    """
+    n_edges = len(state)
+    n_partitions = max(1, min(n_partitions, n_edges)) if n_edges else 1
+    if state.vertex_xy is None:
+        return [np.sort(part) for part in np.array_split(np.arange(n_edges), n_partitions)]
+
+    midpoints = (state.vertex_xy[state.source] + state.vertex_xy[state.target]) / 2
+    partitions = []
+    stack = [(np.arange(n_edges), n_partitions)]
+    while stack:
+        indices, k = stack.pop()
+        if k == 1 or len(indices) <= 1:
+            partitions.append(np.sort(indices))
+            continue
+        points = midpoints[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = indices[np.argsort(points[:, axis], kind='stable')]
+        k_left = k // 2
+        cut = len(order) * k_left // k
+        stack.append((order[cut:], k - k_left))
+        stack.append((order[:cut], k_left))
+    return partitions
+
+
+def _attach(name, count):
+    """连接到共享内存并返回float64数组视图"""
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray((count,), dtype=np.float64, buffer=shm.buf)
+
+
+def _partition_worker(conn, shm_names, n_edges, owned, local, sub_adjacency, owned_local, capacity, upper):
+    """
+    分区工作进程
+
+    每一步分两个阶段，由主进程通过管道发送命令驱动:
+        'A': 应用随机变化，计算本分区道路每单位权重分出的车辆数并写入共享数组
+        'B': 读取相邻道路（包括其他分区的边界道路）的分出量，计算本分区道路的流入量并写入后缓冲区
+
+    参数:
+        conn: 与主进程通信的管道
+        shm_names: 共享内存名称 (缓冲区0, 缓冲区1, 变化量, 每单位权重分出量)
+        n_edges: 道路总数
+        owned: 本分区道路的全局下标
+        local: 本分区道路及其相邻道路的全局下标（升序）
+        sub_adjacency: 本分区道路在local上的相邻矩阵 (len(owned) × len(local))
+        owned_local: owned在local中的位置
+        capacity: local道路的容量
+        upper: local道路的车辆数上限
+    """
+    handles = [_attach(name, n_edges) for name in shm_names]
+    buffers = (handles[0][1], handles[1][1])
+    change, per_weight = handles[2][1], handles[3][1]
+    handles = [shm for shm, _ in handles]
+    adjacency_rows = np.repeat(np.arange(len(owned)), np.diff(sub_adjacency.indptr))
+    share = np.empty(sub_adjacency.nnz)
+    row_weights = np.empty(sub_adjacency.nnz)
+    unit_adjacency = bool(np.all(sub_adjacency.data == 1))
+    weights = remaining = None
+
+    try:
+        while True:
+            command, parity = conn.recv()
+            if command == 'stop':
+                break
+            front, back = buffers[parity], buffers[1 - parity]
+            if command == 'A':
+                vehicles = np.clip(front[local] + change[local], 0, upper)
+                outflow = np.where(vehicles > 0, np.minimum(vehicles, MAX_DISTRIBUTE), 0.0)
+                remaining = vehicles - outflow
+                weights = capacity / np.maximum(remaining, 1)
+                total_weight = sub_adjacency @ weights
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    per_weight[owned] = np.where(total_weight > 0, outflow[owned_local] / total_weight, 0.0)
+            elif command == 'B':
+                owned_weights = weights[owned_local]
+                inflow = collect_inflow(sub_adjacency, adjacency_rows, per_weight[local], owned_weights,
+                                        share, row_weights, unit_adjacency)
+                back[owned] = remaining[owned_local] + inflow
+            conn.send(True)
+    finally:
+        # 先释放指向共享内存的数组视图，再关闭共享内存
+        buffers = change = per_weight = front = back = None
+        for shm in handles:
+            shm.close()
+        conn.close()
+
+
+class PartitionedTrafficExecutor:
+    """
+    分区并行的交通流模拟执行器
+
+    主进程每一步批量生成随机变化量，各工作进程负责各自分区的道路，
+    相邻分区之间只交换边界道路的数据。由于随机数和计算方式与单进程引擎相同，
+    使用相同的随机数生成器时结果逐位一致
+
+    用法:
+        with PartitionedTrafficExecutor(state, n_partitions=4) as executor:
+            executor.step(rng)
+        # 退出后state.vehicles为最新结果
+
+    属性:
+        state: 交通状态
+        partitions: 每个分区的道路下标数组
+    """
+
+    def __init__(self, state: TrafficState, n_partitions: Optional[int] = None):
+        """
+        初始化执行器
+
+        参数:
+            state: 交通状态
+            n_partitions: 分区（工作进程）数量，默认为CPU核心数
+        """
+        self.state = state
+        self.partitions = partition_edges(state, n_partitions or mp.cpu_count())
+        self._shms = []
+        self._buffers = None
+        self._change = None
+        self._parity = 0
+        self._workers = []
+        self._conns = []
+
+    def _create_shared(self, n_edges):
+        """创建一个共享内存float64数组"""
+        shm = shared_memory.SharedMemory(create=True, size=max(n_edges, 1) * 8)
+        self._shms.append(shm)
+        return np.ndarray((n_edges,), dtype=np.float64, buffer=shm.buf)
+
+    def start(self):
+        """创建共享内存并启动工作进程"""
+        if self._workers:
+            return self
+        state = self.state
+        n_edges = len(state)
+        self._buffers = (self._create_shared(n_edges), self._create_shared(n_edges))
+        self._change = self._create_shared(n_edges)
+        self._create_shared(n_edges)  # 每单位权重分出量
+        self._buffers[0][:] = state.vehicles
+        self._parity = 0
+        shm_names = [shm.name for shm in self._shms]
+
+        for owned in self.partitions:
+            rows = state.adjacency[owned]
+            local = np.union1d(owned, rows.indices)
+            sub_adjacency = sparse.csr_matrix(
+                (rows.data, np.searchsorted(local, rows.indices), rows.indptr),
+                shape=(len(owned), len(local)))
+            parent_conn, child_conn = mp.Pipe()
+            worker = mp.Process(
+                target=_partition_worker,
+                args=(child_conn, shm_names, n_edges, owned, local, sub_adjacency,
+                      np.searchsorted(local, owned), state.capacity[local], state.upper[local]),
+                daemon=True)
+            worker.start()
+            child_conn.close()
+            self._workers.append(worker)
+            self._conns.append(parent_conn)
+        return self
+
+    def _broadcast(self, command):
+        """向所有工作进程发送命令并等待完成"""
+        for conn in self._conns:
+            conn.send((command, self._parity))
+        for conn in self._conns:
+            conn.recv()
+
+    def step(self, rng: Optional[np.random.Generator] = None):
+        """
+        执行一次交通流更新
+
+        参数:
+            rng: 随机数生成器
+        """
+        if not self._workers:
+            self.start()
+        self._change[:] = draw_vehicle_changes(self.state, rng)
+        self._broadcast('A')
+        self._broadcast('B')
+        self._parity = 1 - self._parity
+
+    @property
+    def vehicles(self) -> np.ndarray:
+        """当前车辆数（共享内存视图，下一步之后内容会改变）"""
+        return self._buffers[self._parity] if self._buffers is not None else self.state.vehicles
+
+    def close(self):
+        """将结果写回state，停止工作进程并释放共享内存"""
+        if self._buffers is not None:
+            self.state.vehicles[:] = self._buffers[self._parity]
+        for conn in self._conns:
+            try:
+                conn.send(('stop', 0))
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        for conn in self._conns:
+            conn.close()
+        self._buffers = self._change = None
+        for shm in self._shms:
+            try:
+                shm.close()
+            except BufferError:
+                # 调用方仍持有vehicles视图，内存在视图释放后回收
+                pass
+            shm.unlink()
+        self._shms, self._workers, self._conns = [], [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
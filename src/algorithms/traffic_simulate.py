@@ -4,6 +4,7 @@ from typing import Dict, List, Tuple
 import numpy as np
 from ..models.vertex import Vertex
 from ..models.graph import Graph
+from .congestion_models import get_congestion_model
 
 # 全局变量
 threshold: float = 0.5  # 拥堵阈值
@@ -12,7 +13,7 @@ running: bool = False
 
 def calculate_travel_time(graph: Graph) -> Dict[str, float]:
     """
-    计算所有边的行驶时间
+    计算所有边的行驶时间，使用当前的拥堵成本模型对所有边向量化计算
     
     参数:
         graph: 图实例
@@ -20,25 +21,39 @@ def calculate_travel_time(graph: Graph) -> Dict[str, float]:
     返回:
         每条边的行驶时间字典 {edge_id: travel_time}
     """
-    travel_times = {}
-    for edge_id, edge in graph.edges.items():
-        ratio = max(edge.current_vehicles, 1) / edge.capacity
-        if ratio <= threshold:
-            f = 1
-        elif ratio <= 0.7:
-            f = math.exp(ratio)
-        else:
-            f = 1.2 + math.exp(ratio)
-        travel_times[edge_id] = edge.length * f
-    return travel_times
+    edges = list(graph.edges.values())
+    n = len(edges)
+    travel_times = get_congestion_model().travel_time(
+        np.fromiter((edge.length for edge in edges), dtype=np.float64, count=n),
+        np.fromiter((edge.capacity for edge in edges), dtype=np.float64, count=n),
+        np.fromiter((edge.current_vehicles for edge in edges), dtype=np.float64, count=n))
+    return dict(zip(graph.edges.keys(), travel_times.tolist()))
+
+def congestion_factor(vehicles: float, capacity: float) -> float:
+    """
+    拥堵系数 f(n/v)：行驶时间 = c × 道路长度 × f(n/v)，f由当前的拥堵成本模型决定
+    
+    参数:
+        vehicles: 道路上的车辆数 n
+        capacity: 道路容量 v
+        
+    返回:
+        拥堵系数
+    """
+    return get_congestion_model().scalar_factor(max(vehicles, 1) / capacity)
 
-def distribute_vehicles(graph: Graph):
+def distribute_vehicles(graph: Graph, synchronous: bool = False):
     """
     将车辆分配到相邻的边
     
     参数:
         graph: 图实例
+        synchronous: 是否使用同步（双缓冲）模式，结果与边的遍历顺序无关
     """
+    if synchronous:
+        distribute_vehicles_synchronous(graph)
+        return
+    
     for edge_id, edge in graph.edges.items():
         if edge.current_vehicles <= 0:
             continue
@@ -70,16 +85,54 @@ def distribute_vehicles(graph: Graph):
                 vehicles = int(vehicles_to_distribute * (w / total_weight))
                 e.current_vehicles += vehicles
 
-def update_traffic_flow(graph: Graph):
+def distribute_vehicles_synchronous(graph: Graph):
     """
-    更新所有边的交通流量
+    同步模式的车辆分配：所有边都从同一时刻的车辆数快照读取，
+    分配结果写入新的缓冲区，全部计算完成后再写回图中
     
     参数:
         graph: 图实例
     """
+    # 读缓冲区：本步开始时的车辆数
+    front = {edge_id: edge.current_vehicles for edge_id, edge in graph.edges.items()}
+    outflow = {edge_id: min(v, 5) if v > 0 else 0 for edge_id, v in front.items()}
+    remaining = {edge_id: front[edge_id] - outflow[edge_id] for edge_id in front}
+    weights = {edge_id: graph.edges[edge_id].capacity / max(v, 1) for edge_id, v in remaining.items()}
+    
+    # 写缓冲区
+    back = dict(remaining)
     for edge_id, edge in graph.edges.items():
+        vehicles_to_distribute = outflow[edge_id]
+        if vehicles_to_distribute <= 0:
+            continue
+        
+        all_adjacent_edges = [e for e in edge.vertex1.edges if e != edge] + \
+                             [e for e in edge.vertex2.edges if e != edge]
+        if not all_adjacent_edges:
+            continue
+        
+        total_weight = sum(weights[e.id] for e in all_adjacent_edges)
+        if total_weight > 0:
+            per_weight = vehicles_to_distribute / total_weight
+            for e in all_adjacent_edges:
+                back[e.id] += math.floor(per_weight * weights[e.id])
+    
+    for edge_id, vehicles in back.items():
+        graph.edges[edge_id].current_vehicles = vehicles
+
+def update_traffic_flow(graph: Graph, synchronous: bool = False, rng: np.random.Generator = None):
+    """
+    更新所有边的交通流量
+    
+    参数:
+        graph: 图实例
+        synchronous: 是否使用同步（双缓冲）模式分配车辆
+        rng: 可选的随机数生成器，指定后一次性按边的顺序生成所有随机数，结果可复现
+    """
+    changes = rng.integers(-2, 3, size=len(graph.edges)).tolist() if rng is not None else None
+    for i, (edge_id, edge) in enumerate(graph.edges.items()):
         # 随机增减车辆数量
-        change = np.random.randint(-2, 3)  # -2到2的随机数
+        change = changes[i] if changes is not None else np.random.randint(-2, 3)  # -2到2的随机数
         
         # 如果是连接商场的边，增加车流量
         if edge.is_mall_connection:
@@ -95,7 +148,7 @@ def update_traffic_flow(graph: Graph):
             edge.current_vehicles = min(edge.current_vehicles, edge.capacity * 1.05)
     
     # 分配车辆到相邻边
-    distribute_vehicles(graph)
+    distribute_vehicles(graph, synchronous)
 
 def get_traffic_level(graph: Graph) -> Dict[str, int]:
     """
@@ -107,20 +160,28 @@ def get_traffic_level(graph: Graph) -> Dict[str, int]:
     返回:
         每条边的交通流量等级字典 {edge_id: level}
     """
-    levels = {}
-    for edge_id, edge in graph.edges.items():
-        ratio = edge.current_vehicles / edge.capacity
-        if ratio < 0.5:
-            levels[edge_id] = 0  # 畅通
-        elif ratio < 0.7:
-            levels[edge_id] = 1  # 轻微拥堵
-        elif ratio < 0.8:
-            levels[edge_id] = 2  # 中度拥堵
-        elif ratio < 0.9:
-            levels[edge_id] = 3  # 严重拥堵
-        else:
-            levels[edge_id] = 4  # 极度拥堵
-    return levels
+    return {edge_id: get_edge_traffic_level(edge) for edge_id, edge in graph.edges.items()}
+
+def get_edge_traffic_level(edge) -> int:
+    """
+    获取单条边的交通流量等级
+    
+    参数:
+        edge: 边实例
+        
+    返回:
+        交通流量等级 (0-4)
+    """
+    ratio = edge.current_vehicles / edge.capacity
+    if ratio < 0.5:
+        return 0  # 畅通
+    elif ratio < 0.7:
+        return 1  # 轻微拥堵
+    elif ratio < 0.8:
+        return 2  # 中度拥堵
+    elif ratio < 0.9:
+        return 3  # 严重拥堵
+    return 4  # 极度拥堵
 
 def get_traffic_color(graph: Graph) -> Dict[str, str]:
     """
@@ -154,7 +215,7 @@ def run_simulation(graph: Graph, steps: int = -1):
     step = 0
     while steps == -1 or step < steps:
         update_traffic_flow(graph)
-        time.sleep(update_interval)
+        time.sleep(update_interval / 1000)  # update_interval的单位为毫秒
         step += 1
 
 def init_traffic_simulation(graph: Graph, congestion_threshold: float = 0.5, interval: int = 10):
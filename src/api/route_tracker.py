@@ -0,0 +1,332 @@
+"""
+路线跟踪
+客户端订阅已规划的路线后，服务器把每条路线保存为道路下标数组，所有路线首尾相接存放在一个数组中。
+每一步模拟之后对行驶时间数组做一次按下标取值和分段求和，同时得到所有路线剩余部分的预计行驶时间（ETA），
+只向ETA变化超过阈值或拥堵警告发生变化的路线所属的客户端推送
+"""
+import itertools
+import threading
+from typing import Optional
+import numpy as np
+from src.algorithms.traffic_engine import TrafficState
+
+# 交通等级达到该值（车辆数超过容量的90%）的道路视为严重拥堵
+DEFAULT_WARNING_LEVEL = 4
+# ETA比订阅时增加超过该比例时发出延误警告
+DEFAULT_DELAY_WARNING = 0.2
+# 警告代码对应的名称: 无、剩余路线上有严重拥堵的道路、ETA比订阅时明显增加、剩余路线上有封闭的道路
+WARNINGS = (None, 'congestion', 'delay', 'closed')
+
+
+class RouteTracker:
+    """
+    路线ETA跟踪
+
+    路线按订阅顺序首尾相接存放在_edges中，_starts / _ends 为每条路线的起止位置，
+    _offsets为已经驶过的道路数量。订阅或取消订阅只标记需要重新打包，在下一次刷新时统一重建数组
+
+    属性:
+        state: 交通状态
+        eta_tolerance: ETA相对变化超过该比例时才推送
+        warning_level: 视为严重拥堵的交通等级
+        delay_warning: ETA比订阅时增加超过该比例时发出延误警告
+    """
+
+    def __init__(self, state: TrafficState, eta_tolerance: float = 0.02,
+                 warning_level: int = DEFAULT_WARNING_LEVEL, delay_warning: float = DEFAULT_DELAY_WARNING):
+        """
+        初始化路线跟踪
+
+        参数:
+            state: 交通状态
+            eta_tolerance: ETA推送阈值（相对变化）
+            warning_level: 视为严重拥堵的交通等级 (0-4)
+            delay_warning: 延误警告阈值（相对于订阅时的ETA）
+        """
+        self.state = state
+        self.eta_tolerance = eta_tolerance
+        self.warning_level = warning_level
+        self.delay_warning = delay_warning
+        # 路线ID -> {client_id, edges, offset, baseline_eta, published_eta, warning（警告代码）}
+        self._routes = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._order = []
+        self._position = {}
+        self._edges = np.empty(0, dtype=np.int64)
+        self._starts = np.empty(0, dtype=np.int64)
+        self._ends = np.empty(0, dtype=np.int64)
+        self._offsets = np.empty(0, dtype=np.int64)
+        self._baseline = np.empty(0)
+        self._published_eta = np.empty(0)
+        self._published_warning = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        """返回跟踪的路线数量"""
+        return len(self._routes)
+
+    def edge_indices(self, edge_ids) -> np.ndarray:
+        """
+        把道路ID列表转换为道路下标数组
+
+        参数:
+            edge_ids: 道路ID列表（按行驶顺序）
+
+        返回:
+            道路下标数组
+
+        异常:
+            ValueError: 道路不存在
+        """
+        index_of = self.state.edge_index
+        try:
+            return np.fromiter((index_of[edge_id] for edge_id in edge_ids), dtype=np.int64, count=len(edge_ids))
+        except KeyError as e:
+            raise ValueError(f"道路不存在: {e.args[0]}") from None
+
+    def add(self, client_id, edges, travel_time: np.ndarray, levels: np.ndarray,
+            closed: Optional[np.ndarray] = None) -> dict:
+        """
+        订阅一条路线
+
+        参数:
+            client_id: 客户端ID（Socket.IO的sid）
+            edges: 道路下标数组（按行驶顺序）
+            travel_time: 当前每条道路的行驶时间
+            levels: 当前每条道路的交通等级
+            closed: 可选的道路封闭标记数组
+
+        返回:
+            路线的当前状态，见_route_status
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        eta = float(travel_time[edges].sum())
+        congested = int(np.count_nonzero(levels[edges] >= self.warning_level))
+        blocked = int(np.count_nonzero(closed[edges])) if closed is not None else 0
+        with self._lock:
+            route_id = next(self._ids)
+            warning = 3 if blocked else (1 if congested else 0)
+            self._routes[route_id] = {"client_id": client_id, "edges": edges, "offset": 0, "baseline_eta": eta,
+                                      "published_eta": eta, "warning": warning}
+            self._dirty = True
+        return self._route_status(route_id, eta, eta, congested, blocked, warning, len(edges))
+
+    def remove(self, route_id, client_id=None) -> bool:
+        """
+        取消订阅一条路线
+
+        参数:
+            route_id: 路线ID
+            client_id: 提供时只能取消该客户端自己的路线
+
+        返回:
+            是否取消了路线
+        """
+        with self._lock:
+            route = self._routes.get(route_id)
+            if route is None or (client_id is not None and route["client_id"] != client_id):
+                return False
+            del self._routes[route_id]
+            self._dirty = True
+            return True
+
+    def remove_client(self, client_id) -> int:
+        """
+        取消客户端的所有路线（客户端断开连接时调用）
+
+        参数:
+            client_id: 客户端ID
+
+        返回:
+            取消的路线数量
+        """
+        with self._lock:
+            route_ids = [route_id for route_id, route in self._routes.items() if route["client_id"] == client_id]
+            for route_id in route_ids:
+                del self._routes[route_id]
+            if route_ids:
+                self._dirty = True
+            return len(route_ids)
+
+    def set_progress(self, route_id, position: int, client_id=None) -> bool:
+        """
+        更新路线上已经驶过的道路数量，之后的ETA只计算剩余的道路
+
+        参数:
+            route_id: 路线ID
+            position: 已经驶过的道路数量
+            client_id: 提供时只能更新该客户端自己的路线
+
+        返回:
+            是否更新成功
+        """
+        with self._lock:
+            route = self._routes.get(route_id)
+            if route is None or (client_id is not None and route["client_id"] != client_id):
+                return False
+            position = min(max(int(position), 0), len(route["edges"]))
+            route["offset"] = position
+            if not self._dirty:
+                self._offsets[self._position[route_id]] = position
+            return True
+
+    def _pack(self):
+        """把所有路线重新打包为连续数组（调用方需持有锁）"""
+        routes = self._routes
+        self._order = list(routes)
+        self._position = {route_id: i for i, route_id in enumerate(self._order)}
+        lengths = np.fromiter((len(routes[route_id]["edges"]) for route_id in self._order),
+                              dtype=np.int64, count=len(routes))
+        self._ends = np.cumsum(lengths)
+        self._starts = self._ends - lengths
+        self._edges = np.concatenate([routes[route_id]["edges"] for route_id in self._order]) if routes else \
+            np.empty(0, dtype=np.int64)
+        self._offsets = np.fromiter((routes[route_id]["offset"] for route_id in self._order),
+                                    dtype=np.int64, count=len(routes))
+        self._baseline = np.fromiter((routes[route_id]["baseline_eta"] for route_id in self._order),
+                                     dtype=np.float64, count=len(routes))
+        self._published_eta = np.fromiter((routes[route_id]["published_eta"] for route_id in self._order),
+                                          dtype=np.float64, count=len(routes))
+        self._published_warning = np.fromiter((routes[route_id]["warning"] for route_id in self._order),
+                                              dtype=np.uint8, count=len(routes))
+        self._dirty = False
+
+    def refresh(self, travel_time: np.ndarray, levels: np.ndarray, closed: Optional[np.ndarray] = None):
+        """
+        计算所有路线剩余部分的ETA、严重拥堵道路数量和封闭道路数量
+
+        参数:
+            travel_time: 每条道路的行驶时间
+            levels: 每条道路的交通等级
+            closed: 可选的道路封闭标记数组
+
+        返回:
+            (ETA数组, 严重拥堵道路数量数组, 封闭道路数量数组)，顺序与内部打包顺序一致
+        """
+        with self._lock:
+            if self._dirty:
+                self._pack()
+            return self._refresh(travel_time, levels, closed)
+
+    def _refresh(self, travel_time, levels, closed=None, routes=None):
+        """
+        按下标取出路线的道路，用np.add.reduceat一次得到每条路线剩余部分的和（调用方需持有锁）
+
+        区间边界交替为每条路线的剩余起点和终点，取偶数位置的结果；
+        取值数组末尾补一个0，使最后一条路线的终点也是有效下标。
+        给定routes（打包顺序中的位置）时只计算这些路线，先把它们的剩余道路取出排成连续数组
+        """
+        if routes is None:
+            edges = self._edges
+            begin = self._starts + self._offsets
+            end = self._ends
+        else:
+            remaining_begin = self._starts[routes] + self._offsets[routes]
+            lengths = self._ends[routes] - remaining_begin
+            end = np.cumsum(lengths)
+            begin = end - lengths
+            edges = self._edges[np.repeat(remaining_begin - begin, lengths) + np.arange(int(lengths.sum()))]
+        bounds = np.empty(2 * len(begin), dtype=np.int64)
+        bounds[0::2] = begin
+        bounds[1::2] = end
+        # 剩余部分为空的路线，reduceat返回的是起点处的单个值
+        empty = begin == end
+        eta = self._segment_sums(travel_time, edges, bounds, empty)
+        congested = self._segment_sums((levels >= self.warning_level).astype(np.float64), edges, bounds, empty)
+        if closed is None:
+            blocked = np.zeros(len(begin), dtype=np.int64)
+        else:
+            blocked = self._segment_sums(closed.astype(np.float64), edges, bounds, empty).astype(np.int64)
+        return eta, congested.astype(np.int64), blocked
+
+    @staticmethod
+    def _segment_sums(edge_values, edges, bounds, empty):
+        """按道路下标取值后求每个区间的和"""
+        n = len(edges)
+        values = np.empty(n + 1)
+        values[n] = 0.0
+        # 下标在订阅时已经检查过，mode='clip'避免np.take为检查越界而使用临时缓冲区
+        np.take(edge_values, edges, out=values[:n], mode='clip')
+        sums = np.add.reduceat(values, bounds)[0::2]
+        sums[empty] = 0.0
+        return sums
+
+    def _routes_using(self, edges) -> np.ndarray:
+        """剩余部分经过给定道路的路线在打包顺序中的位置（调用方需持有锁）"""
+        mask = np.zeros(len(self.state), dtype=bool)
+        mask[np.asarray(edges, dtype=np.int64)] = True
+        hits = np.flatnonzero(mask[self._edges])
+        routes = np.searchsorted(self._ends, hits, side='right')
+        hits_remaining = hits >= self._starts[routes] + self._offsets[routes]
+        return np.unique(routes[hits_remaining])
+
+    def publish(self, travel_time: np.ndarray, levels: np.ndarray, tick: Optional[int] = None,
+                closed: Optional[np.ndarray] = None, edges=None) -> list:
+        """
+        刷新路线，为ETA变化超过阈值或警告发生变化的路线生成推送
+
+        警告（按优先级）: 'closed' 剩余路线上有封闭的道路，'delay' ETA比订阅时增加超过delay_warning，
+        'congestion' 剩余路线上有严重拥堵的道路
+
+        参数:
+            travel_time: 每条道路的行驶时间
+            levels: 每条道路的交通等级
+            tick: 模拟步数，附带在推送中
+            closed: 可选的道路封闭标记数组
+            edges: 只刷新剩余部分经过这些道路的路线（例如容量刚被修改的道路），为None时刷新所有路线
+
+        返回:
+            [(客户端ID, {"tick": 步数, "routes": [路线状态, ...]}), ...]
+        """
+        with self._lock:
+            if self._dirty:
+                self._pack()
+            if not self._order:
+                return []
+            routes = None if edges is None else self._routes_using(edges)
+            if routes is not None and len(routes) == 0:
+                return []
+            eta, congested, blocked = self._refresh(travel_time, levels, closed, routes)
+            positions = np.arange(len(self._order)) if routes is None else routes
+            delayed = eta > self._baseline[positions] * (1 + self.delay_warning)
+            warning = np.where(blocked > 0, 3, np.where(delayed, 2, np.where(congested > 0, 1, 0))).astype(np.uint8)
+            published = self._published_eta[positions]
+            changed = np.abs(eta - published) > self.eta_tolerance * np.maximum(published, 1e-9)
+            changed |= warning != self._published_warning[positions]
+            selected = np.flatnonzero(changed)
+            if len(selected) == 0:
+                return []
+            self._published_eta[positions[selected]] = eta[selected]
+            self._published_warning[positions[selected]] = warning[selected]
+
+            updates = {}
+            routes, order = self._routes, self._order
+            remaining = self._ends - self._starts - self._offsets
+            for i, route_eta, count, closed_count, route_warning in zip(
+                    selected.tolist(), eta[selected].tolist(), congested[selected].tolist(),
+                    blocked[selected].tolist(), warning[selected].tolist()):
+                position = int(positions[i])
+                route = routes[order[position]]
+                route["published_eta"] = route_eta
+                route["warning"] = route_warning
+                updates.setdefault(route["client_id"], []).append(self._route_status(
+                    order[position], route_eta, route["baseline_eta"], count, closed_count, route_warning,
+                    int(remaining[position])))
+        return [(client_id, {"tick": tick, "routes": statuses}) for client_id, statuses in updates.items()]
+
+    @staticmethod
+    def _route_status(route_id, eta, baseline_eta, congested, closed, warning, remaining_edges) -> dict:
+        """
+        路线状态: {route_id, eta, delay, congested_edges, closed_edges, warning, remaining_edges}，
+        warning为警告代码；剩余路线上有封闭的道路时ETA和延误为None
+        """
+        return {
+            "route_id": route_id,
+            "eta": None if closed else eta,
+            "delay": None if closed else eta - baseline_eta,
+            "congested_edges": congested,
+            "closed_edges": closed,
+            "warning": WARNINGS[warning],
+            "remaining_edges": remaining_edges
+        }
@@ -2,7 +2,7 @@
 Flask服务器
 提供获取地图数据的API
 """
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, jsonify, send_from_directory, request, Response
 from flask_socketio import SocketIO, emit
 import json
 import os
@@ -10,6 +10,8 @@ import time
 import sys
 import math
 import threading
+import atexit
+import numpy as np
 
 # 确保可以导入src模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -33,12 +35,59 @@ from src.algorithms.DBSCAN import DBSCAN, apply_dbscan
 # 导入KMeans和Mini-Batch KMeans
 from src.algorithms.KMeans import apply_kmeans, apply_mini_batch_kmeans
 # 导入交通模拟模块
-from src.algorithms.traffic_simulate import update_traffic_flow, get_traffic_color, get_traffic_level
+from src.algorithms.traffic_simulate import get_edge_traffic_level
+from src.algorithms.traffic_engine import TrafficState, LEVEL_COLORS, congestion_travel_time, traffic_levels
+from src.algorithms.traffic_history import TrafficHistory
+from src.algorithms.simulation_process import TrafficSimulationProcess
+from src.algorithms.grid_congestion import GridCongestion, CongestionPyramid
+from src.algorithms.traffic_demand import generate_od_demand
+from src.algorithms.traffic_assignment import TrafficAssignment
+from src.algorithms.traffic_ensemble import Scenario, TrafficEnsemble
+from src.algorithms.probe_ingestion import ProbeIngestor
+from src.algorithms.traffic_incidents import IncidentManager
+from src.algorithms.congestion_models import create_congestion_model, get_congestion_model, set_congestion_model
+from src.algorithms.traffic_checkpoint import (capture_checkpoint, write_checkpoint, load_checkpoint,
+                                               restore_checkpoint, CheckpointWriter)
+from src.api.traffic_stream import TrafficStream
+from src.api.route_tracker import RouteTracker
 # 导入A*寻路算法
 from src.algorithms.a_star import find_shortest_path, find_fastest_path
+# 导入空间索引
+from src.models.quadtree import QuadTree
+from src.models.spatial_index import create_spatial_index
+from src.exporters.quadtree_exporter import iter_quadtree_json, quadtree_to_binary
+from src.exporters.binary_exporter import graph_to_binary
 
 # 交通模拟全局变量
 traffic_simulation_running = False
+TRAFFIC_STATE = None  # 向量化交通状态，随GRAPH按需构建
+TRAFFIC_STREAM = None  # 交通数据增量推送编码器
+TRAFFIC_HISTORY = None  # 交通历史记录（环形缓冲区）
+TRAFFIC_HISTORY_TICKS = 300  # 保存的历史步数，每步2秒约为10分钟；内存占用为 步数 × 道路数 × 2 字节
+TRAFFIC_RNG = None  # 交通模拟使用的随机数生成器，保存在检查点中以便复现
+TRAFFIC_TICK = 0  # 已执行的模拟步数
+TRAFFIC_LOCK = threading.Lock()  # 保护主进程中的交通状态副本与检查点的保存/恢复
+SIMULATION_PROCESS = None  # 运行交通模拟的独立进程，随交通状态按需创建
+SIMULATION_INTERVAL = 2.0  # 每步模拟的间隔（秒）
+TRAFFIC_ACTIVE_PROBABILITY = None  # 设置为概率时模拟进程使用活动集引擎（每条道路每一步以该概率发生随机增减）
+TRAFFIC_ENGINE = None  # 模拟进程使用的引擎 vectorized / active / ctm，None表示按TRAFFIC_ACTIVE_PROBABILITY选择
+TRAFFIC_PUBLISH_POLL = 0.1  # 推送线程检查共享内存版本号的间隔（秒）
+GRAPH_TRAFFIC_STALE = False  # 图中道路的车辆数是否落后于交通状态，需要时才写回
+CHECKPOINT_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'traffic_checkpoint.npz')
+CHECKPOINT_INTERVAL_TICKS = 30  # 每隔多少步在后台保存一次检查点，0表示不自动保存
+CHECKPOINT_WRITER = None  # 后台检查点写入器，首次保存时创建
+GRID_CONGESTION = {}  # 统计范围（None表示整个地图）-> 网格拥堵统计（预先计算的道路到网格分配）
+GRID_CONGESTION_CACHE_SIZE = 8  # 最多缓存的统计范围数量
+GRID_CONGESTION_SIZES = (10, 20, 40)  # 预先计算的网格行/列数，较粗的网格由最细的网格合并得到
+GRID_CONGESTION_MAX_SIZE = 200  # 接口允许的最大网格行/列数
+CONGESTION_PYRAMID = None  # 多分辨率拥堵金字塔，每一步更新
+CONGESTION_PYRAMID_LEVELS = 7  # 最细一级为 2^7 × 2^7 的网格
+GRID_DEFAULT_LEVEL = 3  # 未指定视口的客户端接收的级别（8×8网格）
+GRID_CELL_PIXELS = 48  # 按视口选择级别时，网格在屏幕上的期望宽度（像素）
+GRID_SUBSCRIPTIONS = {}  # 客户端ID -> (金字塔级别, 视口范围或None)
+ROUTE_TRACKER = None  # 客户端订阅的路线，每一步刷新ETA
+PROBE_INGESTOR = None  # 探测车定位点接入（滑动时间窗口），随交通状态按需构建
+INCIDENT_MANAGER = None  # 道路封闭与交通事件，随交通状态按需构建
 traffic_simulation_thread = None
 
 @app.route('/api/map-data')
@@ -61,8 +110,16 @@ def get_map_data_detail():
     """
     提供详细地图数据的API端点
     从JSON文件中读取数据并返回  
+    
+    查询参数:
+        format: json（默认）或binary，binary时返回当前图的列式二进制数据（见binary_exporter）
     """
     try:
+        if request.args.get('format', 'json') == 'binary':
+            if GRAPH is None:
+                return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+            sync_graph_traffic()
+            return Response(graph_to_binary(GRAPH), mimetype='application/octet-stream')
         data_file = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'map_data.json')
         with open(data_file, 'r', encoding='utf-8') as f:
             map_data = json.load(f)
@@ -142,11 +199,69 @@ def get_nearby_nodes():
         print(error_traceback)
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
+@app.route('/api/nearby_edges')
+def get_nearby_edges():
+    """
+    提供获取附近道路的API端点
+    给定x、y和radius时返回与该坐标距离不超过radius的道路；
+    给定west、south、east、north时返回与该矩形（视口）相交的道路
+    """
+    try:
+        global GRAPH
+        if GRAPH is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        sync_graph_traffic()
+
+        start_time = time.time()
+        if 'west' in request.args:
+            try:
+                query_rect = (float(request.args['west']), float(request.args['south']),
+                              float(request.args['east']), float(request.args['north']))
+            except (KeyError, ValueError):
+                return jsonify({"error": "west, south, east, north 必须同时提供且为数字"}), 400
+            edges = GRAPH.get_edges_in_range(query_rect)
+        else:
+            try:
+                x = float(request.args.get('x', 0))
+                y = float(request.args.get('y', 0))
+                radius = float(request.args.get('radius', 100))
+            except ValueError:
+                return jsonify({"error": "x, y, radius 必须是数字"}), 400
+            edges = GRAPH.get_edges_in_radius(x, y, radius)
+        query_time = time.time() - start_time
+
+        result_edges = []
+        for edge in edges:
+            result_edges.append({
+                "id": edge.id,
+                "source": edge.vertex1.id,
+                "target": edge.vertex2.id,
+                "length": edge.length,
+                "current_vehicles": edge.current_vehicles,
+                "capacity": edge.capacity,
+                "level": get_edge_traffic_level(edge),
+                "closed": edge.closed
+            })
+
+        print(f"附近道路查询完成，耗时 {query_time:.4f} 秒，找到 {len(result_edges)} 条道路")
+        return jsonify({"edges": result_edges})
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"处理附近道路请求时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
 @app.route('/api/quadtree')
 def get_quadtree_data():
     """
     提供四叉树结构数据的API端点
-    递归提取四叉树的所有边界矩形，返回给前端用于可视化
+    迭代提取四叉树节点边界，返回给前端用于可视化
+
+    查询参数:
+        west, south, east, north: 可选，只返回与该视口相交的节点
+        max_depth: 可选，最大返回深度（根节点为0）
+        format: json（默认，分块流式输出）或 binary（float32边界 + uint8深度）
     """
     try:
         print("收到四叉树数据请求...")
@@ -159,47 +274,36 @@ def get_quadtree_data():
         # 确保空间索引已构建
         if GRAPH.spatial_index is None:
             GRAPH.build_spatial_index()
-            
-        # 递归提取四叉树中的所有边界矩形
-        boundaries = []
-        
-        def extract_boundaries(quadtree, level=0):
-            """递归提取四叉树的所有边界矩形"""
-            if quadtree is None:
-                return
-                
-            # 添加当前节点的边界
-            x_min, y_min, x_max, y_max = quadtree.boundary
-            boundaries.append({
-                "x_min": x_min,
-                "y_min": y_min,
-                "x_max": x_max,
-                "y_max": y_max,
-                "level": level,
-                "points_count": len(quadtree.points)
-            })
-            
-            # 递归处理子节点
-            if quadtree.divided:
-                extract_boundaries(quadtree.northwest, level + 1)
-                extract_boundaries(quadtree.northeast, level + 1)
-                extract_boundaries(quadtree.southwest, level + 1)
-                extract_boundaries(quadtree.southeast, level + 1)
-        
-        # 开始递归提取边界
-        start_time = time.time()
-        extract_boundaries(GRAPH.spatial_index)
-        process_time = time.time() - start_time
-        
-        print(f"四叉树数据处理完成，耗时 {process_time:.4f} 秒，共 {len(boundaries)} 个边界矩形")
-        
-        # 构建返回结果
-        result = {
-            "boundaries": boundaries,
-            "total_count": len(boundaries)
-        }
-        
-        return jsonify(result)
+
+        # 图使用其他空间索引后端时，单独构建一棵四叉树用于可视化
+        quadtree = GRAPH.spatial_index
+        if not isinstance(quadtree, QuadTree):
+            quadtree = create_spatial_index('quadtree', GRAPH.spatial_index.boundary)
+            quadtree.insert_batch(GRAPH.vertices.values())
+
+        # 解析视口和深度参数
+        range_rect = None
+        viewport = [request.args.get(key, type=float) for key in ('west', 'south', 'east', 'north')]
+        if all(value is not None for value in viewport):
+            west, south, east, north = viewport
+            range_rect = (min(west, east), min(south, north), max(west, east), max(south, north))
+        elif any(value is not None for value in viewport):
+            return jsonify({"error": "视口参数west、south、east、north必须同时提供"}), 400
+        max_depth = request.args.get('max_depth', type=int)
+        output_format = request.args.get('format', 'json')
+
+        print(f"四叉树导出: 视口={range_rect}, 最大深度={max_depth}, 格式={output_format}")
+
+        if output_format == 'binary':
+            start_time = time.time()
+            payload = quadtree_to_binary(quadtree, range_rect, max_depth)
+            print(f"四叉树二进制数据生成完成，耗时 {time.time() - start_time:.4f} 秒，共 {len(payload)} 字节")
+            return Response(payload, mimetype='application/octet-stream')
+        if output_format != 'json':
+            return jsonify({"error": f"不支持的格式: {output_format}"}), 400
+
+        # 分块流式输出，避免一次性构建所有边界矩形
+        return Response(iter_quadtree_json(quadtree, range_rect, max_depth), mimetype='application/json')
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
@@ -735,7 +839,8 @@ def get_paths():
         all_path_vertices = set()
 
         if "fastest" in path_types:
-            # 使用A*算法查找最快路径 (考虑交通)
+            # 使用A*算法查找最快路径 (考虑交通)，先把最新的车辆数写回图中
+            sync_graph_traffic()
             path_vertices, path_edges, total_cost = find_fastest_path(GRAPH, start_vertex, end_vertex, use_traffic=True)
             if path_vertices:
                  result_edges = []
@@ -810,13 +915,225 @@ def get_paths():
 def handle_connect():
     """处理客户端连接"""
     print('客户端已连接')
+    GRID_SUBSCRIPTIONS[request.sid] = (GRID_DEFAULT_LEVEL, None)
     emit('connection_response', {'data': '已成功连接到服务器'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """处理客户端断开连接"""
+    if TRAFFIC_STREAM is not None:
+        TRAFFIC_STREAM.unsubscribe(request.sid)
+    if ROUTE_TRACKER is not None:
+        ROUTE_TRACKER.remove_client(request.sid)
+    GRID_SUBSCRIPTIONS.pop(request.sid, None)
     print('客户端已断开连接')
 
+@socketio.on('subscribe_traffic')
+def handle_subscribe_traffic(data=None):
+    """
+    客户端订阅交通数据，发送订阅范围内的关键帧
+
+    参数:
+        data: 可选的订阅参数 {west, south, east, north, binary}，
+              不提供视口范围时订阅整个地图，binary为true时使用二进制帧
+    """
+    stream = get_traffic_stream()
+    if stream is None:
+        emit('simulation_status', {'status': 'error', 'message': '图数据尚未加载完成'})
+        return
+    bounds = None
+    binary = bool(data.get('binary', False)) if data else False
+    if data and 'west' in data:
+        try:
+            west, south, east, north = (float(data[key]) for key in ('west', 'south', 'east', 'north'))
+        except (KeyError, TypeError, ValueError):
+            emit('simulation_status', {'status': 'error', 'message': '视口参数west、south、east、north必须同时提供且为数字'})
+            return
+        bounds = (min(west, east), min(south, north), max(west, east), max(south, north))
+    emit('traffic_update', stream.subscribe(request.sid, bounds, binary))
+
+@socketio.on('traffic_resync')
+def handle_traffic_resync():
+    """客户端检测到丢帧后请求重新同步，按其订阅范围发送关键帧"""
+    stream = get_traffic_stream()
+    if stream is None:
+        emit('simulation_status', {'status': 'error', 'message': '图数据尚未加载完成'})
+        return
+    emit('traffic_update', stream.resync(request.sid))
+
+@socketio.on('track_route')
+def handle_track_route(data=None):
+    """
+    订阅一条路线（例如/api/paths返回的最快路径），之后每一步模拟在ETA变化或出现拥堵时推送route_eta_update
+
+    参数:
+        data: {edges: [道路ID, ...]}，按行驶顺序排列
+    """
+    tracker = get_route_tracker()
+    if tracker is None:
+        emit('route_tracking', {'status': 'error', 'message': '图数据尚未加载完成'})
+        return
+    edge_ids = data.get('edges') if isinstance(data, dict) else None
+    if not isinstance(edge_ids, list) or not edge_ids:
+        emit('route_tracking', {'status': 'error', 'message': 'edges必须是非空的道路ID列表'})
+        return
+    try:
+        edges = tracker.edge_indices(edge_ids)
+    except ValueError as e:
+        emit('route_tracking', {'status': 'error', 'message': str(e)})
+        return
+    travel_time, levels, closed = route_costs(read_traffic_snapshot())
+    route = tracker.add(request.sid, edges, travel_time, levels, closed)
+    emit('route_tracking', {'status': 'tracking', 'route': route})
+
+@socketio.on('untrack_route')
+def handle_untrack_route(data=None):
+    """
+    取消订阅路线
+
+    参数:
+        data: {route_id: 路线ID}
+    """
+    route_id = data.get('route_id') if isinstance(data, dict) else None
+    removed = ROUTE_TRACKER is not None and ROUTE_TRACKER.remove(route_id, request.sid)
+    emit('route_tracking', {'status': 'untracked' if removed else 'error', 'route_id': route_id})
+
+@socketio.on('route_progress')
+def handle_route_progress(data=None):
+    """
+    更新路线上已经驶过的道路数量，之后只计算剩余道路的ETA
+
+    参数:
+        data: {route_id: 路线ID, position: 已经驶过的道路数量}
+    """
+    try:
+        route_id = data['route_id']
+        position = int(data['position'])
+    except (KeyError, TypeError, ValueError):
+        emit('route_tracking', {'status': 'error', 'message': '需要route_id和整数position'})
+        return
+    if ROUTE_TRACKER is None or not ROUTE_TRACKER.set_progress(route_id, position, request.sid):
+        emit('route_tracking', {'status': 'error', 'route_id': route_id, 'message': '路线不存在'})
+
+@socketio.on('probe_pings')
+def handle_probe_pings(data=None):
+    """
+    通过Socket.IO接入一批定位点（例如回放定位点文件），格式与POST /api/probes相同
+
+    参数:
+        data: {t: [...], x: [...], y: [...], speed: [...]}
+    """
+    if get_traffic_state() is None:
+        emit('probe_status', {'status': 'error', 'message': '图数据尚未加载完成'})
+        return
+    try:
+        batch = parse_probe_batch(data)
+    except ValueError as e:
+        emit('probe_status', {'status': 'error', 'message': str(e)})
+        return
+    emit('probe_status', dict(ingest_probe_batch(*batch), status='ok'))
+
+@socketio.on('replay_traffic')
+def handle_replay_traffic(data=None):
+    """
+    回放一段交通历史，只发送给请求的客户端，并限定在其订阅范围内
+
+    参数:
+        data: {start, end}（Unix时间，秒）或 {seconds}（最近若干秒），以及可选的 speed（回放倍速，默认10）
+    """
+    history = get_traffic_history()
+    stream = get_traffic_stream()
+    if history is None or stream is None:
+        emit('replay_status', {'status': 'error', 'message': '图数据尚未加载完成'})
+        return
+    data = data or {}
+    try:
+        speed = float(data.get('speed', 10))
+        if 'seconds' in data:
+            end_time = time.time()
+            start_time = end_time - float(data['seconds'])
+        else:
+            start_time = float(data['start']) if data.get('start') is not None else None
+            end_time = float(data['end']) if data.get('end') is not None else None
+    except (TypeError, ValueError):
+        emit('replay_status', {'status': 'error', 'message': 'start、end、seconds、speed必须为数字'})
+        return
+
+    indices = stream.subscribed_indices(request.sid)
+    if indices is None:
+        indices = np.arange(len(stream.state))
+    # 先复制整个窗口，回放过程中新的记录不会覆盖正在回放的数据
+    timestamps, vehicles = history.query_edges(indices, start_time, end_time)
+    if len(timestamps) == 0:
+        emit('replay_status', {'status': 'error', 'message': '该时间范围内没有交通历史记录'})
+        return
+    emit('replay_status', {'status': 'started', 'frames': len(timestamps),
+                           'start': float(timestamps[0]), 'end': float(timestamps[-1])})
+    socketio.start_background_task(replay_traffic_frames, request.sid, stream, indices,
+                                   timestamps, vehicles, max(speed, 0.01))
+
+def replay_traffic_frames(client_id, stream, indices, timestamps, vehicles, speed):
+    """
+    按记录的时间间隔（除以回放倍速）向客户端发送回放帧，每帧只包含交通等级变化的道路
+
+    参数:
+        client_id: 客户端ID
+        stream: 交通数据编码器，用于获取道路的起终点
+        indices: 回放的道路下标
+        timestamps: 每帧的时间
+        vehicles: 每帧的车辆数 (帧数, 道路数)
+        speed: 回放倍速
+    """
+    levels = traffic_levels(vehicles, stream.state.capacity[indices])
+    n_frames = len(timestamps)
+    for frame in range(n_frames):
+        changed = np.arange(len(indices)) if frame == 0 else np.nonzero(levels[frame] != levels[frame - 1])[0]
+        edges_data = [{
+            "source": stream.sources[edge],
+            "target": stream.targets[edge],
+            "color": LEVEL_COLORS[level]
+        } for edge, level in zip(indices[changed].tolist(), levels[frame, changed].tolist())]
+        socketio.emit('traffic_replay', {
+            "frame": frame,
+            "frames": n_frames,
+            "timestamp": float(timestamps[frame]),
+            "last": frame == n_frames - 1,
+            "edges": edges_data
+        }, to=client_id)
+        if frame < n_frames - 1:
+            socketio.sleep(min((timestamps[frame + 1] - timestamps[frame]) / speed, 5.0))
+
+@socketio.on('subscribe_grid_congestion')
+def handle_subscribe_grid_congestion(data=None):
+    """
+    设置客户端接收的拥堵金字塔级别和视口范围，并立即发送一次该级别的网格数据
+
+    参数:
+        data: {"level": 级别} 或 {"west", "south", "east", "north", "width": 视口宽度（像素）}，
+              只提供视口时按视口宽度选择级别；不提供视口时发送整个地图
+    """
+    data = data or {}
+    pyramid = get_congestion_pyramid()
+    if pyramid is None:
+        emit('grid_congestion_update', {"error": "图数据尚未加载完成，请稍后再试"})
+        return
+    try:
+        viewport = None
+        if all(data.get(name) is not None for name in ('west', 'south', 'east', 'north')):
+            viewport = tuple(float(data[name]) for name in ('west', 'south', 'east', 'north'))
+        if data.get('level') is not None:
+            level = int(data['level'])
+        elif viewport is not None and data.get('width'):
+            level = pyramid.level_for_viewport(viewport, float(data['width']), GRID_CELL_PIXELS)
+        else:
+            level = GRID_DEFAULT_LEVEL
+        level = max(0, min(level, pyramid.max_level))
+    except (TypeError, ValueError):
+        emit('grid_congestion_update', {"error": "无效的网格订阅参数"})
+        return
+    GRID_SUBSCRIPTIONS[request.sid] = (level, viewport)
+    emit('grid_congestion_update', pyramid.level_dict(level, viewport))
+
 @socketio.on('start_traffic_simulation')
 def handle_start_simulation():
     """开始交通模拟"""
@@ -832,6 +1149,7 @@ def handle_start_simulation():
         return
     
     traffic_simulation_running = True
+    get_simulation_process().resume()
     traffic_simulation_thread = threading.Thread(target=traffic_simulation_loop)
     traffic_simulation_thread.daemon = True
     traffic_simulation_thread.start()
@@ -842,118 +1160,497 @@ def handle_start_simulation():
 @socketio.on('stop_traffic_simulation')
 def handle_stop_simulation():
     """停止交通模拟"""
-    global traffic_simulation_running
+    global traffic_simulation_running, TRAFFIC_RNG
     
     traffic_simulation_running = False
+    process = SIMULATION_PROCESS
+    if process is not None and process.is_alive():
+        # 暂停后取回模拟进程的状态，最后一步尚未推送时在这里推送，使主进程中的副本与之一致
+        process.pause()
+        vehicles, rng, tick = process.get_state()
+        if tick != TRAFFIC_TICK:
+            publish_traffic_tick(vehicles, tick)
+        TRAFFIC_RNG = rng
     emit('simulation_status', {'status': 'stopped'})
     print('交通模拟已停止')
 
-def calculate_grid_congestion_data(current_graph, west, south, east, north, grid_size):
+def get_grid_congestion(bounds=None, grid_size=None):
+    """
+    获取与当前交通状态、统计范围和网格大小对应的网格拥堵统计，
+    按统计范围分别缓存，交通状态重建或需要新的网格大小时重新构建
+
+    参数:
+        bounds: 统计范围 (west, south, east, north)，为None时使用整个地图的范围
+        grid_size: 需要支持的网格行/列数，为None时只需要GRID_CONGESTION_SIZES
+
+    返回:
+        GridCongestion实例，图尚未加载时返回None
+    """
+    state = get_traffic_state()
+    if state is None:
+        return None
+    key = None if bounds is None else tuple(float(value) for value in bounds)
+    grid = GRID_CONGESTION.get(key)
+    if grid is None or grid.state is not state or (grid_size is not None and grid_size not in grid.grid_sizes):
+        sizes = set(GRID_CONGESTION_SIZES)
+        if grid is not None and grid.state is state:
+            sizes.update(grid.grid_sizes)
+        if grid_size is not None:
+            sizes.add(grid_size)
+        if len(GRID_CONGESTION) >= GRID_CONGESTION_CACHE_SIZE:
+            GRID_CONGESTION.clear()
+        grid = GridCongestion(state, key, sizes)
+        GRID_CONGESTION[key] = grid
+    return grid
+
+def get_congestion_pyramid():
+    """
+    获取与当前交通状态对应的拥堵金字塔，交通状态重建后重新构建
+
+    返回:
+        CongestionPyramid实例，图尚未加载时返回None
+    """
+    global CONGESTION_PYRAMID
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if CONGESTION_PYRAMID is None or CONGESTION_PYRAMID.state is not state:
+        CONGESTION_PYRAMID = CongestionPyramid(state, max_level=CONGESTION_PYRAMID_LEVELS)
+    return CONGESTION_PYRAMID
+
+def calculate_grid_congestion_data(current_graph, west=None, south=None, east=None, north=None, grid_size=10):
     """
     辅助函数，用于计算网格拥堵数据。
+    道路到网格的分配只在地图、范围或网格大小变化时计算一次，每次调用只需对车辆数做一次bincount
     参数:
         current_graph: 当前的图对象
-        west, south, east, north: 地图边界
+        west, south, east, north: 统计范围，均为None时使用整个地图的范围
         grid_size: 网格的行/列数
     返回:
         包含网格拥堵数据的字典，或在错误时返回None
     """
-    if current_graph is None or current_graph.spatial_index is None:
-        print("错误 (calculate_grid_congestion_data): 图数据或空间索引尚未加载")
+    if current_graph is None:
+        print("错误 (calculate_grid_congestion_data): 图数据尚未加载")
         return None
 
-    grid_data_list = []
-    map_width = east - west
-    map_height = north - south
-    cell_width = map_width / grid_size
-    cell_height = map_height / grid_size
-
-    # 初始化网格数据结构
-    grid_cells_calc = {}
-    for r_idx in range(grid_size):
-        for c_idx in range(grid_size):
-            cell_west_coord = west + c_idx * cell_width
-            cell_south_coord = south + r_idx * cell_height
-            cell_east_coord = cell_west_coord + cell_width
-            cell_north_coord = cell_south_coord + cell_height
-
-            grid_cells_calc[(r_idx, c_idx)] = {
-                "row": r_idx,
-                "col": c_idx,
-                "bounds": {"west": cell_west_coord, "south": cell_south_coord, "east": cell_east_coord, "north": cell_north_coord},
-                "total_capacity": 0,
-                "current_vehicles": 0,
-                "edge_count": 0,
-                "added_edges": set()
-            }
+    bounds = None if west is None else (west, south, east, north)
+    grid = get_grid_congestion(bounds, grid_size)
+    if grid is None:
+        return None
+    # 统计一致的快照，避免读到更新到一半的车辆数
+    vehicles_per_cell = grid.aggregate(read_traffic_snapshot())[grid_size]
+    return grid.to_dict(grid_size, vehicles_per_cell)
 
-    for r_idx in range(grid_size):
-        for c_idx in range(grid_size):
-            cell_key_calc = (r_idx, c_idx)
-            cell_bounds_calc = grid_cells_calc[cell_key_calc]["bounds"]
-            query_rect_calc = (cell_bounds_calc["west"], cell_bounds_calc["south"], cell_bounds_calc["east"], cell_bounds_calc["north"])
-
-            vertices_in_cell_calc = current_graph.spatial_index.query_range(query_rect_calc)
-
-            for vertex_calc in vertices_in_cell_calc:
-                for edge_calc in vertex_calc.edges:
-                    edge_id_calc = edge_calc.id
-                    if edge_id_calc not in grid_cells_calc[cell_key_calc]["added_edges"]:
-                        grid_cells_calc[cell_key_calc]["total_capacity"] += edge_calc.capacity
-                        grid_cells_calc[cell_key_calc]["current_vehicles"] += edge_calc.current_vehicles
-                        grid_cells_calc[cell_key_calc]["edge_count"] += 1
-                        grid_cells_calc[cell_key_calc]["added_edges"].add(edge_id_calc)
-    
-    for r_idx in range(grid_size):
-        for c_idx in range(grid_size):
-            cell_data_calc = grid_cells_calc[(r_idx, c_idx)]
-            del cell_data_calc["added_edges"]
-            grid_data_list.append(cell_data_calc)
+def get_traffic_state():
+    """
+    获取与全局GRAPH对应的向量化交通状态，图的道路数量变化后重新构建
+
+    返回:
+        TrafficState实例，图尚未加载时返回None
+    """
+    global TRAFFIC_STATE
+    if GRAPH is None:
+        return None
+    if TRAFFIC_STATE is None or len(TRAFFIC_STATE) != len(GRAPH.edges):
+        TRAFFIC_STATE = TrafficState.from_graph(GRAPH)
+    return TRAFFIC_STATE
+
+def capture_traffic_checkpoint():
+    """
+    复制当前的交通模拟状态（调用方需持有TRAFFIC_LOCK）
+    模拟进程存活时从进程取回车辆数、随机数生成器和步数，保证三者属于同一步
+
+    返回:
+        检查点数组字典
+    """
+    state = get_traffic_state()
+    process = SIMULATION_PROCESS
+    if process is not None and process.is_alive() and process.state is state:
+        vehicles, rng, tick = process.get_state()
+        snapshot = capture_checkpoint(state, rng, tick, get_traffic_history())
+        snapshot["vehicles"] = vehicles
+        return snapshot
+    return capture_checkpoint(state, TRAFFIC_RNG, TRAFFIC_TICK, get_traffic_history())
+
+def restore_traffic_checkpoint(path=None):
+    """
+    从检查点文件恢复交通模拟状态，并同步到模拟进程
+
+    参数:
+        path: 检查点文件路径，默认为CHECKPOINT_PATH
+
+    返回:
+        恢复后的步数
+    """
+    global TRAFFIC_RNG, TRAFFIC_TICK, GRAPH_TRAFFIC_STALE
+    snapshot = load_checkpoint(path or CHECKPOINT_PATH)
+    with TRAFFIC_LOCK:
+        state = get_traffic_state()
+        TRAFFIC_RNG, TRAFFIC_TICK = restore_checkpoint(snapshot, state, get_traffic_history())
+        GRAPH_TRAFFIC_STALE = True
+        # 所有道路都可能变化：金字塔完整重算，下一次推送比较所有道路
+        get_congestion_pyramid().update(state.vehicles)
+        get_traffic_stream().mark_changed()
+        process = SIMULATION_PROCESS
+        if process is not None and process.is_alive() and process.state is state:
+            process.set_state(state.vehicles, TRAFFIC_RNG, TRAFFIC_TICK)
+    return TRAFFIC_TICK
+
+def get_traffic_history():
+    """
+    获取与当前交通状态对应的历史记录，交通状态重建（道路数量变化）后重新创建
+
+    返回:
+        TrafficHistory实例，图尚未加载时返回None
+    """
+    global TRAFFIC_HISTORY
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if TRAFFIC_HISTORY is None or TRAFFIC_HISTORY.n_edges != len(state):
+        TRAFFIC_HISTORY = TrafficHistory(len(state), TRAFFIC_HISTORY_TICKS)
+        print(f"交通历史记录: 保存 {TRAFFIC_HISTORY.capacity} 步，占用内存 {TRAFFIC_HISTORY.nbytes / 1024 / 1024:.1f} MB")
+    return TRAFFIC_HISTORY
+
+def get_traffic_stream():
+    """
+    获取与当前交通状态对应的增量推送编码器，交通状态重建后随之重建
+
+    返回:
+        TrafficStream实例，图尚未加载时返回None
+    """
+    global TRAFFIC_STREAM
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if TRAFFIC_STREAM is None or TRAFFIC_STREAM.state is not state:
+        # 序号延续之前的编码器，客户端据此发现需要重新同步
+        start_seq = TRAFFIC_STREAM.seq + 1 if TRAFFIC_STREAM is not None else 0
+        subscriptions = TRAFFIC_STREAM.subscriptions() if TRAFFIC_STREAM is not None else {}
+        TRAFFIC_STREAM = TrafficStream(GRAPH, state, start_seq=start_seq)
+        # 保留各客户端的订阅范围
+        for client_id, (bounds, binary) in subscriptions.items():
+            TRAFFIC_STREAM.subscribe(client_id, bounds, binary)
+    return TRAFFIC_STREAM
+
+def get_route_tracker():
+    """
+    获取与当前交通状态对应的路线跟踪，交通状态重建后随之重建（道路下标可能变化，已订阅的路线需要重新订阅）
+
+    返回:
+        RouteTracker实例，图尚未加载时返回None
+    """
+    global ROUTE_TRACKER
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if ROUTE_TRACKER is None or ROUTE_TRACKER.state is not state:
+        ROUTE_TRACKER = RouteTracker(state)
+    return ROUTE_TRACKER
+
+def route_costs(vehicles):
+    """
+    按给定的车辆数计算每条道路的行驶时间（当前拥堵成本模型）、交通等级和封闭标记，供路线ETA使用
+    封闭道路的容量为0，这里按原始容量计算，使路线的ETA保持有限（有封闭道路的路线另行发出警告）
+
+    参数:
+        vehicles: 车辆数数组
+
+    返回:
+        (行驶时间数组, 交通等级数组, 封闭标记数组或None)
+    """
+    state = get_traffic_state()
+    capacity = state.capacity
+    closed = None
+    manager = INCIDENT_MANAGER
+    if manager is not None and manager.state is state and len(manager):
+        closed = manager.closed
+        capacity = np.where(closed, manager.base_capacity, capacity)
+    travel_time = congestion_travel_time(state.length, capacity, vehicles)
+    levels = traffic_levels(vehicles, capacity)
+    return travel_time, levels, closed
+
+def get_incident_manager():
+    """
+    获取与当前交通状态对应的交通事件管理，交通状态重建后随之重建
+
+    返回:
+        IncidentManager实例，图尚未加载时返回None
+    """
+    global INCIDENT_MANAGER
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if INCIDENT_MANAGER is None or INCIDENT_MANAGER.state is not state:
+        INCIDENT_MANAGER = IncidentManager(state)
+    return INCIDENT_MANAGER
+
+def apply_capacity_changes(indices, capacity):
+    """
+    把交通事件造成的容量变化只应用到受影响的道路及其派生数据:
+    交通状态的容量和车辆数上限、图中的道路（容量和封闭标记，寻路使用）、模拟进程（引擎只更新相关数组）、
+    拥堵金字塔和已缓存的网格统计的网格容量、增量推送的发送阈值，并刷新经过这些道路的订阅路线
+
+    参数:
+        indices: 容量发生变化的道路下标数组
+        capacity: 这些道路的新容量数组
+    """
+    global GRAPH_TRAFFIC_STALE
+    if len(indices) == 0:
+        return
+    manager = get_incident_manager()
+    with TRAFFIC_LOCK:
+        state = get_traffic_state()
+        # 金字塔需要在修改容量之前获取：新建的金字塔按当前容量统计，之后再加上变化量
+        pyramid = get_congestion_pyramid()
+        stream = get_traffic_stream()
+        capacity_delta = capacity - state.capacity[indices]
+        previous = state.vehicles[indices]
+        state.set_capacity(indices, capacity)
+        vehicles_delta = state.vehicles[indices] - previous
+
+        # 封闭的道路在图中保留原始容量，寻路按封闭标记跳过
+        closed = manager.closed[indices].tolist()
+        base_capacity = manager.base_capacity[indices].tolist()
+        for i, edge_capacity, base, is_closed in zip(indices.tolist(), capacity.tolist(), base_capacity, closed):
+            edge = GRAPH.edges[state.edge_ids[i]]
+            edge.closed = is_closed
+            edge.capacity = base if is_closed else edge_capacity
+        GRAPH_TRAFFIC_STALE = True
+
+        pyramid.apply_capacity_changes(indices, capacity_delta)
+        pyramid.apply_changes(indices, vehicles_delta)
+        for grid in GRID_CONGESTION.values():
+            if grid.state is state:
+                grid.apply_capacity_changes(indices, capacity_delta)
+        stream.update_capacity(indices)
+        process = SIMULATION_PROCESS
+        if process is not None and process.is_alive() and process.state is state:
+            process.set_capacity(indices, capacity)
+        vehicles = state.vehicles.copy()
+
+    for client_id, frame in stream.publish(indices):
+        socketio.emit('traffic_update', frame, to=client_id)
+    # 只刷新剩余部分经过这些道路的路线
+    tracker = get_route_tracker()
+    if len(tracker):
+        travel_time, levels, closed = route_costs(vehicles)
+        for client_id, update in tracker.publish(travel_time, levels, TRAFFIC_TICK, closed, edges=indices):
+            socketio.emit('route_eta_update', update, to=client_id)
+
+def get_probe_ingestor():
+    """
+    获取与当前交通状态对应的探测车数据接入，交通状态重建后随之重建（窗口内的数据被清空）
+
+    返回:
+        ProbeIngestor实例，图尚未加载时返回None
+    """
+    global PROBE_INGESTOR
+    state = get_traffic_state()
+    if state is None:
+        return None
+    if PROBE_INGESTOR is None or PROBE_INGESTOR.state is not state:
+        PROBE_INGESTOR = ProbeIngestor(state)
+    return PROBE_INGESTOR
+
+def parse_probe_batch(data):
+    """
+    解析一批定位点: {t: [...], x: [...], y: [...], speed: [...]（可选）}
+
+    参数:
+        data: 请求数据
+
+    返回:
+        (时间数组, 横坐标数组, 纵坐标数组, 速度数组或None)
+
+    异常:
+        ValueError: 缺少字段、不是数字或长度不一致
+    """
+    if not isinstance(data, dict):
+        raise ValueError("定位点数据必须是包含t、x、y数组的对象")
+    try:
+        t, x, y = (np.asarray(data[key], dtype=np.float64) for key in ('t', 'x', 'y'))
+        speed = np.asarray(data['speed'], dtype=np.float64) if data.get('speed') is not None else None
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("定位点数据必须包含数字数组t、x、y，speed可选") from None
+    if t.ndim != 1 or t.shape != x.shape or t.shape != y.shape or (speed is not None and speed.shape != t.shape):
+        raise ValueError("定位点的t、x、y、speed数组长度必须相同")
+    return t, x, y, speed
+
+def ingest_probe_batch(t, x, y, speed=None):
+    """
+    接入一批定位点，把有观测的道路的估计车辆数写入交通状态和模拟进程，并推送变化
+
+    参数:
+        t: 时间数组（秒）
+        x: 横坐标数组
+        y: 纵坐标数组
+        speed: 可选的速度数组
+
+    返回:
+        {pings, matched, expired, changed_edges, window_pings, observed_edges, mean_speed, latest_time}
+    """
+    global GRAPH_TRAFFIC_STALE
+    ingestor = get_probe_ingestor()
+    with TRAFFIC_LOCK:
+        state = get_traffic_state()
+        stats = ingestor.ingest(t, x, y, speed)
+        previous = state.vehicles.copy()
+        changed = ingestor.apply_to_state(state)
+        if len(changed):
+            GRAPH_TRAFFIC_STALE = True
+            get_congestion_pyramid().apply_changes(changed, state.vehicles[changed] - previous[changed])
+            # 模拟进程从观测值继续推进，下一步之后没有新观测的道路由模拟接管
+            process = SIMULATION_PROCESS
+            if process is not None and process.is_alive() and process.state is state:
+                process.set_state(state.vehicles)
+    if len(changed):
+        for client_id, frame in get_traffic_stream().publish(changed):
+            socketio.emit('traffic_update', frame, to=client_id)
+    stats["changed_edges"] = len(changed)
+    stats.update(ingestor.summary())
+    return stats
+
+def get_simulation_process():
+    """
+    获取运行交通模拟的进程，交通状态重建或进程意外退出后重新创建
+    新进程从主进程中的交通状态、随机数生成器和步数继续，启动后处于暂停状态
+
+    返回:
+        TrafficSimulationProcess实例，图尚未加载时返回None
+    """
+    global SIMULATION_PROCESS, TRAFFIC_RNG
+    state = get_traffic_state()
+    if state is None:
+        return None
+    process = SIMULATION_PROCESS
+    if process is None or process.state is not state or not process.is_alive():
+        if process is not None:
+            process.close()
+        with TRAFFIC_LOCK:
+            if TRAFFIC_RNG is None:
+                TRAFFIC_RNG = np.random.default_rng()
+            SIMULATION_PROCESS = TrafficSimulationProcess(state, SIMULATION_INTERVAL, TRAFFIC_RNG, TRAFFIC_TICK,
+                                                          TRAFFIC_ACTIVE_PROBABILITY, TRAFFIC_ENGINE).start()
+        print(f"交通模拟进程已启动，道路 {len(state)} 条")
+    return SIMULATION_PROCESS
+
+@atexit.register
+def close_simulation_process():
+    """退出时停止模拟进程并释放共享内存"""
+    global SIMULATION_PROCESS
+    if SIMULATION_PROCESS is not None:
+        SIMULATION_PROCESS.close()
+        SIMULATION_PROCESS = None
+
+def read_traffic_snapshot():
+    """
+    读取最新一步的车辆数
+    模拟进程存活时从共享内存无锁读取一致的快照，否则复制主进程中的交通状态
+
+    返回:
+        车辆数数组（副本），图尚未加载时返回None
+    """
+    state = get_traffic_state()
+    if state is None:
+        return None
+    process = SIMULATION_PROCESS
+    if process is not None and process.is_alive() and process.state is state:
+        return process.snapshot()[0]
+    with TRAFFIC_LOCK:
+        return state.vehicles.copy()
+
+def sync_graph_traffic():
+    """
+    需要读取图中道路车辆数时（寻路、附近道路等），把最新的车辆数写回图中
+    模拟每一步不再遍历所有道路对象，只有在状态变化后第一次需要时才写回
+    """
+    global GRAPH_TRAFFIC_STALE
+    if not GRAPH_TRAFFIC_STALE or GRAPH is None:
+        return
+    # 先清除标记：写回期间又有新的一步时会重新标记
+    GRAPH_TRAFFIC_STALE = False
+    state = get_traffic_state()
+    for edge_id, vehicles in zip(state.edge_ids, read_traffic_snapshot().tolist()):
+        GRAPH.edges[edge_id].current_vehicles = vehicles
+
+def publish_traffic_tick(vehicles, tick):
+    """
+    处理模拟进程完成的一步：更新主进程中的交通状态副本、历史记录和拥堵金字塔，
+    定期保存检查点，并向订阅的客户端推送变化
+
+    参数:
+        vehicles: 该步的车辆数数组
+        tick: 步数
+    """
+    global TRAFFIC_TICK, CHECKPOINT_WRITER, GRAPH_TRAFFIC_STALE
+    with TRAFFIC_LOCK:
+        state = get_traffic_state()
+        # 金字塔需要在更新副本之前获取：新建的金字塔按当前副本统计，之后再加上变化量
+        pyramid = get_congestion_pyramid()
+        # 只有车辆数变化的道路需要更新拥堵金字塔和参与增量推送的比较
+        changed = np.flatnonzero(vehicles != state.vehicles)
+        delta = vehicles[changed] - state.vehicles[changed]
+        state.vehicles[changed] = vehicles[changed]
+        TRAFFIC_TICK = tick
+        GRAPH_TRAFFIC_STALE = True
+        get_traffic_history().record(state.vehicles, tick=TRAFFIC_TICK)
+        pyramid.apply_changes(changed, delta)
+        
+        # 定期保存检查点：这里只复制状态，文件在后台线程写入
+        if CHECKPOINT_INTERVAL_TICKS and TRAFFIC_TICK % CHECKPOINT_INTERVAL_TICKS == 0:
+            if CHECKPOINT_WRITER is None:
+                CHECKPOINT_WRITER = CheckpointWriter(CHECKPOINT_PATH)
+            CHECKPOINT_WRITER.submit(capture_traffic_checkpoint())
     
-    return {
-        "grid_size": grid_size,
-        "bounds": {"west": west, "south": south, "east": east, "north": north},
-        "cells": grid_data_list
-    }
+    # 每个客户端只接收其订阅范围内交通等级或车辆数发生变化的路段
+    for client_id, frame in get_traffic_stream().publish(changed):
+        socketio.emit('traffic_update', frame, to=client_id)
+
+    # 刷新所有订阅路线的ETA，只推送变化超过阈值或警告发生变化的路线
+    tracker = get_route_tracker()
+    if len(tracker):
+        travel_time, levels, closed = route_costs(vehicles)
+        for client_id, update in tracker.publish(travel_time, levels, tick, closed):
+            socketio.emit('route_eta_update', update, to=client_id)
+
+    # 发送网格拥堵数据：每个客户端接收与其缩放相符的金字塔级别，只包含视口内的网格
+    level_frames = {}
+    for client_id, (level, viewport) in list(GRID_SUBSCRIPTIONS.items()):
+        if viewport is None:
+            if level not in level_frames:
+                level_frames[level] = pyramid.level_dict(level)
+            frame = level_frames[level]
+        else:
+            frame = pyramid.level_dict(level, viewport)
+        socketio.emit('grid_congestion_update', frame, to=client_id)
+        # print("已通过WebSocket发送网格拥堵更新") # 可选日志
 
 def traffic_simulation_loop():
-    """交通模拟循环"""
+    """
+    交通数据推送循环
+    模拟在独立进程中按SIMULATION_INTERVAL推进；这里只轮询共享内存的版本号，
+    有新的一步时无锁读取快照并推送，推送线程不再与模拟计算争用GIL
+    """
     global traffic_simulation_running
     global GRAPH # 确保能访问全局GRAPH对象
     
+    last_process = last_version = None
     while traffic_simulation_running:
-        if GRAPH is not None:
-            # 更新交通流
-            update_traffic_flow(GRAPH)
-            
-            # 获取交通颜色和等级 (用于路段)
-            traffic_colors = get_traffic_color(GRAPH)
-            traffic_levels = get_traffic_level(GRAPH)
-            
-            # 构建路段数据
-            edges_data = []
-            for edge_id, edge in GRAPH.edges.items():
-                edges_data.append({
-                    "id": edge_id,
-                    "source": edge.vertex1.id,
-                    "target": edge.vertex2.id,
-                    "color": traffic_colors.get(edge_id, "#808080"),
-                    "level": traffic_levels.get(edge_id, 0),
-                    "current_vehicles": edge.current_vehicles,
-                    "capacity": edge.capacity
-                })
-            
-            # 发送路段数据到客户端
-            socketio.emit('traffic_update', {'edges': edges_data})
-
-            # 计算并发送网格拥堵数据
-            grid_congestion_data = calculate_grid_congestion_data(GRAPH, 0, 0, 2000, 2000, 10)
-            if grid_congestion_data:
-                socketio.emit('grid_congestion_update', grid_congestion_data)
-                # print("已通过WebSocket发送网格拥堵更新") # 可选日志
+        process = get_simulation_process() if GRAPH is not None else None
+        if process is not last_process:
+            # 进程意外退出后重建的新进程处于暂停状态，模拟仍在运行时需要继续；新进程的版本号重新计数
+            if process is not None and traffic_simulation_running and not process.running:
+                process.resume()
+            last_process, last_version = process, None
+        if process is not None and process.version != last_version:
+            vehicles, tick, last_version, _ = process.snapshot()
+            # 恢复检查点或写入分配结果也会更新共享内存，步数不变时不作为新的一步
+            if tick != TRAFFIC_TICK:
+                publish_traffic_tick(vehicles, tick)
         
         # 休眠一段时间
-        time.sleep(2)  # 每2秒更新一次
+        time.sleep(TRAFFIC_PUBLISH_POLL)
 
 @app.route('/api/nearby_special_points', methods=['GET'])
 def get_nearby_special_points():
@@ -1042,28 +1739,53 @@ def get_nearby_special_points():
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
 @app.route('/api/grid_congestion', methods=['GET','POST'])
-def get_grid_congestion():
+def get_grid_congestion_api():
     """
-    API端点，用于计算固定地图网格的拥堵程度。
-    使用固定边界(0,0)到(2000,2000)，划分为10x10网格。
-    计算每个网格内边的总容量和当前车辆数。
-    利用四叉树空间索引查询网格内的顶点来辅助统计。
+    API端点，用于计算地图网格的拥堵程度。
+    计算每个网格内边的总容量和当前车辆数，每条道路计入其起点所在的网格。
     
     此端点主要用于初始加载或不支持WebSocket的备选方案。
     实时更新通过Socket.IO的 'grid_congestion_update' 事件推送。
+    
+    查询参数:
+        grid_size: 网格的行/列数，默认为10
+        west, south, east, north: 统计范围，需同时提供，默认为整个地图的范围
+        level: 拥堵金字塔级别（2^level × 2^level 网格）；提供时west等参数表示视口范围，
+               只返回与视口相交且有道路的网格
         
     返回:
         JSON响应，包含每个网格的数据列表。
     """
     start_time_total = time.time()
-    print("API /api/grid_congestion 开始处理请求 (固定边界 2000x2000, HTTP端点)")
+    print("API /api/grid_congestion 开始处理请求 (HTTP端点)")
     try:
-        # 固定地图边界和网格大小
-        west, south, east, north = 0, 0, 2000, 2000
-        grid_size = 10
+        grid_size = request.args.get('grid_size', 10, type=int)
+        if grid_size is None or not 0 < grid_size <= GRID_CONGESTION_MAX_SIZE:
+            return jsonify({"error": f"grid_size必须是1到{GRID_CONGESTION_MAX_SIZE}之间的整数"}), 400
+
+        bounds = [request.args.get(name, type=float) for name in ('west', 'south', 'east', 'north')]
+        if all(value is None for value in bounds):
+            bounds = [None] * 4
+        elif any(value is None for value in bounds):
+            return jsonify({"error": "west、south、east、north参数需要同时提供"}), 400
+        elif bounds[2] <= bounds[0] or bounds[3] <= bounds[1]:
+            return jsonify({"error": "east必须大于west，north必须大于south"}), 400
+        
+        level = request.args.get('level', type=int)
+        if level is not None:
+            if not 0 <= level <= CONGESTION_PYRAMID_LEVELS:
+                return jsonify({"error": f"level必须是0到{CONGESTION_PYRAMID_LEVELS}之间的整数"}), 400
+            viewport = None if bounds[0] is None else tuple(bounds)
+            # 拥堵金字塔在每个模拟步中随交通状态一起增量更新，这里只需在锁内读取
+            with TRAFFIC_LOCK:
+                pyramid = get_congestion_pyramid()
+                if pyramid is None:
+                    return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+                level_data = pyramid.level_dict(level, viewport)
+            return jsonify(level_data)
         
         global GRAPH
-        calculated_data = calculate_grid_congestion_data(GRAPH, west, south, east, north, grid_size)
+        calculated_data = calculate_grid_congestion_data(GRAPH, *bounds, grid_size)
 
         if calculated_data is None:
             return jsonify({"error": "计算网格拥堵数据失败，可能是图数据未加载"}), 500
@@ -1079,6 +1801,409 @@ def get_grid_congestion():
         print(error_traceback)
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
+@app.route('/api/traffic_assignment', methods=['POST'])
+def run_traffic_assignment():
+    """
+    生成起讫点出行需求并进行用户均衡交通分配，用分配结果替换当前的道路车辆数
+    
+    请求体(JSON，均可选):
+        trips: 出行总量，默认50000
+        zone_grid: 每个方向的交通小区数量，默认16
+        iterations: Frank-Wolfe最大迭代次数，默认10
+        gap: 相对间隙容差，默认0.001
+        workers: 计算最短路径的工作进程数量，默认为CPU核心数
+        seed: 随机数种子
+        
+    返回:
+        JSON响应，包含起讫点对数量、迭代次数、相对间隙和耗时
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            n_trips = int(data.get('trips', 50000))
+            zone_grid = int(data.get('zone_grid', 16))
+            iterations = int(data.get('iterations', 10))
+            gap = float(data.get('gap', 1e-3))
+            workers = int(data['workers']) if data.get('workers') is not None else None
+            seed = int(data['seed']) if data.get('seed') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "无效的交通分配参数"}), 400
+        if n_trips <= 0 or zone_grid <= 0 or iterations <= 0:
+            return jsonify({"error": "trips、zone_grid和iterations必须为正整数"}), 400
+        
+        state = get_traffic_state()
+        if state is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        
+        global GRAPH_TRAFFIC_STALE
+        start_time = time.time()
+        demand = generate_od_demand(GRAPH, n_trips, zone_grid, rng=np.random.default_rng(seed))
+        with TrafficAssignment(state, demand, n_workers=workers) as assignment:
+            stats = assignment.solve(iterations, gap)
+            # 分配耗时较长，只在写入结果时持有锁
+            with TRAFFIC_LOCK:
+                assignment.apply_to_state(state)
+                GRAPH_TRAFFIC_STALE = True
+                get_congestion_pyramid().update(state.vehicles)
+                get_traffic_stream().mark_changed()
+                process = SIMULATION_PROCESS
+                if process is not None and process.is_alive() and process.state is state:
+                    process.set_state(state.vehicles)
+        elapsed = time.time() - start_time
+        print(f"交通分配完成: {len(demand)} 对起讫点，迭代 {stats['iterations']} 次，"
+              f"相对间隙 {stats['relative_gap']:.6f}，耗时 {elapsed:.2f} 秒")
+        return jsonify({
+            "od_pairs": len(demand),
+            "trips": demand.total_trips,
+            "iterations": stats["iterations"],
+            "relative_gap": stats["relative_gap"],
+            "gaps": stats["gaps"],
+            "unassigned": stats["unassigned"],
+            "shortest_path_time": stats["shortest_path_time"],
+            "elapsed": elapsed
+        })
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"交通分配时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/probes', methods=['POST'])
+def ingest_probes():
+    """
+    接入一批探测车定位点：匹配到道路，按滑动时间窗口估计车辆数和平均速度，
+    写入交通状态后寻路和交通数据推送使用观测值
+    
+    请求体(JSON):
+        t: 时间数组（秒）
+        x: 横坐标数组
+        y: 纵坐标数组
+        speed: 可选的速度数组
+        
+    返回:
+        JSON响应，包含匹配数量、发生变化的道路数量和窗口统计
+    """
+    try:
+        if get_traffic_state() is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        try:
+            batch = parse_probe_batch(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        start_time = time.time()
+        stats = ingest_probe_batch(*batch)
+        stats["elapsed"] = time.time() - start_time
+        print(f"接入定位点 {stats['pings']} 个，匹配 {stats['matched']} 个，"
+              f"更新 {stats['changed_edges']} 条道路，耗时 {stats['elapsed']:.4f} 秒")
+        return jsonify(stats)
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"接入定位点时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/incidents', methods=['GET', 'POST'])
+def incidents_api():
+    """
+    查看或添加交通事件（道路封闭或通行能力下降），只更新受影响道路的派生数据
+    
+    请求体(POST，JSON):
+        edges: 道路ID列表
+        type: closure（封闭，默认）或 capacity（通行能力下降）
+        capacity_factor: 通行能力下降时的容量系数 (0, 1)
+        description: 可选的事件描述
+        
+    返回:
+        GET: {"incidents": [事件, ...]}
+        POST: JSON响应，包含新事件、容量发生变化的道路数量和耗时
+    """
+    try:
+        manager = get_incident_manager()
+        if manager is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        if request.method == 'GET':
+            return jsonify({"incidents": [manager.to_dict(incident) for incident in manager.incidents()]})
+        
+        data = request.get_json(silent=True) or {}
+        edge_ids = data.get('edges')
+        if not isinstance(edge_ids, list) or not edge_ids:
+            return jsonify({"error": "edges必须是非空的道路ID列表"}), 400
+        state = get_traffic_state()
+        missing = [edge_id for edge_id in edge_ids if edge_id not in state.edge_index]
+        if missing:
+            return jsonify({"error": f"道路不存在: {missing[:10]}"}), 400
+        try:
+            capacity_factor = float(data['capacity_factor']) if data.get('capacity_factor') is not None else None
+            start_time = time.time()
+            incident, changed, capacity = manager.add([state.edge_index[edge_id] for edge_id in edge_ids],
+                                                      data.get('type', 'closure'), capacity_factor,
+                                                      str(data.get('description', '')))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"无效的交通事件: {e}"}), 400
+        apply_capacity_changes(changed, capacity)
+        elapsed = time.time() - start_time
+        print(f"交通事件 {incident['id']} ({incident['type']}) 已添加，{len(changed)} 条道路的容量发生变化，"
+              f"耗时 {elapsed:.4f} 秒")
+        return jsonify({"incident": manager.to_dict(incident), "changed_edges": len(changed), "elapsed": elapsed})
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"处理交通事件请求时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/incidents/<int:incident_id>', methods=['DELETE'])
+def remove_incident_api(incident_id):
+    """
+    解除交通事件，受影响的道路恢复为其余事件的最小容量系数或原始容量
+    
+    返回:
+        JSON响应，包含解除的事件、容量发生变化的道路数量和耗时
+    """
+    try:
+        manager = get_incident_manager()
+        if manager is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        if manager.get(incident_id) is None:
+            return jsonify({"error": f"交通事件不存在: {incident_id}"}), 404
+        start_time = time.time()
+        incident, changed, capacity = manager.remove(incident_id)
+        apply_capacity_changes(changed, capacity)
+        elapsed = time.time() - start_time
+        print(f"交通事件 {incident_id} 已解除，{len(changed)} 条道路的容量发生变化，耗时 {elapsed:.4f} 秒")
+        return jsonify({"incident": manager.to_dict(incident), "changed_edges": len(changed), "elapsed": elapsed})
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"解除交通事件时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/traffic_ensemble', methods=['POST'])
+def run_traffic_ensemble():
+    """
+    从当前交通状态出发，对若干情景并行运行蒙特卡洛模拟副本，比较各道路的拥堵度统计
+    不会修改当前的交通模拟
+    
+    请求体(JSON):
+        scenarios: 情景列表，每项可包含 name、closed_edges（道路ID列表）、capacity_scale、
+                   capacity_factors（道路ID -> 倍数）、mall_demand、demand_edges；默认只有基准情景
+        replicas: 每个情景的副本数量，默认8
+        ticks: 每个副本统计的步数，默认100
+        warmup: 开始统计之前执行的步数，默认0
+        workers: 工作进程数量，默认为CPU核心数
+        seed: 随机数种子
+        quantile: 统计的分位数，默认0.9
+        top: 每个情景列出的最拥堵道路数量，默认10
+        
+    返回:
+        JSON响应，包含每个情景的汇总统计和耗时
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            replicas = int(data.get('replicas', 8))
+            ticks = int(data.get('ticks', 100))
+            warmup = int(data.get('warmup', 0))
+            workers = int(data['workers']) if data.get('workers') is not None else None
+            seed = int(data['seed']) if data.get('seed') is not None else None
+            quantile = float(data.get('quantile', 0.9))
+            top = int(data.get('top', 10))
+            specs = data.get('scenarios') or [{"name": "基准"}]
+            scenarios = [Scenario(spec.get('name', f"情景{i + 1}"), spec.get('closed_edges', ()),
+                                  float(spec.get('capacity_scale', 1.0)), spec.get('capacity_factors'),
+                                  float(spec.get('mall_demand', 0.0)), spec.get('demand_edges'))
+                         for i, spec in enumerate(specs)]
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({"error": f"无效的集合模拟参数: {e}"}), 400
+        if replicas <= 0 or ticks <= 0 or warmup < 0 or not 0 <= quantile <= 1:
+            return jsonify({"error": "replicas和ticks必须为正整数，warmup不能为负，quantile必须在0到1之间"}), 400
+        
+        state = get_traffic_state()
+        if state is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        
+        start_time = time.time()
+        try:
+            ensemble = TrafficEnsemble(state, scenarios, n_workers=workers, vehicles=read_traffic_snapshot())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        with ensemble:
+            results = ensemble.run(replicas, ticks, warmup, seed)
+        elapsed = time.time() - start_time
+        print(f"集合模拟完成: {len(scenarios)} 个情景 × {replicas} 个副本 × {ticks} 步，耗时 {elapsed:.2f} 秒")
+        return jsonify({
+            "scenarios": [result.summary(state.edge_ids, quantile, top) for result in results],
+            "replicas": replicas,
+            "ticks": ticks,
+            "quantile": quantile,
+            "elapsed": elapsed
+        })
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"集合模拟时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/congestion_model', methods=['GET', 'POST'])
+def congestion_model_api():
+    """
+    查看或切换拥堵成本模型（寻路、交通分配和路网行驶时间共用）
+    
+    请求体(POST，JSON):
+        type: 模型名称 default / spec / bpr / piecewise
+        scale: 常数c，默认1
+        exp_table: default和spec模型是否使用指数查表近似（true或 {max_x, resolution}）
+        params: 模型参数，例如 {"threshold": 0.5}、{"alpha": 0.15, "beta": 4}、{"table": [[0, 1], [1, 3]]}
+        
+    返回:
+        JSON响应，包含当前模型的类型、常数c和参数
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            params = data.get('params') or {}
+            if not isinstance(params, dict):
+                return jsonify({"error": "params必须是对象"}), 400
+            try:
+                model = create_congestion_model(data.get('type', 'default'), float(data.get('scale', 1.0)),
+                                                data.get('exp_table'), **params)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": f"无效的拥堵成本模型: {e}"}), 400
+            set_congestion_model(model)
+            print(f"拥堵成本模型已切换为 {model.name}")
+        return jsonify(get_congestion_model().to_dict())
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"处理拥堵成本模型请求时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/traffic_checkpoint', methods=['POST'])
+def save_traffic_checkpoint():
+    """
+    立即保存交通模拟检查点
+        
+    返回:
+        JSON响应，包含检查点路径、步数、文件大小和耗时
+    """
+    try:
+        if get_traffic_state() is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        start_time = time.time()
+        with TRAFFIC_LOCK:
+            snapshot = capture_traffic_checkpoint()
+        write_checkpoint(CHECKPOINT_PATH, snapshot)
+        elapsed = time.time() - start_time
+        print(f"交通检查点已保存，步数 {int(snapshot['tick'])}，耗时 {elapsed:.4f} 秒")
+        return jsonify({
+            "path": os.path.abspath(CHECKPOINT_PATH),
+            "tick": int(snapshot["tick"]),
+            "size": os.path.getsize(CHECKPOINT_PATH),
+            "elapsed": elapsed
+        })
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"保存交通检查点时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/traffic_checkpoint/restore', methods=['POST'])
+def restore_traffic_checkpoint_api():
+    """
+    从检查点文件恢复交通模拟状态（模拟运行中也可以恢复，下一步从恢复的状态继续）
+        
+    返回:
+        JSON响应，包含恢复后的步数和耗时
+    """
+    try:
+        if get_traffic_state() is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        if not os.path.exists(CHECKPOINT_PATH):
+            return jsonify({"error": "检查点文件不存在"}), 404
+        start_time = time.time()
+        tick = restore_traffic_checkpoint()
+        elapsed = time.time() - start_time
+        print(f"交通检查点已恢复，步数 {tick}，耗时 {elapsed:.4f} 秒")
+        return jsonify({"tick": tick, "elapsed": elapsed})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"恢复交通检查点时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+@app.route('/api/traffic_history', methods=['GET'])
+def get_traffic_history_data():
+    """
+    查询交通历史记录
+    
+    查询参数:
+        edge_id: 查询单条道路的车辆数历史
+        west, south, east, north: 查询与该矩形相交的所有道路（与edge_id二选一）
+        start, end: 可选的时间范围（Unix时间，秒），默认为全部记录
+        per_edge: 矩形查询时是否返回每条道路的历史，默认只返回汇总
+        
+    返回:
+        JSON响应，包含时间序列和对应的车辆数
+    """
+    try:
+        history = get_traffic_history()
+        if history is None:
+            return jsonify({"error": "图数据尚未加载完成，请稍后再试"}), 500
+        state = get_traffic_state()
+
+        start_time = request.args.get('start', type=float)
+        end_time = request.args.get('end', type=float)
+        if 'edge_id' in request.args:
+            edge_id = request.args.get('edge_id', type=int)
+            if edge_id not in state.edge_index:
+                return jsonify({"error": f"道路 {edge_id} 不存在"}), 400
+            index = state.edge_index[edge_id]
+            timestamps, vehicles = history.query_edge(index, start_time, end_time)
+            return jsonify({
+                "edge_id": edge_id,
+                "capacity": float(state.capacity[index]),
+                "timestamps": timestamps.tolist(),
+                "vehicles": vehicles.tolist()
+            })
+
+        viewport = [request.args.get(key, type=float) for key in ('west', 'south', 'east', 'north')]
+        if None in viewport:
+            return jsonify({"error": "必须提供edge_id，或同时提供west、south、east、north"}), 400
+        west, south, east, north = viewport
+        edges = GRAPH.get_edges_in_range((min(west, east), min(south, north), max(west, east), max(south, north)))
+        indices = np.asarray([state.edge_index[edge.id] for edge in edges if edge.id in state.edge_index],
+                             dtype=np.int64)
+        timestamps, vehicles = history.query_edges(indices, start_time, end_time)
+        result = {
+            "edge_count": len(indices),
+            "total_capacity": float(state.capacity[indices].sum()),
+            "timestamps": timestamps.tolist(),
+            "total_vehicles": vehicles.sum(axis=1, dtype=np.int64).tolist()
+        }
+        if request.args.get('per_edge', 'false').lower() in ('1', 'true'):
+            result["edges"] = [{
+                "id": state.edge_ids[index],
+                "capacity": float(state.capacity[index]),
+                "vehicles": vehicles[:, column].tolist()
+            } for column, index in enumerate(indices.tolist())]
+        return jsonify(result)
+
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        print(f"处理交通历史请求时出错: {str(e)}")
+        print(error_traceback)
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
 def precompute_zoom_level_clusters_KMeans(graph):
     """
     为所有预定义的缩放等级预计算Mini-Batch KMeans聚类结果
@@ -1304,6 +2429,14 @@ def run_server(host='127.0.0.1', port=5000, debug=True):
         load_time = time.time() - start_time
         print(f"地图数据加载完成，耗时 {load_time:.2f} 秒，共 {len(GRAPH.vertices)} 个顶点和 {len(GRAPH.edges)} 条边")
         
+        # 存在检查点时恢复上一次运行的交通模拟状态
+        if os.path.exists(CHECKPOINT_PATH):
+            try:
+                tick = restore_traffic_checkpoint()
+                print(f"已从检查点恢复交通模拟状态，步数 {tick}")
+            except ValueError as e:
+                print(f"检查点与当前地图不一致，忽略: {e}")
+        
         # 预计算不同缩放等级的聚类结果
         # 如需切换为DBSCAN预计算，请改为 precompute_zoom_level_clusters_DBSCAN(GRAPH)
         # precompute_zoom_level_clusters_DBSCAN(GRAPH)
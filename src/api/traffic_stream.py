@@ -0,0 +1,296 @@
+"""
+交通数据增量推送
+维护已发布给客户端的道路交通状态快照，订阅时发送完整关键帧，
+之后每次更新只发送交通等级或车辆数发生变化的道路，并附带序号用于客户端检测丢帧和重新同步
+"""
+import threading
+import numpy as np
+from src.algorithms.traffic_engine import TrafficState, get_traffic_level_vectorized, traffic_levels, LEVEL_COLORS
+from src.exporters.binary_exporter import encode_traffic_keyframe, encode_traffic_delta
+
+
+class TrafficStream:
+    """
+    交通数据增量编码器
+
+    已发布的状态（published_levels / published_vehicles）是所有客户端共同的基准：
+    关键帧描述的是已发布状态，增量帧把已发布状态从序号base推进到seq。
+    客户端可以只订阅一个矩形范围，之后只收到与该范围相交的道路，
+    每个客户端的数据量只与其视口内的道路数有关，与地图规模无关
+
+    属性:
+        state: 对应的交通状态
+        seq: 最近一次发布的序号
+        vehicle_tolerance: 车辆数变化超过 容量×该比例 时才发送，0表示任何变化都发送
+    """
+
+    def __init__(self, graph, state: TrafficState, vehicle_tolerance: float = 0.02, start_seq: int = 0):
+        """
+        初始化增量编码器
+
+        参数:
+            graph: 图实例
+            state: 交通状态
+            vehicle_tolerance: 车辆数变化的发送阈值（相对于道路容量）
+            start_seq: 起始序号，重建时应大于之前的序号以便客户端检测到重新同步
+        """
+        self.graph = graph
+        self.state = state
+        self.vehicle_tolerance = vehicle_tolerance
+        self.seq = start_seq
+        edges = [graph.edges[edge_id] for edge_id in state.edge_ids]
+        self.sources = [edge.vertex1.id for edge in edges]
+        self.targets = [edge.vertex2.id for edge in edges]
+        self._source_array = np.asarray(self.sources)
+        self._target_array = np.asarray(self.targets)
+        self.published_levels = get_traffic_level_vectorized(state).astype(np.uint8)
+        self.published_vehicles = np.rint(state.vehicles)
+        self._threshold = np.maximum(state.capacity * vehicle_tolerance, 1.0) if vehicle_tolerance > 0 else None
+        self._subscriptions = {}  # 客户端ID -> (订阅范围, 范围内道路的布尔掩码, 是否使用二进制帧)，范围为None表示整个地图
+        self._lock = threading.Lock()
+        self._marked = []  # mark_changed登记的道路下标数组列表，None表示下一次发布比较所有道路
+
+    def _edges_in_bounds(self, bounds) -> np.ndarray:
+        """使用道路空间索引查询与矩形范围相交的道路，返回道路下标数组"""
+        edge_index = self.graph.edge_index or self.graph.build_edge_index()
+        if edge_index is None:
+            return np.empty(0, dtype=np.int64)
+        index_of = self.state.edge_index
+        found = [index_of[edge.id] for edge in edge_index.query_box(bounds) if edge.id in index_of]
+        return np.asarray(found, dtype=np.int64)
+
+    def subscribe(self, client_id, bounds=None, binary: bool = False):
+        """
+        设置客户端的订阅范围，并返回该范围内的关键帧
+
+        参数:
+            client_id: 客户端ID（Socket.IO的sid）
+            bounds: 订阅范围 (x_min, y_min, x_max, y_max)，为None时订阅整个地图
+            binary: 是否使用二进制帧（见binary_exporter）
+
+        返回:
+            订阅范围内的关键帧
+        """
+        if bounds is None:
+            mask = None
+            indices = None
+        else:
+            indices = np.sort(self._edges_in_bounds(bounds))
+            mask = np.zeros(len(self.state), dtype=bool)
+            mask[indices] = True
+        with self._lock:
+            self._subscriptions[client_id] = (bounds, mask, binary)
+            # 在同一把锁内生成关键帧，保证之后发布的增量帧都以它为基准
+            return self._keyframe(indices, binary)
+
+    def resync(self, client_id):
+        """
+        客户端检测到丢帧时，按其现有订阅范围重新生成关键帧
+
+        参数:
+            client_id: 客户端ID
+
+        返回:
+            关键帧，未订阅的客户端返回整个地图的关键帧
+        """
+        with self._lock:
+            _, mask, binary = self._subscriptions.get(client_id, (None, None, False))
+            return self._keyframe(None if mask is None else np.nonzero(mask)[0], binary)
+
+    def subscribed_indices(self, client_id):
+        """
+        获取客户端订阅范围内的道路下标
+
+        参数:
+            client_id: 客户端ID
+
+        返回:
+            道路下标数组，订阅整个地图或未订阅时返回None
+        """
+        with self._lock:
+            _, mask, _ = self._subscriptions.get(client_id, (None, None, False))
+        return None if mask is None else np.nonzero(mask)[0]
+
+    def unsubscribe(self, client_id):
+        """
+        取消客户端的订阅
+
+        参数:
+            client_id: 客户端ID
+        """
+        with self._lock:
+            self._subscriptions.pop(client_id, None)
+
+    def subscriptions(self) -> dict:
+        """
+        获取所有客户端的订阅范围
+
+        返回:
+            {客户端ID: (订阅范围, 是否使用二进制帧)} 字典，用于交通状态重建后恢复订阅
+        """
+        with self._lock:
+            return {client_id: (bounds, binary) for client_id, (bounds, _, binary) in self._subscriptions.items()}
+
+    def keyframe(self, indices=None) -> dict:
+        """
+        生成描述当前已发布状态的关键帧
+
+        参数:
+            indices: 只包含这些道路（下标数组），为None时包含所有道路
+
+        返回:
+            {"type": "keyframe", "seq": 序号, "edges": [道路数据, ...]}
+        """
+        with self._lock:
+            return self._keyframe(indices)
+
+    def _keyframe(self, indices, binary=False):
+        """构建关键帧（调用方需持有锁）"""
+        if indices is None:
+            indices = np.arange(len(self.state))
+        if binary:
+            return encode_traffic_keyframe(
+                self.seq, indices, self._source_array[indices], self._target_array[indices],
+                self.state.capacity[indices], self.published_vehicles[indices], self.published_levels[indices])
+        levels = self.published_levels[indices].tolist()
+        vehicles = self.published_vehicles[indices].tolist()
+        capacity = self.state.capacity[indices].tolist()
+        edge_ids, sources, targets = self.state.edge_ids, self.sources, self.targets
+        edges_data = [{
+            "id": edge_ids[i],
+            "source": sources[i],
+            "target": targets[i],
+            "color": LEVEL_COLORS[level],
+            "level": level,
+            "current_vehicles": vehicles_count,
+            "capacity": edge_capacity
+        } for i, level, vehicles_count, edge_capacity in zip(indices.tolist(), levels, vehicles, capacity)]
+        return {"type": "keyframe", "seq": self.seq, "edges": edges_data}
+
+    def update_capacity(self, indices):
+        """
+        部分道路的容量发生变化后（state.capacity已更新）调用：更新这些道路的车辆数发送阈值，
+        并登记在下一次发布时比较（交通等级随容量变化）
+
+        参数:
+            indices: 容量发生变化的道路下标数组
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        with self._lock:
+            if self._threshold is not None:
+                self._threshold[indices] = np.maximum(self.state.capacity[indices] * self.vehicle_tolerance, 1.0)
+        self.mark_changed(indices)
+
+    def mark_changed(self, indices=None):
+        """
+        登记在下一次发布之前车辆数发生变化的道路，供只比较部分道路的发布使用
+
+        参数:
+            indices: 道路下标数组，为None时下一次发布比较所有道路
+        """
+        with self._lock:
+            if indices is None:
+                self._marked = None
+            elif self._marked is not None:
+                self._marked.append(np.asarray(indices, dtype=np.int64))
+
+    def changed_indices(self, candidates=None):
+        """
+        比较交通状态与已发布状态，返回需要发送的道路下标
+
+        参数:
+            candidates: 只比较这些道路（上次发布以来车辆数发生变化的道路），为None时比较所有道路
+
+        返回:
+            (道路下标数组, 新等级数组, 新车辆数数组)
+        """
+        if candidates is None:
+            levels = get_traffic_level_vectorized(self.state).astype(np.uint8)
+            vehicles = np.rint(self.state.vehicles)
+            published_levels, published_vehicles, threshold = \
+                self.published_levels, self.published_vehicles, self._threshold
+        else:
+            candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+            levels = traffic_levels(self.state.vehicles[candidates], self.state.capacity[candidates]).astype(np.uint8)
+            vehicles = np.rint(self.state.vehicles[candidates])
+            published_levels = self.published_levels[candidates]
+            published_vehicles = self.published_vehicles[candidates]
+            threshold = None if self._threshold is None else self._threshold[candidates]
+        changed = levels != published_levels
+        if threshold is None:
+            changed |= vehicles != published_vehicles
+        else:
+            changed |= np.abs(vehicles - published_vehicles) >= threshold
+        selected = np.nonzero(changed)[0]
+        indices = selected if candidates is None else candidates[selected]
+        return indices, levels[selected], vehicles[selected]
+
+    def _advance(self, candidates=None):
+        """更新已发布状态并推进序号，返回 (基准序号, 道路下标, 等级, 车辆数)"""
+        if candidates is not None:
+            if self._marked is None:
+                candidates = None
+            else:
+                candidates = np.concatenate([np.asarray(candidates, dtype=np.int64)] + self._marked)
+        self._marked = []
+        indices, levels, vehicles = self.changed_indices(candidates)
+        self.published_levels[indices] = levels
+        self.published_vehicles[indices] = vehicles
+        base = self.seq
+        self.seq += 1
+        return base, indices, levels, vehicles
+
+    def _delta_frame(self, base, indices, levels, vehicles, binary=False):
+        """构建增量帧"""
+        if binary:
+            return encode_traffic_delta(self.seq, base, indices, vehicles, levels)
+        edge_ids = self.state.edge_ids
+        return {
+            "type": "delta",
+            "seq": self.seq,
+            "base": base,
+            "ids": [edge_ids[i] for i in indices.tolist()],
+            "levels": levels.tolist(),
+            "vehicles": vehicles.tolist()
+        }
+
+    def delta(self, candidates=None) -> dict:
+        """
+        发布一次更新，返回包含整个地图的增量帧
+
+        参数:
+            candidates: 上次发布以来车辆数发生变化的道路下标，为None时比较所有道路
+
+        返回:
+            {"type": "delta", "seq": 序号, "base": 基准序号, "ids": [...], "levels": [...], "vehicles": [...]}
+        """
+        with self._lock:
+            return self._delta_frame(*self._advance(candidates))
+
+    def publish(self, candidates=None) -> list:
+        """
+        发布一次更新，为每个订阅的客户端生成只包含其订阅范围内道路的增量帧
+
+        变化检测对所有客户端只做一次，之后按各自的掩码筛选，订阅整个地图的客户端共用同一帧。
+        给定candidates（上次发布以来车辆数发生变化的道路）时只比较这些道路以及mark_changed登记的道路
+
+        参数:
+            candidates: 道路下标数组，为None时比较所有道路
+
+        返回:
+            [(客户端ID, 增量帧), ...]
+        """
+        with self._lock:
+            base, indices, levels, vehicles = self._advance(candidates)
+            full_frames = {}
+            frames = []
+            for client_id, (_, mask, binary) in self._subscriptions.items():
+                if mask is None:
+                    if binary not in full_frames:
+                        full_frames[binary] = self._delta_frame(base, indices, levels, vehicles, binary)
+                    frames.append((client_id, full_frames[binary]))
+                else:
+                    selected = mask[indices]
+                    frames.append((client_id, self._delta_frame(
+                        base, indices[selected], levels[selected], vehicles[selected], binary)))
+            return frames
@@ -0,0 +1,147 @@
+"""
+二进制导出模块
+将交通数据帧和图数据编码为小端序的列式二进制格式，
+前端可以直接用TypedArray读取各列，无需解析JSON
+"""
+import struct
+import numpy as np
+
+# 交通帧头部: 魔数 b'NTRF'、版本(uint8)、帧类型(uint8)、保留(uint16)、序号(uint32)、基准序号(uint32)、道路数量N(uint32)
+# 关键帧数据: uint32[N] 道路下标、uint32[N] 起点ID、uint32[N] 终点ID、float32[N] 容量、uint16[N] 车辆数、uint8[N] 等级
+# 增量帧数据: uint32[N] 道路下标、uint16[N] 车辆数、uint8[N] 等级
+# 各列按元素大小从大到小排列，保证每一列都按自身大小对齐
+TRAFFIC_FRAME_HEADER = struct.Struct('<4sBBHIII')
+TRAFFIC_FRAME_MAGIC = b'NTRF'
+TRAFFIC_FRAME_VERSION = 1
+FRAME_KEYFRAME = 0
+FRAME_DELTA = 1
+
+# 图数据头部: 魔数 b'NGRF'、版本(uint8)、保留(uint8, uint16)、顶点数量V(uint32)、道路数量E(uint32)
+# 数据: uint32[V] 顶点ID、float32[V] x、float32[V] y、
+#       uint32[E] 起点ID、uint32[E] 终点ID、float32[E] 长度、float32[E] 容量、float32[E] 车辆数、
+#       uint8[V] 顶点属性（1加油站、2商场、4停车场）、uint8[E] 是否连接商场
+GRAPH_HEADER = struct.Struct('<4sBBHII')
+GRAPH_MAGIC = b'NGRF'
+GRAPH_VERSION = 1
+
+# 车辆数使用uint16传输，超出范围的值截断
+_MAX_VEHICLES = np.iinfo(np.uint16).max
+
+
+def _vehicles_column(vehicles):
+    """将车辆数四舍五入并截断为uint16"""
+    return np.clip(np.rint(vehicles), 0, _MAX_VEHICLES).astype('<u2')
+
+
+def encode_traffic_keyframe(seq, indices, sources, targets, capacity, vehicles, levels):
+    """
+    编码交通关键帧
+
+    参数:
+        seq: 序号
+        indices: 道路下标数组
+        sources: 起点ID数组
+        targets: 终点ID数组
+        capacity: 容量数组
+        vehicles: 车辆数数组
+        levels: 交通等级数组
+
+    返回:
+        编码后的bytes
+    """
+    count = len(indices)
+    return b''.join((
+        TRAFFIC_FRAME_HEADER.pack(TRAFFIC_FRAME_MAGIC, TRAFFIC_FRAME_VERSION, FRAME_KEYFRAME, 0, seq, seq, count),
+        np.asarray(indices, dtype='<u4').tobytes(),
+        np.asarray(sources, dtype='<u4').tobytes(),
+        np.asarray(targets, dtype='<u4').tobytes(),
+        np.asarray(capacity, dtype='<f4').tobytes(),
+        _vehicles_column(vehicles).tobytes(),
+        np.asarray(levels, dtype=np.uint8).tobytes()
+    ))
+
+
+def encode_traffic_delta(seq, base, indices, vehicles, levels):
+    """
+    编码交通增量帧
+
+    参数:
+        seq: 序号
+        base: 基准序号
+        indices: 发生变化的道路下标数组
+        vehicles: 车辆数数组
+        levels: 交通等级数组
+
+    返回:
+        编码后的bytes
+    """
+    count = len(indices)
+    return b''.join((
+        TRAFFIC_FRAME_HEADER.pack(TRAFFIC_FRAME_MAGIC, TRAFFIC_FRAME_VERSION, FRAME_DELTA, 0, seq, base, count),
+        np.asarray(indices, dtype='<u4').tobytes(),
+        _vehicles_column(vehicles).tobytes(),
+        np.asarray(levels, dtype=np.uint8).tobytes()
+    ))
+
+
+def decode_traffic_frame(data):
+    """
+    解码交通帧
+
+    参数:
+        data: encode_traffic_keyframe或encode_traffic_delta生成的bytes
+
+    返回:
+        {"type", "seq", "base", "indices", "vehicles", "levels"}，关键帧还包含"sources"、"targets"、"capacity"
+    """
+    magic, version, frame_type, _, seq, base, count = TRAFFIC_FRAME_HEADER.unpack_from(data)
+    if magic != TRAFFIC_FRAME_MAGIC or version != TRAFFIC_FRAME_VERSION:
+        raise ValueError(f"不支持的交通帧格式: {magic!r} 版本 {version}")
+    offset = TRAFFIC_FRAME_HEADER.size
+
+    def column(dtype):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    frame = {"type": "keyframe" if frame_type == FRAME_KEYFRAME else "delta", "seq": seq, "base": base,
+             "indices": column('<u4')}
+    if frame_type == FRAME_KEYFRAME:
+        frame["sources"] = column('<u4')
+        frame["targets"] = column('<u4')
+        frame["capacity"] = column('<f4')
+    frame["vehicles"] = column('<u2')
+    frame["levels"] = column(np.uint8)
+    return frame
+
+
+def graph_to_binary(graph):
+    """
+    将图的顶点和道路编码为列式二进制格式（见GRAPH_HEADER说明）
+
+    参数:
+        graph: Graph对象，顶点ID必须为非负整数
+
+    返回:
+        编码后的bytes
+    """
+    vertices = list(graph.vertices.values())
+    edges = list(graph.edges.values())
+    n_vertices = len(vertices)
+    n_edges = len(edges)
+    attributes = np.fromiter((v.is_gas_station | (v.is_shopping_mall << 1) | (v.is_parking_lot << 2)
+                              for v in vertices), dtype=np.uint8, count=n_vertices)
+    return b''.join((
+        GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, 0, 0, n_vertices, n_edges),
+        np.fromiter((v.id for v in vertices), dtype='<u4', count=n_vertices).tobytes(),
+        np.fromiter((v.x for v in vertices), dtype='<f4', count=n_vertices).tobytes(),
+        np.fromiter((v.y for v in vertices), dtype='<f4', count=n_vertices).tobytes(),
+        np.fromiter((e.vertex1.id for e in edges), dtype='<u4', count=n_edges).tobytes(),
+        np.fromiter((e.vertex2.id for e in edges), dtype='<u4', count=n_edges).tobytes(),
+        np.fromiter((e.length for e in edges), dtype='<f4', count=n_edges).tobytes(),
+        np.fromiter((e.capacity for e in edges), dtype='<f4', count=n_edges).tobytes(),
+        np.fromiter((e.current_vehicles for e in edges), dtype='<f4', count=n_edges).tobytes(),
+        attributes.tobytes(),
+        np.fromiter((e.is_mall_connection for e in edges), dtype=np.uint8, count=n_edges).tobytes()
+    ))
@@ -1,6 +1,6 @@
 """
 JSON导出模块
-用于将Graph对象转换为visjs兼容的JSON格式
+用于将Graph对象转换为visjs兼容的JSON格式，以及从该格式重新构建Graph对象
 """
 import json
 from ..models.graph import Graph
@@ -68,4 +68,52 @@ def export_graph_to_json(graph: Graph, filepath: str) -> None:
     with open(filepath, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
-    print(f"地图数据已导出到: {filepath}") 
\ No newline at end of file
+    print(f"地图数据已导出到: {filepath}")
+
+def graph_from_visjs(data: dict) -> Graph:
+    """
+    从graph_to_visjs生成的数据重新构建Graph对象（顶点ID按加载顺序重新分配）
+    
+    参数:
+        data: 包含nodes和edges的字典
+        
+    返回:
+        Graph对象
+    """
+    graph = Graph()
+    
+    vertex_map = {}
+    for node in data.get('nodes', []):
+        vertex = graph.create_vertex(float(node['x']), float(node['y']))
+        vertex.is_gas_station = node.get('is_gas_station', False)
+        vertex.is_shopping_mall = node.get('is_shopping_mall', False)
+        vertex.is_parking_lot = node.get('is_parking_lot', False)
+        vertex_map[node['id']] = vertex
+    
+    for edge_data in data.get('edges', []):
+        source_id = edge_data.get('source')
+        target_id = edge_data.get('target')
+        if source_id not in vertex_map or target_id not in vertex_map:
+            continue
+        edge = graph.create_edge(vertex_map[source_id], vertex_map[target_id])
+        # 保留导出时的道路属性，缺失时使用创建边时计算的值
+        edge.length = edge_data.get('length', edge.length)
+        edge.capacity = edge_data.get('capacity', edge.capacity)
+        edge.current_vehicles = edge_data.get('current_vehicles', edge.current_vehicles)
+        edge.is_mall_connection = edge_data.get('is_mall_connection', edge.is_mall_connection)
+    
+    return graph
+
+def load_graph_from_json(filepath: str) -> Graph:
+    """
+    从export_graph_to_json导出的JSON文件加载Graph对象
+    
+    参数:
+        filepath: JSON文件路径
+        
+    返回:
+        Graph对象
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return graph_from_visjs(data)
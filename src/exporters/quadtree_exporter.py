@@ -0,0 +1,75 @@
+"""
+四叉树导出模块
+将四叉树节点边界按视口和深度裁剪后导出，支持分块流式JSON和紧凑二进制两种格式
+"""
+import json
+import struct
+import numpy as np
+
+# 二进制格式: uint32 节点数量 N，随后是 float32[N*4] 边界 (x_min, y_min, x_max, y_max)，
+# 最后是 uint8[N] 节点深度，全部为小端序
+BINARY_HEADER = struct.Struct('<I')
+
+
+def iter_quadtree_json(quadtree, range_rect=None, max_depth=None, chunk_size=1000):
+    """
+    以文本块的形式流式生成四叉树边界JSON
+
+    输出格式与 {"boundaries": [...], "total_count": N} 一致，
+    每个块包含最多chunk_size个节点，无需在内存中构建完整列表
+
+    参数:
+        quadtree: 要导出的QuadTree
+        range_rect: 视口矩形 (x_min, y_min, x_max, y_max)，为None时导出全部节点
+        max_depth: 最大导出深度，为None时不限制
+        chunk_size: 每个文本块包含的节点数量
+
+    返回:
+        JSON文本块的生成器
+    """
+    yield '{"boundaries": ['
+    total = 0
+    chunk = []
+    for node, level in quadtree.iter_nodes(range_rect, max_depth):
+        x_min, y_min, x_max, y_max = node.boundary
+        chunk.append(json.dumps({
+            "x_min": x_min,
+            "y_min": y_min,
+            "x_max": x_max,
+            "y_max": y_max,
+            "level": level,
+            "points_count": len(node.points)
+        }))
+        total += 1
+        if len(chunk) >= chunk_size:
+            yield (',' if total > len(chunk) else '') + ','.join(chunk)
+            chunk = []
+    if chunk:
+        yield (',' if total > len(chunk) else '') + ','.join(chunk)
+    yield f'], "total_count": {total}}}'
+
+
+def quadtree_to_binary(quadtree, range_rect=None, max_depth=None):
+    """
+    将四叉树边界编码为紧凑的二进制格式（见BINARY_HEADER说明）
+
+    参数:
+        quadtree: 要导出的QuadTree
+        range_rect: 视口矩形，为None时导出全部节点
+        max_depth: 最大导出深度，为None时不限制
+
+    返回:
+        编码后的bytes
+    """
+    bounds = []
+    levels = []
+    for node, level in quadtree.iter_nodes(range_rect, max_depth):
+        bounds.extend(node.boundary)
+        levels.append(level)
+
+    count = len(levels)
+    return b''.join((
+        BINARY_HEADER.pack(count),
+        np.asarray(bounds, dtype='<f4').tobytes(),
+        np.minimum(np.asarray(levels, dtype=np.int64), 255).astype(np.uint8).tobytes()
+    ))
@@ -4,18 +4,88 @@ import { io } from 'https://cdn.socket.io/4.7.2/socket.io.esm.min.js';
  * API服务模块 - 负责处理与后端API的通信
  */
 
+/**
+ * 解码二进制图数据
+ * 格式（小端序）: 头部 'NGRF'、uint8 版本、uint8/uint16 保留、uint32 顶点数V、uint32 道路数E，
+ * 之后依次为 uint32[V] 顶点ID、float32[V] x、float32[V] y、uint32[E] 起点ID、uint32[E] 终点ID、
+ * float32[E] 长度、float32[E] 容量、float32[E] 车辆数、uint8[V] 顶点属性、uint8[E] 是否连接商场
+ * @param {ArrayBuffer} buffer - 二进制数据
+ * @returns {Object} 与JSON格式相同的 {nodes, edges}
+ */
+function decodeGraphBinary(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    const version = view.getUint8(4);
+    if (magic !== 'NGRF' || version !== 1) {
+        throw new Error(`不支持的图数据格式: ${magic} 版本 ${version}`);
+    }
+    const vertexCount = view.getUint32(8, true);
+    const edgeCount = view.getUint32(12, true);
+    let offset = 16;
+    const column = (ArrayType, count) => {
+        const array = new ArrayType(buffer, offset, count);
+        offset += array.byteLength;
+        return array;
+    };
+    const ids = column(Uint32Array, vertexCount);
+    const xs = column(Float32Array, vertexCount);
+    const ys = column(Float32Array, vertexCount);
+    const sources = column(Uint32Array, edgeCount);
+    const targets = column(Uint32Array, edgeCount);
+    const lengths = column(Float32Array, edgeCount);
+    const capacities = column(Float32Array, edgeCount);
+    const vehicles = column(Float32Array, edgeCount);
+    const attributes = column(Uint8Array, vertexCount);
+    const mallConnections = column(Uint8Array, edgeCount);
+
+    const nodes = new Array(vertexCount);
+    for (let i = 0; i < vertexCount; i++) {
+        const flags = attributes[i];
+        nodes[i] = {
+            id: ids[i],
+            label: `Node ${ids[i]}`,
+            x: xs[i],
+            y: ys[i],
+            size: 0.5,
+            fixed: true,
+            is_gas_station: (flags & 1) !== 0,
+            is_shopping_mall: (flags & 2) !== 0,
+            is_parking_lot: (flags & 4) !== 0,
+            attribute_type: flags & 1 ? 'gas_station' : flags & 2 ? 'shopping_mall' : flags & 4 ? 'parking_lot' : 'normal'
+        };
+    }
+    const edges = new Array(edgeCount);
+    for (let i = 0; i < edgeCount; i++) {
+        edges[i] = {
+            id: `${sources[i]}-${targets[i]}`,
+            source: sources[i],
+            target: targets[i],
+            size: 0.1,
+            length: lengths[i],
+            capacity: capacities[i],
+            current_vehicles: vehicles[i],
+            is_mall_connection: mallConnections[i] !== 0
+        };
+    }
+    return { nodes, edges };
+}
+
 /**
  * 获取地图数据
+ * @param {Object} [options] - 选项
+ * @param {boolean} [options.binary=true] - 是否使用二进制格式传输
  * @returns {Promise<Object>} 包含节点和边数据的对象
  */
-async function fetchMapData() {
+async function fetchMapData({ binary = true } = {}) {
     try {
       // 从后端获取详细视图数据
-      const detailResponse = await fetch('/api/map-data/detail');
+      const detailResponse = await fetch(binary ? '/api/map-data/detail?format=binary' : '/api/map-data/detail');
       if (!detailResponse.ok) {
         throw new Error(`HTTP error fetching detail data: ${detailResponse.status}`);
       }
-      const detailData = await detailResponse.json();
+      const detailData = binary
+        ? decodeGraphBinary(await detailResponse.arrayBuffer())
+        : await detailResponse.json();
       return {detailData};
 
     } catch (error) {
@@ -82,13 +152,93 @@ async function fetchNearbyNodesData(x, y, count) {
     }
   }
 
+/**
+ * 解码二进制四叉树数据
+ * 格式: uint32 节点数量N，float32[N*4] 边界，uint8[N] 深度（小端序）
+ * @param {ArrayBuffer} buffer - 二进制数据
+ * @returns {Array} 边界数组
+ */
+function decodeQuadtreeBinary(buffer) {
+    const count = new DataView(buffer).getUint32(0, true);
+    const bounds = new Float32Array(buffer, 4, count * 4);
+    const levels = new Uint8Array(buffer, 4 + count * 16, count);
+    const boundaries = new Array(count);
+    for (let i = 0; i < count; i++) {
+        boundaries[i] = {
+            x_min: bounds[i * 4],
+            y_min: bounds[i * 4 + 1],
+            x_max: bounds[i * 4 + 2],
+            y_max: bounds[i * 4 + 3],
+            level: levels[i]
+        };
+    }
+    return boundaries;
+}
+
+/**
+ * 解码二进制交通帧，各列直接映射为TypedArray
+ * 格式（小端序）: 头部 'NTRF'、uint8 版本、uint8 帧类型(0关键帧/1增量帧)、uint16 保留、
+ * uint32 序号、uint32 基准序号、uint32 道路数量N，之后依次为 uint32[N] 道路下标、
+ * （仅关键帧）uint32[N] 起点ID、uint32[N] 终点ID、float32[N] 容量，以及 uint16[N] 车辆数、uint8[N] 等级
+ * @param {ArrayBuffer} buffer - 二进制数据
+ * @returns {Object} {type, seq, base, indices, vehicles, levels}，关键帧还包含 sources、targets、capacity
+ */
+function decodeTrafficFrame(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    const version = view.getUint8(4);
+    if (magic !== 'NTRF' || version !== 1) {
+        throw new Error(`不支持的交通帧格式: ${magic} 版本 ${version}`);
+    }
+    const isKeyframe = view.getUint8(5) === 0;
+    const count = view.getUint32(16, true);
+    let offset = 20;
+    const column = (ArrayType) => {
+        const array = new ArrayType(buffer, offset, count);
+        offset += array.byteLength;
+        return array;
+    };
+    const frame = {
+        type: isKeyframe ? 'keyframe' : 'delta',
+        seq: view.getUint32(8, true),
+        base: view.getUint32(12, true),
+        indices: column(Uint32Array)
+    };
+    if (isKeyframe) {
+        frame.sources = column(Uint32Array);
+        frame.targets = column(Uint32Array);
+        frame.capacity = column(Float32Array);
+    }
+    frame.vehicles = column(Uint16Array);
+    frame.levels = column(Uint8Array);
+    return frame;
+}
+
   /**
  * 获取四叉树数据
+ * @param {Object} [options] - 查询选项
+ * @param {Object} [options.bounds] - 视口范围 {west, south, east, north}，只返回与其相交的节点
+ * @param {number} [options.maxDepth] - 最大返回深度
+ * @param {boolean} [options.binary=true] - 是否使用二进制格式传输
+ * @returns {Promise<Array>} 边界数组 [{x_min, y_min, x_max, y_max, level}, ...]
  */
-async function fetchQuadtreeData() {
+async function fetchQuadtreeData({ bounds = null, maxDepth = null, binary = true } = {}) {
     try {
-        const response = await fetch('/api/quadtree');
+        const params = new URLSearchParams();
+        if (bounds) {
+            params.set('west', bounds.west);
+            params.set('south', bounds.south);
+            params.set('east', bounds.east);
+            params.set('north', bounds.north);
+        }
+        if (maxDepth !== null && maxDepth !== undefined) params.set('max_depth', maxDepth);
+        if (binary) params.set('format', 'binary');
+
+        const response = await fetch(`/api/quadtree?${params.toString()}`);
         if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        if (binary) {
+            return decodeQuadtreeBinary(await response.arrayBuffer());
+        }
         const data = await response.json();
         return data.boundaries;
     } catch (error) {
@@ -232,4 +382,4 @@ async function fetchGridCongestion() {
     throw error; // 重新抛出错误以便调用者处理
   }
 }
-export { fetchMapData, fetchNearbyNodesData, fetchQuadtreeData, fetchZoomClusterData, listenToSocket, fetchShortestPath, fetchNearbySpecialPoints, fetchGridCongestion, fetchTriangulationData }; 
\ No newline at end of file
+export { fetchMapData, decodeTrafficFrame, fetchNearbyNodesData, fetchQuadtreeData, fetchZoomClusterData, listenToSocket, fetchShortestPath, fetchNearbySpecialPoints, fetchGridCongestion, fetchTriangulationData }; 
\ No newline at end of file
@@ -8,6 +8,10 @@ let sigmaInstance = null;
 let quadtreeCanvas, quadtreeCtx;
 let allQuadtreeBoundaries = [];
 let currentlyDrawingQuadtree = false;
+let viewportRefreshTimer = null;
+
+// 视口变化后重新请求四叉树数据的延迟(毫秒)
+const VIEWPORT_REFRESH_DELAY = 300;
 
 /**
  * 初始化四叉树渲染组件
@@ -64,15 +68,44 @@ export function drawQuadtreeBoundaries(boundaries) {
     });
 }
 
+/**
+ * 获取当前视口对应的图坐标范围
+ * @returns {Object|null} - {west, south, east, north}，Sigma实例未就绪时返回null
+ */
+function getViewportBounds() {
+    if (!sigmaInstance || !quadtreeCanvas) return null;
+    const p1 = sigmaInstance.viewportToGraph({ x: 0, y: 0 });
+    const p2 = sigmaInstance.viewportToGraph({ x: quadtreeCanvas.width, y: quadtreeCanvas.height });
+    return {
+        west: Math.min(p1.x, p2.x),
+        south: Math.min(p1.y, p2.y),
+        east: Math.max(p1.x, p2.x),
+        north: Math.max(p1.y, p2.y)
+    };
+}
+
+/**
+ * 视口变化后按新的视口范围重新请求并绘制四叉树
+ */
+function scheduleViewportRefresh() {
+    if (viewportRefreshTimer) clearTimeout(viewportRefreshTimer);
+    viewportRefreshTimer = setTimeout(async () => {
+        viewportRefreshTimer = null;
+        allQuadtreeBoundaries = await fetchQuadtreeData({ bounds: getViewportBounds() });
+        drawQuadtreeBoundaries(allQuadtreeBoundaries);
+    }, VIEWPORT_REFRESH_DELAY);
+}
+
 /**
  * 逐步可视化四叉树
+ * 只请求当前视口范围内的节点，视口变化后重新请求
  * @returns {Promise<void>}
  */
 export async function visualizeQuadtreeStepByStep() {
     if (currentlyDrawingQuadtree) return;
     currentlyDrawingQuadtree = true;
 
-    allQuadtreeBoundaries = await fetchQuadtreeData();
+    allQuadtreeBoundaries = await fetchQuadtreeData({ bounds: getViewportBounds() });
     if (!sigmaInstance) {
         console.warn("Sigma instance not ready for quadtree drawing.");
         currentlyDrawingQuadtree = false;
@@ -102,7 +135,8 @@ export async function visualizeQuadtreeStepByStep() {
         
             if (sigmaInstance) {
                 sigmaInstance.getCamera().on("updated", () => {
-                     drawQuadtreeBoundaries(drawnBoundaries); // Redraw all drawn boundaries
+                     drawQuadtreeBoundaries(allQuadtreeBoundaries); // Redraw current boundaries
+                     scheduleViewportRefresh();
                 });
             }
         }
@@ -1,25 +1,213 @@
 import { addConsoleMessage } from '../uiUtils.js';
 import { updateTrafficOnEdges } from '../../renderers/mapRenderer.js';
-import { listenToSocket } from '../../api/apiService.js';
+import { listenToSocket, decodeTrafficFrame } from '../../api/apiService.js';
 // 导入来自 layersEvents.js 的渲染函数
 import { renderGridCongestion } from './layersEvents.js'; 
 
+// 交通等级对应的颜色，与服务端 LEVEL_COLORS 一致
+const LEVEL_COLORS = ['#00FF00', '#90EE90', '#FFFF00', '#FFA500', '#FF0000'];
+
+// 客户端保存的交通状态：最近一次应用的帧序号，以及每条边的最新数据
+const trafficState = {
+  seq: null,
+  replaying: false, // 回放历史期间暂停渲染实时数据（仍然更新状态）
+  edges: new Map() // id -> { source, target, level, vehicles, capacity }
+};
+let trafficSocket = null;
+
+// 视口变化后重新订阅的延迟（毫秒），以及订阅范围在视口四周额外扩展的比例
+const TRAFFIC_SUBSCRIBE_DELAY = 300;
+const TRAFFIC_VIEWPORT_MARGIN = 0.2;
+let trafficSubscribeTimer = null;
+
+/**
+ * 获取渲染器当前视口（向四周扩展一定比例）对应的图坐标范围
+ * @param {Object} renderer - Sigma渲染器
+ * @param {HTMLElement} container - 地图容器
+ * @returns {Object|null} - {west, south, east, north}，渲染器未就绪时返回null
+ */
+function getRendererViewport(renderer, container) {
+  if (!renderer || !container || !container.clientWidth || !container.clientHeight) {
+    return null;
+  }
+  const p1 = renderer.viewportToGraph({ x: 0, y: 0 });
+  const p2 = renderer.viewportToGraph({ x: container.clientWidth, y: container.clientHeight });
+  const marginX = Math.abs(p2.x - p1.x) * TRAFFIC_VIEWPORT_MARGIN;
+  const marginY = Math.abs(p2.y - p1.y) * TRAFFIC_VIEWPORT_MARGIN;
+  return {
+    west: Math.min(p1.x, p2.x) - marginX,
+    south: Math.min(p1.y, p2.y) - marginY,
+    east: Math.max(p1.x, p2.x) + marginX,
+    north: Math.max(p1.y, p2.y) + marginY
+  };
+}
+
+/**
+ * 获取当前视口（向四周扩展一定比例）对应的图坐标范围
+ * @param {Object} mapData - 地图数据对象
+ * @returns {Object|null} - {west, south, east, north}，渲染器未就绪时返回null（订阅整个地图）
+ */
+function getTrafficViewport(mapData) {
+  return getRendererViewport(mapData.originalRenderer, mapData.container);
+}
+
+// 按当前视口订阅交通数据（二进制帧），服务端会发送订阅范围内的关键帧，之后只推送范围内的道路
+function subscribeTraffic(mapData) {
+  if (!trafficSocket) {
+    return;
+  }
+  trafficSocket.emit('subscribe_traffic', { ...getTrafficViewport(mapData), binary: true });
+}
+
+// 视口变化后延迟重新订阅，避免拖动过程中频繁请求
+function scheduleTrafficSubscribe(mapData) {
+  if (trafficSubscribeTimer) clearTimeout(trafficSubscribeTimer);
+  trafficSubscribeTimer = setTimeout(() => {
+    trafficSubscribeTimer = null;
+    subscribeTraffic(mapData);
+  }, TRAFFIC_SUBSCRIBE_DELAY);
+}
+
+// 按集群图层的视口订阅网格拥堵数据，服务端根据视口宽度选择拥堵金字塔的级别，只发送视口内的网格
+function subscribeGridCongestion(mapData) {
+  if (!trafficSocket) {
+    return;
+  }
+  const viewport = getRendererViewport(mapData.clusterRenderer, mapData.container);
+  const width = mapData.container ? mapData.container.clientWidth * (1 + 2 * TRAFFIC_VIEWPORT_MARGIN) : 0;
+  trafficSocket.emit('subscribe_grid_congestion', viewport ? { ...viewport, width } : {});
+}
+
+// 视口变化后延迟重新订阅网格拥堵数据
+let gridSubscribeTimer = null;
+function scheduleGridCongestionSubscribe(mapData) {
+  if (gridSubscribeTimer) clearTimeout(gridSubscribeTimer);
+  gridSubscribeTimer = setTimeout(() => {
+    gridSubscribeTimer = null;
+    subscribeGridCongestion(mapData);
+  }, TRAFFIC_SUBSCRIBE_DELAY);
+}
+
+// 将变化的边交给渲染函数更新颜色
+function renderTrafficEdges(edgesData) {
+  if (window.mapData) { // 确保 mapData 可用
+    updateTrafficOnEdges(window.mapData, edgesData);
+  } else {
+    console.warn('mapData 不可用，无法更新交通数据视图。');
+  }
+}
+
+// 应用关键帧：替换全部交通状态
+function applyTrafficKeyframe(data) {
+  trafficState.edges.clear();
+  data.edges.forEach(edge => {
+    trafficState.edges.set(edge.id, {
+      source: edge.source,
+      target: edge.target,
+      level: edge.level,
+      vehicles: edge.current_vehicles,
+      capacity: edge.capacity
+    });
+  });
+  trafficState.seq = data.seq;
+  if (!trafficState.replaying) {
+    renderTrafficEdges(data.edges);
+  }
+}
+
+// 应用增量帧：只更新发生变化的边，序号不连续时请求服务端重新发送关键帧
+function applyTrafficDelta(data) {
+  if (trafficState.seq === null || data.base !== trafficState.seq) {
+    if (trafficSocket) {
+      trafficSocket.emit('traffic_resync');
+    }
+    return;
+  }
+  const changedEdges = [];
+  for (let i = 0; i < data.ids.length; i++) {
+    const edge = trafficState.edges.get(data.ids[i]);
+    if (!edge) {
+      continue;
+    }
+    edge.level = data.levels[i];
+    edge.vehicles = data.vehicles[i];
+    changedEdges.push({ source: edge.source, target: edge.target, color: LEVEL_COLORS[edge.level] });
+  }
+  trafficState.seq = data.seq;
+  if (changedEdges.length > 0 && !trafficState.replaying) {
+    renderTrafficEdges(changedEdges);
+  }
+}
+
+// 将解码后的二进制帧转换为与JSON帧相同的结构，道路以服务端的道路下标标识
+function fromBinaryTrafficFrame(frame) {
+  if (frame.type === 'delta') {
+    return { type: 'delta', seq: frame.seq, base: frame.base, ids: frame.indices, levels: frame.levels, vehicles: frame.vehicles };
+  }
+  const edges = new Array(frame.indices.length);
+  for (let i = 0; i < edges.length; i++) {
+    edges[i] = {
+      id: frame.indices[i],
+      source: frame.sources[i],
+      target: frame.targets[i],
+      color: LEVEL_COLORS[frame.levels[i]],
+      level: frame.levels[i],
+      current_vehicles: frame.vehicles[i],
+      capacity: frame.capacity[i]
+    };
+  }
+  return { type: 'keyframe', seq: frame.seq, edges };
+}
+
 // 定义处理交通更新的函数
 function handleTrafficUpdate(data) {
   // console.log('收到交通更新数据:', data);
-  if (data && data.edges) {
-    // console.log(`收到 ${data.edges.length} 条边的交通更新数据`);
-    // addConsoleMessage(`收到${data.edges.length}条边的交通更新数据`);
-    
-    // 调用渲染函数更新边的颜色
-    if (window.mapData) { // 确保 mapData 可用
-      updateTrafficOnEdges(window.mapData, data.edges);
-    } else {
-      console.warn('mapData 不可用，无法更新交通数据视图。');
+  if (!data) {
+    return;
+  }
+  if (data instanceof ArrayBuffer) {
+    data = fromBinaryTrafficFrame(decodeTrafficFrame(data));
+  }
+  if (data.type === 'delta') {
+    applyTrafficDelta(data);
+  } else if (data.type === 'keyframe') {
+    applyTrafficKeyframe(data);
+  } else if (data.edges) {
+    // 兼容不带序号的完整数据
+    renderTrafficEdges(data.edges);
+  }
+}
+
+// 回放的时长（秒）和倍速
+const TRAFFIC_REPLAY_SECONDS = 300;
+const TRAFFIC_REPLAY_SPEED = 10;
+
+// 处理交通历史回放帧，回放结束后重新同步实时数据
+function handleTrafficReplay(data) {
+  if (!data) {
+    return;
+  }
+  trafficState.replaying = !data.last;
+  renderTrafficEdges(data.edges);
+  if (data.last) {
+    addConsoleMessage('交通历史回放结束，恢复实时数据');
+    if (trafficSocket) {
+      trafficSocket.emit('traffic_resync');
     }
   }
 }
 
+// 处理回放请求的结果
+function handleReplayStatus(data) {
+  if (data.status === 'started') {
+    const start = new Date(data.start * 1000).toLocaleTimeString();
+    const end = new Date(data.end * 1000).toLocaleTimeString();
+    addConsoleMessage(`开始回放交通历史: ${start} - ${end}，共 ${data.frames} 帧`);
+  } else if (data.status === 'error') {
+    addConsoleMessage(`回放失败: ${data.message}`);
+  }
+}
+
 // 定义处理网格拥堵数据更新的函数
 function handleGridCongestionUpdate(data) {
   // console.log('收到网格拥堵更新数据:', data);
@@ -41,16 +229,30 @@ function initTrafficEvents(mapData) {
   const { state } = mapData;
 
   // 初始化 WebSocket 连接并监听事件
-  // listenToSocket 返回的是同一个socket实例，我们可以多次调用它来为同一个socket实例注册不同事件的监听器
+  // listenToSocket 每次调用都会新建一个连接，其余事件的监听器都注册在它返回的同一个socket上，
+  // 服务端按连接保存订阅的视口和网格级别，订阅和接收必须使用同一个连接
   const socket = listenToSocket('traffic_update', handleTrafficUpdate);
-  listenToSocket('grid_congestion_update', handleGridCongestionUpdate); // 为网格拥堵数据添加监听
+  socket.on('grid_congestion_update', handleGridCongestionUpdate); // 为网格拥堵数据添加监听
   
   // 将socket保存到mapData.state中，以便其他地方使用
-  // 由于 listenToSocket 内部处理 socket 实例的创建和返回，这里我们假设它返回的是同一个实例
-  // 如果不是，apiService.js 中的 listenToSocket 需要调整为返回或管理单个共享的 socket 实例
-  if (!state.socket) { // 避免重复赋值，假设 listenToSocket 返回的是相同的 socket 实例
+  if (!state.socket) { // 避免重复赋值
     state.socket = socket; 
   }
+  // 连接（包括断线重连）后按当前视口订阅交通数据，视口变化后重新订阅
+  trafficSocket = socket;
+  socket.on('connect', () => {
+    trafficState.seq = null;
+    subscribeTraffic(mapData);
+    subscribeGridCongestion(mapData);
+  });
+  if (mapData.originalRenderer) {
+    mapData.originalRenderer.getCamera().on('updated', () => scheduleTrafficSubscribe(mapData));
+  }
+  if (mapData.clusterRenderer) {
+    mapData.clusterRenderer.getCamera().on('updated', () => scheduleGridCongestionSubscribe(mapData));
+  }
+  socket.on('traffic_replay', handleTrafficReplay);
+  socket.on('replay_status', handleReplayStatus);
   state.isTrafficSimulationRunning = false; // 初始化模拟状态
   
   // 添加交通模拟控制按钮事件
@@ -77,6 +279,15 @@ function initTrafficEvents(mapData) {
       state.isTrafficSimulationRunning = !state.isTrafficSimulationRunning;
     });
   }
+
+  // 添加交通历史回放按钮事件
+  const trafficReplayButton = document.getElementById("trafficReplay");
+  if (trafficReplayButton) {
+    trafficReplayButton.addEventListener('click', function() {
+      addConsoleMessage(`已请求回放最近 ${TRAFFIC_REPLAY_SECONDS} 秒的交通历史`);
+      state.socket.emit('replay_traffic', { seconds: TRAFFIC_REPLAY_SECONDS, speed: TRAFFIC_REPLAY_SPEED });
+    });
+  }
 }
 
-export { initTrafficEvents, handleTrafficUpdate, handleGridCongestionUpdate };
+export { initTrafficEvents, handleTrafficUpdate, handleGridCongestionUpdate, handleTrafficReplay };
@@ -378,8 +378,11 @@ def would_cross_existing_edges(graph, v1, v2):
     返回:
         如果添加会导致不合理交叉则为True，否则为False
     """
-    # 检查现有边是否会与新边交叉
-    for edge in graph.edges.values():
+    if graph.edge_index is None:
+        return False
+    
+    # 通过道路索引只检查外包矩形与新边相交的现有边
+    for edge in graph.edge_index.query_intersecting((v1.x, v1.y), (v2.x, v2.y)):
         v3 = edge.vertex1
         v4 = edge.vertex2
         
@@ -387,78 +390,9 @@ def would_cross_existing_edges(graph, v1, v2):
         if v1 == v3 or v1 == v4 or v2 == v3 or v2 == v4:
             continue
         
-        # 检查边是否相交
-        if do_segments_intersect(
-            (v1.x, v1.y), (v2.x, v2.y),
-            (v3.x, v3.y), (v4.x, v4.y)
-        ):
-            return True
-    
-    return False
-
-def do_segments_intersect(p1, p2, p3, p4):
-    """
-    检查两条线段是否相交
-    
-    参数:
-        p1: 第一条线段的起点 (x, y)
-        p2: 第一条线段的终点 (x, y)
-        p3: 第二条线段的起点 (x, y)
-        p4: 第二条线段的终点 (x, y)
-        
-    返回:
-        如果线段相交则为True，否则为False
-    """
-    # 计算方向
-    d1 = direction(p3, p4, p1)
-    d2 = direction(p3, p4, p2)
-    d3 = direction(p1, p2, p3)
-    d4 = direction(p1, p2, p4)
-    
-    # 如果方向不同，线段相交
-    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and \
-       ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
-        return True
-    
-    # 检查共线的情况
-    if d1 == 0 and on_segment(p3, p4, p1):
-        return True
-    if d2 == 0 and on_segment(p3, p4, p2):
-        return True
-    if d3 == 0 and on_segment(p1, p2, p3):
-        return True
-    if d4 == 0 and on_segment(p1, p2, p4):
         return True
     
     return False
 
-def direction(p1, p2, p3):
-    """
-    计算三点方向
-    
-    参数:
-        p1: 点1 (x, y)
-        p2: 点2 (x, y)
-        p3: 点3 (x, y)
-        
-    返回:
-        大于0表示逆时针，小于0表示顺时针，等于0表示共线
-    """
-    return (p3[1] - p1[1]) * (p2[0] - p1[0]) - (p2[1] - p1[1]) * (p3[0] - p1[0])
-
-def on_segment(p1, p2, p3):
-    """
-    检查点p3是否在线段p1-p2上
-    
-    参数:
-        p1: 线段起点 (x, y)
-        p2: 线段终点 (x, y)
-        p3: 检查点 (x, y)
-        
-    返回:
-        如果p3在线段上则为True，否则为False
-    """
-    return (min(p1[0], p2[0]) <= p3[0] <= max(p1[0], p2[0]) and
-            min(p1[1], p2[1]) <= p3[1] <= max(p1[1], p2[1]))
 
     
@@ -9,6 +9,7 @@ from .models.graph import Graph
 from .models.vertex import Vertex
 from .models.edge import Edge
 from .models.quadtree import QuadTree
+from .models.spatial_index import benchmark_spatial_indexes, bounding_box
 from .generators.random_map import generate_random_points, generate_connected_map
 from .exporters.json_exporter import export_graph_to_json
 from .api.server import run_server
@@ -74,6 +75,609 @@ def test_traffic_simulation(graph: Graph, simulation_steps: int = 5):
 
 
 
+def test_traffic_engine_performance(graph: Graph, steps: int = 5):
+    """
+    比较逐条道路循环的交通流更新与向量化引擎的单步耗时
+    
+    参数:
+        graph: 图实例
+        steps: 每种实现执行的更新次数
+    """
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized
+    
+    print("\n=== 测试向量化交通流引擎性能 ===")
+    
+    start_time = time.time()
+    for _ in range(steps):
+        update_traffic_flow(graph)
+    loop_time = (time.time() - start_time) / steps
+    print(f"逐条道路循环: 平均每步 {loop_time * 1000:.2f} 毫秒")
+    
+    start_time = time.time()
+    state = TrafficState.from_graph(graph)
+    print(f"构建交通状态数组: {(time.time() - start_time) * 1000:.2f} 毫秒，"
+          f"{len(state)} 条道路，相邻矩阵非零元素 {state.adjacency.nnz} 个")
+    
+    start_time = time.time()
+    for _ in range(steps):
+        update_traffic_flow_vectorized(state)
+    vectorized_time = (time.time() - start_time) / steps
+    print(f"向量化引擎: 平均每步 {vectorized_time * 1000:.2f} 毫秒")
+    
+    speedup = loop_time / vectorized_time if vectorized_time > 0 else float('inf')
+    print(f"性能提升: {speedup:.2f}x")
+    
+    state.sync_to_graph(graph)
+
+def test_partitioned_traffic_engine(graph: Graph, n_partitions: int = 4, steps: int = 5, seed: int = 0):
+    """
+    验证分区并行执行器与单进程向量化引擎的结果一致，并比较耗时
+    
+    参数:
+        graph: 图实例
+        n_partitions: 分区（工作进程）数量
+        steps: 更新次数
+        seed: 随机数种子
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized
+    from .algorithms.traffic_partition import PartitionedTrafficExecutor
+    
+    print("\n=== 测试分区并行交通流模拟 ===")
+    
+    serial_state = TrafficState.from_graph(graph)
+    rng = np.random.default_rng(seed)
+    start_time = time.time()
+    for _ in range(steps):
+        update_traffic_flow_vectorized(serial_state, rng)
+    serial_time = (time.time() - start_time) / steps
+    print(f"单进程: 平均每步 {serial_time * 1000:.2f} 毫秒")
+    
+    parallel_state = TrafficState.from_graph(graph)
+    rng = np.random.default_rng(seed)
+    with PartitionedTrafficExecutor(parallel_state, n_partitions) as executor:
+        print(f"分区大小: {[len(part) for part in executor.partitions]}")
+        start_time = time.time()
+        for _ in range(steps):
+            executor.step(rng)
+        parallel_time = (time.time() - start_time) / steps
+    print(f"{n_partitions} 个分区: 平均每步 {parallel_time * 1000:.2f} 毫秒")
+    
+    identical = np.array_equal(serial_state.vehicles, parallel_state.vehicles)
+    print(f"结果一致性检查: {'一致' if identical else '不一致'}")
+
+def test_agent_simulation(graph: Graph, n_vehicles: int = 100000, n_routes: int = 100,
+                          depart_window: float = 60.0, realtime_seconds: float = 5.0):
+    """
+    测试基于个体车辆的离散事件模拟能否实时运行
+    
+    参数:
+        graph: 图实例
+        n_vehicles: 车辆数量
+        n_routes: 预先规划的路径数量（车辆从中随机选择路径）
+        depart_window: 车辆出发时间在[0, depart_window)内均匀分布
+        realtime_seconds: 实时运行的墙钟时间
+    """
+    import numpy as np
+    from .algorithms.agent_simulation import AgentSimulation, build_route_pool
+    
+    print("\n=== 测试个体车辆离散事件模拟 ===")
+    
+    rng = np.random.default_rng(0)
+    start_time = time.time()
+    routes = build_route_pool(graph, n_routes, rng)
+    print(f"规划 {len(routes)} 条路径，用时 {time.time() - start_time:.4f} 秒")
+    if not routes:
+        print("没有可用的路径，跳过测试")
+        return
+    
+    simulation = AgentSimulation(graph)
+    start_time = time.time()
+    for i in range(n_vehicles):
+        simulation.add_vehicle(routes[i % len(routes)], depart_time=rng.uniform(0, depart_window))
+    print(f"添加 {n_vehicles} 辆车，用时 {time.time() - start_time:.4f} 秒")
+    
+    start_time = time.time()
+    events = simulation.advance(depart_window)
+    elapsed = time.time() - start_time
+    print(f"模拟 {depart_window} 秒: 处理 {events} 个事件，用时 {elapsed:.4f} 秒，"
+          f"{events / elapsed if elapsed > 0 else float('inf'):.0f} 事件/秒")
+    
+    stats = simulation.run_realtime(realtime_seconds)
+    print(f"实时运行 {realtime_seconds} 秒: 处理 {stats['events']} 个事件，最大延迟 {stats['max_lag'] * 1000:.2f} 毫秒，"
+          f"在途车辆 {stats['active_vehicles']}，已到达车辆 {stats['finished_vehicles']}")
+
+def test_traffic_frame_encoding(graph: Graph, steps: int = 5):
+    """
+    比较交通数据帧和图数据在JSON与二进制格式下的大小和编码时间
+    
+    参数:
+        graph: 图实例
+        steps: 比较增量帧时的模拟步数
+    """
+    import json
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized
+    from .api.traffic_stream import TrafficStream
+    from .exporters.binary_exporter import graph_to_binary
+    from .exporters.json_exporter import graph_to_visjs
+    
+    print("\n=== 比较JSON与二进制帧格式 ===")
+    
+    state = TrafficState.from_graph(graph)
+    stream = TrafficStream(graph, state)
+    stream.subscribe('json')
+    stream.subscribe('binary', binary=True)
+    
+    start_time = time.time()
+    json_keyframe = json.dumps(stream.resync('json'))
+    json_time = time.time() - start_time
+    start_time = time.time()
+    binary_keyframe = stream.resync('binary')
+    binary_time = time.time() - start_time
+    print(f"关键帧: JSON {len(json_keyframe)} 字节 / {json_time:.4f} 秒，"
+          f"二进制 {len(binary_keyframe)} 字节 / {binary_time:.4f} 秒")
+    
+    json_sizes = []
+    binary_sizes = []
+    for _ in range(steps):
+        update_traffic_flow_vectorized(state)
+        frames = dict(stream.publish())
+        json_sizes.append(len(json.dumps(frames['json'])))
+        binary_sizes.append(len(frames['binary']))
+    print(f"增量帧平均大小: JSON {np.mean(json_sizes):.0f} 字节，二进制 {np.mean(binary_sizes):.0f} 字节")
+    
+    start_time = time.time()
+    json_graph = json.dumps(graph_to_visjs(graph))
+    json_time = time.time() - start_time
+    start_time = time.time()
+    binary_graph = graph_to_binary(graph)
+    binary_time = time.time() - start_time
+    print(f"图数据: JSON {len(json_graph)} 字节 / {json_time:.4f} 秒，"
+          f"二进制 {len(binary_graph)} 字节 / {binary_time:.4f} 秒")
+
+def test_grid_congestion(graph: Graph, grid_size: int = 10, steps: int = 20):
+    """
+    比较逐格四叉树聚合查询与预先分配网格后bincount统计网格拥堵的耗时
+    
+    参数:
+        graph: 图实例
+        grid_size: 网格的行/列数
+        steps: 重复统计的次数
+    """
+    from .algorithms.traffic_engine import TrafficState
+    from .algorithms.grid_congestion import GridCongestion
+    
+    print("\n=== 测试网格拥堵统计 ===")
+    
+    state = TrafficState.from_graph(graph)
+    west, south, east, north = 0, 0, 2000, 2000
+    cell_width = (east - west) / grid_size
+    cell_height = (north - south) / grid_size
+    aggregates = graph.aggregates or graph.build_aggregates()
+    
+    start_time = time.time()
+    for _ in range(steps):
+        aggregates.refresh_from_graph(graph)
+        for row in range(grid_size):
+            for col in range(grid_size):
+                aggregates.query_aggregate((west + col * cell_width, south + row * cell_height,
+                                           west + (col + 1) * cell_width, south + (row + 1) * cell_height))
+    query_time = (time.time() - start_time) / steps
+    
+    start_time = time.time()
+    grid = GridCongestion(state, (west, south, east, north), (grid_size, grid_size * 2, grid_size * 4))
+    build_time = time.time() - start_time
+    start_time = time.time()
+    for _ in range(steps):
+        result = grid.aggregate()
+    bincount_time = (time.time() - start_time) / steps
+    
+    print(f"四叉树逐格查询: 每次 {query_time * 1000:.2f} 毫秒（{grid_size}x{grid_size}）")
+    print(f"预先分配: 构建 {build_time * 1000:.2f} 毫秒，每次统计 {bincount_time * 1000:.2f} 毫秒"
+          f"（同时统计 {', '.join(f'{size}x{size}' for size in grid.grid_sizes)}）")
+    print(f"总车辆数: {result[grid_size].sum():.0f}")
+
+def test_traffic_assignment(graph: Graph, n_trips: int = 50000, iterations: int = 10, n_workers: int = None):
+    """
+    测试起讫点出行需求生成和Frank-Wolfe用户均衡交通分配
+    
+    参数:
+        graph: 图实例
+        n_trips: 出行总量
+        iterations: 最大迭代次数
+        n_workers: 计算最短路径的工作进程数量，默认为CPU核心数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, get_traffic_level_vectorized
+    from .algorithms.traffic_demand import generate_od_demand
+    from .algorithms.traffic_assignment import TrafficAssignment
+    
+    print("\n=== 测试用户均衡交通分配 ===")
+    
+    state = TrafficState.from_graph(graph)
+    start_time = time.time()
+    demand = generate_od_demand(graph, n_trips, rng=np.random.default_rng(0))
+    print(f"生成出行需求: {len(demand)} 对起讫点，{len(np.unique(demand.origins))} 个起点，"
+          f"用时 {time.time() - start_time:.4f} 秒")
+    
+    with TrafficAssignment(state, demand, n_workers=n_workers) as assignment:
+        stats = assignment.solve(iterations, verbose=True)
+        assignment.apply_to_state()
+    print(f"迭代 {stats['iterations']} 次，相对间隙 {stats['relative_gap']:.6f}，"
+          f"总用时 {stats['elapsed']:.2f} 秒（最短路径 {stats['shortest_path_time']:.2f} 秒）")
+    levels = np.bincount(get_traffic_level_vectorized(state), minlength=5)
+    print(f"各交通等级的道路数量: {levels.tolist()}")
+
+def test_active_set_engine(graph: Graph, probability: float = 0.001, warmup: int = 1500, steps: int = 50):
+    """
+    比较活动集引擎与向量化引擎在相同随机增减下的结果和每步耗时
+    
+    参数:
+        graph: 图实例
+        probability: 每条道路每一步发生随机增减的概率
+        warmup: 预先执行的分配步数，使路网达到车辆数变化较少的状态
+        steps: 比较的步数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, distribute_vehicles_vectorized
+    from .algorithms.traffic_active import ActiveSetTrafficEngine, draw_sparse_vehicle_changes
+    from .algorithms.grid_congestion import CongestionPyramid
+    
+    print("\n=== 测试活动集交通流引擎 ===")
+    dense = TrafficState.from_graph(graph)
+    for _ in range(warmup):
+        distribute_vehicles_vectorized(dense)
+    active = TrafficState.from_graph(graph)
+    active.vehicles[:] = dense.vehicles
+    engine = ActiveSetTrafficEngine(active, probability)
+    pyramid = CongestionPyramid(active)
+    
+    dense_rng, active_rng = np.random.default_rng(0), np.random.default_rng(0)
+    dense_time = active_time = pyramid_time = 0.0
+    active_counts = []
+    identical = True
+    for _ in range(steps):
+        start_time = time.perf_counter()
+        edges, change = draw_sparse_vehicle_changes(dense, probability, dense_rng)
+        dense.vehicles[edges] += change
+        np.clip(dense.vehicles, 0, dense.upper, out=dense.vehicles)
+        distribute_vehicles_vectorized(dense)
+        dense_time += time.perf_counter() - start_time
+        
+        previous = active.vehicles.copy()
+        start_time = time.perf_counter()
+        changed = engine.step(active_rng)
+        active_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        pyramid.apply_changes(changed, active.vehicles[changed] - previous[changed])
+        pyramid_time += time.perf_counter() - start_time
+        active_counts.append(engine.active)
+        identical &= np.array_equal(dense.vehicles, active.vehicles)
+    
+    print(f"道路数 {len(dense)}，每步平均活动道路 {np.mean(active_counts):.0f} 条，结果一致: {identical}")
+    print(f"向量化引擎: 每步 {dense_time / steps * 1000:.3f} 毫秒")
+    print(f"活动集引擎: 每步 {active_time / steps * 1000:.3f} 毫秒，"
+          f"增量更新拥堵金字塔 {pyramid_time / steps * 1000:.3f} 毫秒")
+
+def test_simulation_process(graph: Graph, duration: float = 5.0, interval: float = 0.5):
+    """
+    比较在线程中和在独立进程中运行交通模拟时，模拟请求处理的延迟
+    
+    参数:
+        graph: 图实例
+        duration: 每种方式的测试时长（秒）
+        interval: 每步模拟的间隔（秒）
+    """
+    import threading
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized
+    from .algorithms.simulation_process import TrafficSimulationProcess
+    
+    print("\n=== 测试独立进程中的交通模拟 ===")
+    edges = list(graph.edges.values())[:2000]
+    
+    def measure(read_vehicles):
+        # 模拟请求处理：读取车辆数快照并遍历一部分道路对象
+        latencies = []
+        end_time = time.perf_counter() + duration
+        while time.perf_counter() < end_time:
+            start_time = time.perf_counter()
+            read_vehicles()
+            sum(edge.capacity for edge in edges)
+            latencies.append(time.perf_counter() - start_time)
+            time.sleep(0.005)
+        latencies = np.array(latencies) * 1000
+        return np.percentile(latencies, 50), np.percentile(latencies, 99), latencies.max()
+    
+    # 在线程中模拟：每一步更新后写回图中
+    state = TrafficState.from_graph(graph)
+    lock = threading.Lock()
+    stop = threading.Event()
+    
+    def simulate():
+        rng = np.random.default_rng(0)
+        while not stop.wait(interval):
+            with lock:
+                update_traffic_flow_vectorized(state, rng)
+                state.sync_to_graph(graph)
+    
+    thread = threading.Thread(target=simulate, daemon=True)
+    thread.start()
+    
+    def read_locked():
+        with lock:
+            return state.vehicles.copy()
+    
+    p50, p99, worst = measure(read_locked)
+    stop.set()
+    thread.join()
+    print(f"线程中模拟: 请求延迟 p50 {p50:.3f} 毫秒，p99 {p99:.3f} 毫秒，最大 {worst:.3f} 毫秒")
+    
+    # 在独立进程中模拟：请求无锁读取共享内存快照
+    state = TrafficState.from_graph(graph)
+    with TrafficSimulationProcess(state, interval, np.random.default_rng(0)) as process:
+        process.resume()
+        p50, p99, worst = measure(lambda: process.snapshot()[0])
+        process.pause()
+        _, _, ticks = process.get_state()
+    print(f"进程中模拟: 请求延迟 p50 {p50:.3f} 毫秒，p99 {p99:.3f} 毫秒，最大 {worst:.3f} 毫秒（模拟 {ticks} 步）")
+
+def test_congestion_models(graph: Graph, repeat: int = 50):
+    """
+    比较各拥堵成本模型对所有道路计算行驶时间的耗时
+    
+    参数:
+        graph: 图实例
+        repeat: 每个模型的重复次数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState
+    from .algorithms.congestion_models import CONGESTION_MODEL_TYPES, create_congestion_model
+    
+    print("\n=== 测试拥堵成本模型 ===")
+    state = TrafficState.from_graph(graph)
+    state.vehicles[:] = np.random.default_rng(0).uniform(0, 1.6, len(state)) * state.capacity
+    models = [(name, create_congestion_model(name)) for name in CONGESTION_MODEL_TYPES]
+    models += [(f"{name}+查表", create_congestion_model(name, exp_table=True)) for name in ('default', 'spec')]
+    reference = create_congestion_model('default').travel_time(state.length, state.capacity, state.vehicles)
+    for name, model in models:
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            times = model.travel_time(state.length, state.capacity, state.vehicles)
+        elapsed = (time.perf_counter() - start_time) / repeat
+        print(f"{name}: 每次 {elapsed * 1000:.3f} 毫秒，"
+              f"与默认模型的最大相对差 {np.max(np.abs(times / reference - 1)):.3g}")
+
+def test_traffic_ensemble(graph: Graph, replicas: int = 4, ticks: int = 100, workers: int = None):
+    """
+    运行封闭道路、扩容和商场需求增加等情景的蒙特卡洛集合模拟，比较串行与进程池并行的耗时
+    
+    参数:
+        graph: 图实例
+        replicas: 每个情景的副本数量
+        ticks: 每个副本统计的步数
+        workers: 并行运行时的工作进程数量，默认为CPU核心数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState
+    from .algorithms.traffic_ensemble import Scenario, TrafficEnsemble
+    
+    print("\n=== 测试蒙特卡洛集合模拟 ===")
+    state = TrafficState.from_graph(graph)
+    busiest = state.edge_ids[int(np.argmax(state.vehicles / state.capacity))]
+    scenarios = [Scenario("基准"), Scenario("封闭最拥堵道路", closed_edges=[busiest]),
+                 Scenario("容量翻倍", capacity_scale=2.0), Scenario("商场需求增加", mall_demand=2.0)]
+    for n_workers in (1, workers):
+        start_time = time.perf_counter()
+        with TrafficEnsemble(state, scenarios, n_workers=n_workers) as ensemble:
+            results = ensemble.run(replicas, ticks, seed=0)
+        elapsed = time.perf_counter() - start_time
+        print(f"工作进程数 {ensemble.n_workers}: {len(scenarios)} 个情景 × {replicas} 个副本，耗时 {elapsed:.2f} 秒")
+    for result in results:
+        summary = result.summary(state.edge_ids, top=1)
+        print(f"{result.scenario.name}: 平均拥堵度 {summary['mean_congestion']:.4f} "
+              f"(副本间标准差 {summary['replica_std']:.4f})，平均p90 {summary['mean_quantile']:.4f}，"
+              f"最拥堵道路 {summary['top_edges'][0]['id']}")
+
+def test_cell_transmission_engine(graph: Graph, steps: int = 50):
+    """
+    比较元胞传输模型与向量化引擎的每步耗时，并封闭一条路段观察上游路段的排队（溢出）
+    
+    参数:
+        graph: 图实例
+        steps: 模拟步数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized
+    from .algorithms.traffic_ctm import CellTransmissionEngine
+    
+    print("\n=== 测试元胞传输模型 ===")
+    state = TrafficState.from_graph(graph)
+    initial = state.vehicles.copy()
+    rng = np.random.default_rng(0)
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        update_traffic_flow_vectorized(state, rng)
+    vectorized_time = (time.perf_counter() - start_time) / steps
+    
+    results = []
+    for blocked in (False, True):
+        state.vehicles[:] = initial
+        engine = CellTransmissionEngine(state)
+        link = int(np.argmax(engine.link_capacity))
+        if blocked:
+            # 封闭该路段：单元容量和最大流量为0
+            cells = slice(engine.first_cell[link], engine.last_cell[link] + 1)
+            engine.jam[cells] = 0.0
+            engine.max_flow[cells] = 0.0
+            engine.cells[cells] = 0.0
+        upstream = np.flatnonzero(engine.link_to == engine.link_from[link])
+        upstream = upstream[upstream != engine.reverse[link]]
+        rng = np.random.default_rng(0)
+        start_time = time.perf_counter()
+        for _ in range(steps):
+            engine.step(rng)
+        elapsed = (time.perf_counter() - start_time) / steps
+        queued = sum(engine.cells[engine.last_cell[i]] for i in upstream.tolist())
+        results.append((elapsed, queued))
+    
+    print(f"道路数 {len(state)}，单元数 {engine.n_cells}，单元长度 {engine.cell_length:.2f}")
+    print(f"向量化引擎: 每步 {vectorized_time * 1000:.3f} 毫秒")
+    print(f"元胞传输模型: 每步 {results[0][0] * 1000:.3f} 毫秒")
+    print(f"封闭路段的上游路段末端单元车辆数: 正常 {results[0][1]:.1f}，封闭后 {results[1][1]:.1f}")
+
+def test_route_tracking(graph: Graph, n_routes: int = 10000, steps: int = 20):
+    """
+    测试路线跟踪：订阅大量随机路线，比较向量化刷新与逐条路线计算ETA的耗时
+    
+    参数:
+        graph: 图实例
+        n_routes: 订阅的路线数量
+        steps: 模拟步数
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState, update_traffic_flow_vectorized, congestion_travel_time, traffic_levels
+    from .api.route_tracker import RouteTracker
+    
+    print("\n=== 测试路线跟踪 ===")
+    state = TrafficState.from_graph(graph)
+    rng = np.random.default_rng(0)
+    
+    def costs():
+        travel_time = congestion_travel_time(state.length, state.capacity, state.vehicles)
+        levels = traffic_levels(state.vehicles, state.capacity)
+        return travel_time, levels
+    
+    tracker = RouteTracker(state)
+    travel_time, levels = costs()
+    routes = [rng.integers(0, len(state), rng.integers(50, 100)) for _ in range(n_routes)]
+    for i, edges in enumerate(routes):
+        tracker.add(i % 100, edges, travel_time, levels)
+    
+    refresh_time = 0.0
+    updates = 0
+    for tick in range(steps):
+        update_traffic_flow_vectorized(state, rng)
+        travel_time, levels = costs()
+        start_time = time.perf_counter()
+        for _, update in tracker.publish(travel_time, levels, tick):
+            updates += len(update["routes"])
+        refresh_time += time.perf_counter() - start_time
+    
+    start_time = time.perf_counter()
+    naive = [float(travel_time[edges].sum()) for edges in routes]
+    naive_time = time.perf_counter() - start_time
+    eta, _, _ = tracker.refresh(travel_time, levels)
+    
+    print(f"路线数 {n_routes}，道路总数 {sum(len(edges) for edges in routes)}")
+    print(f"向量化刷新: 每步 {refresh_time / steps * 1000:.3f} 毫秒，共推送 {updates} 条路线更新")
+    print(f"逐条路线计算: {naive_time * 1000:.3f} 毫秒")
+    print(f"最大误差: {float(np.max(np.abs(eta - naive))):.3e}")
+
+def test_probe_ingestion(graph: Graph, n_pings: int = 200000, batch_seconds: float = 5.0, noise: float = 2.0):
+    """
+    测试探测车数据接入：在道路上生成带噪声的定位点并写入文件，按时间分批回放，统计匹配吞吐量和准确率
+    
+    参数:
+        graph: 图实例
+        n_pings: 定位点数量
+        batch_seconds: 回放时每批覆盖的时间长度（秒）
+        noise: 定位噪声的标准差
+    """
+    import tempfile
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState
+    from .algorithms.probe_ingestion import ProbeIngestor, read_probe_file, iter_probe_batches
+    
+    print("\n=== 测试探测车数据接入 ===")
+    state = TrafficState.from_graph(graph)
+    rng = np.random.default_rng(0)
+    edges = rng.integers(0, len(state), n_pings)
+    ratio = rng.random(n_pings)[:, None]
+    xy = state.vertex_xy
+    points = xy[state.source[edges]] * (1 - ratio) + xy[state.target[edges]] * ratio
+    points += rng.normal(0, noise, points.shape)
+    t = rng.uniform(0, 120, n_pings)
+    speed = rng.uniform(5, 20, n_pings)
+    
+    path = os.path.join(tempfile.gettempdir(), 'probe_pings.csv')
+    np.savetxt(path, np.column_stack((t, points, speed)), delimiter=',', header='t,x,y,speed', comments='', fmt='%.3f')
+    pings = read_probe_file(path)
+    os.remove(path)
+    
+    start_time = time.perf_counter()
+    ingestor = ProbeIngestor(state)
+    build_time = time.perf_counter() - start_time
+    matched = 0
+    start_time = time.perf_counter()
+    for batch in iter_probe_batches(pings, batch_seconds):
+        matched += ingestor.ingest(batch["t"], batch["x"], batch["y"], batch["speed"])["matched"]
+    ingest_time = time.perf_counter() - start_time
+    changed = ingestor.apply_to_state()
+    
+    sample = slice(0, min(n_pings, 100000))
+    found, _ = ingestor.matcher.match(points[sample, 0], points[sample, 1])
+    summary = ingestor.summary()
+    print(f"道路数 {len(state)}，匹配距离 {ingestor.matcher.max_distance:.2f}，网格 {ingestor.matcher.shape}，"
+          f"构建耗时 {build_time * 1000:.1f} 毫秒")
+    print(f"接入 {n_pings} 个定位点，匹配 {matched} 个，耗时 {ingest_time:.3f} 秒，"
+          f"吞吐量 {n_pings / ingest_time:.0f} 个/秒")
+    print(f"匹配到生成道路的比例: {np.mean(found == edges[sample]):.3f}")
+    print(f"窗口内有观测的道路 {summary['observed_edges']} 条，写入 {len(changed)} 条，平均速度 {summary['mean_speed']:.2f}")
+
+def test_traffic_incidents(graph: Graph, n_incidents: int = 20, edges_per_incident: int = 5):
+    """
+    测试交通事件：随机封闭道路或降低通行能力，比较只更新受影响道路与整体重建派生数据的耗时，并检查两者结果一致
+    
+    参数:
+        graph: 图实例
+        n_incidents: 事件数量
+        edges_per_incident: 每个事件包含的道路数量
+    """
+    import numpy as np
+    from .algorithms.traffic_engine import TrafficState
+    from .algorithms.traffic_ctm import CellTransmissionEngine
+    from .algorithms.grid_congestion import CongestionPyramid
+    from .algorithms.traffic_incidents import IncidentManager
+    
+    print("\n=== 测试交通事件 ===")
+    state = TrafficState.from_graph(graph)
+    engine = CellTransmissionEngine(state)
+    pyramid = CongestionPyramid(state)
+    manager = IncidentManager(state)
+    rng = np.random.default_rng(0)
+    
+    incremental_time = rebuild_time = 0.0
+    for i in range(n_incidents):
+        edges = rng.choice(len(state), edges_per_incident, replace=False)
+        if i % 2 == 0:
+            _, changed, capacity = manager.add(edges, 'closure')
+        else:
+            _, changed, capacity = manager.add(edges, 'capacity', 0.5)
+        
+        start_time = time.perf_counter()
+        capacity_delta = capacity - state.capacity[changed]
+        previous = state.vehicles[changed]
+        state.set_capacity(changed, capacity)
+        engine.update_edges(changed)
+        pyramid.apply_capacity_changes(changed, capacity_delta)
+        pyramid.apply_changes(changed, state.vehicles[changed] - previous)
+        incremental_time += time.perf_counter() - start_time
+        
+        start_time = time.perf_counter()
+        rebuilt_engine = CellTransmissionEngine(state)
+        rebuilt_pyramid = CongestionPyramid(state)
+        rebuild_time += time.perf_counter() - start_time
+    
+    capacity_error = max(float(np.max(np.abs(a - b))) for a, b in zip(pyramid.capacity, rebuilt_pyramid.capacity))
+    junction_error = float(np.max(np.abs(engine._inverse_denominator - rebuilt_engine._inverse_denominator)))
+    print(f"道路数 {len(state)}，单元数 {engine.n_cells}，事件 {n_incidents} 个，封闭道路 {int(manager.closed.sum())} 条")
+    print(f"只更新受影响道路: 每个事件 {incremental_time / n_incidents * 1000:.3f} 毫秒")
+    print(f"整体重建: 每个事件 {rebuild_time / n_incidents * 1000:.3f} 毫秒")
+    print(f"与重建结果的最大误差: 网格容量 {capacity_error:.3e}，路口转向 {junction_error:.3e}，"
+          f"阻塞车辆数 {float(np.max(np.abs(engine.jam - rebuilt_engine.jam))):.3e}")
+
 def test_random_map_generation(n=10000,load_existing=False):
     """
     测试随机地图生成功能
@@ -218,6 +822,123 @@ def test_quadtree_performance(graph, num_queries=100):
     if difference:
         print("注意: 两种方法可能在距离相等的顶点上有排序差异")
 
+def test_spatial_index_backends(graph, num_queries=100, query_size=100, nearest_count=10):
+    """
+    比较各空间索引后端（四叉树、网格、KD树）在当前点分布和查询组合上的性能，
+    并将图切换为最快的后端
+
+    参数:
+        graph: 要测试的图
+        num_queries: 每类查询的次数
+        query_size: 矩形查询的边长 / 圆形查询的直径
+        nearest_count: 每次最近邻查询返回的顶点数量
+
+    返回:
+        最快的后端名称
+    """
+    print("\n=== 测试空间索引后端性能 ===")
+
+    vertices = list(graph.vertices.values())
+    boundary = bounding_box(vertices)
+    if boundary is None:
+        print("图中没有顶点，跳过测试")
+        return None
+    x_min, y_min, x_max, y_max = boundary
+
+    # 生成与实际使用场景相近的查询组合
+    centers = [(random.uniform(x_min, x_max), random.uniform(y_min, y_max)) for _ in range(num_queries)]
+    half = query_size / 2
+    range_queries = [(x - half, y - half, x + half, y + half) for x, y in centers]
+    radius_queries = [(x, y, half) for x, y in centers]
+
+    best_type, results = benchmark_spatial_indexes(
+        vertices, boundary,
+        range_queries=range_queries,
+        radius_queries=radius_queries,
+        nearest_queries=centers,
+        nearest_count=nearest_count
+    )
+
+    for index_type, timings in results.items():
+        print(f"  {index_type:<8} 构建 {timings['build']:.4f} 秒, 矩形查询 {timings['range']:.4f} 秒, "
+              f"圆形查询 {timings['radius']:.4f} 秒, 最近邻查询 {timings['nearest']:.4f} 秒, 总计 {timings['total']:.4f} 秒")
+    print(f"最快的空间索引后端: {best_type}")
+
+    # 切换到最快的后端
+    graph.build_spatial_index(index_type=best_type)
+    return best_type
+
+def test_quadtree_query_allocations(graph, num_queries=200, query_size=100):
+    """
+    使用tracemalloc比较四叉树矩形查询的单次查询内存分配：
+    递归逐层构建列表的旧实现、迭代查询、以及复用结果缓冲区的迭代查询
+
+    参数:
+        graph: 要测试的图
+        num_queries: 查询次数
+        query_size: 矩形查询的边长
+    """
+    import tracemalloc
+
+    print("\n=== 测试四叉树查询内存分配 ===")
+
+    vertices = list(graph.vertices.values())
+    boundary = bounding_box(vertices)
+    if boundary is None:
+        print("图中没有顶点，跳过测试")
+        return
+    quadtree = QuadTree(boundary)
+    quadtree.insert_batch(vertices)
+    x_min, y_min, x_max, y_max = boundary
+    half = query_size / 2
+    queries = []
+    for _ in range(num_queries):
+        x, y = random.uniform(x_min, x_max), random.uniform(y_min, y_max)
+        queries.append((x - half, y - half, x + half, y + half))
+
+    def recursive_query_range(node, range_rect):
+        """旧实现：递归查询并在每一层创建新列表"""
+        found_points = []
+        if not node._intersects(range_rect):
+            return found_points
+        for point in node.points:
+            if node._point_in_range(point, range_rect):
+                found_points.append(point)
+        if node.divided:
+            for child in (node.northwest, node.northeast, node.southwest, node.southeast):
+                found_points.extend(recursive_query_range(child, range_rect))
+        return found_points
+
+    buffer = []
+
+    def buffered_query_range(range_rect):
+        buffer.clear()
+        return quadtree.query_range(range_rect, out=buffer)
+
+    variants = [
+        ("递归查询", lambda rect: recursive_query_range(quadtree, rect)),
+        ("迭代查询", quadtree.query_range),
+        ("复用缓冲区", buffered_query_range),
+    ]
+
+    for name, query in variants:
+        # 预热一次，使缓冲区达到所需大小
+        for rect in queries:
+            query(rect)
+        tracemalloc.start()
+        peak_total = 0
+        start_time = time.time()
+        for rect in queries:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            query(rect)
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - current
+        elapsed = time.time() - start_time
+        tracemalloc.stop()
+        print(f"  {name:<6} 平均每次查询峰值分配 {peak_total / num_queries:.0f} 字节, "
+              f"{num_queries} 次查询用时 {elapsed:.4f} 秒（含tracemalloc开销）")
+
 def export_and_serve_map(graph, data_path=None, run_web_server=True):
     """
     导出地图数据并运行Web服务器
@@ -294,6 +1015,10 @@ def main():
     
     # 测试四叉树性能
     # test_quadtree_performance(graph, num_queries=50)
+    # 比较各空间索引后端并切换到最快的后端
+    # test_spatial_index_backends(graph, num_queries=50)
+    # 比较四叉树查询的内存分配
+    # test_quadtree_query_allocations(graph)
     
     # 清理并导出数据
     data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'map_data.json')
@@ -304,6 +1029,34 @@ def main():
     
     # 测试交通流模拟
     # test_traffic_simulation(graph, simulation_steps=5)
+    # 比较向量化交通流引擎的性能
+    # test_traffic_engine_performance(graph)
+    # 验证分区并行交通流模拟
+    # test_partitioned_traffic_engine(graph)
+    # 测试个体车辆离散事件模拟
+    # test_agent_simulation(graph)
+    # 比较JSON与二进制帧格式
+    # test_traffic_frame_encoding(graph)
+    # 测试网格拥堵统计
+    # test_grid_congestion(graph)
+    # 测试用户均衡交通分配
+    # test_traffic_assignment(graph)
+    # 比较活动集引擎与向量化引擎
+    # test_active_set_engine(graph)
+    # 比较线程与独立进程中模拟时的请求延迟
+    # test_simulation_process(graph)
+    # 比较各拥堵成本模型的计算耗时
+    # test_congestion_models(graph)
+    # 比较各情景的蒙特卡洛集合模拟结果
+    # test_traffic_ensemble(graph)
+    # 比较元胞传输模型与向量化引擎
+    # test_cell_transmission_engine(graph)
+    # 比较订阅路线的向量化ETA刷新与逐条计算
+    # test_route_tracking(graph)
+    # 测试探测车定位点的匹配与滑动窗口汇总
+    # test_probe_ingestion(graph)
+    # 比较交通事件的增量更新与整体重建
+    # test_traffic_incidents(graph)
     
     # 测试A*算法
     # test_a_star_algorithm(graph)
@@ -1,11 +1,17 @@
 """
 导航系统数据结构模块
-包含顶点、边、图和四叉树等基础数据结构
+包含顶点、边、图和空间索引（四叉树、网格、KD树）等基础数据结构
 """
 
 from .vertex import Vertex
 from .edge import Edge
 from .graph import Graph
 from .quadtree import QuadTree
+from .spatial_index import SpatialIndex, create_spatial_index, benchmark_spatial_indexes
+from .grid_index import GridIndex
+from .kdtree_index import KDTreeIndex
+from .edge_index import EdgeIndex
+from .quadtree_aggregate import QuadTreeAggregates
 
-__all__ = ['Vertex', 'Edge', 'Graph', 'QuadTree'] 
\ No newline at end of file
+__all__ = ['Vertex', 'Edge', 'Graph', 'QuadTree', 'SpatialIndex', 'GridIndex', 'KDTreeIndex', 'EdgeIndex',
+           'QuadTreeAggregates', 'create_spatial_index', 'benchmark_spatial_indexes'] 
\ No newline at end of file
@@ -18,6 +18,7 @@ class Edge:
         capacity: 道路容量（饱和状态下可容纳的车辆数量）
         current_vehicles: 当前道路上的车辆数
         is_mall_connection: 是否连接商场
+        closed: 道路是否封闭（寻路时跳过）
     """
     
     def __init__(self, id, vertex1, vertex2, capacity=100, is_mall_connection=False):
@@ -38,6 +39,7 @@ class Edge:
         self.capacity : int = int(self.length *100)
         self.current_vehicles : int = random.randint(min(100,int(self.capacity)), int(self.capacity))
         self.is_mall_connection = is_mall_connection
+        self.closed = False
         
         # 将边添加到两个顶点
         vertex1.add_edge(self)
@@ -0,0 +1,377 @@
+"""
+道路（边）空间索引
+使用松散四叉树（loose quadtree）按线段外包矩形索引边，
+支持矩形范围查询、线段相交查询和最近道路查询
+"""
+import heapq
+
+
+class _EdgeNode:
+    """
+    松散四叉树节点
+
+    每个节点的松散边界是其核心边界向四周各扩展半个边长，
+    线段按外包矩形中心落入的象限下放，只要外包矩形仍在子节点的松散边界内即可
+    """
+    __slots__ = ('boundary', 'loose', 'depth', 'items', 'children')
+
+    def __init__(self, boundary, depth):
+        x_min, y_min, x_max, y_max = boundary
+        half_w = (x_max - x_min) / 2
+        half_h = (y_max - y_min) / 2
+        self.boundary = boundary
+        self.loose = (x_min - half_w, y_min - half_h, x_max + half_w, y_max + half_h)
+        self.depth = depth
+        self.items = []      # [(x_min, y_min, x_max, y_max, edge), ...]
+        self.children = None  # [西北, 东北, 西南, 东南]
+
+
+class EdgeIndex:
+    """
+    道路线段的松散四叉树索引
+
+    属性:
+        boundary: 根节点核心边界 (x_min, y_min, x_max, y_max)
+        capacity: 节点分裂前可容纳的线段数量
+        max_depth: 最大深度
+    """
+
+    def __init__(self, boundary, capacity=8, max_depth=16):
+        """
+        初始化道路索引
+
+        参数:
+            boundary: 根节点边界 (x_min, y_min, x_max, y_max)
+            capacity: 节点最大容量
+            max_depth: 最大深度
+        """
+        self.boundary = boundary
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self.root = _EdgeNode(boundary, 0)
+        self._node_of = {}  # edge.id -> (所在节点, 条目)
+
+    @staticmethod
+    def _segment_box(edge):
+        """返回边的线段外包矩形"""
+        v1, v2 = edge.vertex1, edge.vertex2
+        return (min(v1.x, v2.x), min(v1.y, v2.y), max(v1.x, v2.x), max(v1.y, v2.y))
+
+    def insert(self, edge):
+        """
+        插入一条边，超出当前边界时自动扩大根节点并重建索引
+
+        参数:
+            edge: 要插入的边，其两个顶点必须有x和y属性
+        """
+        if edge.id in self._node_of:
+            return
+        box = self._segment_box(edge)
+        if not _contains(self.boundary, box):
+            self._grow_to(box)
+        self._insert_item(self.root, box + (edge,))
+
+    def insert_batch(self, edges):
+        """
+        批量插入边
+
+        参数:
+            edges: 边的可迭代集合
+        """
+        for edge in edges:
+            self.insert(edge)
+
+    def _insert_item(self, node, item):
+        """将条目下放到最深的可容纳节点"""
+        while True:
+            if node.children is None:
+                node.items.append(item)
+                self._node_of[item[4].id] = (node, item)
+                if len(node.items) > self.capacity and node.depth < self.max_depth:
+                    self._subdivide(node)
+                return
+            child = self._child_for(node, item)
+            if child is None:
+                node.items.append(item)
+                self._node_of[item[4].id] = (node, item)
+                return
+            node = child
+
+    def _child_for(self, node, item):
+        """按外包矩形中心选择子节点，外包矩形超出该子节点松散边界时返回None"""
+        x_min, y_min, x_max, y_max = node.boundary
+        x_mid = (x_min + x_max) / 2
+        y_mid = (y_min + y_max) / 2
+        cx = (item[0] + item[2]) / 2
+        cy = (item[1] + item[3]) / 2
+        if cy >= y_mid:
+            child = node.children[0] if cx < x_mid else node.children[1]
+        else:
+            child = node.children[2] if cx < x_mid else node.children[3]
+        return child if _contains(child.loose, item) else None
+
+    def _subdivide(self, node):
+        """分裂节点并将可下放的条目移入子节点"""
+        x_min, y_min, x_max, y_max = node.boundary
+        x_mid = (x_min + x_max) / 2
+        y_mid = (y_min + y_max) / 2
+        depth = node.depth + 1
+        node.children = [
+            _EdgeNode((x_min, y_mid, x_mid, y_max), depth),  # 西北
+            _EdgeNode((x_mid, y_mid, x_max, y_max), depth),  # 东北
+            _EdgeNode((x_min, y_min, x_mid, y_mid), depth),  # 西南
+            _EdgeNode((x_mid, y_min, x_max, y_mid), depth),  # 东南
+        ]
+        items = node.items
+        node.items = []
+        for item in items:
+            child = self._child_for(node, item)
+            if child is None:
+                node.items.append(item)
+                self._node_of[item[4].id] = (node, item)
+            else:
+                self._insert_item(child, item)
+
+    def _grow_to(self, box):
+        """将根节点边界成倍扩大直到包含box，然后重建索引"""
+        x_min, y_min, x_max, y_max = self.boundary
+        while not _contains((x_min, y_min, x_max, y_max), box):
+            width = max(x_max - x_min, 1.0)
+            height = max(y_max - y_min, 1.0)
+            x_min = min(x_min, box[0]) - width / 2
+            y_min = min(y_min, box[1]) - height / 2
+            x_max = max(x_max, box[2]) + width / 2
+            y_max = max(y_max, box[3]) + height / 2
+        items = [item for node, item in self._node_of.values()]
+        self.boundary = (x_min, y_min, x_max, y_max)
+        self.root = _EdgeNode(self.boundary, 0)
+        self._node_of = {}
+        for item in items:
+            self._insert_item(self.root, item)
+
+    def remove(self, edge):
+        """
+        从索引中移除一条边
+
+        参数:
+            edge: 要移除的边
+
+        返回:
+            移除成功返回True，边不在索引中返回False
+        """
+        entry = self._node_of.pop(edge.id, None)
+        if entry is None:
+            return False
+        node, item = entry
+        node.items.remove(item)
+        return True
+
+    def _iter_candidates(self, range_rect):
+        """迭代遍历松散边界与查询矩形相交的节点，生成外包矩形与查询矩形相交的条目"""
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            lx_min, ly_min, lx_max, ly_max = node.loose
+            if rx_max < lx_min or rx_min > lx_max or ry_max < ly_min or ry_min > ly_max:
+                continue
+            for item in node.items:
+                if not (rx_max < item[0] or rx_min > item[2] or ry_max < item[1] or ry_min > item[3]):
+                    yield item
+            if node.children is not None:
+                stack.extend(node.children)
+
+    def query_box(self, range_rect, exact=True):
+        """
+        查询与矩形范围相交的所有道路
+
+        参数:
+            range_rect: 查询矩形 (x_min, y_min, x_max, y_max)
+            exact: 为True时要求线段本身与矩形相交，为False时只比较外包矩形
+
+        返回:
+            边列表
+        """
+        if not exact:
+            return [item[4] for item in self._iter_candidates(range_rect)]
+
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        corners = ((rx_min, ry_min), (rx_max, ry_min), (rx_max, ry_max), (rx_min, ry_max))
+        found_edges = []
+        for item in self._iter_candidates(range_rect):
+            edge = item[4]
+            p1 = (edge.vertex1.x, edge.vertex1.y)
+            p2 = (edge.vertex2.x, edge.vertex2.y)
+            # 任一端点在矩形内，或线段与矩形的某条边相交
+            if (rx_min <= p1[0] <= rx_max and ry_min <= p1[1] <= ry_max) or \
+               (rx_min <= p2[0] <= rx_max and ry_min <= p2[1] <= ry_max) or \
+               any(segments_intersect(p1, p2, corners[i], corners[(i + 1) % 4]) for i in range(4)):
+                found_edges.append(edge)
+        return found_edges
+
+    def query_intersecting(self, p1, p2):
+        """
+        查询与线段 p1-p2 相交的所有道路（包括端点接触）
+
+        参数:
+            p1: 线段起点 (x, y)
+            p2: 线段终点 (x, y)
+
+        返回:
+            边列表
+        """
+        box = (min(p1[0], p2[0]), min(p1[1], p2[1]), max(p1[0], p2[0]), max(p1[1], p2[1]))
+        found_edges = []
+        for item in self._iter_candidates(box):
+            edge = item[4]
+            if segments_intersect(p1, p2, (edge.vertex1.x, edge.vertex1.y), (edge.vertex2.x, edge.vertex2.y)):
+                found_edges.append(edge)
+        return found_edges
+
+    def query_radius(self, x, y, radius):
+        """
+        查询到指定坐标距离不超过radius的所有道路
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            radius: 查询半径
+
+        返回:
+            边列表
+        """
+        radius_sq = radius * radius
+        found_edges = []
+        for item in self._iter_candidates((x - radius, y - radius, x + radius, y + radius)):
+            edge = item[4]
+            if point_segment_distance_sq(x, y, edge.vertex1.x, edge.vertex1.y,
+                                         edge.vertex2.x, edge.vertex2.y) <= radius_sq:
+                found_edges.append(edge)
+        return found_edges
+
+    def query_nearest(self, x, y, max_count=1, max_distance=float('inf')):
+        """
+        查询距离指定坐标最近的道路（按点到线段的距离）
+        以节点松散边界到查询点的距离为下界做最佳优先搜索
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            max_count: 最大返回数量
+            max_distance: 最大查询距离
+
+        返回:
+            最近的边列表，按距离排序
+        """
+        max_distance_sq = max_distance * max_distance
+        # 优先队列中的元素: (距离平方下界, 序号, 是否为边, 节点或边)
+        heap = [(0.0, 0, False, self.root)]
+        counter = 1
+        found_edges = []
+        while heap and len(found_edges) < max_count:
+            dist_sq, _, is_edge, entry = heapq.heappop(heap)
+            if dist_sq > max_distance_sq:
+                break
+            if is_edge:
+                found_edges.append(entry)
+                continue
+            for item in entry.items:
+                edge = item[4]
+                d = point_segment_distance_sq(x, y, edge.vertex1.x, edge.vertex1.y,
+                                              edge.vertex2.x, edge.vertex2.y)
+                heapq.heappush(heap, (d, counter, True, edge))
+                counter += 1
+            if entry.children is not None:
+                for child in entry.children:
+                    if child.items or child.children is not None:
+                        heapq.heappush(heap, (_box_distance_sq(child.loose, x, y), counter, False, child))
+                        counter += 1
+        return found_edges
+
+    def count(self):
+        """
+        统计索引中的道路数量
+
+        返回:
+            道路数量
+        """
+        return len(self._node_of)
+
+    def __contains__(self, edge):
+        return edge.id in self._node_of
+
+    def __str__(self):
+        """返回道路索引的字符串表示"""
+        return f"EdgeIndex(boundary={self.boundary}, total_edges={len(self._node_of)})"
+
+
+def _contains(outer, box):
+    """判断矩形outer是否完全包含box（box可以带有额外的元素）"""
+    return outer[0] <= box[0] and outer[1] <= box[1] and box[2] <= outer[2] and box[3] <= outer[3]
+
+
+def _box_distance_sq(box, x, y):
+    """计算点到矩形的距离平方（点在矩形内时为0）"""
+    dx = max(box[0] - x, 0.0, x - box[2])
+    dy = max(box[1] - y, 0.0, y - box[3])
+    return dx * dx + dy * dy
+
+
+def point_segment_distance_sq(px, py, x1, y1, x2, y2):
+    """
+    计算点到线段的距离平方
+
+    参数:
+        px, py: 点坐标
+        x1, y1, x2, y2: 线段端点坐标
+
+    返回:
+        距离平方
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return (px - x1) ** 2 + (py - y1) ** 2
+    t = ((px - x1) * dx + (py - y1) * dy) / length_sq
+    t = max(0.0, min(1.0, t))
+    cx = x1 + t * dx
+    cy = y1 + t * dy
+    return (px - cx) ** 2 + (py - cy) ** 2
+
+
+def segments_intersect(p1, p2, p3, p4):
+    """
+    检查线段 p1-p2 与 p3-p4 是否相交（包括端点接触和共线重叠）
+
+    参数:
+        p1, p2: 第一条线段的端点 (x, y)
+        p3, p4: 第二条线段的端点 (x, y)
+
+    返回:
+        相交返回True，否则返回False
+    """
+    d1 = _direction(p3, p4, p1)
+    d2 = _direction(p3, p4, p2)
+    d3 = _direction(p1, p2, p3)
+    d4 = _direction(p1, p2, p4)
+
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and \
+       ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
+        return True
+
+    return (d1 == 0 and _on_segment(p3, p4, p1)) or \
+           (d2 == 0 and _on_segment(p3, p4, p2)) or \
+           (d3 == 0 and _on_segment(p1, p2, p3)) or \
+           (d4 == 0 and _on_segment(p1, p2, p4))
+
+
+def _direction(p1, p2, p3):
+    """计算三点方向，大于0为逆时针，小于0为顺时针，等于0为共线"""
+    return (p3[1] - p1[1]) * (p2[0] - p1[0]) - (p2[1] - p1[1]) * (p3[0] - p1[0])
+
+
+def _on_segment(p1, p2, p3):
+    """检查与p1-p2共线的点p3是否落在线段p1-p2上"""
+    return (min(p1[0], p2[0]) <= p3[0] <= max(p1[0], p2[0]) and
+            min(p1[1], p2[1]) <= p3[1] <= max(p1[1], p2[1]))
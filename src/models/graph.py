@@ -3,7 +3,8 @@
 """
 import math
 from collections import defaultdict, deque  # 添加deque用于BFS
-from .quadtree import QuadTree
+from .spatial_index import create_spatial_index, bounding_box
+from .edge_index import EdgeIndex
 
 class Graph:
     """
@@ -13,13 +14,23 @@ class Graph:
         vertices: 图中所有顶点的字典 {id: vertex}
         edges: 图中所有边的字典 {id: edge}
         spatial_index: 空间索引结构
+        index_type: 空间索引后端名称 ('quadtree', 'grid', 'kdtree')
+        edge_index: 道路线段的空间索引，随create_edge/add_edge自动维护
     """
     
-    def __init__(self):
-        """初始化空图"""
+    def __init__(self, index_type='quadtree'):
+        """
+        初始化空图
+        
+        参数:
+            index_type: 构建空间索引时使用的后端名称
+        """
         self.vertices = {}  # id -> vertex
         self.edges = {}     # id -> edge
-        self.spatial_index = None  # 空间索引，后续实现
+        self.spatial_index = None  # 空间索引，按需构建
+        self.index_type = index_type
+        self.edge_index = None  # 道路索引，添加第一条边时创建
+        self.aggregates = None  # 四叉树聚合统计，按需构建
         self.next_vertex_id = 0
         self.next_edge_id = 0
     
@@ -34,6 +45,7 @@ class Graph:
             添加的顶点
         """
         self.vertices[vertex.id] = vertex
+        self.aggregates = None  # 图结构变化后聚合统计失效
         
         # 如果存在空间索引，则添加到索引中
         if self.spatial_index:
@@ -69,6 +81,13 @@ class Graph:
             添加的边
         """
         self.edges[edge.id] = edge
+        self.aggregates = None  # 图结构变化后聚合统计失效
+        
+        # 维护道路索引
+        if self.edge_index is None:
+            self.edge_index = EdgeIndex(bounding_box(list(self.vertices.values()) or [edge.vertex1, edge.vertex2]))
+        self.edge_index.insert(edge)
+        
         return edge
     
     def create_edge(self, vertex1, vertex2, capacity=100):
@@ -141,32 +160,117 @@ class Graph:
                 return edge
         return None
     
-    def build_spatial_index(self):
+    def build_spatial_index(self, index_type=None):
         """
         构建空间索引，用于快速查找顶点
+        
+        参数:
+            index_type: 空间索引后端名称，为None时使用图的index_type
+            
+        返回:
+            构建好的空间索引
         """
+        if index_type is not None:
+            self.index_type = index_type
+        
         if not self.vertices:
             return
         
-        # 确定图的边界
-        x_values = [v.x for v in self.vertices.values()]
-        y_values = [v.y for v in self.vertices.values()]
+        # 确定图的边界（包含少量边距以确保边界点被包含）
+        vertices = list(self.vertices.values())
+        boundary = bounding_box(vertices)
         
-        x_min, x_max = min(x_values), max(x_values)
-        y_min, y_max = min(y_values), max(y_values)
+        # 创建空间索引并插入所有顶点
+        self.spatial_index = create_spatial_index(self.index_type, boundary, expected_count=len(vertices))
+        self.spatial_index.insert_batch(vertices)
         
-        # 为了确保边界包含所有点，增加一点边距
-        padding = max((x_max - x_min), (y_max - y_min)) * 0.01
-        boundary = (x_min - padding, y_min - padding, x_max + padding, y_max + padding)
+        return self.spatial_index
+    
+    def build_aggregates(self):
+        """
+        构建带子树聚合值的四叉树统计结构，用于快速的范围统计查询
+        当前空间索引不是四叉树时，临时构建一棵四叉树
         
-        # 创建四叉树
-        self.spatial_index = QuadTree(boundary)
+        返回:
+            QuadTreeAggregates实例，图为空时返回None
+        """
+        from .quadtree import QuadTree
+        from .quadtree_aggregate import QuadTreeAggregates
         
-        # 将所有顶点插入四叉树
-        for vertex in self.vertices.values():
-            self.spatial_index.insert(vertex)
+        if not self.vertices:
+            self.aggregates = None
+            return None
         
-        return self.spatial_index
+        if not self.spatial_index:
+            self.build_spatial_index()
+        quadtree = self.spatial_index
+        if not isinstance(quadtree, QuadTree):
+            vertices = list(self.vertices.values())
+            quadtree = QuadTree(bounding_box(vertices))
+            quadtree.insert_batch(vertices)
+        
+        self.aggregates = QuadTreeAggregates(quadtree, self)
+        return self.aggregates
+    
+    def build_edge_index(self):
+        """
+        重新构建道路索引
+        
+        返回:
+            构建好的道路索引，图中没有边时返回None
+        """
+        if not self.edges:
+            self.edge_index = None
+            return None
+        self.edge_index = EdgeIndex(bounding_box(list(self.vertices.values())))
+        self.edge_index.insert_batch(self.edges.values())
+        return self.edge_index
+    
+    def get_edges_in_range(self, range_rect):
+        """
+        获取与指定矩形范围（例如当前视口）相交的所有道路
+        
+        参数:
+            range_rect: 查询矩形 (x_min, y_min, x_max, y_max)
+            
+        返回:
+            边列表
+        """
+        if self.edge_index is None:
+            return []
+        return self.edge_index.query_box(range_rect)
+    
+    def get_edges_in_radius(self, center_x, center_y, radius):
+        """
+        获取到指定坐标距离不超过radius的所有道路
+        
+        参数:
+            center_x: 中心点x坐标
+            center_y: 中心点y坐标
+            radius: 查询半径
+            
+        返回:
+            边列表
+        """
+        if self.edge_index is None:
+            return []
+        return self.edge_index.query_radius(center_x, center_y, radius)
+    
+    def get_nearest_edges(self, x, y, n=1):
+        """
+        获取距离指定坐标最近的n条道路（按点到线段的距离）
+        
+        参数:
+            x: x坐标
+            y: y坐标
+            n: 返回的道路数量
+            
+        返回:
+            边列表，按距离排序
+        """
+        if self.edge_index is None:
+            return []
+        return self.edge_index.query_nearest(x, y, max_count=n)
     
     def get_nearby_vertices(self, x, y, n=100):
         """
@@ -343,17 +447,7 @@ class Graph:
         if not self.spatial_index: # Still no index (e.g., empty graph)
             return []
 
-        # Define the query bounding box for the spatial index
-        query_bounds = (center_x - radius, center_y - radius, center_x + radius, center_y + radius)
-        candidate_vertices = self.spatial_index.query_range(query_bounds)
-
-        vertices_in_radius = []
-        for vertex in candidate_vertices:
-            # Calculate squared distance for efficiency, compare with radius squared
-            distance_sq = (vertex.x - center_x)**2 + (vertex.y - center_y)**2
-            if distance_sq <= radius**2:
-                vertices_in_radius.append(vertex)
-        return vertices_in_radius
+        return self.spatial_index.query_radius(center_x, center_y, radius)
 
     def get_all_vertices_by_type(self, attribute_type: str):
         """
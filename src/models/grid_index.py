@@ -0,0 +1,188 @@
+"""
+均匀网格哈希空间索引
+将平面划分为等大的正方形单元格，用字典按单元格坐标存放点
+适合分布较均匀的点集和小范围查询
+"""
+import heapq
+import math
+from collections import defaultdict
+from .spatial_index import SpatialIndex
+
+
+class GridIndex(SpatialIndex):
+    """
+    均匀网格哈希实现
+
+    属性:
+        boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+        cell_size: 单元格边长
+        cells: 单元格坐标 (i, j) 到点列表的映射
+    """
+
+    # 未指定预计点数时，单元格按边界长边划分为该数量
+    DEFAULT_CELLS_PER_SIDE = 64
+    # 每个单元格期望容纳的点数
+    TARGET_POINTS_PER_CELL = 4
+
+    def __init__(self, boundary, cell_size=None, expected_count=None):
+        """
+        初始化网格索引
+
+        参数:
+            boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+            cell_size: 单元格边长，为None时自动推算
+            expected_count: 预计插入的点数量，用于推算单元格边长
+        """
+        super().__init__(boundary)
+        x_min, y_min, x_max, y_max = boundary
+        width = max(x_max - x_min, 1e-9)
+        height = max(y_max - y_min, 1e-9)
+
+        if cell_size is None:
+            if expected_count:
+                cell_size = math.sqrt(width * height * self.TARGET_POINTS_PER_CELL / expected_count)
+            else:
+                cell_size = max(width, height) / self.DEFAULT_CELLS_PER_SIDE
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self._count = 0
+        # 已占用单元格的坐标范围 [i_min, j_min, i_max, j_max]
+        self._extent = None
+
+    def _cell_of(self, x, y):
+        """返回坐标所在单元格的 (i, j)"""
+        return (int(math.floor((x - self.boundary[0]) / self.cell_size)),
+                int(math.floor((y - self.boundary[1]) / self.cell_size)))
+
+    def insert(self, point):
+        """
+        插入一个点（网格没有边界限制，超出边界的点同样会被存放）
+
+        参数:
+            point: 要插入的点对象
+
+        返回:
+            True
+        """
+        i, j = self._cell_of(point.x, point.y)
+        self.cells[(i, j)].append(point)
+        self._count += 1
+        if self._extent is None:
+            self._extent = [i, j, i, j]
+        else:
+            extent = self._extent
+            extent[0] = min(extent[0], i)
+            extent[1] = min(extent[1], j)
+            extent[2] = max(extent[2], i)
+            extent[3] = max(extent[3], j)
+        return True
+
+    def query_range(self, range_rect):
+        """
+        查询指定矩形范围内的所有点
+
+        参数:
+            range_rect: 查询范围矩形 (x_min, y_min, x_max, y_max)
+
+        返回:
+            范围内的点列表
+        """
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        i_min, j_min = self._cell_of(rx_min, ry_min)
+        i_max, j_max = self._cell_of(rx_max, ry_max)
+
+        found_points = []
+        cells = self.cells
+        # 查询范围远大于已占用单元格数时，直接遍历已占用的单元格
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > len(cells):
+            keys = [key for key in cells if i_min <= key[0] <= i_max and j_min <= key[1] <= j_max]
+        else:
+            keys = [(i, j) for i in range(i_min, i_max + 1) for j in range(j_min, j_max + 1)]
+
+        for key in keys:
+            bucket = cells.get(key)
+            if not bucket:
+                continue
+            i, j = key
+            # 完全位于查询范围内部的单元格无需逐点检查
+            if i_min < i < i_max and j_min < j < j_max:
+                found_points.extend(bucket)
+                continue
+            for point in bucket:
+                if rx_min <= point.x <= rx_max and ry_min <= point.y <= ry_max:
+                    found_points.append(point)
+        return found_points
+
+    def query_nearest(self, x, y, max_count=1, max_distance=float('inf')):
+        """
+        查询距离指定坐标最近的点，以查询点所在单元格为中心逐圈向外扩展
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            max_count: 最大返回点数量
+            max_distance: 最大查询距离
+
+        返回:
+            最近的点列表，按距离排序
+        """
+        if max_count <= 0 or not self._count:
+            return []
+
+        ci, cj = self._cell_of(x, y)
+        # 网格中已占用单元格的坐标范围，超出后不再扩展
+        max_ring = self._max_ring(ci, cj)
+        if max_distance != float('inf'):
+            max_ring = min(max_ring, int(math.ceil(max_distance / self.cell_size)) + 1)
+
+        # 最大堆（距离取负），只保留当前最近的max_count个点
+        heap = []
+        max_distance_sq = max_distance * max_distance
+        ring = 0
+        while ring <= max_ring:
+            for key in self._ring_cells(ci, cj, ring):
+                for point in self.cells.get(key, ()):
+                    dist_sq = (point.x - x) ** 2 + (point.y - y) ** 2
+                    if dist_sq > max_distance_sq:
+                        continue
+                    if len(heap) < max_count:
+                        heapq.heappush(heap, (-dist_sq, id(point), point))
+                    elif -heap[0][0] > dist_sq:
+                        heapq.heapreplace(heap, (-dist_sq, id(point), point))
+            # 第ring圈之外的点距离至少为 ring * cell_size
+            if len(heap) == max_count and (ring * self.cell_size) ** 2 >= -heap[0][0]:
+                break
+            ring += 1
+
+        heap.sort(key=lambda item: -item[0])
+        return [point for _, _, point in heap]
+
+    def _ring_cells(self, ci, cj, ring):
+        """生成以 (ci, cj) 为中心、切比雪夫距离为ring的所有单元格坐标"""
+        if ring == 0:
+            yield (ci, cj)
+            return
+        for i in range(ci - ring, ci + ring + 1):
+            yield (i, cj - ring)
+            yield (i, cj + ring)
+        for j in range(cj - ring + 1, cj + ring):
+            yield (ci - ring, j)
+            yield (ci + ring, j)
+
+    def _max_ring(self, ci, cj):
+        """计算覆盖所有已占用单元格所需的最大圈数"""
+        i_min, j_min, i_max, j_max = self._extent
+        return max(ci - i_min, i_max - ci, cj - j_min, j_max - cj, 0)
+
+    def count(self):
+        """
+        统计网格中的点数量
+
+        返回:
+            点数量
+        """
+        return self._count
+
+    def __str__(self):
+        """返回网格索引的字符串表示"""
+        return f"GridIndex(boundary={self.boundary}, cell_size={self.cell_size:.2f}, cells={len(self.cells)}, total_points={self._count})"
@@ -0,0 +1,202 @@
+"""
+KD树空间索引
+基于scipy.spatial.cKDTree实现，适合大规模静态点集和批量查询
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+from .spatial_index import SpatialIndex
+
+
+class KDTreeIndex(SpatialIndex):
+    """
+    KD树实现
+
+    cKDTree本身不支持增量插入，新插入的点先记录下来，
+    在下一次查询时统一重建KD树
+
+    属性:
+        boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+        points: 已插入的点对象列表，下标与KD树中的坐标一一对应
+    """
+
+    def __init__(self, boundary, leafsize=16):
+        """
+        初始化KD树索引
+
+        参数:
+            boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+            leafsize: cKDTree叶节点大小
+        """
+        super().__init__(boundary)
+        self.leafsize = leafsize
+        self.points = []
+        self._tree = None
+        self._dirty = False
+
+    def insert(self, point):
+        """
+        插入一个点，KD树将在下一次查询前重建
+
+        参数:
+            point: 要插入的点对象
+
+        返回:
+            True
+        """
+        self.points.append(point)
+        self._dirty = True
+        return True
+
+    def insert_batch(self, points):
+        """
+        批量插入点
+
+        参数:
+            points: 点对象的可迭代集合
+
+        返回:
+            插入的点数量
+        """
+        before = len(self.points)
+        self.points.extend(points)
+        self._dirty = True
+        return len(self.points) - before
+
+    def _ensure_tree(self):
+        """在有新插入的点时重建KD树"""
+        if self._dirty or self._tree is None:
+            if self.points:
+                coords = np.fromiter((c for p in self.points for c in (p.x, p.y)),
+                                     dtype=np.float64, count=2 * len(self.points)).reshape(-1, 2)
+            else:
+                coords = np.empty((0, 2), dtype=np.float64)
+            self._tree = cKDTree(coords, leafsize=self.leafsize)
+            self._dirty = False
+        return self._tree
+
+    def query_range(self, range_rect):
+        """
+        查询指定矩形范围内的所有点
+        以矩形中心为圆心、半边长为半径做切比雪夫距离查询，再按矩形过滤
+
+        参数:
+            range_rect: 查询范围矩形 (x_min, y_min, x_max, y_max)
+
+        返回:
+            范围内的点列表
+        """
+        return self.query_range_batch([range_rect])[0]
+
+    def query_range_batch(self, range_rects):
+        """
+        批量矩形范围查询
+
+        参数:
+            range_rects: 查询矩形列表
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        tree = self._ensure_tree()
+        if not self.points or not range_rects:
+            return [[] for _ in range_rects]
+
+        rects = np.asarray(range_rects, dtype=np.float64).reshape(-1, 4)
+        centers = np.column_stack(((rects[:, 0] + rects[:, 2]) / 2, (rects[:, 1] + rects[:, 3]) / 2))
+        half_sizes = np.maximum(rects[:, 2] - rects[:, 0], rects[:, 3] - rects[:, 1]) / 2
+        index_lists = tree.query_ball_point(centers, half_sizes, p=np.inf)
+
+        data = tree.data
+        results = []
+        for (rx_min, ry_min, rx_max, ry_max), indices in zip(rects, index_lists):
+            if not indices:
+                results.append([])
+                continue
+            indices = np.asarray(indices)
+            xy = data[indices]
+            mask = (xy[:, 0] >= rx_min) & (xy[:, 0] <= rx_max) & (xy[:, 1] >= ry_min) & (xy[:, 1] <= ry_max)
+            results.append([self.points[i] for i in indices[mask]])
+        return results
+
+    def query_radius(self, x, y, radius):
+        """
+        查询指定圆形范围内的所有点
+
+        参数:
+            x: 圆心x坐标
+            y: 圆心y坐标
+            radius: 查询半径
+
+        返回:
+            范围内的点列表
+        """
+        return self.query_radius_batch([(x, y)], radius)[0]
+
+    def query_radius_batch(self, centers, radius):
+        """
+        批量圆形范围查询
+
+        参数:
+            centers: 圆心坐标列表 [(x, y), ...]
+            radius: 查询半径
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        tree = self._ensure_tree()
+        if not self.points or not centers:
+            return [[] for _ in centers]
+        index_lists = tree.query_ball_point(np.asarray(centers, dtype=np.float64).reshape(-1, 2), radius)
+        return [[self.points[i] for i in indices] for indices in index_lists]
+
+    def query_nearest(self, x, y, max_count=1, max_distance=float('inf')):
+        """
+        查询距离指定坐标最近的点
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            max_count: 最大返回点数量
+            max_distance: 最大查询距离
+
+        返回:
+            最近的点列表，按距离排序
+        """
+        return self.query_nearest_batch([(x, y)], max_count, max_distance)[0]
+
+    def query_nearest_batch(self, centers, max_count=1, max_distance=float('inf')):
+        """
+        批量最近邻查询
+
+        参数:
+            centers: 查询坐标列表 [(x, y), ...]
+            max_count: 每个查询的最大返回点数量
+            max_distance: 最大查询距离
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        tree = self._ensure_tree()
+        if not self.points or not centers or max_count <= 0:
+            return [[] for _ in centers]
+
+        k = min(max_count, len(self.points))
+        _, indices = tree.query(np.asarray(centers, dtype=np.float64).reshape(-1, 2), k=k,
+                                distance_upper_bound=max_distance)
+        indices = np.asarray(indices).reshape(len(centers), k)
+        n = len(self.points)
+        # 距离超出上限的结果以下标n表示
+        return [[self.points[i] for i in row if i < n] for row in indices]
+
+    def count(self):
+        """
+        统计KD树中的点数量
+
+        返回:
+            点数量
+        """
+        return len(self.points)
+
+    def __str__(self):
+        """返回KD树索引的字符串表示"""
+        return f"KDTreeIndex(boundary={self.boundary}, total_points={len(self.points)})"
@@ -2,14 +2,17 @@
 四叉树类，用于空间数据索引
 实现高效的二维空间点查询
 """
+import heapq
+from .spatial_index import SpatialIndex
 
-class QuadTree:
+class QuadTree(SpatialIndex):
     """
     四叉树实现，用于二维空间中的点查询
     
     属性:
         boundary: 边界矩形 (x_min, y_min, x_max, y_max)
         capacity: 每个节点的最大容量，达到后进行分裂
+        depth: 当前节点深度，根节点为0
         points: 当前节点中的点集合
         divided: 当前节点是否已分裂
         northwest: 西北象限子节点
@@ -18,18 +21,24 @@ class QuadTree:
         southeast: 东南象限子节点
     """
     
-    def __init__(self, boundary, capacity=4):
+    # 最大深度，超过后节点不再分裂（避免大量重合点导致无限分裂）
+    MAX_DEPTH = 32
+    
+    def __init__(self, boundary, capacity=4, depth=0):
         """
         初始化四叉树节点
         
         参数:
             boundary: 边界矩形 (x_min, y_min, x_max, y_max)
             capacity: 节点最大容量
+            depth: 节点深度
         """
-        self.boundary = boundary
+        super().__init__(boundary)
         self.capacity = capacity
+        self.depth = depth
         self.points = []
         self.divided = False
+        self._count = 0  # 子树中的点数量，插入时增量维护
         
         # 子节点
         self.northwest = None
@@ -51,27 +60,33 @@ class QuadTree:
         if not self._contains(point):
             return False
         
-        # 如果当前节点未满，则直接添加
-        if len(self.points) < self.capacity and not self.divided:
-            self.points.append(point)
-            return True
-        
-        # 如果当前节点未分裂，则进行分裂
-        if not self.divided:
-            self._subdivide()
-        
-        # 尝试将点插入到子节点中
-        if self.northwest.insert(point):
-            return True
-        if self.northeast.insert(point):
-            return True
-        if self.southwest.insert(point):
-            return True
-        if self.southeast.insert(point):
-            return True
+        # 沿路径向下，途经的每个节点子树计数加一
+        node = self
+        while True:
+            node._count += 1
+            if not node.divided:
+                # 如果当前节点未满，则直接添加
+                if len(node.points) < node.capacity or node.depth >= self.MAX_DEPTH:
+                    node.points.append(point)
+                    return True
+                # 否则进行分裂
+                node._subdivide()
+            node = node._child_for(point)
+    
+    def _child_for(self, point):
+        """
+        返回点所属的子节点，落在分界线上的点归入东侧/北侧象限
         
-        # 理论上不应该到达这一步，除非点在边界上
-        return False
+        参数:
+            point: 位于当前节点边界内的点
+            
+        返回:
+            子节点
+        """
+        x_min, y_min, x_max, y_max = self.boundary
+        if point.y >= (y_min + y_max) / 2:
+            return self.northeast if point.x >= (x_min + x_max) / 2 else self.northwest
+        return self.southeast if point.x >= (x_min + x_max) / 2 else self.southwest
     
     def _subdivide(self):
         """
@@ -80,30 +95,27 @@ class QuadTree:
         x_min, y_min, x_max, y_max = self.boundary
         x_mid = (x_min + x_max) / 2
         y_mid = (y_min + y_max) / 2
+        depth = self.depth + 1
         
         # 创建四个子节点
         nw_boundary = (x_min, y_mid, x_mid, y_max)
-        self.northwest = QuadTree(nw_boundary, self.capacity)
+        self.northwest = QuadTree(nw_boundary, self.capacity, depth)
         
         ne_boundary = (x_mid, y_mid, x_max, y_max)
-        self.northeast = QuadTree(ne_boundary, self.capacity)
+        self.northeast = QuadTree(ne_boundary, self.capacity, depth)
         
         sw_boundary = (x_min, y_min, x_mid, y_mid)
-        self.southwest = QuadTree(sw_boundary, self.capacity)
+        self.southwest = QuadTree(sw_boundary, self.capacity, depth)
         
         se_boundary = (x_mid, y_min, x_max, y_mid)
-        self.southeast = QuadTree(se_boundary, self.capacity)
+        self.southeast = QuadTree(se_boundary, self.capacity, depth)
         
-        # 将当前节点中的点重新分配到子节点
-        for point in self.points:
-            self.northwest.insert(point)
-            self.northeast.insert(point)
-            self.southwest.insert(point)
-            self.southeast.insert(point)
-        
-        # 清空当前节点的点列表
-        self.points = []
+        # 将当前节点中的点重新分配到唯一的子节点（分界线上的点不会重复插入）
         self.divided = True
+        points = self.points
+        self.points = []
+        for point in points:
+            self._child_for(point).insert(point)
     
     def _contains(self, point):
         """
@@ -118,34 +130,98 @@ class QuadTree:
         x_min, y_min, x_max, y_max = self.boundary
         return (x_min <= point.x <= x_max) and (y_min <= point.y <= y_max)
     
-    def query_range(self, range_rect):
+    def _children(self):
+        """返回子节点元组（西北、东北、西南、东南）"""
+        return (self.northwest, self.northeast, self.southwest, self.southeast)
+    
+    def iter_range(self, range_rect):
         """
-        查询指定矩形范围内的所有点
+        迭代查询指定矩形范围内的所有点，逐个产出而不构建中间列表
         
         参数:
             range_rect: 查询范围矩形 (x_min, y_min, x_max, y_max)
             
         返回:
-            范围内的点列表
+            范围内的点的生成器
         """
-        found_points = []
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._count == 0:
+                continue
+            x_min, y_min, x_max, y_max = node.boundary
+            # 与查询范围不相交，跳过
+            if rx_max < x_min or rx_min > x_max or ry_max < y_min or ry_min > y_max:
+                continue
+            # 节点完全落在查询范围内，子树中的点无需逐个判断
+            if rx_min <= x_min and x_max <= rx_max and ry_min <= y_min and y_max <= ry_max:
+                yield from node.points
+                if node.divided:
+                    stack.extend(node._children())
+                continue
+            for point in node.points:
+                if rx_min <= point.x <= rx_max and ry_min <= point.y <= ry_max:
+                    yield point
+            if node.divided:
+                stack.extend(node._children())
+    
+    def query_range(self, range_rect, out=None):
+        """
+        查询指定矩形范围内的所有点
         
-        # 如果当前节点与查询范围不相交，直接返回空列表
-        if not self._intersects(range_rect):
-            return found_points
+        参数:
+            range_rect: 查询范围矩形 (x_min, y_min, x_max, y_max)
+            out: 可选的结果列表，结果追加到其中，便于调用方复用缓冲区
+            
+        返回:
+            范围内的点列表（传入out时即为out）
+        """
+        found_points = [] if out is None else out
+        append = found_points.append
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._count == 0:
+                continue
+            x_min, y_min, x_max, y_max = node.boundary
+            # 与查询范围不相交，跳过
+            if rx_max < x_min or rx_min > x_max or ry_max < y_min or ry_min > y_max:
+                continue
+            # 节点完全落在查询范围内，子树中的点无需逐个判断
+            if rx_min <= x_min and x_max <= rx_max and ry_min <= y_min and y_max <= ry_max:
+                found_points.extend(node.points)
+                if node.divided:
+                    stack.extend(node._children())
+                continue
+            for point in node.points:
+                if rx_min <= point.x <= rx_max and ry_min <= point.y <= ry_max:
+                    append(point)
+            if node.divided:
+                stack.extend(node._children())
+        return found_points
+    
+    def query_radius(self, x, y, radius, out=None):
+        """
+        查询指定圆形范围内的所有点
         
-        # 检查当前节点中的点是否在查询范围内
-        for point in self.points:
-            if self._point_in_range(point, range_rect):
+        参数:
+            x: 圆心x坐标
+            y: 圆心y坐标
+            radius: 查询半径
+            out: 可选的结果列表，结果追加到其中
+            
+        返回:
+            范围内的点列表（传入out时即为out）
+        """
+        found_points = [] if out is None else out
+        radius_sq = radius * radius
+        for point in self.iter_range((x - radius, y - radius, x + radius, y + radius)):
+            dx = point.x - x
+            dy = point.y - y
+            if dx * dx + dy * dy <= radius_sq:
                 found_points.append(point)
-        
-        # 如果当前节点已分裂，则在子节点中查询
-        if self.divided:
-            found_points.extend(self.northwest.query_range(range_rect))
-            found_points.extend(self.northeast.query_range(range_rect))
-            found_points.extend(self.southwest.query_range(range_rect))
-            found_points.extend(self.southeast.query_range(range_rect))
-        
         return found_points
     
     def _intersects(self, range_rect):
@@ -177,9 +253,33 @@ class QuadTree:
         rx_min, ry_min, rx_max, ry_max = range_rect
         return (rx_min <= point.x <= rx_max) and (ry_min <= point.y <= ry_max)
     
+    def iter_nodes(self, range_rect=None, max_depth=None):
+        """
+        迭代遍历四叉树节点（先序，与递归遍历顺序一致）
+        
+        参数:
+            range_rect: 只遍历与该矩形相交的节点，为None时遍历全部节点
+            max_depth: 最大遍历深度，根节点深度为0，为None时不限制
+            
+        返回:
+            (节点, 深度) 的生成器
+        """
+        stack = [(self, 0)]
+        while stack:
+            node, level = stack.pop()
+            if range_rect is not None and not node._intersects(range_rect):
+                continue
+            yield node, level
+            if node.divided and (max_depth is None or level < max_depth):
+                stack.append((node.southeast, level + 1))
+                stack.append((node.southwest, level + 1))
+                stack.append((node.northeast, level + 1))
+                stack.append((node.northwest, level + 1))
+    
     def query_nearest(self, x, y, max_count=1, max_distance=float('inf')):
         """
         查询距离指定坐标最近的点
+        以节点边界到查询点的距离为下界做最佳优先搜索
         
         参数:
             x: 查询点x坐标
@@ -190,43 +290,41 @@ class QuadTree:
         返回:
             最近的点列表，按距离排序
         """
-        # 首先找出可能包含最近点的区域
-        search_radius = max_distance
-        search_range = (x - search_radius, y - search_radius, 
-                       x + search_radius, y + search_radius)
-        
-        # 获取该范围内的所有点
-        candidates = self.query_range(search_range)
-        
-        # 计算每个点到查询点的距离
-        distance_points = []
-        for point in candidates:
-            dist = ((point.x - x) ** 2 + (point.y - y) ** 2) ** 0.5
-            if dist <= max_distance:
-                distance_points.append((dist, point))
-        
-        # 按距离排序
-        distance_points.sort(key=lambda x: x[0])
-        
-        # 返回最近的max_count个点
-        return [point for _, point in distance_points[:max_count]]
+        max_distance_sq = max_distance * max_distance
+        # 优先队列中的元素: (距离平方下界, 序号, 是否为点, 节点或点)
+        heap = [(0.0, 0, False, self)]
+        counter = 1
+        found_points = []
+        while heap and len(found_points) < max_count:
+            dist_sq, _, is_point, entry = heapq.heappop(heap)
+            if dist_sq > max_distance_sq:
+                break
+            if is_point:
+                found_points.append(entry)
+                continue
+            for point in entry.points:
+                dx = point.x - x
+                dy = point.y - y
+                heapq.heappush(heap, (dx * dx + dy * dy, counter, True, point))
+                counter += 1
+            if entry.divided:
+                for child in entry._children():
+                    if child._count:
+                        x_min, y_min, x_max, y_max = child.boundary
+                        dx = max(x_min - x, 0.0, x - x_max)
+                        dy = max(y_min - y, 0.0, y - y_max)
+                        heapq.heappush(heap, (dx * dx + dy * dy, counter, False, child))
+                        counter += 1
+        return found_points
     
     def count(self):
         """
-        统计四叉树中的点数量
+        统计四叉树中的点数量（插入时增量维护，O(1)）
         
         返回:
             点数量
         """
-        count = len(self.points)
-        
-        if self.divided:
-            count += self.northwest.count()
-            count += self.northeast.count()
-            count += self.southwest.count()
-            count += self.southeast.count()
-        
-        return count
+        return self._count
     
     def __str__(self):
         """返回四叉树的字符串表示"""
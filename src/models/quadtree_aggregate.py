@@ -0,0 +1,201 @@
+"""
+四叉树聚合统计
+将已构建的四叉树展开为数组形式，并为每个节点维护子树聚合值
+（顶点数、道路数、道路容量之和、车辆数之和、各类特殊点数量），
+范围统计查询可直接使用完全落在查询范围内的内部节点的聚合值，无需访问叶节点
+"""
+import numpy as np
+
+# 聚合通道名称，对应aggregates矩阵的列
+AGGREGATE_CHANNELS = ('points', 'edges', 'capacity', 'vehicles', 'gas_station', 'shopping_mall', 'parking_lot')
+_CHANNEL_INDEX = {name: i for i, name in enumerate(AGGREGATE_CHANNELS)}
+
+
+class QuadTreeAggregates:
+    """
+    带子树聚合值的四叉树数组视图
+
+    每条道路的容量和车辆数只计入其起点（vertex1）所在的节点，
+    因此任意范围内的统计值等于起点落在该范围内的道路之和，不会重复计数
+
+    属性:
+        node_bounds: 节点边界数组 (N, 4)
+        node_parent: 父节点下标 (N,)，根节点为-1
+        node_children: 子节点下标 (N, 4)，叶节点为-1
+        point_leaf: 每个顶点所在叶节点的下标 (P,)
+        point_xy: 顶点坐标 (P, 2)
+        aggregates: 节点聚合值矩阵 (N, len(AGGREGATE_CHANNELS))
+    """
+
+    def __init__(self, quadtree, graph):
+        """
+        从四叉树和图构建聚合结构
+
+        参数:
+            quadtree: 已插入所有顶点的QuadTree
+            graph: 顶点和道路所属的图
+        """
+        bounds = []
+        parents = []
+        children = []
+        depths = []
+        leaf_points = []  # (叶节点下标, 顶点)
+
+        # 迭代展开四叉树（广度优先，保证父节点下标小于子节点）
+        queue = [(quadtree, -1, 0)]
+        head = 0
+        while head < len(queue):
+            node, parent, depth = queue[head]
+            index = head
+            head += 1
+            bounds.append(node.boundary)
+            parents.append(parent)
+            depths.append(depth)
+            child_slots = [-1, -1, -1, -1]
+            if parent >= 0:
+                slot = children[parent].index(-2)
+                children[parent][slot] = index
+            for point in node.points:
+                leaf_points.append((index, point))
+            if node.divided:
+                child_slots = [-2, -2, -2, -2]
+                for child in (node.northwest, node.northeast, node.southwest, node.southeast):
+                    queue.append((child, index, depth + 1))
+            children.append(child_slots)
+
+        self.node_bounds = np.asarray(bounds, dtype=np.float64)
+        self.node_parent = np.asarray(parents, dtype=np.int64)
+        self.node_children = np.asarray(children, dtype=np.int64)
+        self.node_depth = np.asarray(depths, dtype=np.int64)
+
+        n_points = len(leaf_points)
+        self.points = [point for _, point in leaf_points]
+        self.point_leaf = np.fromiter((leaf for leaf, _ in leaf_points), dtype=np.int64, count=n_points)
+        self.point_xy = np.fromiter((c for _, p in leaf_points for c in (p.x, p.y)),
+                                    dtype=np.float64, count=2 * n_points).reshape(-1, 2)
+        self._point_index = {point.id: i for i, point in enumerate(self.points)}
+
+        # 每个叶节点的顶点下标列表（部分相交的叶节点需要逐点检查）
+        order = np.argsort(self.point_leaf, kind='stable')
+        sorted_leaf = self.point_leaf[order]
+        n_nodes = len(bounds)
+        self._leaf_order = order
+        self._leaf_start = np.searchsorted(sorted_leaf, np.arange(n_nodes), side='left')
+        self._leaf_end = np.searchsorted(sorted_leaf, np.arange(n_nodes), side='right')
+
+        # 自底向上汇总时按深度分层，每层一次向量化累加
+        max_depth = int(self.node_depth.max()) if n_nodes else 0
+        self._levels = []
+        for depth in range(max_depth, 0, -1):
+            level_nodes = np.nonzero(self.node_depth == depth)[0]
+            self._levels.append((level_nodes, self.node_parent[level_nodes]))
+
+        # 道路按graph.edges的顺序对应到起点顶点
+        self.edge_ids = list(graph.edges.keys())
+        edges = list(graph.edges.values())
+        self.edge_owner = np.fromiter((self._point_index.get(e.vertex1.id, -1) for e in edges),
+                                      dtype=np.int64, count=len(edges))
+
+        # 顶点级别的静态通道
+        self.point_values = np.zeros((n_points, len(AGGREGATE_CHANNELS)), dtype=np.float64)
+        self.point_values[:, _CHANNEL_INDEX['points']] = 1.0
+        for i, point in enumerate(self.points):
+            attribute_type = point.get_attribute_type()
+            if attribute_type in _CHANNEL_INDEX:
+                self.point_values[i, _CHANNEL_INDEX[attribute_type]] = 1.0
+        capacities = np.fromiter((e.capacity for e in edges), dtype=np.float64, count=len(edges))
+        vehicles = np.fromiter((e.current_vehicles for e in edges), dtype=np.float64, count=len(edges))
+        self.point_values[:, _CHANNEL_INDEX['edges']] = self._sum_by_owner(np.ones(len(edges)))
+        self.point_values[:, _CHANNEL_INDEX['capacity']] = self._sum_by_owner(capacities)
+        self.point_values[:, _CHANNEL_INDEX['vehicles']] = self._sum_by_owner(vehicles)
+
+        self.aggregates = np.zeros((n_nodes, len(AGGREGATE_CHANNELS)), dtype=np.float64)
+        self._rebuild_channels(range(len(AGGREGATE_CHANNELS)))
+
+    def _sum_by_owner(self, edge_values):
+        """将按道路给出的值汇总到起点顶点"""
+        valid = self.edge_owner >= 0
+        return np.bincount(self.edge_owner[valid], weights=edge_values[valid], minlength=len(self.points))
+
+    def _rebuild_channels(self, channels):
+        """对指定通道自底向上重新计算所有节点的聚合值"""
+        n_nodes = len(self.node_bounds)
+        for channel in channels:
+            sums = np.bincount(self.point_leaf, weights=self.point_values[:, channel], minlength=n_nodes)
+            for level_nodes, level_parents in self._levels:
+                np.add.at(sums, level_parents, sums[level_nodes])
+            self.aggregates[:, channel] = sums
+
+    def update_vehicles(self, vehicles):
+        """
+        使用一次交通更新后的车辆数数组刷新聚合值（向量化的自底向上汇总）
+
+        参数:
+            vehicles: 按graph.edges顺序排列的车辆数数组
+        """
+        vehicles = np.asarray(vehicles, dtype=np.float64)
+        self.point_values[:, _CHANNEL_INDEX['vehicles']] = self._sum_by_owner(vehicles)
+        self._rebuild_channels([_CHANNEL_INDEX['vehicles']])
+
+    def refresh_from_graph(self, graph):
+        """
+        从图中读取当前的车辆数并刷新聚合值
+
+        参数:
+            graph: 图实例，道路顺序必须与构建时一致
+        """
+        vehicles = np.fromiter((e.current_vehicles for e in graph.edges.values()),
+                               dtype=np.float64, count=len(graph.edges))
+        self.update_vehicles(vehicles)
+
+    def query_aggregate(self, range_rect):
+        """
+        查询矩形范围内的聚合统计值
+
+        完全落在范围内的节点直接使用其聚合值，只有与范围边界相交的叶节点才逐点检查
+
+        参数:
+            range_rect: 查询矩形 (x_min, y_min, x_max, y_max)
+
+        返回:
+            {通道名称: 统计值} 字典
+        """
+        rx_min, ry_min, rx_max, ry_max = range_rect
+        bounds = self.node_bounds
+        children = self.node_children
+        total = np.zeros(len(AGGREGATE_CHANNELS), dtype=np.float64)
+
+        stack = [0] if len(bounds) else []
+        while stack:
+            node = stack.pop()
+            x_min, y_min, x_max, y_max = bounds[node]
+            if rx_max < x_min or rx_min > x_max or ry_max < y_min or ry_min > y_max:
+                continue
+            if rx_min <= x_min and x_max <= rx_max and ry_min <= y_min and y_max <= ry_max:
+                total += self.aggregates[node]
+                continue
+            if children[node, 0] >= 0:
+                stack.extend(children[node].tolist())
+                continue
+            start, end = self._leaf_start[node], self._leaf_end[node]
+            if start == end:
+                continue
+            indices = self._leaf_order[start:end]
+            xy = self.point_xy[indices]
+            mask = (xy[:, 0] >= rx_min) & (xy[:, 0] <= rx_max) & (xy[:, 1] >= ry_min) & (xy[:, 1] <= ry_max)
+            if mask.any():
+                total += self.point_values[indices[mask]].sum(axis=0)
+
+        return {name: float(total[i]) for i, name in enumerate(AGGREGATE_CHANNELS)}
+
+    def query_aggregate_batch(self, range_rects):
+        """
+        批量范围统计查询
+
+        参数:
+            range_rects: 查询矩形列表
+
+        返回:
+            与输入一一对应的统计字典列表
+        """
+        return [self.query_aggregate(rect) for rect in range_rects]
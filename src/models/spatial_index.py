@@ -0,0 +1,246 @@
+"""
+空间索引接口模块
+定义所有空间索引后端（四叉树、均匀网格哈希、KD树）共享的查询接口，
+并提供按名称创建索引以及根据点分布和查询组合挑选最优后端的工具
+"""
+import time
+from abc import ABC, abstractmethod
+
+# 可用的空间索引后端名称
+SPATIAL_INDEX_TYPES = ('quadtree', 'grid', 'kdtree')
+
+
+class SpatialIndex(ABC):
+    """
+    空间索引接口，所有后端都需要实现insert、query_range、query_nearest和count
+
+    被索引的点对象必须具有x和y属性（例如Vertex）
+
+    属性:
+        boundary: 索引覆盖的边界矩形 (x_min, y_min, x_max, y_max)
+    """
+
+    def __init__(self, boundary):
+        """
+        初始化空间索引
+
+        参数:
+            boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+        """
+        self.boundary = boundary
+
+    @abstractmethod
+    def insert(self, point):
+        """
+        插入一个点
+
+        参数:
+            point: 要插入的点对象，必须有x和y属性
+
+        返回:
+            插入成功返回True，否则返回False
+        """
+
+    def insert_batch(self, points):
+        """
+        批量插入点
+
+        参数:
+            points: 点对象的可迭代集合
+
+        返回:
+            成功插入的点数量
+        """
+        inserted = 0
+        for point in points:
+            if self.insert(point):
+                inserted += 1
+        return inserted
+
+    @abstractmethod
+    def query_range(self, range_rect):
+        """
+        查询指定矩形范围内的所有点
+
+        参数:
+            range_rect: 查询范围矩形 (x_min, y_min, x_max, y_max)
+
+        返回:
+            范围内的点列表
+        """
+
+    def query_radius(self, x, y, radius):
+        """
+        查询指定圆形范围内的所有点
+
+        参数:
+            x: 圆心x坐标
+            y: 圆心y坐标
+            radius: 查询半径
+
+        返回:
+            范围内的点列表
+        """
+        radius_sq = radius * radius
+        candidates = self.query_range((x - radius, y - radius, x + radius, y + radius))
+        return [p for p in candidates if (p.x - x) ** 2 + (p.y - y) ** 2 <= radius_sq]
+
+    @abstractmethod
+    def query_nearest(self, x, y, max_count=1, max_distance=float('inf')):
+        """
+        查询距离指定坐标最近的点
+
+        参数:
+            x: 查询点x坐标
+            y: 查询点y坐标
+            max_count: 最大返回点数量
+            max_distance: 最大查询距离
+
+        返回:
+            最近的点列表，按距离排序
+        """
+
+    def query_range_batch(self, range_rects):
+        """
+        批量矩形范围查询
+
+        参数:
+            range_rects: 查询矩形列表
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        return [self.query_range(rect) for rect in range_rects]
+
+    def query_radius_batch(self, centers, radius):
+        """
+        批量圆形范围查询
+
+        参数:
+            centers: 圆心坐标列表 [(x, y), ...]
+            radius: 查询半径
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        return [self.query_radius(x, y, radius) for x, y in centers]
+
+    def query_nearest_batch(self, centers, max_count=1, max_distance=float('inf')):
+        """
+        批量最近邻查询
+
+        参数:
+            centers: 查询坐标列表 [(x, y), ...]
+            max_count: 每个查询的最大返回点数量
+            max_distance: 最大查询距离
+
+        返回:
+            与输入一一对应的点列表的列表
+        """
+        return [self.query_nearest(x, y, max_count, max_distance) for x, y in centers]
+
+    @abstractmethod
+    def count(self):
+        """
+        统计索引中的点数量
+
+        返回:
+            点数量
+        """
+
+
+def create_spatial_index(index_type, boundary, expected_count=None):
+    """
+    按名称创建一个空的空间索引
+
+    参数:
+        index_type: 后端名称 ('quadtree', 'grid', 'kdtree')
+        boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+        expected_count: 预计插入的点数量，网格后端据此确定单元格大小
+
+    返回:
+        空间索引实例
+    """
+    if index_type == 'quadtree':
+        from .quadtree import QuadTree
+        return QuadTree(boundary)
+    if index_type == 'grid':
+        from .grid_index import GridIndex
+        return GridIndex(boundary, expected_count=expected_count)
+    if index_type == 'kdtree':
+        from .kdtree_index import KDTreeIndex
+        return KDTreeIndex(boundary)
+    raise ValueError(f"未知的空间索引类型: {index_type}，可选: {', '.join(SPATIAL_INDEX_TYPES)}")
+
+
+def benchmark_spatial_indexes(points, boundary, range_queries=(), radius_queries=(),
+                              nearest_queries=(), nearest_count=10, index_types=SPATIAL_INDEX_TYPES):
+    """
+    在给定的点分布和查询组合上对各空间索引后端计时，并挑选总耗时最少的后端
+
+    参数:
+        points: 要索引的点列表
+        boundary: 边界矩形 (x_min, y_min, x_max, y_max)
+        range_queries: 矩形查询列表 [(x_min, y_min, x_max, y_max), ...]
+        radius_queries: 圆形查询列表 [(x, y, radius), ...]
+        nearest_queries: 最近邻查询坐标列表 [(x, y), ...]
+        nearest_count: 每次最近邻查询返回的点数量
+        index_types: 参与比较的后端名称
+
+    返回:
+        (best_type, results): 最优后端名称，以及每个后端的分阶段耗时字典
+            {index_type: {"build": 秒, "range": 秒, "radius": 秒, "nearest": 秒, "total": 秒}}
+    """
+    results = {}
+    for index_type in index_types:
+        timings = {}
+
+        start_time = time.perf_counter()
+        index = create_spatial_index(index_type, boundary, expected_count=len(points))
+        index.insert_batch(points)
+        timings["build"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for rect in range_queries:
+            index.query_range(rect)
+        timings["range"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for x, y, radius in radius_queries:
+            index.query_radius(x, y, radius)
+        timings["radius"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for x, y in nearest_queries:
+            index.query_nearest(x, y, max_count=nearest_count)
+        timings["nearest"] = time.perf_counter() - start_time
+
+        timings["total"] = sum(timings.values())
+        results[index_type] = timings
+
+    best_type = min(results, key=lambda t: results[t]["total"]) if results else None
+    return best_type, results
+
+
+def bounding_box(points, padding_ratio=0.01):
+    """
+    计算点集的外包矩形，并增加少量边距确保边界点被包含
+
+    参数:
+        points: 点对象列表
+        padding_ratio: 边距占最大边长的比例
+
+    返回:
+        边界矩形 (x_min, y_min, x_max, y_max)，点集为空时返回None
+    """
+    if not points:
+        return None
+    x_values = [p.x for p in points]
+    y_values = [p.y for p in points]
+    x_min, x_max = min(x_values), max(x_values)
+    y_min, y_max = min(y_values), max(y_values)
+    padding = max((x_max - x_min), (y_max - y_min)) * padding_ratio
+    if padding == 0:
+        padding = 1.0
+    return (x_min - padding, y_min - padding, x_max + padding, y_max + padding)
+